@@ -4,8 +4,12 @@
 #
 # standalone gui for executing InterSaME pipeline
 #
+# The pipeline runs outside the Qt main thread: each group of selected files is a job of a thread pool,
+# and each job runs the pipeline in a child process, which sends its progress and log records back
+# through a queue. Jobs of different hist-ids run concurrently and can be cancelled.
+#
 # gui for designing the app:
-#   $ cd /usr/lib/x86_64-linux-gnu/qt5/bin/ 
+#   $ cd /usr/lib/x86_64-linux-gnu/qt5/bin/
 #     ./designer
 #
 # usage:
@@ -21,33 +25,242 @@
 import re
 import os
 import sys
-from contextlib import ExitStack
+import time
+import queue
+import logging
+import logging.handlers
+import multiprocessing
 from PyQt5 import QtGui, QtCore
-from PyQt5.QtWidgets import QApplication, QMainWindow, QFileDialog, QAction, QMessageBox, QWidget, QTextEdit, QVBoxLayout, QPushButton
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QApplication, QMainWindow, QFileDialog, QAction, QMessageBox, QWidget, QTextEdit, QVBoxLayout, \
+                            QHBoxLayout, QPushButton, QProgressBar
+
+from isame_pipeline import STAGES, Pipeline, InterSaMEPipelineError, InterSaMEPipelineCancelled, PIPELINE_ERRORS
+from isame_profile import setup_profiling, write_profile
+
+LOG_FORMAT = '%(levelname)s %(name)s: %(message)s'
+
+# miliseconds between reads of the log queue
+LOG_POLL_INTERVAL = 100
+
+# seconds to wait for a cancelled job before killing its process
+CANCEL_TIMEOUT = 5
+
+PROGRESS_STEPS = 1000
+
+FINISHED = 'finished'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+def generate_output_fnames(fnames):
+    """ Generate the name of the output files, depending on the base name and the extension of the input files.
+
+    (ID-1-ini.txt > ID-2-draft-pl.txt) > ID-3-trans.xml > ID-4.txt > ID-5-pre.json > ID-6.json > ID-7-tei.xml
+                    ID-2-draft-ar.txt    ID-3-ref.xml
+
+                                         ID.xml > ID.txt > ID-pre.json > ID.json > ID-tei.xml
 
-from isame_xml2txt import xml2txt
-from isame_parser import parse
-from isame_mapper import quran_map
-from isame_json2tei import json2tei
+    Args:
+        fnames (list): input files, all with the same extension.
+
+    Return:
+        dict: outputs for Pipeline.run.
+
+    """
+    fpath, fname = os.path.split(os.path.realpath(fnames[0]))
+    fbase, fext = os.path.splitext(fname)
+
+    if len(fnames) != 1:
+        base = fbase.partition('_')[0]
+        names = {'txt' : f'{base}.txt', 'pre_json' : f'{base}.pre.json', 'json_' : f'{base}.json', 'tei' : f'{base}.xml'}
+    elif (m := re.match(r'(.+?)-([1-9])(?:-.*)?', fbase)):
+        base, n = m.groups()
+        n = int(n)
+        if fext == '.xml':
+            names = {'txt' : f'{base}-{n+1}.txt', 'pre_json' : f'{base}-{n+2}-pre.json', 'json_' : f'{base}-{n+3}.json',
+                     'tei' : f'{base}-{n+4}.xml'}
+        elif fext == '.txt':
+            names = {'pre_json' : f'{base}-{n+1}-pre.json', 'json_' : f'{base}-{n+2}.json', 'tei' : f'{base}-{n+3}.xml'}
+        else:
+            names = {'tei' : f'{base}-{n+1}.tei'}
+        names = {k : os.path.join(fpath, v) for k, v in names.items()}
+    else:
+        names = {'txt' : f'{fbase}.txt', 'pre_json' : f'{fbase}-pre.json', 'json_' : f'{fbase}.json', 'tei' : f'{fbase}-tei.xml'}
+        names = {k : os.path.join(fpath, v) for k, v in names.items()}
+
+    # the stages are run in memory, and the output of each one is saved after it is done
+    outputs = {'tei' : names['tei']}
+    if fext == '.xml':
+        outputs['txt'] = names['txt']
+    if fext in ('.xml', '.txt'):
+        outputs['pre_json'] = names['pre_json']
+        outputs['json_'] = names['json_']
+    return outputs
+
+def group_files(fnames):
+    """ group the input files that are processed together, i.e. those with the same hist-id and extension.
+
+    Args:
+        fnames (list): input files, in order of selection.
+
+    Return:
+        list: lists of files, in order of selection.
+
+    """
+    groups = {}
+    for fname in fnames:
+        fbase, fext = os.path.splitext(os.path.basename(fname))
+        groups.setdefault((fbase.partition('_')[0], fext), []).append(fname)
+    return list(groups.values())
+
+def profile_fname(outputs):
+    """ name of the profile report of a job, next to its TEI output.
+
+    Args:
+        outputs (dict): outputs for Pipeline.run.
+
+    Return:
+        str: json file for the report.
+
+    """
+    return f'{os.path.splitext(outputs["tei"])[0]}-profile.json'
+
+def _run_job(fnames, outputs, debug, events, cancel, profile=None):
+    """ run the pipeline in a child process.
+
+    Args:
+        fnames (list): input files.
+        outputs (dict): outputs for Pipeline.run.
+        debug (bool): debug mode.
+        events (multiprocessing.Queue): queue for log records, ('progress', stage, done, total) and
+            the final (status, message).
+        cancel (multiprocessing.Event): set to stop the pipeline.
+        profile (str): json file for the profile report of the job, None for not profiling.
+
+    """
+    handler = logging.handlers.QueueHandler(events)
+    handler.setLevel(logging.DEBUG if debug else logging.WARNING)
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(logging.DEBUG if debug else logging.INFO)
+
+    def progress(stage, done, total):
+        if cancel.is_set():
+            raise InterSaMEPipelineCancelled('conversion cancelled')
+        events.put(('progress', stage, done, total))
+
+    if profile:
+        setup_profiling('InterSaME_Data_Handler', profile)
+
+    # the report is written before the final event, as atexit functions are not run in the child process
+    try:
+        Pipeline(debug=debug, progress=progress).run(fnames, **outputs)
+    except InterSaMEPipelineCancelled as e:
+        write_profile()
+        events.put((CANCELLED, str(e)))
+    except (InterSaMEPipelineError, *PIPELINE_ERRORS, OSError) as e:
+        write_profile()
+        events.put((FAILED, str(e)))
+    else:
+        write_profile()
+        events.put((FINISHED, ''))
+
+
+class WorkerSignals(QObject):
+    """ signals of a PipelineWorker, delivered in the thread of the gui.
+
+    """
+    progress = pyqtSignal(int, str, int, int)  # job, stage, done, total
+    finished = pyqtSignal(int, str, str)       # job, status, message
+
+
+class PipelineWorker(QRunnable):
+    """ job of the thread pool running the pipeline on a group of files.
+
+    Attributes:
+        job (int): job number.
+        fnames (list): input files.
+        outputs (dict): outputs for Pipeline.run.
+        debug (bool): debug mode.
+        log_queue (queue.Queue): queue where the log records of the pipeline are put.
+        profile (str): json file for the profile report, None for not profiling.
+        signals (WorkerSignals): progress and finished signals.
+
+    """
+    def __init__(self, job, fnames, outputs, debug, log_queue, profile=None):
+
+        super().__init__()
+        self.job = job
+        self.fnames = fnames
+        self.outputs = outputs
+        self.debug = debug
+        self.log_queue = log_queue
+        self.profile = profile
+        self.signals = WorkerSignals()
+
+        self._context = multiprocessing.get_context('spawn')
+        self._events = self._context.Queue()
+        self._cancel = self._context.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def run(self):
+        process = self._context.Process(target=_run_job, args=(self.fnames, self.outputs, self.debug, self._events, self._cancel,
+                                                               self.profile),
+                                        daemon=True)
+        process.start()
+
+        status, message = None, ''
+        exited = False
+        cancelled_at = None
+        while status is None:
+            try:
+                event = self._events.get(timeout=LOG_POLL_INTERVAL/1000)
+            except queue.Empty:
+                # the process may have put its last event just before exiting
+                if exited:
+                    status, message = FAILED, f'pipeline process exited with code {process.exitcode}'
+                exited = not process.is_alive()
+
+                if self._cancel.is_set():
+                    cancelled_at = cancelled_at or time.monotonic()
+                    if time.monotonic() - cancelled_at > CANCEL_TIMEOUT:
+                        process.terminate()
+                        status, message = CANCELLED, 'conversion cancelled'
+                continue
+
+            if isinstance(event, logging.LogRecord):
+                self.log_queue.put(event)
+            elif event[0] == 'progress':
+                self.signals.progress.emit(self.job, *event[1:])
+            else:
+                status, message = event
+
+        process.join()
+        self.signals.finished.emit(self.job, status, message)
 
 
 class GUI(QMainWindow):
 
     def __init__(self):
-        
-        self.infile_paths = []
 
-        self.xml_fpath = []
-        self.txt_fpath = []
-        self.pre_json_fpath = []
-        self.json_fpath = []
-        self.tei_fpath = []
+        self.infile_paths = []
 
         self.box_info = None
         self.debug_mode = False
+        self.profile_mode = False
+
+        self.pool = QThreadPool()
+        self.log_queue = queue.Queue()
+        self.log_formatter = logging.Formatter(LOG_FORMAT)
+        self.workers = {}
+        self.job_progress = {}
+        self.job_failed = False
 
         super().__init__()
-        self.initUI()        
+        self.initUI()
 
     def initUI(self):
         self.setWindowTitle('InterSaME Data Handler')
@@ -63,7 +276,7 @@ class GUI(QMainWindow):
         menu = self.menuBar()
         file_menu = menu.addMenu('&File')
 
-        new_file = QAction('&New', self)        
+        new_file = QAction('&New', self)
         new_file.setStatusTip('New File')
         new_file.triggered.connect(self.open_dialog)
 
@@ -79,7 +292,13 @@ class GUI(QMainWindow):
         debug_toggle = QAction('&Debug mode', self, checkable=True)
         debug_toggle.setChecked(False)
         debug_toggle.triggered.connect(self.toggleMenu)
-        options_menu.addAction(debug_toggle)        
+        options_menu.addAction(debug_toggle)
+
+        profile_toggle = QAction('&Profile', self, checkable=True)
+        profile_toggle.setStatusTip('Save the time of each phase and page of the conversion')
+        profile_toggle.setChecked(False)
+        profile_toggle.triggered.connect(self.toggleProfile)
+        options_menu.addAction(profile_toggle)
 
         #
         # processing box and run pipeline
@@ -92,16 +311,32 @@ class GUI(QMainWindow):
         self.box_info.setPlainText('Select one or more files file using the menu File > New to run a new conversion pipeline on it.'
                                    '\nThe conversion pipeline is as follows:'
                                    '\n    Archetype .xml > InterSaME .txt > InterSaME .json > InterSaME TEI .xml'
-                                   '\n Warning! If you select several files they will be processed in the order of selection')
+                                   '\n If you select several files of the same hist-id they will be joined in the order of selection.'
+                                   '\n Files of different hist-ids are processed at the same time.')
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, PROGRESS_STEPS)
+        self.progress_bar.setValue(0)
+
+        self.run_button = QPushButton('&RUN')
+        self.cancel_button = QPushButton('&CANCEL')
+        self.cancel_button.setEnabled(False)
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.run_button)
+        buttons.addWidget(self.cancel_button)
 
-        run_button = QPushButton('&RUN')
-        #run_button.resize(self.run_button.sizeHint())
-        #run_button.move(50, 50)
         layout = QVBoxLayout()
         layout.addWidget(self.box_info)
-        layout.addWidget(run_button)
+        layout.addWidget(self.progress_bar)
+        layout.addLayout(buttons)
         self.info_box.setLayout(layout)
-        run_button.clicked.connect(self.run_pipeline)
+        self.run_button.clicked.connect(self.run_pipeline)
+        self.cancel_button.clicked.connect(self.cancel_pipeline)
+
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.show_logs)
+        self.log_timer.start(LOG_POLL_INTERVAL)
 
     def toggleMenu(self, state):
         if state:
@@ -109,6 +344,9 @@ class GUI(QMainWindow):
         else:
             self.debug_mode = False
 
+    def toggleProfile(self, state):
+        self.profile_mode = bool(state)
+
     def open_dialog(self):
         fnames, _ = QFileDialog.getOpenFileNames(self, 'Open File', filter='Archetype xml (*.xml);;InterSaME txt file (*.txt);;InterSaME JSON file (*.json)')
         self.infile_paths = fnames
@@ -116,205 +354,98 @@ class GUI(QMainWindow):
     def about_window(self):
         QMessageBox.about(self, "About InterSaME Data Handler", "This standalone application was created for the InterSaME Project.")
 
-    def generate_output_fnames(self, fpath, fbase, fext, multiple):
-        """ Generate the name of the output files, depending on the base name and the extension of the input file.
-
-        (ID-1-ini.txt > ID-2-draft-pl.txt) > ID-3-trans.xml > ID-4.txt > ID-5-pre.json > ID-6.json > ID-7-tei.xml
-                        ID-2-draft-ar.txt    ID-3-ref.xml
-
-                                             ID.xml > ID.txt > ID-pre.json > ID.json > ID-tei.xml
-    
-        Args:
-            fpath (str): path of input file.
-            fbase (str): base name of input file.
-            fext (str): extension of input file.
-            multiple (bool): flag to indicate if there are more than one input files.
-    
-        """
-        if multiple:
-            base = fbase.partition('_')[0]
-            if fext == '.xml':
-                self.xml_fpath = self.infile_paths
-                self.txt_fpath.append(f'{base}.txt')
-                self.pre_json_fpath.append(f'{base}.pre.json')
-                self.json_fpath.append(f'{base}.json')
-                self.tei_fpath.append(f'{base}.xml')
-            elif fext == '.txt':
-                self.txt_fpath = self.infile_paths
-                self.pre_json_fpath.append(f'{base}.pre.json')
-                self.json_fpath.append(f'{base}.json')
-                self.tei_fpath.append(f'{base}.xml')
-            else:
-                self.pre_json_fpath = self.infile_paths
-                self.json_fpath.append(f'{base}.json')
-                self.tei_fpath.append(f'{base}.xml')
-        else:
-            if (m := re.match(r'(.+?)-([1-9])(?:-.*)?', fbase)):
-                base, n = m.groups()
-                n = int(n)
-        
-                if fext == '.xml':
-                    self.xml_fpath.append(fpath)
-                    self.txt_fpath.append(os.path.join(fpath, f'{base}-{n+1}.txt'))
-                    self.pre_json_fpath.append(os.path.join(fpath, f'{base}-{n+2}-pre.json'))
-                    self.json_fpath.append(os.path.join(fpath, f'{base}-{n+3}.json'))
-                    self.tei_fpath.append(os.path.join(fpath, f'{base}-{n+4}.xml'))
-                elif fext == '.txt':
-                    self.txt_fpath.append(fpath)
-                    self.pre_json_fpath.append(os.path.join(fpath, f'{base}-{n+1}-pre.json'))
-                    self.json_fpath.append(os.path.join(fpath, f'{base}-{n+2}.json'))
-                    self.tei_fpath.append(os.path.join(fpath, f'{base}-{n+3}.xml'))
-                else:
-                    self.json_fpath.append(fpath)
-                    self.tei_fpath.append(os.path.join(fpath, f'{base}-{n+1}.tei'))
-            else:
-                
-                if fext == '.xml':
-                    self.xml_fpath.append(fpath)
-                    self.txt_fpath.append(os.path.join(fpath, f'{fbase}.txt'))
-                    self.pre_json_fpath.append(os.path.join(fpath, f'{fbase}-pre.json'))
-                    self.json_fpath.append(os.path.join(fpath, f'{fbase}.json'))
-                    self.tei_fpath.append(os.path.join(fpath, f'{fbase}-tei.xml'))
-                elif fext == '.txt':
-                    self.txt_fpath.append(fpath)
-                    self.pre_json_fpath.append(os.path.join(fpath, f'{fbase}-pre.json'))
-                    self.json_fpath.append(os.path.join(fpath, f'{fbase}.json'))
-                    self.tei_fpath.append(os.path.join(fpath, f'{fbase}-tei.xml'))
-                else:
-                    self.json_fpath.append(fpath)
-                    self.tei_fpath.append(os.path.join(fpath, f'{fbase}-tei.xml'))
-
     def run_pipeline(self):
         if not self.infile_paths:
             self.box_info.append('Please, choose one or several files to run the pipeline on it')
             return
+        if self.workers:
+            return
 
-        fpath, fname = os.path.split(os.path.realpath(self.infile_paths[0]))
-        base, ext = os.path.splitext(fname)
-        MULTIPLE_FILES = len(self.infile_paths)!=1
-
-        self.generate_output_fnames(fpath, base, ext, multiple=MULTIPLE_FILES)
-
-        self.box_info.append(f'\n *************************************') 
+        self.box_info.append(f'\n *************************************')
         self.box_info.append(f' *  STARTING PIPELINE CONVERSION *')
-        self.box_info.append(f' **************************************\n') 
+        self.box_info.append(f' **************************************\n')
+
+        self.job_progress = {}
+        self.job_failed = False
+        for job, fnames in enumerate(group_files(self.infile_paths)):
+            outputs = generate_output_fnames(fnames)
+
+            self.box_info.append(f'[{job}] Processing input file(s) {", ".join(fnames)} ...')
+            if 'txt' in outputs:
+                self.box_info.append(f'[{job}] Converting xml file(s) to txt, saving it as {outputs["txt"]} ...')
+            if 'pre_json' in outputs:
+                self.box_info.append(f'[{job}] Converting txt file(s) to pre-json, saving it as {outputs["pre_json"]} ...')
+                self.box_info.append(f'[{job}] Converting pre-json file(s) to json, saving it as {outputs["json_"]} ...')
+            self.box_info.append(f'[{job}] Converting json file(s) to tei, saving it as {outputs["tei"]} ...')
+
+            profile = profile_fname(outputs) if self.profile_mode else None
+            if profile:
+                self.box_info.append(f'[{job}] Profiling conversion, saving report as {profile} ...')
+
+            worker = PipelineWorker(job, fnames, outputs, self.debug_mode, self.log_queue, profile)
+            worker.signals.progress.connect(self.update_progress)
+            worker.signals.finished.connect(self.job_finished)
+            self.workers[job] = worker
+            self.job_progress[job] = 0.0
+            self.pool.start(worker)
+
+        self.progress_bar.setValue(0)
+        self.run_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+
+    def cancel_pipeline(self):
+        self.statusBar().showMessage('Cancelling conversion...')
+        self.cancel_button.setEnabled(False)
+        for worker in self.workers.values():
+            worker.cancel()
+
+    def update_progress(self, job, stage, done, total):
+        self.job_progress[job] = (STAGES.index(stage) + (done / total if total else 0)) / len(STAGES)
+        self.progress_bar.setValue(int(PROGRESS_STEPS * sum(self.job_progress.values()) / len(self.job_progress)))
+        self.statusBar().showMessage(f'[{job}] {stage} {done}/{total}')
+
+    def job_finished(self, job, status, message):
+        self.workers.pop(job, None)
+        self.job_progress[job] = 1.0
+        self.show_logs()
+
+        if status != FINISHED:
+            self.job_failed = True
+            self.box_info.append(f'\n[{job}] CONVERSION {"CANCELLED" if status == CANCELLED else "ABORTED"}! {message}')
+            if status == FAILED and not self.debug_mode:
+                self.box_info.append(f'Hint: Use debug mode to find the error.')
+
+        if self.workers:
+            return
+
+        self.progress_bar.setValue(PROGRESS_STEPS)
+        self.run_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        self.statusBar().showMessage('Select New File to start conversion pipeline')
 
-        if ext == '.xml':
+        if not self.job_failed:
+            self.box_info.append(f'\n ***************************')
+            self.box_info.append(f' * CONVERSION FINISHED *')
+            self.box_info.append(f' ***************************\n')
 
-            self.box_info.append(f'Processing input file(s) {", ".join(self.xml_fpath)} ...')
-            self.box_info.append(f'Converting xml file(s) to txt ...')
+    def show_logs(self):
+        lines = []
+        while True:
+            try:
+                lines.append(self.log_formatter.format(self.log_queue.get_nowait()))
+            except queue.Empty:
+                break
+        if lines:
+            self.box_info.append('\n'.join(lines))
 
-            if len(self.xml_fpath) == 1:
-                with open(self.xml_fpath[0]) as xml_fp, open(self.txt_fpath[0], 'w') as txt_fp:
-                    xml2txt(xml_fp, txt_fp)
-                
-            else:
-                with ExitStack() as stack, open(self.txt_fpath[0], 'w') as txt_fp:
-                    xml2txt([stack.enter_context(open(fn)) for fn in self.xml_fpath], txt_fp)
-
-            self.box_info.append(f'Saving txt file as {self.txt_fpath} ...')
-            self.box_info.append(f'\n >> XML TO TXT CONVERSION DONE\n')
-
-
-        #FIXME update rest !!!!!!
-        if ext in ('.xml', '.txt'):
-
-            self.box_info.append(f'Converting txt file(s) to pre-json ...')
-            self.box_info.append(f'Saving pre-json file(s) as {self.pre_json_fpath} ...')
-
-            if len(self.txt_fpath) == 1:
-                with open(self.txt_fpath[0]) as txt_fp, open(self.pre_json_fpath[0], 'w') as pre_json_fp: #FIXME TypeError: expected str, bytes or os.PathLike object, not list
-                    try:
-                        parse(txt_fp, pre_json_fp, debug=self.debug_mode)
-                        if self.debug_mode:
-                            with open('isame_parser.log') as parser_logfp:
-                                self.box_info.append(parser_logfp.read())
-                        self.box_info.append(f'\n >> TXT TO PRE-JSON CONVERSION DONE\n')
-                    except Exception as e:
-                        self.box_info.append(f'\nPARSING ABORTED!')
-                        if not self.debug_mode:
-                            self.box_info.append(f'Hint: Use debug mode to find the error.')
-                        return
-            else:
-                with ExitStack() as stack, open(self.pre_json_fpath[0], 'w') as pre_json_fp:
-                    try:
-                        parse([stack.enter_context(open(fn)) for fn in self.txt_fpath], pre_json_fp, debug=self.debug_mode)
-                        if self.debug_mode:
-                            with open('isame_parser.log') as parser_logfp:
-                                self.box_info.append(parser_logfp.read())
-                    except Exception as e:
-                        self.box_info.append(f'\nPARSING ABORTED!')
-                        if not self.debug_mode:
-                            self.box_info.append(f'Hint: Use debug mode to find the error.')
-                        return
-
-            self.box_info.append(f'Converting pre-json file(s) to json ...')
-            self.box_info.append(f'Saving json file(s) as {self.json_fpath} ...')
-
-            if len(self.txt_fpath) == 1:
-                with open(self.pre_json_fpath[0]) as pre_json_fp, open(self.json_fpath[0], 'w') as json_fp:
-                    try:
-                        quran_map(pre_json_fp, json_fp, debug=self.debug_mode)
-                        if self.debug_mode:
-                            with open('isame_mapper.log') as mapper_logfp:
-                                self.box_info.append(mapper_logfp.read())
-                        self.box_info.append(f'\n >> PRE-JSON TO JSON CONVERSION DONE\n')
-                    except Exception as e:
-                        self.box_info.append(f'\nMAPPING ABORTED!')
-                        if not self.debug_mode:
-                            self.box_info.append(f'Hint: Use debug mode to find the error.')
-                        return
-            else:
-                with ExitStack() as stack, open(self.json_fpath[0], 'w') as json_fp:
-                    try:
-                        parse([stack.enter_context(open(fn)) for fn in self.pre_json_fpath], json_fp, debug=self.debug_mode)
-                        if self.debug_mode:
-                            with open('isame_mapper.log') as mapper_logfp:
-                                self.box_info.append(mapper_logfp.read())
-                    except Exception as e:
-                        self.box_info.append(f'\nMAPPING ABORTED!')
-                        if not self.debug_mode:
-                            self.box_info.append(f'Hint: Use debug mode to find the error.')
-                        return
-
-        if ext in ('.xml', '.txt', '.json'):
-
-            self.box_info.append(f'Converting json file(s) to tei ...')
-            self.box_info.append(f'Saving tei file(s) as {self.json_fpath} ...')
-
-            if len(self.json_fpath) == 1:
-                with open(self.json_fpath[0]) as json_fp, open(self.tei_fpath[0], 'w') as tei_fp:
-                    try:
-                        json2tei(json_fp, tei_fp)
-                        if self.debug_mode:
-                            with open('isame_json2tei.log') as json2tei_logfp:
-                                self.box_info.append(json2tei_logfp.read())
-                        self.box_info.append(f'\n >> JSON TO TEI CONVERSION DONE\n')
-                    except Exception as e:
-                        self.box_info.append(f'\nTEI CONVERSION ABORTED!')
-                        #FIXME print ERRORS from log file!!
-                        if not self.debug_mode:
-                            self.box_info.append(f'Hint: Use debug mode to find the error.')
-                        return
-            else:
-                with ExitStack() as stack, open(self.tei_fpath[0], 'w') as tei_fp:
-                    try:
-                        parse([stack.enter_context(open(fn)) for fn in self.json_fpath], tei_fp, debug=self.debug_mode)
-                        if self.debug_mode:
-                            with open('isame_json2tei.log') as json2tei_logfp:
-                                self.box_info.append(json2tei_logfp.read())
-                    except Exception as e:
-                        self.box_info.append(f'\nMAPPING ABORTED!')
-                        if not self.debug_mode:
-                            self.box_info.append(f'Hint: Use debug mode to find the error.')
-                        return
-
-        self.box_info.append(f'\n ***************************') 
-        self.box_info.append(f' * CONVERSION FINISHED *')
-        self.box_info.append(f' ***************************\n') 
+    def closeEvent(self, event):
+        for worker in self.workers.values():
+            worker.cancel()
+        super().closeEvent(event)
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     gui = GUI()
     gui.show()
@@ -14,6 +14,8 @@ import re
 import sys
 from argparse import ArgumentParser, FileType
 
+from isame_transducer import Transducer
+
 
 MAPPING = {
     ' ' : '♯' ,
@@ -56,7 +58,7 @@ MAPPING = {
 
 BASE = ''.join(MAPPING.keys())
 
-REGEX = re.compile('|'.join(MAPPING))
+TRANSDUCER = Transducer(MAPPING)
 
 def ar2latrasm(text, debug=False):
     """ convert Arabic text into Latin rasm.
@@ -83,7 +85,7 @@ def ar2latrasm(text, debug=False):
     text = re.sub(r'ق(?! |$)', 'F', text)
     if debug: print(f'@debug::Q->{text}', file=sys.stderr) #DEBUG
 
-    text = REGEX.sub(lambda m: MAPPING[m.group(0)], text)
+    text = TRANSDUCER(text)
     if debug: print(f'@debug::C->{text}', file=sys.stderr) #DEBUG
 
     return text
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+#
+#    isame.py
+#
+# command line entry point for the InterSaME tools
+#
+# commands:
+#   run    run the processing workflow in a single process (see isame_pipeline.py)
+#   build  build the whole corpus, skipping targets that are up to date (see isame_build.py)
+#   bench  benchmark the workflow on synthetic transcriptions (see isame_bench.py)
+#
+# examples:
+#   $ python isame.py run ../../data/arabic/trans/F001_BnF.Ar.330f-3-trans.xml --json ../../data/arabic/trans/F001_BnF.Ar.330f-6.json \
+#       --tei ../../data/arabic/trans/F001_BnF.Ar.330f-7.xml --csv ../../data/arabic/trans/F001_BnF.Ar.330f-7.csv
+#   $ python isame.py build ../../data/arabic/trans --jobs 4
+#   $ python isame.py bench --scales 1 10 100 bench.json
+#
+##########################################################################################################################################
+
+import sys
+from argparse import ArgumentParser
+
+import isame_pipeline
+import isame_build
+import isame_bench
+from isame_util import setup_logging
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='InterSaME tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run processing workflow: xml2txt -> parse -> quran_map -> json2tei / json2csv')
+    isame_pipeline.add_run_arguments(run_parser)
+
+    build_parser = commands.add_parser('build', help='build whole corpus: HIST-4.txt -> HIST-5-pre.json -> HIST-6.json -> HIST-7.xml / HIST-7-ara.xml / HIST-7.csv')
+    isame_build.add_build_arguments(build_parser)
+
+    bench_parser = commands.add_parser('bench', help='benchmark workflow on synthetic transcriptions: parse -> quran_map -> json2tei / json2csv')
+    isame_bench.add_bench_arguments(bench_parser)
+
+    args = parser.parse_args()
+
+    setup_logging(f'isame_{args.command}', args.debug)
+
+    if args.command == 'run':
+        if len(args.csv_sep) != 1:
+            run_parser.error('separator must be a single character')
+        sys.exit(isame_pipeline.run(args))
+
+    if args.command == 'build':
+        if len(args.csv_sep) != 1:
+            build_parser.error('separator must be a single character')
+        sys.exit(isame_build.run(args))
+
+    if args.command == 'bench':
+        sys.exit(isame_bench.run(args))
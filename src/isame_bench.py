@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+#
+#    isame_bench.py
+#
+# reproducible benchmark of the InterSaME workflow on synthetic transcriptions (see isame_synth.py)
+#
+#   parse -> quran_map -> json2tei / json2csv
+#
+# A document is generated for each scale (number of pages) with the same seed and densities, and each
+# stage is run on it several times. Every run of a stage gets a fresh copy of its input, so stages that
+# modify the pages in place are always measured on the same data. For each stage and scale it reports
+# the wall and cpu time (best and median of the runs), the throughput in blocks per second and the peak
+# of memory allocated during the stage (from an extra run traced with tracemalloc, so tracing does not
+# affect the times). The scaling curves of the stages, i.e. time against number of blocks, are reported
+# together with the exponent of the power law that best fits them (1 means linear).
+#
+# The report is written in json.
+#
+# The stage json2tei measures the rendering of the pages, which does not need the manuscript table for
+# the header of the TEI. The stage json2csv needs the morphological analysis of the Quran unless
+# --no_morph is given, in which case empty analyses are used.
+#
+# examples:
+#   $ python isame_bench.py --scales 1 10 100 > bench.json
+#   $ python isame_bench.py --scales 50 100 200 400 --stages parse quran_map --repeat 5 --seed 1 --density lacuna=0.1 > bench.json
+#   $ python isame_bench.py --no_morph bench.json
+#
+######################################################################################################################################
+
+import os
+import gc
+import io
+import sys
+import copy
+import math
+import time
+import logging
+import platform
+import statistics
+import tracemalloc
+from datetime import datetime
+from importlib import metadata
+from collections import defaultdict
+from tempfile import TemporaryDirectory
+from argparse import ArgumentParser, FileType
+try:
+    import ujson as json
+except ImportError:
+    import json
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from isame_synth import DENSITIES, LINES_PER_PAGE, WORDS_PER_LINE, InterSaMESynthError, generate, parse_densities, parse_qindex
+from isame_parser import InterSaMESyntaxError, parse_text
+from isame_mapper import InterSaMEMappingError, map_struct
+from isame_json2tei import DEFAULT_WORD_SEP, InterSaMETeiError, render_body
+from isame_json2csv import SEP, InterSaMECsvError, json2csv, load_morphology
+from isame_morph_store import MORPH_FIELDS
+from isame_util import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# increase when the content of the report changes
+BENCH_VERSION = 1
+
+STAGES = ('parse', 'quran_map', 'json2tei', 'json2csv')
+SCALES = (1, 4, 16, 64)
+REPEAT = 3
+
+BENCH_ERRORS = (InterSaMESynthError, InterSaMESyntaxError, InterSaMEMappingError, InterSaMETeiError, InterSaMECsvError)
+
+
+class InterSaMEBenchError(Exception):
+    """ Exception for benchmarks that cannot be run.
+
+    """
+    pass
+
+def measure(func, prepare, repeat=REPEAT, memory=True):
+    """ run func several times, each one on a fresh input, and measure it.
+
+    Args:
+        func (callable): function to measure. It takes the input returned by prepare.
+        prepare (callable): function returning the input of func. It is not measured.
+        repeat (int): number of timed runs.
+        memory (bool): measure the peak of memory in an extra run.
+
+    Return:
+        dict, object: measures (wall and cpu seconds of the best run and the median, and peak of memory
+            in KiB or None) and the output of the last run.
+
+    """
+    walls, cpus = [], []
+    for _ in range(repeat):
+        arg = prepare()
+        gc.collect()
+        wall, cpu = time.perf_counter(), time.process_time()
+        out = func(arg)
+        walls.append(time.perf_counter()-wall)
+        cpus.append(time.process_time()-cpu)
+
+    peak = None
+    if memory:
+        arg = prepare()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func(arg)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {'wall' : round(min(walls), 6),
+            'wall_median' : round(statistics.median(walls), 6),
+            'cpu' : round(min(cpus), 6),
+            'cpu_median' : round(statistics.median(cpus), 6),
+            'peak_kib' : round(peak/1024, 1) if peak is not None else None}, out
+
+def scaling_exponent(sizes, times):
+    """ fit times = c * sizes**k by least squares in log-log scale.
+
+    Args:
+        sizes (list): sizes of the inputs.
+        times (list): time spent for each size.
+
+    Return:
+        float: exponent k, None if there are less than two different sizes.
+
+    """
+    points = [(math.log(x), math.log(y)) for x, y in zip(sizes, times) if x > 0 and y > 0]
+    if len(set(x for x, _ in points)) < 2:
+        return None
+
+    mean_x = statistics.fmean(x for x, _ in points)
+    mean_y = statistics.fmean(y for _, y in points)
+    return round(sum((x-mean_x)*(y-mean_y) for x, y in points) / sum((x-mean_x)**2 for x, _ in points), 3)
+
+def bench_scale(pages,
+                stages = STAGES,
+                repeat = REPEAT,
+                memory = True,
+                morf_ref = None,
+                start = (1, 1),
+                lines_per_page = LINES_PER_PAGE,
+                words_per_line = WORDS_PER_LINE,
+                densities = None,
+                seed = 0):
+    """ generate a synthetic document and measure the stages on it.
+
+    Stages not requested are run once, without measuring them, if a later stage needs their output.
+
+    Args:
+        pages (int): number of pages of the document.
+        stages (list): stages to measure.
+        repeat (int): number of timed runs of each stage.
+        memory (bool): measure the peak of memory of each stage.
+        morf_ref (dict): morphological analysis as returned by isame_json2csv.load_morphology.
+        start (tuple): sura and vers where the document starts.
+        lines_per_page (int): number of lines of a page.
+        words_per_line (int): average number of words in a line.
+        densities (dict): probability of each feature of the document, see isame_synth.DENSITIES.
+        seed (int): seed of the random generator.
+
+    Return:
+        dict: size of the document (pages, lines, words, annotations and blocks) and measures of each stage.
+
+    """
+    text, indexes, stats = generate(pages, start, lines_per_page, words_per_line, densities, seed)
+
+    result = {**stats, 'chars' : len(text), 'stages' : {}}
+
+    def _run(stage, func, prepare):
+        if stage in stages:
+            logger.info('%s pages: %s', pages, stage)
+            result['stages'][stage], out = measure(func, prepare, repeat, memory)
+            return out
+        return func(prepare())
+
+    with TemporaryDirectory() as tmpdir:
+        index_fname = os.path.join(tmpdir, 'isame_indexes.json')
+        with open(index_fname, 'w') as index_fp:
+            json.dump(indexes, index_fp)
+
+        parsed = _run('parse', lambda text: parse_text(text, index_fname), lambda: text)
+
+    result['blocks'] = sum(len(item['page']['blocks']) for item in parsed)
+
+    if any(s in stages for s in STAGES[1:]):
+        mapped = _run('quran_map', map_struct, lambda: copy.deepcopy(parsed))
+
+        if 'json2tei' in stages:
+            _run('json2tei', lambda struct: render_body(struct, DEFAULT_WORD_SEP), lambda: copy.deepcopy(mapped))
+
+        if 'json2csv' in stages:
+            _run('json2csv', lambda struct: json2csv(struct, io.StringIO(), morf_ref, sep=SEP), lambda: copy.deepcopy(mapped))
+
+    for measures in result['stages'].values():
+        measures['blocks_per_s'] = round(result['blocks']/measures['wall'], 1) if measures['wall'] else None
+
+    return result
+
+def scaling_curves(results):
+    """ collect the measures of each stage across scales.
+
+    Args:
+        results (list): results of bench_scale, one for each scale.
+
+    Return:
+        dict: stage -> pages, blocks, wall, blocks_per_s and peak_kib of each scale, and exponent of the fit
+            of wall time against blocks.
+
+    """
+    curves = {}
+    for stage in STAGES:
+        points = [(res, res['stages'][stage]) for res in results if stage in res['stages']]
+        if not points:
+            continue
+        curves[stage] = {'pages' : [res['pages'] for res, _ in points],
+                         'blocks' : [res['blocks'] for res, _ in points],
+                         'wall' : [m['wall'] for _, m in points],
+                         'blocks_per_s' : [m['blocks_per_s'] for _, m in points],
+                         'peak_kib' : [m['peak_kib'] for _, m in points],
+                         'exponent' : scaling_exponent([res['blocks'] for res, _ in points], [m['wall'] for _, m in points])}
+    return curves
+
+def bench(scales = SCALES,
+          stages = STAGES,
+          repeat = REPEAT,
+          memory = True,
+          morf_ref = None,
+          start = (1, 1),
+          lines_per_page = LINES_PER_PAGE,
+          words_per_line = WORDS_PER_LINE,
+          densities = None,
+          seed = 0):
+    """ run the benchmark at several scales.
+
+    Args:
+        scales (list): number of pages of each document.
+        stages (list): stages to measure.
+        repeat (int): number of timed runs of each stage.
+        memory (bool): measure the peak of memory of each stage.
+        morf_ref (dict): morphological analysis as returned by isame_json2csv.load_morphology.
+            Only needed for json2csv.
+        start (tuple): sura and vers where the documents start.
+        lines_per_page (int): number of lines of a page.
+        words_per_line (int): average number of words in a line.
+        densities (dict): probability of each feature of the documents, see isame_synth.DENSITIES.
+        seed (int): seed of the random generator.
+
+    Return:
+        dict: report with the environment, the settings, the results of each scale and the scaling curves.
+
+    Raise:
+        InterSaMEBenchError: if the settings are not valid or a stage fails.
+
+    """
+    if repeat < 1:
+        raise InterSaMEBenchError('the number of runs must be at least 1')
+    if (unknown := set(stages) - set(STAGES)):
+        raise InterSaMEBenchError(f'unknown stages {", ".join(sorted(unknown))}')
+    if 'json2csv' in stages and morf_ref is None:
+        raise InterSaMEBenchError('json2csv needs the morphological analysis')
+
+    densities = {**DENSITIES, **(densities or {})}
+
+    results = []
+    try:
+        for pages in sorted(set(scales)):
+            results.append(bench_scale(pages, stages, repeat, memory, morf_ref, start, lines_per_page, words_per_line, densities, seed))
+    except BENCH_ERRORS as e:
+        raise InterSaMEBenchError(f'{type(e).__name__} in benchmark of {pages} pages: {e}')
+
+    try:
+        rasm_version = metadata.version('rasm')
+    except metadata.PackageNotFoundError:
+        rasm_version = None
+
+    return {'version' : BENCH_VERSION,
+            'date' : datetime.now().isoformat(timespec='seconds'),
+            'environment' : {'python' : platform.python_version(),
+                             'implementation' : platform.python_implementation(),
+                             'platform' : platform.platform(),
+                             'rasm' : rasm_version,
+                             'max_rss_kib' : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None},
+            'settings' : {'stages' : [s for s in STAGES if s in stages],
+                          'repeat' : repeat,
+                          'seed' : seed,
+                          'start' : list(start),
+                          'lines_per_page' : lines_per_page,
+                          'words_per_line' : words_per_line,
+                          'densities' : densities},
+            'scales' : results,
+            'curves' : scaling_curves(results)}
+
+def print_summary(report, outfp=sys.stderr):
+    """ print the throughput of each stage at each scale.
+
+    Args:
+        report (dict): report as returned by bench.
+        outfp (io.TextIOWrapper): output stream.
+
+    """
+    stages = report['settings']['stages']
+    print('pages'.rjust(7) + 'blocks'.rjust(10) + ''.join(s.rjust(14) for s in stages) + '   (blocks/s)', file=outfp)
+    for res in report['scales']:
+        print(str(res['pages']).rjust(7) + str(res['blocks']).rjust(10) +
+              ''.join(str(res['stages'][s]['blocks_per_s']).rjust(14) for s in stages), file=outfp)
+    print('exponent'.ljust(17) + ''.join(str(report['curves'][s]['exponent']).rjust(14) for s in stages), file=outfp)
+
+def add_bench_arguments(parser):
+    """ add arguments of the bench command to parser.
+
+    Args:
+        parser (argparse.ArgumentParser): command line parser.
+
+    """
+    parser.add_argument('outfile', nargs='?', type=FileType('w'), default=sys.stdout, help='json report [default stdout]')
+    parser.add_argument('--scales', nargs='+', type=int, default=list(SCALES), metavar='PAGES',
+                        help=f'number of pages of each document [default {" ".join(map(str, SCALES))}]')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES), help='stages to measure [default all]')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help=f'timed runs of each stage [default {REPEAT}]')
+    parser.add_argument('--no_memory', action='store_true', help='do not measure the peak of memory')
+    parser.add_argument('--no_morph', action='store_true', help='use empty morphological analyses for json2csv')
+    parser.add_argument('--start', default='1:1', help='sura:vers where the documents start [default 1:1]')
+    parser.add_argument('--lines', type=int, default=LINES_PER_PAGE, help=f'lines per page [default {LINES_PER_PAGE}]')
+    parser.add_argument('--words', type=int, default=WORDS_PER_LINE, help=f'average words per line [default {WORDS_PER_LINE}]')
+    parser.add_argument('--density', nargs='+', default=[], metavar='FEATURE=P',
+                        help=f'probability of a feature of the documents, one of {", ".join(DENSITIES)}')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator [default 0]')
+    parser.add_argument('--debug', action='store_true', help='debug mode')
+
+def run(args):
+    """ run the benchmark with the command line arguments added by add_bench_arguments.
+
+    Args:
+        args (argparse.Namespace): parsed arguments.
+
+    Return:
+        int: exit status.
+
+    """
+    try:
+        morf_ref = None
+        if 'json2csv' in args.stages:
+            if args.no_morph:
+                morf_ref = defaultdict(lambda: dict.fromkeys(MORPH_FIELDS, ''))
+            else:
+                morf_ref = load_morphology()
+
+        report = bench(args.scales, args.stages, args.repeat, not args.no_memory, morf_ref, parse_qindex(args.start),
+                       args.lines, args.words, parse_densities(args.density), args.seed)
+
+    except (InterSaMEBenchError, InterSaMESynthError, OSError) as e:
+        print(f'Fatal error! {e}', file=sys.stderr)
+        return 1
+
+    json.dump(report, args.outfile, indent=2, ensure_ascii=False)
+    args.outfile.write('\n')
+
+    print_summary(report)
+    return 0
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='benchmark InterSaME workflow on synthetic transcriptions')
+    add_bench_arguments(parser)
+    args = parser.parse_args()
+
+    setup_logging('isame_bench', args.debug)
+
+    sys.exit(run(args))
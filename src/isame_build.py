@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+#
+#    isame_build.py
+#
+# build the whole corpus of InterSaME transcriptions, skipping the targets that are up to date
+#
+# Every hist-id with archetype transcriptions in the input directory is built following the naming
+# scheme of the workflow (see isame_main.sh):
+#
+#   HIST_SIG-3-trans.xml ... > HIST-4.txt > HIST-5-pre.json > HIST-6.json > HIST-7.xml
+#                                                                         > HIST-7-ara.xml
+#                                                                         > HIST-7.csv
+#
+# The digest of a target is calculated from the content of its inputs, the data files it depends on,
+# the source of the tools that produce it and the options of the build. A target is only built again
+# if its digest has changed since the last build, which is recorded in a state file in the output
+# directory. Since digests use the content of the inputs, a target that is built again with the same
+# result does not force the rebuilding of the following ones.
+#
+# Hist-ids are independent from each other and they are built concurrently in a pool of processes.
+#
+# examples:
+#   $ python isame_build.py ../../data/arabic/trans --jobs 4
+#   $ python isame_build.py ../../data/arabic/trans --hist_ids F001 D001 --targets tei csv
+#   $ python isame_build.py ../../data/arabic/trans --force --targets json
+#
+##################################################################################################
+
+import os
+import re
+import sys
+import glob
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from argparse import ArgumentParser
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from isame_settings import SETTINGS_PATH
+from isame_catalog import TABLE_FILE
+from isame_parser import INDEXES_FILE
+from isame_json2tei import TEI_TEMPLATE_FILE
+from isame_json2csv import SEP
+from isame_morph_store import DT_QURAN_FNAME
+from isame_pipeline import Pipeline, PIPELINE_ERRORS
+from isame_util import setup_logging, tool_sources, package_version, fingerprint, write_atomic
+
+# increase when the way targets are built changes, so that all of them are built again
+BUILD_VERSION = 2
+
+STATE_FILE = '.isame_build.json'
+
+XML_REGEX = re.compile(r'^(?P<hist_id>[FDU][0-9]{3})_(?P<sig>.+)-3-trans\.xml$')
+
+# target -> suffix of output file, input target, tool module, data files (keys of data_files)
+# targets are listed in the order they have to be built
+TARGETS = {
+    'txt'      : ('-4.txt',      'xml',      'isame_xml2txt',  ('settings',)),
+    'pre_json' : ('-5-pre.json', 'txt',      'isame_parser',   ('indexes', 'table')),
+    'json'     : ('-6.json',     'pre_json', 'isame_mapper',   ()),
+    'tei'      : ('-7.xml',      'json',     'isame_json2tei', ('template', 'table', 'indexes')),
+    'tei_ara'  : ('-7-ara.xml',  'json',     'isame_json2tei', ('template', 'table', 'indexes')),
+    'csv'      : ('-7.csv',      'json',     'isame_json2csv', ('morph',)),
+}
+
+# external packages whose version is part of the digest of the tools
+PACKAGES = ('rasm',)
+
+RAN = 'ran'
+CACHED = 'cached'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class InterSaMEBuildError(Exception):
+    """ Exception for inputs of the build that cannot be found.
+
+    """
+    pass
+
+
+def discover(indir, hist_ids=None):
+    """ find the archetype transcriptions of each hist-id in indir.
+
+    Args:
+        indir (str): directory with the transcriptions (HIST_SIG-3-trans.xml).
+        hist_ids (list): hist-ids to build. If None, all hist-ids found are returned.
+
+    Return:
+        dict: hist_id -> sorted list of xml files, sorted by hist-id.
+
+    Raise:
+        InterSaMEBuildError: if no transcription is found for any of the hist-ids.
+
+    """
+    found = {}
+    for fname in sorted(glob.glob(os.path.join(indir, '*-3-trans.xml'))):
+        if (m := XML_REGEX.match(os.path.basename(fname))):
+            found.setdefault(m.group('hist_id'), []).append(fname)
+
+    if hist_ids is None:
+        if not found:
+            raise InterSaMEBuildError(f'no transcriptions found in {indir}')
+        return dict(sorted(found.items()))
+
+    missing = [hist_id for hist_id in hist_ids if hist_id not in found]
+    if missing:
+        raise InterSaMEBuildError(f'no transcriptions found in {indir} for {", ".join(missing)}')
+    return {hist_id : found[hist_id] for hist_id in sorted(hist_ids)}
+
+def required_targets(targets):
+    """ add to targets all the targets they depend on.
+
+    Args:
+        targets (iterable): names of targets, from TARGETS.
+
+    Return:
+        list: targets in the order they have to be built.
+
+    """
+    required = set()
+    for target in targets:
+        while target in TARGETS:
+            required.add(target)
+            target = TARGETS[target][1]
+    return [target for target in TARGETS if target in required]
+
+def data_files(target, options):
+    """ get the data files a target depends on, with the paths given in the options of the build.
+
+    Args:
+        target (str): name of target, from TARGETS.
+        options (dict): options of the pipeline.
+
+    Return:
+        list: paths of the data files.
+
+    """
+    fnames = {'settings' : options['settings'],
+              'indexes' : options['index_fname'],
+              'table' : TABLE_FILE,
+              'template' : TEI_TEMPLATE_FILE,
+              'morph' : DT_QURAN_FNAME}
+    return [fnames[name] for name in TARGETS[target][3]]
+
+def tool_digests(targets, stamps):
+    """ calculate the digest of the tools of each target.
+
+    Args:
+        targets (list): names of targets.
+        stamps (dict): fingerprints of files, as returned by fingerprint. It is updated.
+
+    Return:
+        dict: target -> digest of the sources of its tool and the versions of PACKAGES.
+
+    """
+    versions = [(name, package_version(name)) for name in PACKAGES]
+    digests = {}
+    for target in targets:
+        sources = tool_sources(TARGETS[target][2])
+        digests[target] = _digest(versions, [(os.path.basename(fname), file_digest(fname, stamps)) for fname in sources])
+    return digests
+
+def file_digest(fname, stamps):
+    """ get the content hash of a file, using and updating the fingerprints in stamps.
+
+    Args:
+        fname (str): path of file.
+        stamps (dict): path -> fingerprint.
+
+    Return:
+        str: sha1 of the content of fname, None if it does not exist.
+
+    """
+    key = os.path.abspath(fname)
+    stamp = stamps[key] = fingerprint(fname, stamps.get(key))
+    return stamp['sha1'] if stamp else None
+
+def _digest(*parts):
+    """ hash json serialisable parts.
+
+    """
+    return hashlib.sha1(json.dumps([BUILD_VERSION, *parts]).encode('utf-8')).hexdigest()
+
+def _load(target, fname):
+    """ read an intermediate target from its file.
+
+    """
+    with open(fname) as infp:
+        return infp.read() if target == 'txt' else json.load(infp)
+
+def _build_target(target, pipelines, value, fname):
+    """ build a target from the value of its input target and write it into fname.
+
+    Args:
+        target (str): name of target.
+        pipelines (dict): 'lat' and 'ara' configured pipelines.
+        value (object): xml files, text or pages of the input target.
+        fname (str): output file.
+
+    Return:
+        object: value of the target, None for final targets.
+
+    """
+    pipeline = pipelines['lat']
+
+    if target == 'txt':
+        text = pipeline.xml2txt(value)
+        write_atomic(fname, lambda fp: fp.write(text))
+        return text
+
+    if target in ('pre_json', 'json'):
+        struct = pipeline.parse(value) if target == 'pre_json' else pipeline.quran_map(value)
+        write_atomic(fname, lambda fp: json.dump(struct, fp, ensure_ascii=False, indent=4))
+        return struct
+
+    if target in ('tei', 'tei_ara'):
+        write_atomic(fname, lambda fp: pipelines['ara' if target == 'tei_ara' else 'lat'].json2tei(value, fp))
+        return None
+
+    write_atomic(fname, lambda fp: pipeline.json2csv(value, fp))
+    return None
+
+def build_hist(args):
+    """ build the targets of a hist-id, in a worker process.
+
+    Args:
+        args (tuple): hist-id, xml files, output directory, targets, digests of the tools of the targets,
+            previous digests of the targets, fingerprints of files, options of the pipeline and force flag.
+
+    Return:
+        tuple: hist-id, list of (target, status, message), new digests of the built targets and fingerprints
+            of the files used.
+
+    """
+    hist_id, xml_fnames, outdir, targets, tools, old_digests, stamps, options, force = args
+
+    pipelines = {'lat' : Pipeline(**options),
+                 'ara' : Pipeline(**{**options, 'to_ara' : True, 'sep' : ' '})}
+    build_options = {k : v for k, v in options.items() if k not in ('jobs', 'cache_dir', 'debug')}
+
+    fnames = {'xml' : xml_fnames}
+    values = {'xml' : xml_fnames}
+    digests = {}
+    results = []
+    status = {'xml' : CACHED}
+
+    for target in targets:
+        suffix, source, _, _ = TARGETS[target]
+        fname = fnames[target] = os.path.join(outdir, f'{hist_id}{suffix}')
+
+        if status[source] in (FAILED, SKIPPED):
+            status[target] = SKIPPED
+            results.append((target, SKIPPED, f'{source} not available'))
+            continue
+
+        inputs = xml_fnames if source == 'xml' else [fnames[source]]
+        digest = _digest(target, build_options, tools[target],
+                         [(os.path.basename(f), file_digest(f, stamps)) for f in inputs],
+                         [(os.path.basename(f), file_digest(f, stamps)) for f in data_files(target, options)])
+
+        if not force and old_digests.get(fname) == digest and os.path.exists(fname):
+            status[target] = CACHED
+            results.append((target, CACHED, ''))
+            digests[fname] = digest
+            continue
+
+        try:
+            if source not in values:
+                values[source] = _load(source, fnames[source])
+            value = _build_target(target, pipelines, values[source], fname)
+        except (*PIPELINE_ERRORS, OSError, ValueError) as e:
+            status[target] = FAILED
+            results.append((target, FAILED, f'{type(e).__name__}: {e}'))
+            continue
+
+        if value is not None:
+            values[target] = value
+        file_digest(fname, stamps)
+        status[target] = RAN
+        results.append((target, RAN, ''))
+        digests[fname] = digest
+
+    return hist_id, results, digests, stamps
+
+def load_state(fname):
+    """ read the state of the previous build.
+
+    Args:
+        fname (str): state file.
+
+    Return:
+        dict: {'version': int, 'targets': {path: digest}, 'stamps': {path: fingerprint}}. Empty state if the
+            file does not exist, cannot be read or belongs to another version.
+
+    """
+    empty = {'version' : BUILD_VERSION, 'targets' : {}, 'stamps' : {}}
+    try:
+        with open(fname) as infp:
+            state = json.load(infp)
+    except (OSError, ValueError):
+        return empty
+    if not isinstance(state, dict) or state.get('version') != BUILD_VERSION:
+        return empty
+    return {**empty, **state}
+
+def save_state(state, fname):
+    """ write the state of the build.
+
+    Args:
+        state (dict): state as returned by load_state.
+        fname (str): state file.
+
+    """
+    write_atomic(fname, lambda fp: json.dump(state, fp, indent=1))
+
+def build(indir, outdir=None, hist_ids=None, targets=tuple(TARGETS), jobs=1, force=False, state_fname=None,
+          settings=SETTINGS_PATH, index_fname=INDEXES_FILE, cache_dir=None, csv_sep=SEP, debug=False):
+    """ build the corpus.
+
+    Args:
+        indir (str): directory with the transcriptions.
+        outdir (str): directory for the targets. If None, indir is used.
+        hist_ids (list): hist-ids to build. If None, all hist-ids found in indir.
+        targets (iterable): targets to build. The targets they depend on are also built.
+        jobs (int): number of hist-ids built concurrently.
+        force (bool): build targets even if they are up to date.
+        state_fname (str): state file. If None, STATE_FILE in outdir.
+        settings (str): settings file for Archetype transcription editor menus.
+        index_fname (str): json file with start qindexes.
+        cache_dir (str): directory for caching rendered TEI pages.
+        csv_sep (str): csv separator.
+        debug (bool): show debugging info.
+
+    Yield:
+        str, list: hist-id and its results as (target, status, message), as each hist-id is finished.
+
+    Raise:
+        InterSaMEBuildError: if no transcriptions are found.
+
+    """
+    outdir = outdir or indir
+    os.makedirs(outdir, exist_ok=True)
+    state_fname = state_fname or os.path.join(outdir, STATE_FILE)
+
+    found = discover(indir, hist_ids)
+    targets = required_targets(targets)
+    state = load_state(state_fname)
+    tools = tool_digests(targets, state['stamps'])
+    options = {'settings' : settings, 'index_fname' : index_fname, 'cache_dir' : cache_dir, 'csv_sep' : csv_sep,
+               'debug' : debug}
+
+    tasks = [(hist_id, fnames, outdir, targets, tools, state['targets'], state['stamps'], options, force)
+             for hist_id, fnames in found.items()]
+
+    def update(digests, stamps):
+        state['targets'].update(digests)
+        state['stamps'].update(stamps)
+
+    try:
+        if jobs <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                hist_id, results, digests, stamps = build_hist(task)
+                update(digests, stamps)
+                yield hist_id, results
+            return
+
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+            for future in as_completed([executor.submit(build_hist, task) for task in tasks]):
+                hist_id, results, digests, stamps = future.result()
+                update(digests, stamps)
+                yield hist_id, results
+    finally:
+        save_state(state, state_fname)
+
+def print_summary(results, outfp=sys.stdout):
+    """ print the status of each target of each hist-id, the totals and the errors.
+
+    Args:
+        results (dict): hist_id -> list of (target, status, message).
+        outfp (io.TextIOWrapper): output stream.
+
+    Return:
+        dict: status -> number of targets.
+
+    """
+    targets = [target for target in TARGETS if any(t == target for res in results.values() for t, _, _ in res)]
+    width = max([len(t) for t in targets] + [len(SKIPPED)]) + 2
+
+    print('hist_id'.ljust(9) + ''.join(t.ljust(width) for t in targets), file=outfp)
+    for hist_id, res in sorted(results.items()):
+        status = {t : s for t, s, _ in res}
+        print(hist_id.ljust(9) + ''.join(status.get(t, '-').ljust(width) for t in targets), file=outfp)
+
+    totals = {s : 0 for s in (RAN, CACHED, FAILED, SKIPPED)}
+    for res in results.values():
+        for _, s, _ in res:
+            totals[s] += 1
+    print('\n' + ', '.join(f'{s}: {n}' for s, n in totals.items()), file=outfp)
+
+    for hist_id, res in sorted(results.items()):
+        for target, s, message in res:
+            if s == FAILED:
+                print(f'{hist_id} {target}: {message}', file=outfp)
+
+    return totals
+
+def add_build_arguments(parser):
+    """ add arguments of the build command to parser.
+
+    Args:
+        parser (argparse.ArgumentParser): command line parser.
+
+    """
+    parser.add_argument('indir', help='directory with archetype transcriptions (HIST_SIG-3-trans.xml)')
+    parser.add_argument('--outdir', help='directory for the built files [default indir]')
+    parser.add_argument('--hist_ids', nargs='+', metavar='HIST_ID', help='build only these hist-ids')
+    parser.add_argument('--targets', nargs='+', choices=TARGETS, default=list(TARGETS),
+                        help='files to build, together with the files they depend on [default all]')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='number of hist-ids built in parallel [default 1]')
+    parser.add_argument('--force', action='store_true', help='build all targets even if they are up to date')
+    parser.add_argument('--state', metavar='FILE', help=f'state file of the build [default {STATE_FILE} in outdir]')
+    parser.add_argument('--settings', default=SETTINGS_PATH, help='local settings file for archetype')
+    parser.add_argument('--indexes', default=INDEXES_FILE, help='json file with start qindexes')
+    parser.add_argument('--cache', metavar='DIR', help='directory for caching rendered TEI pages')
+    parser.add_argument('--csv_sep', default=SEP, help=f'csv separator [default {SEP}]')
+    parser.add_argument('--debug', action='store_true', help='debug mode')
+
+def run(args):
+    """ build the corpus with the command line arguments added by add_build_arguments.
+
+    Args:
+        args (argparse.Namespace): parsed arguments.
+
+    Return:
+        int: exit status.
+
+    """
+    results = {}
+    try:
+        for hist_id, res in build(args.indir, args.outdir, args.hist_ids, args.targets, args.jobs, args.force, args.state,
+                                  args.settings, args.indexes, args.cache, args.csv_sep, args.debug):
+            results[hist_id] = res
+            print(f'{hist_id}: ' + ', '.join(f'{target} {status}' for target, status, _ in res), file=sys.stderr)
+    except (InterSaMEBuildError, OSError) as e:
+        print(f'Fatal error! {e}', file=sys.stderr)
+        return 1
+
+    totals = print_summary(results)
+    return 1 if totals[FAILED] else 0
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='build InterSaME corpus, skipping targets that are up to date')
+    add_build_arguments(parser)
+    args = parser.parse_args()
+
+    setup_logging('isame_build', args.debug)
+
+    if len(args.csv_sep) != 1:
+        parser.error('separator must be a single character')
+
+    sys.exit(run(args))
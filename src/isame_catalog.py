@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+#
+#    isame_catalog.py
+#
+# compiled catalog of the manuscript metadata (List-of-manuscript-fragments.md) and the start
+# indexes of each folio (isame_indexes.json)
+#
+# Both sources are parsed once and stored in a pickled cache. The cache is versioned and it is
+# only rebuilt when the mtime or the content hash of any of the sources changes.
+#
+# dependencies:
+#   * List-of-manuscript-fragments.md
+#   * isame_indexes.json
+#
+# examples:
+#   $ python isame_catalog.py --sig BnF.Ar.330f
+#   $ python isame_catalog.py --hist_id F001
+#   $ python isame_catalog.py --sig BnF.Ar.330f --folio 1r
+#   $ python isame_catalog.py --rebuild
+#
+##################################################################################################
+
+import os
+import sys
+import pickle
+from argparse import ArgumentParser, FileType
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from isame_util import get_metadata_table, fingerprint, write_atomic
+
+MYPATH = os.path.dirname(os.path.abspath(__file__))
+
+TABLE_FILE = os.path.join(MYPATH, 'List-of-manuscript-fragments.md')
+INDEXES_FILE = os.path.join(MYPATH, 'isame_indexes.json')
+CACHE_FILE = os.path.join(MYPATH, '.isame_catalog.pickle')
+
+# increase when the structure of Catalog changes, so that old caches are discarded
+CATALOG_VERSION = 1
+
+# catalogs already loaded in this process: (table, indexes, cache) -> Catalog
+_LOADED = {}
+
+
+class Catalog:
+    """ indexed view of the manuscript fragments table and the start indexes of the folios.
+
+    Attributes:
+        version (int): version of the catalog structure.
+        stamps (dict): fingerprint of each source, as returned by isame_util.fingerprint.
+        fragments (dict): signature -> row of the fragments table (see util.get_metadata_table).
+        indexes (dict): hist_id -> signature -> folio -> start quranic index.
+        hist_ids (dict): hist_id -> list of signatures.
+        folios (dict): (signature, folio) -> (hist_id, start quranic index).
+
+    """
+    def __init__(self, fragments, indexes, stamps):
+
+        self.version = CATALOG_VERSION
+        self.stamps = stamps
+        self.fragments = fragments
+        self.indexes = indexes
+
+        self.hist_ids = {}
+        for sig, row in fragments.items():
+            if (hist_id := row.get('Hist.ID')) and sig != 'Ms.frgmt ID':
+                self.hist_ids.setdefault(hist_id, []).append(sig)
+
+        self.folios = {}
+        for hist_id, sigs in indexes.items():
+            for sig, folios in sigs.items():
+                if sig not in self.hist_ids.setdefault(hist_id, []):
+                    self.hist_ids[hist_id].append(sig)
+                for folio, ini in folios.items():
+                    self.folios[(sig, folio)] = (hist_id, ini)
+
+    def by_signature(self, sig):
+        """ get the metadata of a fragment.
+
+        Args:
+            sig (str): signature of the fragment.
+
+        Return:
+            dict: row of the fragments table.
+
+        Raise:
+            KeyError: if the signature is not in the table.
+
+        """
+        return self.fragments[sig]
+
+    def by_hist_id(self, hist_id):
+        """ get the metadata of all fragments of a historical item.
+
+        Args:
+            hist_id (str): historical id, e.g. F001.
+
+        Return:
+            list: pairs of signature and row of the fragments table (None if the signature is only in the index file).
+
+        Raise:
+            KeyError: if the hist_id is not in the catalog.
+
+        """
+        return [(sig, self.fragments.get(sig)) for sig in self.hist_ids[hist_id]]
+
+    def by_folio(self, sig, folio):
+        """ get the historical id and start index of a folio.
+
+        Args:
+            sig (str): signature of the fragment.
+            folio (str): folio, e.g. 1r.
+
+        Return:
+            str, list: hist_id and start quranic index (sura, verse, word, block).
+
+        Raise:
+            KeyError: if the folio is not in the index file.
+
+        """
+        return self.folios[(sig, folio)]
+
+    def start_index(self, hist_id, sig, folio):
+        """ get the start quranic index of a folio.
+
+        Args:
+            hist_id (str): historical id, e.g. F001.
+            sig (str): signature of the fragment.
+            folio (str): folio, e.g. 1r.
+
+        Return:
+            list: start quranic index (sura, verse, word, block).
+
+        Raise:
+            KeyError: if the folio is not in the index file for that hist_id and signature.
+
+        """
+        return self.indexes[hist_id][sig][folio]
+
+
+def _same_content(stamps, new_stamps):
+    """ check if two sets of fingerprints correspond to the same content of the sources.
+
+    """
+    return all((stamps.get(k) or {}).get('sha1') == (v or {}).get('sha1') for k, v in new_stamps.items()) and \
+           stamps.keys() == new_stamps.keys()
+
+def build_catalog(table_fname=TABLE_FILE, index_fname=INDEXES_FILE):
+    """ parse the sources and create the catalog.
+
+    Args:
+        table_fname (str): markdown file with the table of manuscript fragments.
+        index_fname (str): json file with the start indexes.
+
+    Return:
+        Catalog: compiled catalog. A source that does not exist produces an empty section.
+
+    """
+    stamps = {'table': fingerprint(table_fname), 'indexes': fingerprint(index_fname)}
+
+    fragments = get_metadata_table(table_fname) if stamps['table'] else {}
+
+    indexes = {}
+    if stamps['indexes']:
+        with open(index_fname) as index_fp:
+            indexes = json.load(index_fp)
+
+    return Catalog(fragments, indexes, stamps)
+
+def load_catalog(table_fname=TABLE_FILE, index_fname=INDEXES_FILE, cache_fname=CACHE_FILE, rebuild=False):
+    """ get the catalog from the cache, or build it if the cache is missing or outdated.
+
+    Args:
+        table_fname (str): markdown file with the table of manuscript fragments.
+        index_fname (str): json file with the start indexes.
+        cache_fname (str): pickle file for storing the compiled catalog. If None, no cache is used.
+        rebuild (bool): force the creation of the catalog.
+
+    Return:
+        Catalog: compiled catalog. If the default index file does not exist, the catalog has no start indexes.
+
+    Raise:
+        FileNotFoundError: if index_fname is not the default index file and it does not exist.
+
+    """
+    if os.path.abspath(index_fname) != INDEXES_FILE and not os.path.isfile(index_fname):
+        raise FileNotFoundError(f'index file {index_fname} not found')
+
+    key = (os.path.abspath(table_fname), os.path.abspath(index_fname), cache_fname)
+
+    catalog = None if rebuild else _LOADED.get(key)
+
+    if not catalog and not rebuild and cache_fname:
+        try:
+            with open(cache_fname, 'rb') as cache_fp:
+                cached_key, catalog = pickle.load(cache_fp)
+            if cached_key != key or catalog.version != CATALOG_VERSION:
+                catalog = None
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+            catalog = None
+
+    dirty = catalog is None or catalog is not _LOADED.get(key)
+
+    if catalog:
+        stamps = {'table': fingerprint(table_fname, catalog.stamps.get('table')),
+                  'indexes': fingerprint(index_fname, catalog.stamps.get('indexes'))}
+        if stamps != catalog.stamps:
+            if _same_content(catalog.stamps, stamps):
+                # the files were touched but not modified
+                catalog.stamps = stamps
+                dirty = True
+            else:
+                catalog = None
+
+    if not catalog:
+        catalog = build_catalog(table_fname, index_fname)
+        dirty = True
+
+    if dirty and cache_fname:
+        try:
+            write_atomic(cache_fname, lambda cache_fp: pickle.dump((key, catalog), cache_fp, protocol=pickle.HIGHEST_PROTOCOL), 'wb')
+        except (OSError, pickle.PicklingError):
+            # the cache is an optimisation, we can work without it
+            pass
+
+    _LOADED[key] = catalog
+
+    return catalog
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='query the compiled catalog of manuscript fragments and start indexes')
+    parser.add_argument('outfile', nargs='?', type=FileType('w'), default=sys.stdout, help='output json file')
+    parser.add_argument('--table', default=TABLE_FILE, help=f'markdown table of manuscript fragments [default {TABLE_FILE}]')
+    parser.add_argument('--indexes', default=INDEXES_FILE, help=f'json file with start qindexes [default {INDEXES_FILE}]')
+    parser.add_argument('--cache', default=CACHE_FILE, help=f'cache file [default {CACHE_FILE}]')
+    parser.add_argument('--rebuild', action='store_true', help='force the compilation of the catalog')
+    parser.add_argument('--sig', help='show metadata of signature')
+    parser.add_argument('--folio', help='show hist_id and start index of folio of signature --sig')
+    parser.add_argument('--hist_id', help='show metadata of all fragments of hist_id')
+    args = parser.parse_args()
+
+    try:
+        catalog = load_catalog(args.table, args.indexes, args.cache, args.rebuild)
+    except FileNotFoundError as e:
+        print(f'Fatal error! {e}', file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        if args.sig and args.folio:
+            hist_id, ini = catalog.by_folio(args.sig, args.folio)
+            out = {'hist_id': hist_id, 'ini_index': ini}
+        elif args.sig:
+            out = catalog.by_signature(args.sig)
+        elif args.hist_id:
+            out = dict(catalog.by_hist_id(args.hist_id))
+        else:
+            out = {'version': catalog.version,
+                   'hist_ids': {h: sorted(sigs) for h, sigs in sorted(catalog.hist_ids.items())},
+                   'nfolios': len(catalog.folios)}
+    except KeyError as e:
+        print(f'Error! {e} not found in catalog', file=sys.stderr)
+        sys.exit(1)
+
+    json.dump(out, args.outfile, ensure_ascii=False, indent=4)
+    print(file=args.outfile)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+#
+#    isame_export.py
+#
+# export InterSaME mapped json into TEI, Arabic TEI and CSV from a single load of the json.
+#
+# The json, the catalog of manuscripts and the morphological analysis are loaded only once. The
+# index of each page (boundaries with the surrounding pages, lines and absent spans of its blocks
+# and the slices of the reference text it needs) is also built once and shared by all writers. The
+# TEI body of the pages is rendered once per word separator, so the Latin and Arabic TEI share it
+# when both use the same separator. The output is identical to running isame_json2tei.py,
+# isame_json2tei.py --ara and isame_json2csv.py separately.
+#
+# examples:
+#   $ python isame_export.py ../../data/arabic/trans/F001-6.json --tei ../../data/arabic/trans/F001-7.xml \
+#       --tei_ara ../../data/arabic/trans/F001-7-ara.xml --csv ../../data/arabic/trans/F001-7.csv
+#
+#   $ cat ../../data/arabic/trans/F001-6.json | python isame_export.py --tei F001-7.xml --csv F001-7.csv --jobs 4
+#
+###########################################################################################################################################################
+
+import sys
+import logging
+from argparse import ArgumentParser, FileType
+
+from isame_json2tei import DEFAULT_WORD_SEP, InterSaMETeiError, render_body, struct2tei, iter_page_boundaries, \
+                           gap_before, gap_after
+from isame_json2csv import SEP as CSV_SEP, InterSaMECsvError, load_morphology, json2csv, absent_spans, reference_blocks
+from isame_get_text import DEFAULT_SOURCE, reference_slice
+from isame_util import calculate_line, read_pages, setup_logging, InterSaMEStreamError
+
+logger = logging.getLogger(__name__)
+
+
+class PageIndex:
+    """ indexes of a page shared by the writers, so that they are calculated once.
+
+    Attributes:
+        prev_qind (tuple): index of final block of previous page or None if page is the first one.
+        next_qind (tuple): index of start block of next page or None if page is the last one.
+        lines (list): line of each block.
+        spans (dict): absent and unclear sections by block, as returned by isame_json2csv.absent_spans.
+        before (list): reference text of the gap before the page, as returned by isame_get_text.reference_slice.
+        after (list): reference text of the gap after the page.
+        ref_blocks (list): reference blocks of the page, as returned by isame_json2csv.reference_blocks.
+
+    """
+    def __init__(self, page_obj, prev_qind, next_qind, tei=True, csv=True, source=DEFAULT_SOURCE):
+
+        page = page_obj['page']
+
+        self.prev_qind = prev_qind
+        self.next_qind = next_qind
+        self.before = self.after = None
+        self.lines = self.spans = self.ref_blocks = None
+
+        if tei:
+            k = 0
+            while not page['blocks'][k]['ind']:
+                k += 1
+            ini_qind = page['blocks'][k]['ind'][0]
+            end_qind = page['blocks'][-1]['ind'][-1] if page['blocks'][-1]['ind'] else page['blocks'][-2]['ind'][-1]
+            self.before = reference_slice(gap_before(prev_qind, ini_qind), ini_qind)
+            self.after = reference_slice(end_qind, gap_after(end_qind, next_qind))
+
+        if csv:
+            self.lines = [calculate_line(page['lines'], i) for i in range(len(page['blocks']))]
+            self.spans = absent_spans(page['lacunas'], page['illegible'], page['unclear'])
+            self.ref_blocks = reference_blocks(page, source)
+
+def page_indexes(struct, tei=True, csv=True, source=DEFAULT_SOURCE):
+    """ build the shared index of each page.
+
+    Args:
+        struct (list): json object containing all pages along with their editions.
+        tei (bool): include what the TEI writers need.
+        csv (bool): include what the csv writer needs.
+        source (str): quranic source for rasm in csv.
+
+    Return:
+        list: PageIndex of each page, in page order.
+
+    """
+    return [PageIndex(page, prev_qind, next_qind, tei, csv, source) for page, prev_qind, next_qind in iter_page_boundaries(struct)]
+
+
+def export(struct,
+           tei_fp = None,
+           tei_ara_fp = None,
+           csv_fp = None,
+           template = None,
+           sep = DEFAULT_WORD_SEP,
+           ara_sep = ' ',
+           csv_sep = CSV_SEP,
+           source = DEFAULT_SOURCE,
+           no_sign = False,
+           jobs = 1,
+           cache_dir = None):
+    """ write all requested outputs of an InterSaME structure.
+
+    Args:
+        struct (list): json object containing all pages along with their editions, e.g. as returned by isame_util.read_pages.
+        tei_fp (io.TextIOWrapper): output TEI file, None for not creating it.
+        tei_ara_fp (io.TextIOWrapper): output TEI file in Arabic script, None for not creating it.
+        csv_fp (io.TextIOWrapper): output csv file, None for not creating it.
+        template (str): xml template for the tei. If None, TEI_TEMPLATE_FILE is used.
+        sep (str): word separator of TEI.
+        ara_sep (str): word separator of Arabic TEI.
+        csv_sep (str): separator of csv.
+        source (str): quranic source for rasm in csv.
+        no_sign (bool): do not add ms signature to csv.
+        jobs (int): number of processes for rendering the pages.
+        cache_dir (str): directory for caching the rendered pages.
+
+    Raise:
+        InterSaMETeiError: if the TEI conversion fails.
+        InterSaMECsvError: if the csv conversion fails.
+
+    """
+    indexes = page_indexes(struct, bool(tei_fp or tei_ara_fp), bool(csv_fp), source)
+
+    # the body of the pages only depends on the separator
+    bodies = {}
+    def get_body(word_sep):
+        if word_sep not in bodies:
+            bodies[word_sep] = render_body(struct, word_sep, jobs=jobs, cache_dir=cache_dir, indexes=indexes)
+        return bodies[word_sep]
+
+    if tei_fp:
+        struct2tei(struct, tei_fp, template, sep, body=get_body(sep))
+
+    if tei_ara_fp:
+        struct2tei(struct, tei_ara_fp, template, ara_sep, to_ara=True, body=get_body(ara_sep))
+
+    if csv_fp:
+        json2csv(struct, csv_fp, load_morphology(), source, no_sign, csv_sep, indexes=indexes)
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='export InterSaME structure to TEI, Arabic TEI and csv')
+    parser.add_argument('infile', nargs='?', type=FileType('r'), default=sys.stdin, help='json file')
+    parser.add_argument('--tei', type=FileType('w'), help='output xml TEI file')
+    parser.add_argument('--tei_ara', type=FileType('w'), help='output xml TEI file in Arabic script')
+    parser.add_argument('--csv', type=FileType('w'), help='output csv file')
+    parser.add_argument('--sep', default=DEFAULT_WORD_SEP, help=f'word separator of TEI (default "{DEFAULT_WORD_SEP}")')
+    parser.add_argument('--ara_sep', default=' ', help='word separator of Arabic TEI (default " ")')
+    parser.add_argument('--csv_sep', default=CSV_SEP, help=f'separator of csv, a single character [default {CSV_SEP}]')
+    parser.add_argument('--source', default=DEFAULT_SOURCE, help=f'quranic source for rasm in csv [default {DEFAULT_SOURCE}]')
+    parser.add_argument('--no_sign', action='store_true', help='do not add ms signature to csv output')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='number of processes for rendering pages in parallel [default 1]')
+    parser.add_argument('--cache', metavar='DIR', help='directory for caching rendered pages')
+    args = parser.parse_args()
+
+    setup_logging('isame_export')
+
+    if not (args.tei or args.tei_ara or args.csv):
+        parser.error('at least one of --tei, --tei_ara or --csv is required')
+
+    try:
+        struct = list(read_pages(args.infile))
+    except InterSaMEStreamError as e:
+        logger.error('Export stopped! previous stage failed: %s', e)
+        sys.exit(1)
+
+    try:
+        export(struct,
+               tei_fp = args.tei,
+               tei_ara_fp = args.tei_ara,
+               csv_fp = args.csv,
+               sep = args.sep,
+               ara_sep = args.ara_sep,
+               csv_sep = args.csv_sep,
+               source = args.source,
+               no_sign = args.no_sign,
+               jobs = args.jobs,
+               cache_dir = args.cache)
+    except InterSaMETeiError:
+        logger.error("TEI Conversion stopped!")
+        sys.exit(1)
+    except InterSaMECsvError as e:
+        print(f'Fatal error! {e}', file=sys.stderr)
+        sys.exit(1)
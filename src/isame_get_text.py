@@ -4,21 +4,41 @@
 #
 # gets Quranic text from index range
 #
+# The whole reference text is loaded once and ranges are answered from memory. Many ranges can be
+# retrieved in a single run with --batch, one range per line. With --serve, the text is kept in memory
+# in a local server listening on a Unix socket, and -i/--batch with --socket ask the server instead of
+# loading the text again. If the server is not running, the text is loaded locally.
+#
 # example:
 #   $ python isame_get_text.py -i 4:95:17-4:105:9 | xclip -selection clipboard  # F014_BnF.Ar.338c
 #
+#   $ cat ranges.txt | python isame_get_text.py --batch - > texts.txt
+#
+#   $ python isame_get_text.py --serve &
+#   $ python isame_get_text.py -i 4:95:17-4:105:9 --socket
+#
 ##################################################################################################
 
+import os
 import re
 import sys
+import socket
+import asyncio
+import tempfile
 from itertools import groupby
+from functools import lru_cache
 from argparse import ArgumentParser, FileType, ArgumentTypeError
 
 from rasm import rasm
 
+from isame_util import NUM_VERSES
+
+DEFAULT_SOURCE = 'tanzil-uthmani'
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f'isame_get_text-{os.getuid()}.sock')
+
 def parse_index_range(arg):
     """ Check if arg's format is correct, i.e., i:j:k-n:p:q
-        
+
     Args:
         arg (startr): quranic index range.
 
@@ -35,20 +55,278 @@ def parse_index_range(arg):
 
     raise ArgumentTypeError('arg must be a complete quranic range index, e.g. 2:31:2-2:134:4')
 
+def format_index_range(index_range):
+    """ inverse of parse_index_range.
+
+    """
+    (i, j, k, _), (n, p, q, _) = index_range
+    return f'{i}:{j}:{k}-{n}:{p}:{q}'
+
+class QuranText:
+    """ words of the reference Quran kept in memory.
+
+    Attributes:
+        source (str): quranic source for rasm.
+        words (list): words of the Quran in order.
+        verses (list): (sura, verse) of each word.
+        positions (dict): (sura, verse, word) -> position in words.
+
+    """
+    def __init__(self, source=DEFAULT_SOURCE):
+        self.source = source
+        self.words = []
+        self.verses = []
+        self.positions = {}
+        for w, *_, i in rasm(((1, 1, 1, None), (114, NUM_VERSES[114], None, None)), source=source):
+            self.positions[tuple(i[:3])] = len(self.words)
+            self.words.append(w)
+            self.verses.append((i[0], i[1]))
+
+    def get(self, index_range):
+        """ get text of index range.
+
+        Args:
+            index_range ((int, int, int, int), (int, int, int, int)): range as returned by parse_index_range.
+
+        Return:
+            str: words of each verse followed by the verse index, e.g. "... 4:95 ... 4:96 ".
+
+        Raise:
+            KeyError: if any of the indexes is not found in the Quran.
+
+        """
+        ini = self.positions[tuple(index_range[0][:3])]
+        end = self.positions[tuple(index_range[1][:3])]
+        out = []
+        for (sura, vers), positions in groupby(range(ini, end+1), key=self.verses.__getitem__):
+            out.append(f'{" ".join(self.words[k] for k in positions)} {sura}:{vers} ')
+        return ''.join(out)
+
+@lru_cache(maxsize=None)
+def load_quran_text(source=DEFAULT_SOURCE):
+    """ get the reference text, loading it only the first time.
+
+    Args:
+        source (str): quranic source for rasm.
+
+    Return:
+        QuranText: words of the Quran.
+
+    """
+    return QuranText(source)
+
+def get_range_text(index_range, source=DEFAULT_SOURCE):
+    """ get text of index range asking rasm only for the range, without loading the whole text. Used for
+    single queries, where building QuranText would cost more than the query.
+
+    Args:
+        index_range ((int, int, int, int), (int, int, int, int)): range as returned by parse_index_range.
+        source (str): quranic source for rasm.
+
+    Return:
+        str: words of each verse followed by the verse index, as returned by QuranText.get.
+
+    """
+    words = ((w, i) for w, *_, i in rasm(index_range, source=source))
+    return ''.join(f'{" ".join(w for w, _ in verse)} {sura}:{vers} '
+                   for (sura, vers), verse in groupby(words, key=lambda x: (x[1][0], x[1][1])))
+
+def reference_slice(ini, end, source=DEFAULT_SOURCE):
+    """ get the blocks of the reference text in an index range, grouped by word.
+
+    Args:
+        ini (tuple): quranic index where the range starts.
+        end (tuple): quranic index where the range ends.
+        source (str): quranic source for rasm.
+
+    Return:
+        list: blocks of each word, as yielded by rasm with blocks and paleo.
+
+    """
+    return [bks for _, bks in rasm((ini, end), source=source, blocks=True, paleo=True)]
+
+def answer(quran, query):
+    """ get text of a range given as text.
+
+    Args:
+        quran (QuranText): reference text.
+        query (str): range, e.g. 2:31:2-2:134:4.
+
+    Return:
+        str: text of range.
+
+    Raise:
+        ValueError: if the range is malformed or out of the Quran.
+
+    """
+    try:
+        return quran.get(parse_index_range(query.strip()))
+    except ArgumentTypeError as e:
+        raise ValueError(f'{query.strip()}: {e}')
+    except KeyError as e:
+        raise ValueError(f'{query.strip()}: index {":".join(map(str, e.args[0]))} not found')
+
+def get_texts(quran, lines, outfp):
+    """ get the text of each range in lines and write one result per line in outfp.
+
+    Empty lines are written for malformed ranges, so that results are aligned with the input.
+
+    Args:
+        quran (QuranText or RemoteQuranText): reference text.
+        lines (iterable): ranges, one per line.
+        outfp (io.TextIOWrapper): output stream.
+
+    Return:
+        int: number of ranges that could not be retrieved.
+
+    """
+    nerrors = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            print(answer(quran, line), file=outfp)
+        except ValueError as e:
+            print(f'Error! {e}', file=sys.stderr)
+            print(file=outfp)
+            nerrors += 1
+    return nerrors
+
+async def _handle_client(reader, writer, quran):
+    """ answer the ranges sent by a client, one per line. Each answer is one line, starting with
+    ERROR if the range could not be retrieved.
+
+    """
+    try:
+        while (line := await reader.readline()):
+            query = line.decode('utf-8')
+            if not query.strip():
+                continue
+            try:
+                writer.write(f'{answer(quran, query)}\n'.encode('utf-8'))
+            except ValueError as e:
+                writer.write(f'ERROR {e}\n'.encode('utf-8'))
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def serve(quran, path=DEFAULT_SOCKET):
+    """ answer range queries on a Unix socket until the process is stopped.
+
+    Args:
+        quran (QuranText): reference text.
+        path (str): path of socket.
+
+    Raise:
+        FileExistsError: if a server is already listening on path.
+
+    """
+    if os.path.exists(path):
+        if (client := connect(path)):
+            client.close()
+            raise FileExistsError(f'server already running on {path}')
+        # stale socket left by a server that did not exit cleanly
+        os.remove(path)
+    server = await asyncio.start_unix_server(lambda r, w: _handle_client(r, w, quran), path=path)
+    print(f'serving on {path}', file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+class RemoteQuranText:
+    """ client of the server started with serve, with the interface of QuranText.
+
+    """
+    def __init__(self, path=DEFAULT_SOCKET):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(path)
+        self._fp = self._sock.makefile('rwb')
+
+    def get(self, index_range):
+        self._fp.write(f'{format_index_range(index_range)}\n'.encode('utf-8'))
+        self._fp.flush()
+        reply = self._fp.readline().decode('utf-8').rstrip('\n')
+        if reply.startswith('ERROR '):
+            raise ValueError(reply[len('ERROR '):])
+        return reply
+
+    def close(self):
+        self._fp.close()
+        self._sock.close()
+
+def connect(path=DEFAULT_SOCKET):
+    """ connect to the server, if it is running.
+
+    Args:
+        path (str): path of socket.
+
+    Return:
+        RemoteQuranText: client, or None if the server is not available.
+
+    """
+    try:
+        return RemoteQuranText(path)
+    except OSError:
+        return None
+
+
 if __name__ == '__main__':
 
     parser = ArgumentParser(description='gets Quranic text from index range')
     parser.add_argument('--index', '-i', type=parse_index_range, help='index range')
+    parser.add_argument('--batch', '-b', type=FileType('r'), help='file with one index range per line ("-" for stdin); one text per line is written')
+    parser.add_argument('--serve', action='store_true', help='keep the text in memory and answer queries on a Unix socket')
+    parser.add_argument('--socket', nargs='?', const=DEFAULT_SOCKET, help=f'ask the server on this socket [default {DEFAULT_SOCKET}]')
+    parser.add_argument('--source', default=DEFAULT_SOURCE, help=f'quranic source for rasm [default {DEFAULT_SOURCE}]')
     parser.add_argument('outfile', nargs='?', type=FileType('w'), default=sys.stdout, help='output file')
     args = parser.parse_args()
 
+    if args.serve:
+        try:
+            asyncio.run(serve(load_quran_text(args.source), args.socket or DEFAULT_SOCKET))
+        except KeyboardInterrupt:
+            pass
+        except FileExistsError as e:
+            print(f'Fatal error! {e}', file=sys.stderr)
+            sys.exit(1)
+        sys.exit(0)
+
+    if not args.index and not args.batch:
+        parser.error('one of --index, --batch or --serve is required')
+
+    # the server only answers queries as text
+    remote = connect(args.socket) if args.socket else None
+    if args.socket and not remote:
+        print(f'Warning! server not available on {args.socket}, loading text', file=sys.stderr)
+
+    # a single query only needs its range, do not load the whole text
+    quran = remote or (None if args.index else load_quran_text(args.source))
+
+    nerrors = 0
     try:
-        verses = groupby(((w, i) for w, *_, i in rasm(args.index, source='tanzil-uthmani')), key=lambda x: (x[1][0], x[1][1]))
-        for index, verse in verses:
-            print(' '.join(w for w, _ in verse), f'{index[0]}:{index[1]} ', end='', file=args.outfile)
+        if args.index:
+            try:
+                text = quran.get(args.index) if quran else get_range_text(args.index, args.source)
+                print(text, end='', file=args.outfile)
+            except KeyError as e:
+                print(f'Error! index {":".join(map(str, e.args[0]))} not found', file=sys.stderr)
+                nerrors += 1
+            except ValueError as e:
+                print(f'Error! {e}', file=sys.stderr)
+                nerrors += 1
+        else:
+            nerrors = get_texts(quran, args.batch, args.outfile)
 
     except (BrokenPipeError, IOError):
         pass
 
-    sys.stderr.close()
+    if remote:
+        remote.close()
 
+    sys.stderr.close()
+    sys.exit(1 if nerrors else 0)
@@ -16,26 +16,39 @@
 #
 # example:
 #   $ cat ../../data/arabic/trans/F001-6.json | python isame_json2csv.py > ../../data/arabic/trans/F001.csv
+#   $ cat ../../data/arabic/trans/F001-6.json | python isame_json2csv.py --columnar ../../data/arabic/trans/F001.parquet > ../../data/arabic/trans/F001.csv
+#   $ python isame_json2csv.py ../../data/arabic/trans/F001-6.json F001.csv --profile F001-csv-profile.json
 #
 ##############################################################################################################
 
 import os
 import re
+import csv
 import sys
+import sqlite3
+from itertools import chain
 from argparse import ArgumentParser, FileType
 try:
     import ujson as json
 except ImportError:
     import json
 
-from rasm import rasm
+from isame_util import calculate_line, to_isame_trans, read_pages, InterSaMEStreamError
+from isame_qindex import QIndex
+from isame_get_text import reference_slice
+from isame_profile import phase, iter_phase, count_page, page_title, add_profile_arguments, setup_profiling_args
+from isame_morph_store import DT_QURAN_FNAME, MORPH_STORE_FNAME, morph_fields, open_store
 
-from isame_util import calculate_line, to_isame_trans
-
-MYPATH = os.path.abspath(os.path.dirname(__file__))
-DT_QURAN_FNAME = os.path.join(MYPATH, '../../../../abjad_util/data/processed/mushaf.json')
 
 SEP = '#'
+
+COLUMNS = ('qindex', 'sign', 'folio', 'side', 'line', 'ms_block', 'disagr_txt', 'disagr', 'fasila', 'khawamis', 'awashir', 'miaa',
+           'ref_paleo', 'ref_ara', 'POS', 'type', 'lemma', 'root', 'afix', 'derv', 'flec')
+
+# typed columns of the columnar output
+QINDEX_COLUMNS = ('sura', 'vers', 'word', 'bloc')
+FLAG_COLUMNS = frozenset(('disagr', 'fasila', 'khawamis', 'awashir', 'miaa'))
+CATEGORICAL_COLUMNS = frozenset(('sign', 'folio', 'side'))
 ASTERIX_REGEX = re.compile(r'(?<=\*)\*+')
 ESTIMATE_REGEX = re.compile(r'[1-9](\-[1-9])?r')
 NORM_ASTERISK_REGEX = re.compile(r'\*+')
@@ -43,10 +56,65 @@ NORM_ASTERISK_REGEX = re.compile(r'\*+')
 # for catching illegible/lacuna sections in non-base layers
 LACUNA_ILLEGIBLE_REGEX = re.compile(r'⟦.+⟧|⟨.+⟩')
 
-def calculate_absent(pos, tok, lacunas, illegible, unclear, limit_inic=None, limit_endc=None):
+class InterSaMECsvError(Exception):
+    """ Error in CSV conversion.
+
+    """
+    pass
+
+def absent_spans(lacunas, illegible, unclear, pos=None):
+    """ index absent (lacuna and illegible) and unclear sections of a page by block.
+
+    Args:
+        lacunas (list): list of lacuna elements.
+        illegible (list): list of illegible elements.
+        unclear (list): list of unclear elements.
+        pos (int): index only this block, None for all blocks of the page.
+
+    Return:
+        dict: block index -> (masks, opens, closes). masks is the sorted list of (inic, endc) character ranges
+            of the block that are absent, endc being None if the range reaches the end of the block. opens and
+            closes map a character offset to the number of unclear sections starting or ending on it.
+
+    """
+    index = {}
+    def get(b):
+        if b not in index:
+            index[b] = ([], {}, {})
+        return index[b]
+
+    for span in chain(lacunas, illegible):
+        inib, endb = span['inib'], span['endb']
+        if pos is not None:
+            if not inib <= pos <= endb:
+                continue
+            blocks = (pos,)
+        else:
+            blocks = range(inib, endb+1)
+        for b in blocks:
+            get(b)[0].append((span['inic'] if b == inib else 0, span['endc'] if b == endb else None))
+
+    for unc in unclear:
+        if pos is None or unc['inib'] == pos:
+            opens = get(unc['inib'])[1]
+            opens[unc['inic']] = opens.get(unc['inic'], 0) + 1
+        if pos is None or unc['endb'] == pos:
+            closes = get(unc['endb'])[2]
+            closes[unc['endc']] = closes.get(unc['endc'], 0) + 1
+
+    for masks, _, _ in index.values():
+        masks.sort(key=lambda m: m[0])
+
+    return index
+
+def calculate_absent(pos, tok, lacunas, illegible, unclear, limit_inic=None, limit_endc=None, spans=None):
     """ remove lacunas and illegible from tok and fill the missing parts with *.
     Mark unclear sections with {}.
 
+    The block is copied in slices between the boundaries of its absent and unclear sections, so the cost
+    does not depend on the length of the sections. When processing a whole page, pass the index created
+    by absent_spans in spans, so that the sections of the page are only scanned once.
+
     Args:
         pos (int): ndex of token tok.
         tok (str): token to modify.
@@ -55,65 +123,56 @@ def calculate_absent(pos, tok, lacunas, illegible, unclear, limit_inic=None, lim
         unclear (list): list of unclear elements.
         limit_inic (int): offset to initial character form block to show in results, None if not applicable.
         limit_endc (int): offset to final character form block to show in results, None if not applicable.
+        spans (dict): index of sections of the page as returned by absent_spans, None for calculating it.
 
     Return:
         srt: modified string
 
     """
-    new_tok = []
-    for i, c in enumerate(tok):
+    if spans is None:
+        spans = absent_spans(lacunas, illegible, unclear, pos)
 
-        if limit_inic and i < limit_inic:
-            continue
+    ini = max(limit_inic, 0) if limit_inic else 0
+    end = min(limit_endc, len(tok)-1) if limit_endc else len(tok)-1
+    if end < ini:
+        return ''
 
-        if limit_endc and i > limit_endc:
+    if pos not in spans:
+        return ASTERIX_REGEX.sub('', tok[ini:end+1]).replace('∅', '')
+
+    masks, opens, closes = spans[pos]
+
+    # merge absent ranges clipped to [ini, end]
+    merged = []
+    for m_ini, m_end in masks:
+        m_ini = max(m_ini, ini)
+        m_end = end if m_end is None else min(m_end, end)
+        if m_ini > m_end:
             continue
+        if merged and m_ini <= merged[-1][1]+1:
+            if m_end > merged[-1][1]:
+                merged[-1][1] = m_end
+        else:
+            merged.append([m_ini, m_end])
+
+    marks = sorted(i for i in opens.keys() | closes.keys() if ini <= i <= end)
 
-        for lac in lacunas:
-            if lac['inib'] == pos:
-                if lac['endb'] == pos:
-                    if lac['inic'] <= i and lac['endc'] >= i:
-                        c = '*'
-                        continue
-                elif lac['endb'] > pos:
-                    if lac['inic'] <= i:
-                        c = '*'
-                        continue
-            elif lac['inib'] < pos:
-                if lac['endb'] == pos:
-                    if lac['endc'] >= i:
-                        c = '*'
-                        continue
-                elif lac['endb'] > pos:
-                    c = '*'
-                    continue
-
-        for ill in illegible:
-            if ill['inib'] == pos:
-                if ill['endb'] == pos:
-                    if ill['inic'] <= i and ill['endc'] >= i:
-                        c = '*'
-                        continue
-                elif ill['endb'] > pos:
-                    if ill['inic'] <= i:
-                        c = '*'
-                        continue
-            elif ill['inib'] < pos:
-                if ill['endb'] == pos:
-                    if ill['endc'] >= i:
-                        c = '*'
-                        continue
-                elif ill['endb'] > pos:
-                    c = '*'
-                    continue
-        
-        for unc in unclear:
-            if unc['endb'] == pos and unc['endc'] == i:
-                c = c+'}'
-            if unc['inib'] == pos and unc['inic'] == i:
-                c = '{'+c
-
-        new_tok.append(c)
+    # split block in pieces at the boundaries of absent ranges and around unclear marks
+    cuts = {ini, end+1}
+    cuts.update(b for m_ini, m_end in merged for b in (m_ini, m_end+1))
+    cuts.update(b for i in marks for b in (i, i+1))
+    cuts = sorted(cuts)
+
+    new_tok = []
+    imask = 0
+    for a, b in zip(cuts, cuts[1:]):
+        while imask < len(merged) and merged[imask][1] < a:
+            imask += 1
+        absent = imask < len(merged) and merged[imask][0] <= a
+        piece = '*' if absent else tok[a:b]
+        if b-a == 1 and (a in opens or a in closes):
+            piece = '{'*opens.get(a, 0) + piece + '}'*closes.get(a, 0)
+        new_tok.append(piece)
 
     return ASTERIX_REGEX.sub('', ''.join(new_tok)).replace('∅', '')
 
@@ -172,175 +231,397 @@ def contains_disagr(pos, tok, page):
     #        return '1', base+corr
     #return '0', ''
 
+def load_morphology(fname=DT_QURAN_FNAME, store_fname=MORPH_STORE_FNAME):
+    """ prepare morphological analysis of the Quran.
 
+    The analysis is read lazily from the compiled store (see isame_morph_store), which is created or
+    updated from fname if needed. If the store cannot be written, fname is loaded in memory.
 
-if __name__ == '__main__':
+    Args:
+        fname (str): json file with the morphological analysis of each word of the Quran.
+        store_fname (str): sqlite store compiled from fname.
 
-    parser = ArgumentParser(description='map InterSaME manuscript text to Cairo Quran')
-    parser.add_argument('infile', nargs='?', type=FileType('r'), default=sys.stdin, help='json file')
-    parser.add_argument('outfile', nargs='?', type=FileType('w'), default=sys.stdout, help='csv file')
-    parser.add_argument('--source', default='tanzil-uthmani', help='quranic source for rasm [default tanzil-uthmani]')
-    parser.add_argument('--no_sign', action='store_true', help='do not add ms signature to csv output')
-    parser.add_argument('--sep', default=SEP, help=f'separator [default {SEP}]')
-    parser.add_argument('--debug', action='store_true', help='debug mode')
-    args = parser.parse_args()
+    Return:
+        MorphStore or dict: mapping of (sura, vers, word) to its POS, type, afix, derv, lema, root and flec.
 
-    fragm = json.load(args.infile)
+    """
+    try:
+        return open_store(fname, store_fname)
+    except (OSError, sqlite3.Error) as e:
+        print(f'Warning! morphological store {store_fname} could not be used: {e}', file=sys.stderr)
 
-    sign, folio, side, line = '', '', '', ''
+    with open(fname) as infp:
+        return {(item["sura"], item["vers"], item["word"]): morph_fields(item) for item in json.load(infp)}
 
-    #
-    # prepare morphological analysis
-    #
+def reference_blocks(page, source='tanzil-uthmani', debug=False):
+    """ get the blocks of the reference text from the first to the last block of a page with index.
+
+    Args:
+        page (dict): page information.
+        source (str): quranic source for rasm.
+        debug (bool): debug mode.
+
+    Return:
+        list: arabic text, transcription and QIndex of each block of the reference text.
+
+    """
+    k = 0
+    while not page['blocks'][k]['ind']:
+        k += 1
+    inii = page['blocks'][k]['ind'][0]
+
+    k = -1
+    while not page['blocks'][k]['ind']:
+        k -= 1
+    endi = page['blocks'][k]['ind'][-1]
+
+    if debug: print(f'[[DEBUG-01]] inii={inii} endi={endi}', file=sys.stderr) #DEBUG
+
+    return [(b_ar, to_isame_trans(b_pl), QIndex.from_tuple(b_i)) for bks in reference_slice(inii, endi, source)
+            for b_ar, *_, b_pl, b_i in bks]
+
+def iter_rows(fragm, morf_ref, source='tanzil-uthmani', no_sign=False, debug=False, indexes=None):
+    """ convert InterSaME structure into tabular form.
+
+    Rows of blocks without quranic index, or mapped to the same reference block as the previous one,
+    only contain the columns up to miaa.
+
+    Args:
+        fragm (iterable): pages along with their editions, e.g. as returned by isame_util.read_pages.
+        morf_ref (dict): morphological analysis as returned by load_morphology.
+        source (str): quranic source for rasm.
+        no_sign (bool): do not add ms signature to output.
+        debug (bool): debug mode.
+        indexes (iterable): shared index of each page, as built by isame_export.page_indexes. If None, the
+            index of each page is calculated while converting it.
+
+    Yield:
+        tuple: fields of next row, in the order of get_header.
+
+    Raise:
+        InterSaMECsvError: if a token is empty after processing.
+
+    """
+    indexes = iter(indexes) if indexes else None
+    for page_obj in fragm:
+        index = next(indexes) if indexes else None
+        with phase('render', page_obj['meta']['title']):
+            rows = list(_iter_page_rows(page_obj, morf_ref, source, no_sign, debug, index))
+        count_page('csv', page_obj)
+        yield from rows
+
+def _iter_page_rows(page_obj, morf_ref, source, no_sign, debug, index=None):
+    """ convert a page into tabular form, see iter_rows.
+
+    Args:
+        page_obj (dict): page object with meta and page information.
+        morf_ref (dict): morphological analysis as returned by load_morphology.
+        source (str): quranic source for rasm.
+        no_sign (bool): do not add ms signature to output.
+        debug (bool): debug mode.
+        index (isame_export.PageIndex): lines, absent spans and reference slice of the page, None for calculating them.
 
-    morf_ref = {}
-    with open(DT_QURAN_FNAME) as infp:
-        dt_quran = json.load(infp)
-        for item in dt_quran:
-
-            morf_ref[(item["sura"], item["vers"], item["word"])] = {
-                'POS' : ';'.join((i['POS'] for i in item['morf'])),
-                'type' : ';'.join((i['type'] for i in item['morf'])),
-                'afix' : ';'.join(filter(None, (i['afix'] for i in item['morf']))),
-                'derv' : ';'.join(','.join(x) for x in filter(None, (i['derv'] for i in item['morf']))),
-                'lema' : ';'.join(filter(None, (i['lema'] for i in item['morf']))),
-                'root' : ';'.join(filter(None, (i['root'] for i in item['morf']))),
-                'flec' : ';'.join(','.join(x) for x in filter(None, (i['flec'] for i in item['morf']))),
-            }
+    Yield:
+        tuple: fields of next row.
+
+    Raise:
+        InterSaMECsvError: if a token is empty after processing.
+
+    """
+    # quranic indexes are compared as packed ints and only written as text in the rows
+    def row(fields):
+        qind = str(fields[0])
+        return (qind,) + fields[2:] if no_sign else (qind,) + fields[1:]
+
+    sign = ''
+    folio = page_obj['meta']['folio']
+    side = page_obj['meta']['side']
+    if not no_sign:
+        sign = page_obj['meta']['signature']            
+    page = page_obj['page']
 
     #
-    # process manuscript
+    # prepare reference quran
     #
 
-    hist_id = fragm[0]['meta']['hist_id']
-    out = [f'qindex{args.sep}{"" if args.no_sign else "sign"+args.sep}folio{args.sep}side{args.sep}line{args.sep}ms_block{args.sep}'
-           f'disagr_txt{args.sep}disagr{args.sep}fasila{args.sep}khawamis{args.sep}awashir{args.sep}miaa{args.sep}ref_paleo{args.sep}'
-           f'ref_ara{args.sep}POS{args.sep}type{args.sep}lemma{args.sep}root{args.sep}afix{args.sep}derv{args.sep}flec']
+    if index:
+        ref_blocks, spans, lines = index.ref_blocks, index.spans, index.lines
+    else:
+        ref_blocks = reference_blocks(page, source, debug)
+        spans = absent_spans(page['lacunas'], page['illegible'], page['unclear'])
+        lines = [calculate_line(page['lines'], i) for i in range(len(page['blocks']))]
 
-    for ipage, page_obj in enumerate(fragm):
+    iref = 0
+    qind = ''
 
-        folio = page_obj['meta']['folio']
-        side = page_obj['meta']['side']
-        if not args.no_sign:
-            sign = page_obj['meta']['signature']            
-        page = page_obj['page']
+    for i, bloc in enumerate(page['blocks']):
 
-        #
-        # prepare reference quran
-        #
+        line = str(lines[i])
+        tok = bloc['tok']
 
-        k = 0
-        while not page['blocks'][k]['ind']:
-            k += 1
-        inii = page['blocks'][k]['ind'][0]
+        if debug: print(f'[[DEBUG-02]] line={line}\n[[DEBUG-05]] tok={tok}', file=sys.stderr) #DEBUG
 
-        k = -1
-        while not page['blocks'][k]['ind']:
-            k -= 1
-        endi = page['blocks'][k]['ind'][-1]
+        tok_ms = calculate_absent(i, tok, page['lacunas'], page['illegible'], page['unclear'], spans=spans)
 
-        if args.debug: print(f'[[DEBUG-01]] inii={inii} endi={endi}', file=sys.stderr) #DEBUG
+        if debug: print(f'[[DEBUG-03]] tok_ms={tok_ms}', file=sys.stderr) #DEBUG
 
-        ref_blocks = [(b_ar, to_isame_trans(b_pl), ':'.join(map(str, b_i))) for _, bks in
-                      rasm((inii, endi), source=args.source, paleo=True, blocks=True) for b_ar, *_, b_pl, b_i in bks]
-                      
-        iref = 0
-        qind = ''
+        fasila = '1' if i in page['fasilas'] else '0'
+        khawamis = '1' if i in page['khawamis'] else '0'
+        awashir = '1' if i in page['awashir'] else '0'
+        miaa = '1' if i in page['miaa'] else '0'
 
-        for i, bloc in enumerate(page['blocks']):
+        disagr, disagr_txt = contains_disagr(i, tok, page)
 
-            line = str(calculate_line(page_obj['page']['lines'], i))
-            tok = bloc['tok']
+        # replace illegible/lacuna with *
+        disagr_txt = re.sub('⟦.+?⟧|⟨.+?⟩', '*', disagr_txt)
 
-            if args.debug: print(f'[[DEBUG-02]] line={line}\n[[DEBUG-05]] tok={tok}', file=sys.stderr) #DEBUG
+        # replace illegible/lacuna estimated sections with asterisk
+        tok_ms = ESTIMATE_REGEX.sub('*', tok_ms)
+        disagr_txt = ESTIMATE_REGEX.sub('*', disagr_txt)
+        disagr_txt = LACUNA_ILLEGIBLE_REGEX.sub('*', disagr_txt)
 
-            tok_ms = calculate_absent(i, tok, page['lacunas'], page['illegible'], page['unclear'])
+        # reduce asterisk sequences to one
+        tok_ms = NORM_ASTERISK_REGEX.sub('*', tok_ms)
+        disagr_txt = NORM_ASTERISK_REGEX.sub('*', disagr_txt)
 
-            if args.debug: print(f'[[DEBUG-03]] tok_ms={tok_ms}', file=sys.stderr) #DEBUG
+        if not tok_ms and tok!='∅':
+            raise InterSaMECsvError(f'Empty token "{tok}" after processing at i={i}')
 
-            fasila = '1' if i in page['fasilas'] else '0'
-            khawamis = '1' if i in page['khawamis'] else '0'
-            awashir = '1' if i in page['awashir'] else '0'
-            miaa = '1' if i in page['miaa'] else '0'
+        if not bloc['ind']:
+            if debug: print(f'[[DEBUG-04]] <OUT>', file=sys.stderr) #DEBUG
 
-            disagr, disagr_txt = contains_disagr(i, tok, page)
+            yield row((qind, sign, folio, side, line, tok_ms, disagr_txt, disagr, fasila, khawamis, awashir, miaa))
+            
+            continue
 
-            # replace illegible/lacuna with *
-            disagr_txt = re.sub('⟦.+?⟧|⟨.+?⟩', '*', disagr_txt)
+        qind = QIndex.from_tuple(bloc['ind'][0])
 
-            # replace illegible/lacuna estimated sections with asterisk
-            tok_ms = ESTIMATE_REGEX.sub('*', tok_ms)
-            disagr_txt = ESTIMATE_REGEX.sub('*', disagr_txt)
-            disagr_txt = LACUNA_ILLEGIBLE_REGEX.sub('*', disagr_txt)
+        if debug: print(f'[[DEBUG-05]] qind={qind} iref={iref}', file=sys.stderr) #DEBUG
 
-            # reduce asterisk sequences to one
-            tok_ms = NORM_ASTERISK_REGEX.sub('*', tok_ms)
-            disagr_txt = NORM_ASTERISK_REGEX.sub('*', disagr_txt)
+        try:
+            refbk_ara, refbk_pal, refbk_ind = ref_blocks[iref]
+        except IndexError:
+            print('Warning! Quran index could not be retrieved at: ', qind, sign, folio, side, line, tok_ms, disagr_txt, disagr, fasila,
+                      khawamis, awashir, miaa, refbk_pal, refbk_ara, POS, typ, lema, root, afix, derv, flec, file=sys.stderr)            
 
-            if not tok_ms and tok!='∅':
-                print(f'Fatal error! Empty token "{tok}" after processing at i={i}', file=sys.stderr)
-                sys.exit(1)
+        j = tuple(bloc['ind'][0][:-1])
 
-            if not bloc['ind']:
-                if args.debug: print(f'[[DEBUG-04]] <OUT>', file=sys.stderr) #DEBUG
+        POS = morf_ref[j]['POS']
+        typ = morf_ref[j]['type']
+        afix = morf_ref[j]['afix']
+        derv = morf_ref[j]['derv']
+        lema = morf_ref[j]['lema']
+        root = morf_ref[j]['root']
+        flec = morf_ref[j]['flec']
 
-                out.append(args.sep.join((qind, sign, folio, side, line, tok_ms, disagr_txt, disagr, fasila, khawamis, awashir, miaa)))
+        while refbk_ara in ('۞', '۩'):
+            # this is the only row we don't fill with ms metadata as it does not contain text
+            yield row((refbk_ind, '', '', '', '', '', '', '', '', '', '', '', refbk_pal, refbk_ara, POS, typ, lema, root, afix, derv, flec))
+            iref += 1
+            refbk_ara, refbk_pal, refbk_ind = ref_blocks[iref]
+            if debug: print(f'[[DEBUG-06]] <OUT>', file=sys.stderr) #DEBUG
+
+        if qind == refbk_ind:
+            yield row((qind, sign, folio, side, line, tok_ms, disagr_txt, disagr, fasila, khawamis, awashir, miaa, refbk_pal, refbk_ara, POS, typ, lema, root, afix, derv, flec))
+            if debug: print(f'[[DEBUG-07]] <OUT>', file=sys.stderr) #DEBUG
+        else:
+            # 2 tok in ms -> 1 tok in ref
+            # {"tok": "S,,,B,,+,,Aᵃ→ᵃ←©+ˀ↑", "ind": [[4,78,20,1]], "end": false},
+            # {"tok": "Hᵘ←-ᵘ←!", "ind": [[4,78,20,1]],"end": true},
+            if iref > 0 and qind == ref_blocks[iref-1][-1]:
+                iref -= 1
+                yield row((qind, sign, folio, side, line, tok_ms, disagr_txt, disagr, fasila, khawamis, awashir, miaa))
+                if debug: print(f'[[DEBUG-08]] <OUT>', file=sys.stderr) #DEBUG
                 
-                continue
-
-            qind = ':'.join(map(str, bloc['ind'][0]))
-
-            if args.debug: print(f'[[DEBUG-05]] qind={qind} iref={iref}', file=sys.stderr) #DEBUG
+            else:
+                yield row((refbk_ind, sign, folio, side, line, '', '', '', '', '', '', '', refbk_pal, refbk_ara, POS, typ, lema, root, afix, derv, flec))
+                if debug: print(f'[[DEBUG-09]] <OUT>', file=sys.stderr) #DEBUG
 
-            try:
-                refbk_ara, refbk_pal, refbk_ind = ref_blocks[iref]
-            except IndexError:
-                print('Warning! Quran index could not be retrieved at: ', qind, sign, folio, side, line, tok_ms, disagr_txt, disagr, fasila,
-                          khawamis, awashir, miaa, refbk_pal, refbk_ara, POS, typ, lema, root, afix, derv, flec, file=sys.stderr)            
-
-            j = tuple(bloc['ind'][0][:-1])
-
-            POS = morf_ref[j]['POS']
-            typ = morf_ref[j]['type']
-            afix = morf_ref[j]['afix']
-            derv = morf_ref[j]['derv']
-            lema = morf_ref[j]['lema']
-            root = morf_ref[j]['root']
-            flec = morf_ref[j]['flec']
-
-            while refbk_ara in ('۞', '۩'):
-                # this is the only row we don't fill with ms metadata as it does not contain text
-                out.append(SEP.join((refbk_ind, '', '', '', '', '', '', '', '', '', '', refbk_pal, refbk_ara, POS, typ, lema, root, afix, derv, flec)))
+        if len(bloc['ind'])>1:
+            for _ in bloc['ind'][1:]:
                 iref += 1
                 refbk_ara, refbk_pal, refbk_ind = ref_blocks[iref]
-                if args.debug: print(f'[[DEBUG-06]] <OUT>', file=sys.stderr) #DEBUG
+                yield row((refbk_ind, sign, folio, side, line, '', '', '', '', '', '', '', refbk_pal, refbk_ara, POS, typ, lema, root, afix, derv, flec))
+                if debug: print(f'[[DEBUG-10]] <OUT>', file=sys.stderr) #DEBUG
 
-            if qind == refbk_ind:
-                out.append(args.sep.join((qind, sign, folio, side, line, tok_ms, disagr_txt, disagr, fasila, khawamis, awashir, miaa, refbk_pal, refbk_ara, POS, typ, lema, root, afix, derv, flec)))
-                if args.debug: print(f'[[DEBUG-07]] <OUT>', file=sys.stderr) #DEBUG
-            else:
-                # 2 tok in ms -> 1 tok in ref
-                # {"tok": "S,,,B,,+,,Aᵃ→ᵃ←©+ˀ↑", "ind": [[4,78,20,1]], "end": false},
-                # {"tok": "Hᵘ←-ᵘ←!", "ind": [[4,78,20,1]],"end": true},
-                if iref > 0 and qind == ref_blocks[iref-1][-1]:
-                    iref -= 1
-                    out.append(args.sep.join((qind, sign, folio, side, line, tok_ms, disagr_txt, disagr, fasila, khawamis, awashir, miaa)))
-                    if args.debug: print(f'[[DEBUG-08]] <OUT>', file=sys.stderr) #DEBUG
-                    
+        iref += 1
+
+
+def get_header(no_sign=False):
+    """ get names of the columns of the table.
+
+    Args:
+        no_sign (bool): do not add ms signature column.
+
+    Return:
+        tuple: column names.
+
+    """
+    return tuple(c for c in COLUMNS if not (no_sign and c == 'sign'))
+
+def _typed_columns(rows, names):
+    """ convert string rows into typed columns. Missing values are None.
+
+    qindex is also split into sura, vers, word and bloc integer columns, line is converted to float
+    and flags to integers.
+
+    Args:
+        rows (list): rows of the table as yielded by iter_rows.
+        names (tuple): column names as returned by get_header.
+
+    Return:
+        dict: column name -> list of values.
+
+    """
+    ncols = len(names)
+    columns = {name: [] for name in (*QINDEX_COLUMNS, *names)}
+
+    for fields in rows:
+        fields = fields + ('',) * (ncols-len(fields))
+        for name, value in zip(names, fields):
+            if name in FLAG_COLUMNS:
+                value = int(value) if value else None
+            elif name == 'line':
+                value = float(value) if value not in ('', 'None') else None
+            columns[name].append(value)
+        qind = fields[0].split(':') if fields[0] else ()
+        for i, name in enumerate(QINDEX_COLUMNS):
+            columns[name].append(int(qind[i]) if i < len(qind) else None)
+
+    return columns
+
+def write_columnar(rows, names, fname):
+    """ write table in columnar format with typed columns.
+
+    The format depends on the extension of fname: .parquet for Parquet, .npz for NumPy and any
+    other for Arrow IPC. If pyarrow is not installed, the table is written as NumPy .npz, where
+    missing integers are -1 and missing floats are NaN.
+
+    Args:
+        rows (list): rows of the table as yielded by iter_rows.
+        names (tuple): column names as returned by get_header.
+        fname (str): output file.
+
+    Return:
+        str: name of the file written.
+
+    """
+    columns = _typed_columns(rows, names)
+    base, ext = os.path.splitext(fname)
+
+    if ext.lower() != '.npz':
+        try:
+            import pyarrow as pa
+        except ImportError:
+            fname = f'{base}.npz'
+            print(f'Warning! pyarrow is not installed, columnar output written as NumPy in {fname}', file=sys.stderr)
+        else:
+            fields = {}
+            for name, values in columns.items():
+                if name in QINDEX_COLUMNS:
+                    fields[name] = pa.array(values, type=pa.int16())
+                elif name in FLAG_COLUMNS:
+                    fields[name] = pa.array(values, type=pa.int8())
+                elif name == 'line':
+                    fields[name] = pa.array(values, type=pa.float32())
+                elif name in CATEGORICAL_COLUMNS:
+                    fields[name] = pa.array(values, type=pa.string()).dictionary_encode()
                 else:
-                    out.append(args.sep.join((refbk_ind, sign, folio, side, line, '', '', '', '', '', '', '', refbk_pal, refbk_ara, POS, typ, lema, root, afix, derv, flec)))
-                    if args.debug: print(f'[[DEBUG-09]] <OUT>', file=sys.stderr) #DEBUG
+                    fields[name] = pa.array(values, type=pa.string())
+            table = pa.table(fields)
 
-            if len(bloc['ind'])>1:
-                for _ in bloc['ind'][1:]:
-                    iref += 1
-                    refbk_ara, refbk_pal, refbk_ind = ref_blocks[iref]
-                    out.append(args.sep.join((refbk_ind, sign, folio, side, line, '', '', '', '', '', '', '', refbk_pal, refbk_ara, POS, typ, lema, root, afix, derv, flec)))
-                    if args.debug: print(f'[[DEBUG-10]] <OUT>', file=sys.stderr) #DEBUG
+            if ext.lower() == '.parquet':
+                import pyarrow.parquet as pq
+                pq.write_table(table, fname)
+            else:
+                import pyarrow.feather as feather
+                feather.write_feather(table, fname)
+            return fname
 
-            iref += 1
+    import numpy as np
+
+    arrays = {}
+    for name, values in columns.items():
+        if name in QINDEX_COLUMNS:
+            arrays[name] = np.array([-1 if v is None else v for v in values], dtype=np.int16)
+        elif name in FLAG_COLUMNS:
+            arrays[name] = np.array([-1 if v is None else v for v in values], dtype=np.int8)
+        elif name == 'line':
+            arrays[name] = np.array([np.nan if v is None else v for v in values], dtype=np.float32)
+        else:
+            arrays[name] = np.array(values, dtype=str)
+    np.savez_compressed(fname, **arrays)
+
+    return fname
+
+def json2csv(fragm, outfp, morf_ref, source='tanzil-uthmani', no_sign=False, sep=SEP, columnar=None, debug=False, indexes=None):
+    """ convert InterSaME structure into csv, writing rows as they are produced.
+
+    Args:
+        fragm (iterable): pages along with their editions, e.g. as returned by isame_util.read_pages.
+        outfp (io.TextIOWrapper): output csv file, None for not writing csv.
+        morf_ref (dict): morphological analysis as returned by load_morphology.
+        source (str): quranic source for rasm.
+        no_sign (bool): do not add ms signature to output.
+        sep (str): separator, a single character.
+        columnar (str): file for writing the table in columnar format, None for not writing it.
+        debug (bool): debug mode.
+        indexes (iterable): shared index of each page, as built by isame_export.page_indexes, None for calculating them.
+
+    Raise:
+        InterSaMECsvError: if a token is empty after processing.
+
+    """
+    names = get_header(no_sign)
+    rows = iter_rows(fragm, morf_ref, source, no_sign, debug, indexes)
+
+    if columnar:
+        rows = list(rows)
+
+    if outfp:
+        writer = csv.writer(outfp, delimiter=sep, lineterminator='\n')
+        writer.writerow(names)
+        # rows are produced while they are written, the time of each page is measured in iter_rows
+        with phase('serialize'):
+            writer.writerows(rows)
+
+    if columnar:
+        with phase('serialize'):
+            write_columnar(rows, names, columnar)
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='map InterSaME manuscript text to Cairo Quran')
+    parser.add_argument('infile', nargs='?', type=FileType('r'), default=sys.stdin, help='json file')
+    parser.add_argument('outfile', nargs='?', type=FileType('w'), default=sys.stdout, help='csv file')
+    parser.add_argument('--source', default='tanzil-uthmani', help='quranic source for rasm [default tanzil-uthmani]')
+    parser.add_argument('--no_sign', action='store_true', help='do not add ms signature to csv output')
+    parser.add_argument('--sep', default=SEP, help=f'separator [default {SEP}]')
+    parser.add_argument('--columnar', metavar='FILE', help='write also table with typed columns in Parquet (.parquet), NumPy (.npz) '
+                                                            'or Arrow IPC (any other extension)')
+    parser.add_argument('--columnar_only', action='store_true', help='do not write csv, only the --columnar file')
+    parser.add_argument('--debug', action='store_true', help='debug mode')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    if len(args.sep) != 1:
+        parser.error('separator must be a single character')
 
-    args.outfile.write('\n'.join(out))
+    setup_profiling_args('isame_json2csv', args)
 
+    # json lines are converted as they are read
+    fragm = iter_phase('load', read_pages(args.infile), page_title)
 
+    with phase('load'):
+        morf_ref = load_morphology()
 
+    try:
+        json2csv(fragm, None if args.columnar_only else args.outfile, morf_ref, args.source, args.no_sign, args.sep,
+                 args.columnar, args.debug)
+    except InterSaMECsvError as e:
+        print(f'Fatal error! {e}', file=sys.stderr)
+        sys.exit(1)
+    except InterSaMEStreamError as e:
+        print(f'Fatal error! previous stage failed: {e}', file=sys.stderr)
+        sys.exit(1)
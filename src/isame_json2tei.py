@@ -38,46 +38,69 @@
 #   $ cat ../../data/arabic/trans/F001-4.txt | python isame_parser.py | tee ../../data/arabic/trans/F001-5-pre.json | python isame_mapper.py |
 #     tee ../../data/arabic/trans/F001-6.json | python isame_json2tei.py | grep -v "<!" > ../../data/arabic/trans/F001-7.xml
 #
+#   $ cat ../../data/arabic/trans/F001-6.json | python isame_json2tei.py --jobs 8 > ../../data/arabic/trans/F001-7.xml
+#
+#   $ cat ../../data/arabic/trans/F001-6.json | python isame_json2tei.py --cache .tei_cache > ../../data/arabic/trans/F001-7.xml
+#
+#   $ python isame_json2tei.py ../../data/arabic/trans/F001-6.json F001-7.xml --profile F001-tei-profile.json
+#
 ###########################################################################################################################################################
 
 import re
 import os
 import sys
+import hashlib
 import logging
-logging.basicConfig(handlers=[
-                        logging.FileHandler(f'{os.path.splitext(os.path.basename(__file__))[0]}.log', mode='w',),
-                        logging.StreamHandler()
-                    ],
-                    format='%(asctime)s :: %(levelname)s :: %(funcName)s :: %(lineno)d :: %(message)s',
-                    level=logging.DEBUG)
 try:
     import ujson as json
 except ImportError:
     import json
 
-from bs4 import BeautifulSoup, Comment
-import xml.dom.minidom
+from bs4 import BeautifulSoup
 import xml.parsers.expat
-from xml.sax.saxutils import escape
+from xml.sax.saxutils import escape, unescape
 from argparse import ArgumentParser, FileType
 from itertools import chain, groupby
+from functools import lru_cache
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
 
-from rasm import rasm
-
-from isame_util import HIST_ORIGIN, NUM_VERSES, SURA_NAMES, \
+from isame_util import HIST_ORIGIN, SURA_NAMES, \
                        ARABIC_CHARS_MAPPING, ARABIC_MAPPING, ARABIC_CHARS_REGEX, ARABIC_REGEX, \
-                       get_metadata_table, to_isame_trans
+                       to_isame_trans, read_pages, setup_logging, tool_sources, package_version, \
+                       write_atomic, InterSaMEStreamError
+from isame_catalog import load_catalog
+from isame_get_text import reference_slice
+from isame_qindex import QIndex, last_verse
+from isame_profile import phase, iter_phase, count_page, page_title, add_profile_arguments, setup_profiling_args
 
 from isame_parser import FASILA_REGEX, AWASHIR_REGEX, KHAWAMIS_REGEX, HUNDRED_REGEX
 
+logger = logging.getLogger(__name__)
+
 MANUSCRIPT_TABLE_FILE = os.path.join(os.path.dirname(__file__), 'List-of-manuscript-fragments.md')
 TEI_TEMPLATE_FILE = os.path.join(os.path.dirname(__file__), 'TEI_TEMPLATE.xml')
 
 RASM_DIACSET = '°²³¹ɂʔʷʸˀ˜ˢـᴬᴺᵃᵐᵒᵘᵚᵟᵢ•⁰ⁿ₁₂ₘₙₛ∴⌃⌄⒥⒧⒨⒬⒮'
 DEFAULT_WORD_SEP = '#'
 
+# increase when a change in the rendering of pages is not reflected in the sources of this module, the modules
+# it imports or the version of rasm
+RENDERER_VERSION = 1
+
 ESTIMATE_REGEX = re.compile(r'^(?P<min>[1-9][0-9]*)(?:-(?P<max>[1-9][0-9]*))?r')
 
+# placeholders of the TEI template that are filled in by json2tei
+TEMPLATE_SLOTS = ('{{HIST_ID}}', '{{BODY}}', '{{HIST_ORIGIN}}', '{{RESPONSABILITIES}}', '{{INI_QINDEX}}', '{{END_QINDEX}}',
+                  '{{SUPPORT}}', '{{INK}}', '{{LEAF_DIMENSION}}', '{{LINES_PAGE}}', '{{SCRIPT_STYPE}}', '{{DATE}}', '{{FRAGMENTS}}')
+TEMPLATE_SLOTS_REGEX = re.compile('|'.join(map(re.escape, TEMPLATE_SLOTS)))
+
+# pieces of the rendered pages that are post-processed before being written. The elements of a surah or an ayah
+# can span several pages, so pages are not parsed as a whole: only variants are, and they never span pages
+APP_REGEX = re.compile(r'<app>.*?</app>', re.DOTALL)
+TAG_REGEX = re.compile(r'(<[^>]*>)')
+COMMENT_REGEX = re.compile(r'<!--.*?-->', re.DOTALL)
+
 class InterSaMETeiError(Exception):
     """ Error in TEI conversion.
 
@@ -213,7 +236,7 @@ def retrieve_text(blocks, inib, inic, endb, endc):
 
     return ''.join(retrieved)
 
-def calculate_gap(end, start, include_first=True, include_last=True, sep=DEFAULT_WORD_SEP, diacritics=False):
+def calculate_gap(end, start, include_first=True, include_last=True, sep=DEFAULT_WORD_SEP, diacritics=False, blocks=None):
     """ calculate the text between the end index and the start index.
 
     Quranic indexes follow the pattern (sura, vers, word, bloc).
@@ -224,12 +247,14 @@ def calculate_gap(end, start, include_first=True, include_last=True, sep=DEFAULT
         include_first (bool): include first block in the text of the gap.
         include_last (bool): include last block in the text of the gap.
         sep (str): word separator.
+        blocks (list): blocks of the reference text from end to start, as returned by
+            isame_get_text.reference_slice. If None, they are retrieved from rasm.
 
     Returns:
         str: text gap between the indexes
 
     """
-    results = list(tks for _, tks in rasm((end, start), source='tanzil-uthmani', blocks=True, paleo=True))
+    results = list(blocks) if blocks is not None else reference_slice(end, start)
     if not results:
         return
 
@@ -255,6 +280,48 @@ def calculate_gap(end, start, include_first=True, include_last=True, sep=DEFAULT
 
     return re.sub(rf'[{RASM_DIACSET}]', '', gap)
 
+def gap_before(prev_page_end_qind, ini_qind):
+    """ index where the text supplied before the first block of a page starts: the end of the previous
+    page if it ends in the same or the previous verse, the beginning of the verse otherwise.
+
+    Args:
+        prev_page_end_qind (tuple): index of final block of previous page or None if page is the first one.
+        ini_qind (tuple): index of the first block of the page.
+
+    Return:
+        tuple: quranic index.
+
+    """
+    ini_sura, ini_vers, _, _ = ini_qind
+    if not prev_page_end_qind:
+        return (ini_sura, ini_vers, 1, 1)
+    prev_page_sura, prev_page_vers, _, _ = prev_page_end_qind
+    if prev_page_sura == ini_sura and (prev_page_vers == ini_vers or prev_page_vers+1 == ini_vers):
+        return prev_page_end_qind
+    return (ini_sura, ini_vers, None, None)
+
+def gap_after(end_qind, next_page_start_qind):
+    """ index where the text supplied after the last block of a page ends: the start of the next page
+    if it starts in the same or the next verse, the beginning of the next verse if it starts later in
+    the same sura, and the beginning of the verse of the last block otherwise.
+
+    Args:
+        end_qind (tuple): index of the last block of the page.
+        next_page_start_qind (tuple): index of start block of next page or None if page is the last one.
+
+    Return:
+        tuple: quranic index.
+
+    """
+    end_sura, end_vers, _, _ = end_qind
+    if next_page_start_qind:
+        next_page_sura, next_page_vers, _, _ = next_page_start_qind
+        if end_sura == next_page_sura:
+            if end_vers == next_page_vers or end_vers+1 == next_page_vers:
+                return next_page_start_qind
+            return (end_sura, end_vers+1, None, None)
+    return (end_sura, end_vers, None, None)
+
 def text_is_divider(text):
     """ check if text is a divider, i.e. fasila, kawamis, awashir or hundred.
 
@@ -272,7 +339,8 @@ def text_is_divider(text):
            (text[0]=='+' and (KHAWAMIS_REGEX.match('v'+text[1:]+'#')) or AWASHIR_REGEX.match('x'+text[1:]+'#') or HUNDRED_REGEX.match('c'+text[1:]+'#'))
 
 
-def prepare_content(page, folio, side, source, prev_page_end_qind=None, next_page_start_qind=None, sep='#', arabic=False, debug=False):
+def prepare_content(page, folio, side, source, prev_page_end_qind=None, next_page_start_qind=None, sep='#', arabic=False, debug=False,
+                    index=None):
     """ convert the transcription contained in page into a TEI formatted object.
 
     Args:
@@ -285,6 +353,7 @@ def prepare_content(page, folio, side, source, prev_page_end_qind=None, next_pag
         sep (str): word separator.
         arabic (bool): convert transcription into Arabic script.
         debug (bool): debug mode.
+        index (isame_export.PageIndex): reference slices of the gaps around the page, None for retrieving them.
 
     Return:
         list: TEI tags and text.
@@ -303,8 +372,11 @@ def prepare_content(page, folio, side, source, prev_page_end_qind=None, next_pag
 
     ini_sura, ini_vers, ini_word, ini_bloc = ini_qind
 
+    before = gap_before(prev_page_end_qind, ini_qind)
+    before_blocks = index.before if index else None
+
     if debug:
-        logging.debug(f'@DEBUG@ $folio={folio} $prev_page_end_qind={prev_page_end_qind} ini_qind={ini_qind}')
+        logger.debug('@DEBUG@ $folio=%s $prev_page_end_qind=%s ini_qind=%s', folio, prev_page_end_qind, ini_qind)
 
     if not prev_page_end_qind:
 
@@ -322,7 +394,7 @@ def prepare_content(page, folio, side, source, prev_page_end_qind=None, next_pag
             content.append(f'<gap extent="1-{ini_vers-1}" reason="fragmWit" unit="ayah"/>')
             content.append(f'<ab n="{ini_vers}" type="ayah">')
             gap_found = True
-        if (gap := calculate_gap((ini_sura, ini_vers, 1, 1), (ini_sura, ini_vers, ini_word, ini_bloc), include_last=False, sep=sep)):
+        if (gap := calculate_gap(before, ini_qind, include_last=False, sep=sep, blocks=before_blocks)):
             if not gap_found:
                 content.append(f'<pb n="{folio}-"/>')
             content.append(f'<supplied>{gap}</supplied>')
@@ -336,7 +408,7 @@ def prepare_content(page, folio, side, source, prev_page_end_qind=None, next_pag
 
         if prev_page_sura == ini_sura:
             if prev_page_vers == ini_vers or prev_page_vers+1 == ini_vers:
-                if (gap := calculate_gap(prev_page_end_qind, ini_qind, include_first=False, include_last=False, sep=sep)):
+                if (gap := calculate_gap(before, ini_qind, include_first=False, include_last=False, sep=sep, blocks=before_blocks)):
                     content.append(f'<pb n="{folio}-"/>')
                     content.append(f'<supplied>{gap}</supplied>')
             else:
@@ -350,7 +422,7 @@ def prepare_content(page, folio, side, source, prev_page_end_qind=None, next_pag
 
                     content.append(f'<ab n="{ini_vers}" type="ayah">')
                     gap_found = True
-                if (gap := calculate_gap((ini_sura, ini_vers, None, None), ini_qind, include_last=False, sep=sep)):
+                if (gap := calculate_gap(before, ini_qind, include_last=False, sep=sep, blocks=before_blocks)):
                     if not gap_found:
                         content.append(f'<pb n="{folio}-"/>')
                     content.append(f'<supplied>{gap}</supplied>')
@@ -364,7 +436,7 @@ def prepare_content(page, folio, side, source, prev_page_end_qind=None, next_pag
                 extent = 1 if ini_vers == 2 else f'1-{ini_vers-1}'
                 content.append(f'<gap extent="{extent}" reason="fragmWit" unit="ayah"/>')
 
-            if (gap := calculate_gap((ini_sura, ini_vers, None, None), ini_qind, include_last=False, sep=sep)):
+            if (gap := calculate_gap(before, ini_qind, include_last=False, sep=sep, blocks=before_blocks)):
                 if not gap_found:
                     content.append(f'<pb n="{folio}-"/>')
                 content.append(f'<supplied>{gap}</supplied>')
@@ -590,25 +662,29 @@ def prepare_content(page, folio, side, source, prev_page_end_qind=None, next_pag
         end_qind = page['blocks'][-2]['ind'][-1]
         end_sura, end_vers, end_word, _ = end_qind
 
+    after = gap_after(end_qind, next_page_start_qind)
+    after_blocks = index.after if index else None
+
     if debug:
-        logging.debug(f"@DEBUG@ $folio={folio} end_qind={end_qind} $next_page_start_qind={next_page_start_qind}")
+        logger.debug("@DEBUG@ $folio=%s end_qind=%s $next_page_start_qind=%s",
+                     folio, end_qind, next_page_start_qind)
 
     if not next_page_start_qind:
 
         gap_found = False
-        if (gap := calculate_gap(end_qind, (end_sura, end_vers, None, None), include_first=False, sep=sep)):
+        if (gap := calculate_gap(end_qind, after, include_first=False, sep=sep, blocks=after_blocks)):
             content.append(f'<pb n="{folio}+"/>')
             content.append(f'<supplied>{gap}</supplied>')
             gap_found = True
         content.append('</ab>')
-        if end_vers == NUM_VERSES[end_sura]-1:
+        if end_vers == last_verse(end_sura)-1:
             if not gap_found:
                 content.append(f'<pb n="{folio}+"/>')
-            content.append(f'<gap extent="{NUM_VERSES[end_sura]}" reason="fragmWit" unit="ayah"/>')
-        elif end_vers < NUM_VERSES[end_sura]-1:
+            content.append(f'<gap extent="{last_verse(end_sura)}" reason="fragmWit" unit="ayah"/>')
+        elif end_vers < last_verse(end_sura)-1:
             if not gap_found:
                 content.append(f'<pb n="{folio}+"/>')
-            content.append(f'<gap extent="{end_vers+1}-{NUM_VERSES[end_sura]}" reason="fragmWit" unit="ayah"/>')
+            content.append(f'<gap extent="{end_vers+1}-{last_verse(end_sura)}" reason="fragmWit" unit="ayah"/>')
         content.append('</div>')
 
 
@@ -620,12 +696,12 @@ def prepare_content(page, folio, side, source, prev_page_end_qind=None, next_pag
         next_page_sura, next_page_vers, next_word, _ = next_page_start_qind
         if end_sura == next_page_sura:
             if end_vers == next_page_vers or end_vers+1 == next_page_vers:
-                if (gap := calculate_gap(end_qind, next_page_start_qind, include_first=False, include_last=False, sep=sep)):
+                if (gap := calculate_gap(end_qind, after, include_first=False, include_last=False, sep=sep, blocks=after_blocks)):
                     content.append(f'<pb n="{folio}+"/>')
                     content.append(f'<supplied>{gap}</supplied>')
             else:
                 gap_found = False
-                if (gap := calculate_gap(end_qind, (end_sura, end_vers+1, None, None), sep=sep)):
+                if (gap := calculate_gap(end_qind, after, sep=sep, blocks=after_blocks)):
                     content.append(f'<pb n="{folio}+"/>')
                     content.append(f'<supplied>{gap}</supplied>')
                     gap_found = True
@@ -637,18 +713,18 @@ def prepare_content(page, folio, side, source, prev_page_end_qind=None, next_pag
                 content.append(f'<ab n="{next_page_vers}" type="ayah">')
         else:
             gap_found = False
-            if (gap := calculate_gap(end_qind, (end_sura, end_vers, None, None), include_first=False, sep=sep)):
+            if (gap := calculate_gap(end_qind, after, include_first=False, sep=sep, blocks=after_blocks)):
                 content.append(f'<pb n="{folio}+"/>')
                 content.append(f'<supplied>{gap}</supplied>')
                 content.append('</ab>')
                 gap_found = True
 
             # not last verse of sura
-            if next_page_vers != NUM_VERSES[prev_sura]:
+            if next_page_vers != last_verse(prev_sura):
                 if not gap_found:
                     content.append(f'<pb n="{folio}+"/>')
 
-                extent = NUM_VERSES[prev_sura] if end_vers+1 == NUM_VERSES[prev_sura] else f'{end_vers+1}-{NUM_VERSES[prev_sura]}'
+                extent = last_verse(prev_sura) if end_vers+1 == last_verse(prev_sura) else f'{end_vers+1}-{last_verse(prev_sura)}'
                 content.append(f'<gap extent="{extent}" reason="fragmWit" unit="ayah"/>')
                 content.append('</div>')
 
@@ -820,75 +896,415 @@ def post_process_variants(tei):
                     tag_.append(inner_tag)
 
 
-def json2tei(infp,
-             outfp,
-             template = open(TEI_TEMPLATE_FILE).read(),
-             sep = DEFAULT_WORD_SEP,
-             to_ara = False,
-             debug = False):
+def _start_qind(page):
+    """ index of the first block of page with index.
+
     """
-    create conversion of InterSaME json into TEI and add metadata.
+    k = 0
+    while not page['page']['blocks'][k]['ind']:
+        k += 1
+    return page['page']['blocks'][k]['ind'][-1]
+
+def _end_qind(page):
+    """ index of the last block of page, or of the previous block if the last one has no index.
+
+    """
+    if page['page']['blocks'][-1]['ind']:
+        return page['page']['blocks'][-1]['ind'][-1]
+    return page['page']['blocks'][-2]['ind'][-1]
+
+def iter_page_boundaries(pages):
+    """ calculate the quranic index where the previous page ends and the next page starts for each page,
+    as pages are read. Only one page is kept ahead.
 
     Args:
-        infp (io.TextIOWrapper): input json file.
-        outfp (io.TextIOWrapper): output xml file.
-        template (str): xml template for the tei.
+        pages (iterable): page objects.
+
+    Yield:
+        dict, tuple, tuple: page, index of final block of previous page and index of start block of next page.
+            Any of the indexes is None if the page is the first or the last one, respectively.
+
+    """
+    prev_page, page = None, None
+    for next_page in pages:
+        if page is not None:
+            yield page, _end_qind(prev_page) if prev_page is not None else None, _start_qind(next_page)
+        prev_page, page = page, next_page
+    if page is not None:
+        yield page, _end_qind(prev_page) if prev_page is not None else None, None
+
+def page_boundaries(struct):
+    """ calculate the quranic index where the previous page ends and the next page starts for each page.
+
+    Args:
+        struct (list): json object containing all pages along with their editions.
+
+    Yield:
+        tuple, tuple: index of final block of previous page and index of start block of next page.
+            Any of them is None if the page is the first or the last one, respectively.
+
+    """
+    for _, prev_qind, next_qind in iter_page_boundaries(struct):
+        yield prev_qind, next_qind
+
+def _render_page(args):
+    """ wrapper of prepare_content that can be sent to a worker process.
+
+    Args:
+        args (tuple): page object, previous page end index, next page start index, separator,
+            arabic flag, debug flag and shared page index (see isame_export.PageIndex) or None.
+
+    Return:
+        str: TEI content of the page.
+
+    """
+    page, prev_qind, next_qind, sep, to_ara, debug, index = args
+    with phase('render', page['meta']['title']):
+        return prepare_content(page['page'],
+                               page['meta']['folio'],
+                               page['meta']['side'],
+                               page['meta']['source'],
+                               prev_qind,
+                               next_qind,
+                               sep,
+                               to_ara,
+                               debug,
+                               index)
+
+@lru_cache(maxsize=None)
+def _renderer_digest():
+    """ calculate a digest of the code that renders the pages, so that cached pages are discarded when it changes.
+    It covers the sources of this module and of all the modules of this directory it imports, and the
+    installed version of rasm.
+
+    Return:
+        str: hexadecimal digest.
+
+    """
+    h = hashlib.sha1(f'{RENDERER_VERSION} {package_version("rasm")}'.encode('utf-8'))
+    for fname in tool_sources('isame_json2tei'):
+        try:
+            with open(fname, 'rb') as fp:
+                h.update(fp.read())
+        except OSError:
+            pass
+    return h.hexdigest()
+
+def page_cache_key(page, prev_qind, next_qind, sep, to_ara, debug):
+    """ calculate the key of the rendered content of a page in the cache.
+
+    Args:
+        page (dict): page object.
+        prev_qind (tuple): end index of previous page or None.
+        next_qind (tuple): start index of next page or None.
+        sep (str): word separator.
+        to_ara (bool): arabic flag.
+        debug (bool): debug flag.
+
+    Return:
+        str: hexadecimal key.
+
+    """
+    h = hashlib.sha1(_renderer_digest().encode('utf-8'))
+    h.update(json.dumps([page, prev_qind, next_qind, sep, to_ara, debug], sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    return h.hexdigest()
+
+def _read_cached_page(cache_dir, key):
+    """ get the rendered content of a page from the cache.
+
+    Return:
+        str: TEI content of the page or None if it is not in the cache.
+
+    """
+    try:
+        with open(os.path.join(cache_dir, key[:2], f'{key}.xml'), encoding='utf-8') as fp:
+            return fp.read()
+    except OSError:
+        return None
+
+def _write_cached_page(cache_dir, key, content):
+    """ store the rendered content of a page in the cache. The file is written atomically so that
+    concurrent conversions can share the same cache directory.
+
+    """
+    fname = os.path.join(cache_dir, key[:2], f'{key}.xml')
+    try:
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        write_atomic(fname, lambda fp: fp.write(content))
+    except OSError as e:
+        logger.warning('page could not be stored in cache: %s', e)
+
+def render_body(struct, sep=DEFAULT_WORD_SEP, to_ara=False, jobs=1, cache_dir=None, debug=False, indexes=None):
+    """ convert the content of all pages into TEI.
+
+    The rendering of a page only depends on the page itself and the indexes of the surrounding pages,
+    so pages can be processed in parallel and their rendered content can be reused between runs.
+
+    Args:
+        struct (list): json object containing all pages along with their editions.
         sep (str): word separator.
         to_ara (bool): if True, convert transcription to modern Arabic script.
+        jobs (int): number of worker processes. If 1, pages are rendered in the current process.
+        cache_dir (str): directory for caching the rendered pages. Only pages not found in the
+            cache are rendered. If None, no cache is used.
         debug (bool): debug mode.
+        indexes (list): shared index of each page, as built by isame_export.page_indexes. If None, the
+            reference text of the gaps is retrieved while rendering.
+
+    Return:
+        list: TEI content of each page, in page order.
 
     """
-    struct = json.load(infp)
-    body = []
-    nstruct = len(struct)
+    if indexes:
+        tasks = [(page, index.prev_qind, index.next_qind, sep, to_ara, debug, index) for page, index in zip(struct, indexes)]
+    else:
+        tasks = [(page, prev_qind, next_qind, sep, to_ara, debug, None)
+                 for page, (prev_qind, next_qind) in zip(struct, page_boundaries(struct))]
 
-    for i, page in enumerate(struct):
+    body = [None] * len(tasks)
+    keys = [None] * len(tasks)
 
-        prev_qind, next_qind = None, None
+    if cache_dir:
+        for i, task in enumerate(tasks):
+            keys[i] = page_cache_key(*task[:-1])
+            body[i] = _read_cached_page(cache_dir, keys[i])
+
+    pending = [i for i, content in enumerate(body) if content is None]
+
+    if debug and cache_dir:
+        logger.debug('@@ %s pages taken from cache, %s pages to render', len(tasks)-len(pending), len(pending))
+
+    if jobs > 1 and len(pending) > 1:
+        # pages rendered in the workers are only measured as a whole
+        with phase('render'), ProcessPoolExecutor(max_workers=min(jobs, len(pending))) as executor:
+            rendered = executor.map(_render_page, (tasks[i] for i in pending))
+            for i, content in zip(pending, rendered):
+                body[i] = content
+    else:
+        for i in pending:
+            body[i] = _render_page(tasks[i])
+
+    for page in struct:
+        count_page('render', page)
+
+    if cache_dir:
+        for i in pending:
+            _write_cached_page(cache_dir, keys[i], body[i])
+
+    return body
+
+def iter_render_body(pages, sep=DEFAULT_WORD_SEP, to_ara=False, jobs=1, cache_dir=None, debug=False):
+    """ convert the content of the pages into TEI as pages are read, e.g. from a json lines stream.
+
+    A page is rendered as soon as the next one is available. With several jobs, up to 2*jobs pages
+    are rendered at the same time.
+
+    Args:
+        pages (iterable): page objects.
+        sep (str): word separator.
+        to_ara (bool): if True, convert transcription to modern Arabic script.
+        jobs (int): number of worker processes. If 1, pages are rendered in the current process.
+        cache_dir (str): directory for caching the rendered pages. If None, no cache is used.
+        debug (bool): debug mode.
+
+    Yield:
+        dict, str: page object and its TEI content, in page order.
+
+    """
+    executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+
+    # (page, cache key, rendered content or future, if it has to be stored in cache)
+    pending = deque()
+
+    def result(item):
+        page, key, content, render = item
+        if isinstance(content, Future):
+            content = content.result()
+        if render and cache_dir:
+            _write_cached_page(cache_dir, key, content)
+        count_page('render', page)
+        return page, content
+
+    try:
+        for page, prev_qind, next_qind in iter_page_boundaries(pages):
+            task = (page, prev_qind, next_qind, sep, to_ara, debug, None)
+
+            key, content = None, None
+            if cache_dir:
+                key = page_cache_key(*task[:-1])
+                content = _read_cached_page(cache_dir, key)
+
+            render = content is None
+            if render:
+                content = executor.submit(_render_page, task) if executor else _render_page(task)
+            pending.append((page, key, content, render))
+
+            while pending and (len(pending) > 2*jobs or not isinstance(pending[0][2], Future) or pending[0][2].done()):
+                yield result(pending.popleft())
+
+        while pending:
+            yield result(pending.popleft())
+
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+@lru_cache(maxsize=None)
+def load_template(fname=TEI_TEMPLATE_FILE):
+    """ read TEI template.
+
+    Args:
+        fname (str): path of template file.
+
+    Return:
+        str: xml template.
+
+    """
+    with open(fname) as fp:
+        return fp.read()
+
+@lru_cache(maxsize=8)
+def compile_template(template):
+    """ split template into static chunks and placeholder slots.
+
+    Args:
+        template (str): xml template for the tei.
+
+    Return:
+        tuple: alternating sequence of static text and slot names. Even positions are static text
+            and odd positions contain one of TEMPLATE_SLOTS.
+
+    """
+    parts = []
+    pos = 0
+    for m in TEMPLATE_SLOTS_REGEX.finditer(template):
+        parts.append(template[pos:m.start()])
+        parts.append(m.group(0))
+        pos = m.end()
+    parts.append(template[pos:])
+    return tuple(parts)
+
+def fill_template(compiled, mapping, body, body_sep=''):
+    """ fill the slots of compiled template.
+
+    Args:
+        compiled (tuple): template as returned by compile_template.
+        mapping (dict): content of each slot, except {{BODY}}.
+        body (iterable): TEI content of each page, that goes into {{BODY}} slot.
+        body_sep (str): string inserted between pages.
+
+    Yield:
+        str: next chunk of the TEI document.
+
+    """
+    for i, part in enumerate(compiled):
+        if not i % 2:
+            if part:
+                yield part
+        elif part == '{{BODY}}':
+            for ipage, page in enumerate(body):
+                if ipage and body_sep:
+                    yield body_sep
+                yield page
+        else:
+            yield mapping[part]
+
+def _finish_variant(match):
+    """ give a variant of a rendered page its final shape.
+
+    """
+    app = BeautifulSoup(match.group(0), 'lxml-xml')
+    post_process_variants(app)
+    return str(app.find('app'))
+
+def _arabic_text(text):
+    """ convert a text node of a rendered page into modern Arabic script. The surrounding whitespace is kept.
+
+    """
+    core = text.strip()
+    if not core:
+        return text
+
+    core = unescape(core)
+
+    # hack to exclude the dividers...
+    if text_is_divider(core):
+        return text
+
+    # remove pluses for consonantal diacritics
+    core = re.sub(r'([’,]+)\+([’,]+)', r'\2', core)
+    core = re.sub(r'(?<=[A-Y⇘⇐⇒⇓])\+([’,]+)', r'\1', core)
+
+    # perform Arabic conversion
+    core = ARABIC_CHARS_REGEX.sub(lambda m: ARABIC_CHARS_MAPPING[m.group(0)], core)
+    core = ARABIC_REGEX.sub(lambda m: ARABIC_MAPPING[m.group(0)], core)
+
+    return f'{text[:len(text)-len(text.lstrip())]}{escape(core)}{text[len(text.rstrip()):]}'
+
+def finish_page(content, to_ara=False):
+    """ post-process the TEI content of a page before it goes into the {{BODY}} slot of the template.
+
+    Args:
+        content (str): TEI content of the page, as returned by render_body.
+        to_ara (bool): if True, convert transcription to modern Arabic script.
+
+    Return:
+        str: TEI content with the variants in their final shape and without comments.
+
+    """
+    content = APP_REGEX.sub(_finish_variant, COMMENT_REGEX.sub('', content))
+    if to_ara:
+        content = ''.join(part if i % 2 else _arabic_text(part) for i, part in enumerate(TAG_REGEX.split(content)))
+    return content
+
+def struct2tei(struct,
+               outfp,
+               template = None,
+               sep = DEFAULT_WORD_SEP,
+               to_ara = False,
+               jobs = 1,
+               cache_dir = None,
+               body = None,
+               debug = False):
+    """
+    create conversion of InterSaME structure into TEI and add metadata. The document is written chunk by
+    chunk, each page is post-processed just before it is written into the {{BODY}} slot.
+
+    Args:
+        struct (list): json object containing all pages along with their editions.
+        outfp (io.TextIOWrapper): output xml file.
+        template (str): xml template for the tei. If None, TEI_TEMPLATE_FILE is used.
+        sep (str): word separator.
+        to_ara (bool): if True, convert transcription to modern Arabic script.
+        jobs (int): number of processes for rendering the pages.
+        cache_dir (str): directory for caching the rendered pages.
+        body (list): TEI content of each page as returned by render_body. If None, it is calculated.
+            It only depends on sep and debug, so it can be shared between Latin and Arabic conversions.
+        debug (bool): debug mode. The xml is written as rendered, it is not validated nor post-processed.
+
+    Raise:
+        InterSaMETeiError: if the resulting xml is malformed.
+
+    """
+    if template is None:
+        template = load_template()
+
+    if body is None:
+        body = render_body(struct, sep, to_ara, jobs, cache_dir, debug)
 
-        if i > 0:
-            if struct[i-1]['page']['blocks'][-1]['ind']:
-                prev_qind = struct[i-1]['page']['blocks'][-1]['ind'][-1]
-            else:
-                prev_qind = struct[i-1]['page']['blocks'][-2]['ind'][-1]
-
-        if i < nstruct-1:
-            k = 0
-            while not struct[i+1]['page']['blocks'][k]['ind']:
-                k += 1
-            next_qind = struct[i+1]['page']['blocks'][k]['ind'][-1]
-
-        body.append(prepare_content(page['page'],
-                                    page['meta']['folio'],
-                                    page['meta']['side'],
-                                    page['meta']['source'],
-                                    prev_qind,
-                                    next_qind,
-                                    sep,
-                                    to_ara,
-                                    debug))
     #
     # merge meta, text and tags
     #
 
-    if debug:
-        text_body = '\n'.join(body)
-    else:
-        text_body = ''.join(body)    
-
-    fgmts_table = get_metadata_table(MANUSCRIPT_TABLE_FILE)
-    inii = struct[0]['page']['blocks'][0]['ind'][0][:-2]
-    if struct[-1]['page']['blocks'][-1]['ind']:
-        endi = struct[-1]['page']['blocks'][-1]['ind'][-1][:-2]
-    else:
-        endi = struct[-1]['page']['blocks'][-2]['ind'][-1][:-2]
+    fgmts_table = load_catalog(table_fname=MANUSCRIPT_TABLE_FILE).fragments
+    inii = QIndex.from_tuple(struct[0]['page']['blocks'][0]['ind'][0]).verse()
+    endi = QIndex.from_tuple(_end_qind(struct[-1])).verse()
     
     MAPPING = {'{{HIST_ID}}': struct[0]['meta']['hist_id'],
-               '{{BODY}}': text_body,
                '{{HIST_ORIGIN}}': HIST_ORIGIN[struct[0]['meta']['hist_id'][0]],
                '{{RESPONSABILITIES}}' : create_responsabilities(struct, fgmts_table),
-               '{{INI_QINDEX}}': ':'.join(map(str, inii)),   #FIXME add all ranges
-               '{{END_QINDEX}}': ':'.join(map(str, endi)),
+               '{{INI_QINDEX}}': str(inii),   #FIXME add all ranges
+               '{{END_QINDEX}}': str(endi),
                '{{SUPPORT}}': fgmts_table[struct[0]['meta']['signature']]['Support'],
                '{{INK}}': fgmts_table[struct[0]['meta']['signature']]['Ink'],
                '{{LEAF_DIMENSION}}': fgmts_table[struct[0]['meta']['signature']]['Leaf Dim.'],
@@ -898,46 +1314,55 @@ def json2tei(infp,
                '{{FRAGMENTS}}': calculate_fragments(struct, fgmts_table),
     }
 
-    REGEX = re.compile('|'.join(MAPPING))
-    TEI = REGEX.sub(lambda m: MAPPING[m.group(0)], template)
-    
     if debug:
-        print(TEI) #TRACE https://www.liquid-technologies.com/online-xml-formatter
-
-    else:
-        try:
-            xml.dom.minidom.parseString(TEI)
-        except xml.parsers.expat.ExpatError as e:
-            logging.error(f"Fatal error! malformed xml: {e}. Conversion stopped!")
-            raise InterSaMETeiError
-        soup = BeautifulSoup(TEI, 'lxml-xml')
-
-        post_process_variants(soup)
-        
-        if to_ara:
-            for elem in soup.find('body').find_all(text=True):
-                text = elem.string.strip()
-                if text:
-           
-                    # hack to exclude the dividers...
-                    if text_is_divider(text):
-                        continue
+        for chunk in fill_template(compile_template(template), MAPPING, body, '\n'):
+            outfp.write(chunk)
+        return
 
-                    # remove pluses for consonantal diacritics
-                    text = re.sub(r'([’,]+)\+([’,]+)', r'\2', text)
-                    text = re.sub(r'(?<=[A-Y⇘⇐⇒⇓])\+([’,]+)', r'\1', text)
+    # only one page is post-processed at a time, and the xml is checked while it is being written, as minidom
+    # would do but without building the tree
+    pages = (finish_page(content, to_ara) for content in body)
+    checker = xml.parsers.expat.ParserCreate(namespace_separator=' ')
+    try:
+        for chunk in fill_template(compile_template(COMMENT_REGEX.sub('', template)), MAPPING, pages):
+            checker.Parse(chunk, False)
+            outfp.write(chunk)
+        checker.Parse('', True)
+    except xml.parsers.expat.ExpatError as e:
+        logger.error("Fatal error! malformed xml: %s. Conversion stopped!", e)
+        raise InterSaMETeiError
 
-                    # perform Arabic conversion
-                    text = ARABIC_CHARS_REGEX.sub(lambda m: ARABIC_CHARS_MAPPING[m.group(0)], text)
-                    text = ARABIC_REGEX.sub(lambda m: ARABIC_MAPPING[m.group(0)], text)
+def json2tei(infp,
+             outfp,
+             template = None,
+             sep = DEFAULT_WORD_SEP,
+             to_ara = False,
+             jobs = 1,
+             cache_dir = None,
+             debug = False):
+    """
+    create conversion of InterSaME json into TEI and add metadata.
 
-                    elem.replace_with(text)
+    Args:
+        infp (io.TextIOWrapper): input json file, a json array or json lines with one page per line.
+        outfp (io.TextIOWrapper): output xml file.
+        template (str): xml template for the tei. If None, TEI_TEMPLATE_FILE is used.
+        sep (str): word separator.
+        to_ara (bool): if True, convert transcription to modern Arabic script.
+        jobs (int): number of processes for rendering the pages.
+        cache_dir (str): directory for caching the rendered pages.
+        debug (bool): debug mode.
 
-        # remove comments from template
-        for element in soup(text=lambda s: isinstance(s, Comment)):
-            element.extract()
+    """
+    # pages are rendered while they are read, which matters when infp is a json lines stream
+    struct, body = [], []
+    for page, content in iter_render_body(iter_phase('load', read_pages(infp), page_title), sep, to_ara, jobs, cache_dir, debug):
+        struct.append(page)
+        body.append(content)
 
-        print(soup.prettify(), file=outfp)
+    with phase('serialize'):
+        #TRACE in debug mode https://www.liquid-technologies.com/online-xml-formatter
+        struct2tei(struct, sys.stdout if debug else outfp, template, sep, to_ara, jobs, cache_dir, body, debug)
 
 
 if __name__ == '__main__':
@@ -947,14 +1372,23 @@ if __name__ == '__main__':
     parser.add_argument('outfile', nargs='?', type=FileType('w'), default=sys.stdout, help='xml file')
     parser.add_argument('--sep', default='#', help=f'word separator (default "{DEFAULT_WORD_SEP}")')
     parser.add_argument('--ara', action='store_true', help='convert transctiption into Arabic script')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='number of processes for rendering pages in parallel [default 1]')
+    parser.add_argument('--cache', metavar='DIR', help='directory for caching rendered pages; only modified pages are rendered again')
     parser.add_argument('--debug', action='store_true', help='print xml as text for debugging')
+    add_profile_arguments(parser)
     args = parser.parse_args()
 
+    setup_logging('isame_json2tei', args.debug)
+    setup_profiling_args('isame_json2tei', args)
+
     if args.ara and args.debug:
         print('Warning! --ara arg is incompatible with --debug', file=sys.stderr)
 
     try:
-        json2tei(args.infile, args.outfile, sep=args.sep, to_ara=args.ara, debug=args.debug)
+        json2tei(args.infile, args.outfile, sep=args.sep, to_ara=args.ara, jobs=args.jobs, cache_dir=args.cache, debug=args.debug)
     except InterSaMETeiError:
-        logging.error("TEI Conversion stopped!")
+        logger.error("TEI Conversion stopped!")
+        sys.exit(1)
+    except InterSaMEStreamError as e:
+        logger.error('TEI Conversion stopped! previous stage failed: %s', e)
         sys.exit(1)
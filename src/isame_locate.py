@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+#
+#    isame_locate.py
+#
+# locate the start index of transcribed pages in the reference text
+#
+# The rasm skeleton of every word of the reference text, i.e. its archigraphemes without dots or
+# vowels, is indexed by n-grams of consecutive words. The first words of a page are stripped in the
+# same way and each n-gram found in the index votes for the start position it implies, so that a
+# page is located without aligning it against the whole text. Verse markers of the page, e.g. #5:1#,
+# are used to rank the candidates: a marker after the m-th word of the page must be in the verse of
+# the m-th word of the candidate. Lacunas and illegible text do not vote.
+#
+# The index of the reference text is stored in a pickled cache, as it takes a few seconds to build
+# it from rasm.
+#
+# By default only the pages without a start index in the index file are located. With --write the
+# best candidate of each of them is added to the index file.
+#
+# dependencies:
+#   * rasm
+#
+# examples:
+#   $ python isame_locate.py ../data/arabic/F001_BnF.Ar.330f.txt --indexes isame_indexes.json
+#   $ python isame_locate.py ../data/arabic/F001_BnF.Ar.330f.txt --indexes isame_indexes.json --write
+#   $ python isame_locate.py ../data/arabic/F001_BnF.Ar.330f.txt --all --top 3
+#
+########################################################################################################
+
+import os
+import re
+import sys
+import pickle
+from array import array
+from collections import Counter
+from argparse import ArgumentParser, FileType
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from rasm import rasm
+
+from isame_util import NUM_VERSES, ARCH, EMPTY_SET, split_blocks, write_atomic
+from isame_qindex import QIndex
+from isame_catalog import build_catalog, load_catalog
+from isame_get_text import DEFAULT_SOURCE
+from isame_parser import BLOCKS_REGEX, TITLE_REGEX, LINE_REGEX, INDEXES_FILE
+
+MYPATH = os.path.dirname(os.path.abspath(__file__))
+
+CACHE_FILE = os.path.join(MYPATH, '.isame_locate.pickle')
+
+# increase when the structure of ReferenceIndex changes, so that old caches are discarded
+LOCATE_VERSION = 1
+
+# number of consecutive words of each entry of the index
+NGRAM = 3
+
+# number of words of the page used for locating it
+QUERY_WORDS = 12
+
+# number of candidates shown for each page
+TOP = 5
+
+# first layer of a variant, e.g. [ᵃ/ᵢ=vd=dots] -> ᵃ ; [B>T/B=cr=dots] -> B
+VARIANT_REGEX = re.compile(r'\[(.+?)(?:[>^&].*?)*/.+?\]')
+NOT_SKELETON_REGEX = re.compile(rf'[^{ARCH}]')
+VERSE_MARKER_REGEX = re.compile(r'^([0-9]{1,3}):([0-9]{1,3})$')
+DIVIDER_REGEX = re.compile(r'^[⟦⟨{(]*[*xvc]')
+ESTIMATE_TOKEN_REGEX = re.compile(r'[0-9]+(?:-[0-9]+)?r')
+
+# indexes already loaded in this process: (source, n, cache) -> ReferenceIndex
+_LOADED = {}
+
+
+class InterSaMELocateError(Exception):
+    """ Exception for pages that cannot be located.
+
+    """
+    pass
+
+
+def skeleton(text):
+    """ strip everything but the archigraphemes of text.
+
+    """
+    return NOT_SKELETON_REGEX.sub('', text)
+
+
+class ReferenceIndex:
+    """ n-gram index of the rasm skeletons of the words of the reference text.
+
+    Attributes:
+        version (int): version of the index structure.
+        source (str): quranic source for rasm.
+        n (int): number of words of each n-gram.
+        skeletons (list): skeleton of each word, in order.
+        starts (array): packed QIndex of the first block of each word.
+        nblocks (array): number of blocks of each word.
+        ngrams (dict): tuple of n skeletons -> word ordinals where the n-gram starts.
+        unigrams (dict): skeleton -> word ordinals, for pages with too few readable words for an n-gram.
+
+    """
+    def __init__(self, source=DEFAULT_SOURCE, n=NGRAM):
+
+        self.version = LOCATE_VERSION
+        self.source = source
+        self.n = n
+        self.skeletons = []
+        self.starts = array('L')
+        self.nblocks = array('B')
+
+        for _, bks in rasm(((1, 1, 1, None), (114, NUM_VERSES[114], None, None)), source=source, blocks=True, paleo=True):
+            self.skeletons.append(''.join(skeleton(bk[3]) for bk in bks))
+            self.starts.append(QIndex.from_tuple(bks[0][4][:3]))
+            self.nblocks.append(len(bks))
+
+        self.unigrams = {}
+        for i, sk in enumerate(self.skeletons):
+            self.unigrams.setdefault(sk, array('L')).append(i)
+
+        self.ngrams = {}
+        for i in range(len(self.skeletons)-n+1):
+            self.ngrams.setdefault(tuple(self.skeletons[i:i+n]), array('L')).append(i)
+
+    def _votes(self, words):
+        """ count the n-grams of words that agree on each start position.
+
+        Args:
+            words (list): skeleton of each word of the page, None if the word is not readable.
+
+        Return:
+            Counter, int: start word ordinal -> votes, and number of n-grams that could vote.
+
+        """
+        votes = Counter()
+        voters = 0
+        for n, table in ((self.n, self.ngrams), (1, self.unigrams)):
+            for j in range(len(words)-n+1):
+                gram = words[j:j+n]
+                if None in gram:
+                    continue
+                voters += 1
+                for i in table.get(tuple(gram) if n > 1 else gram[0], ()):
+                    if i >= j:
+                        votes[i-j] += 1
+            if votes:
+                break
+            voters = 0
+        return votes, voters
+
+    def _verse(self, ordinal):
+        """ verse of word in position ordinal, None if it is out of the Quran.
+
+        """
+        return QIndex.from_int(self.starts[ordinal]).verse() if 0 <= ordinal < len(self.starts) else None
+
+    def locate(self, words, markers=(), partial=False, top=TOP):
+        """ find the positions of the reference text where a page may start.
+
+        Args:
+            words (list): skeleton of each of the first words of the page, None if the word is not readable.
+            markers (list): verse markers of the page, as pairs of QIndex and number of words before the marker.
+            partial (bool): the first word of the page is the end of a word started in the previous page.
+            top (int): maximum number of candidates.
+
+        Return:
+            list: candidates sorted from the best one, each one a dict with the start index (sura, vers,
+                word, bloc), the votes received out of the n-grams that could vote, and the verse markers matched.
+
+        """
+        words = list(words)
+        first = words[0] if words else None
+        if partial and words:
+            # only its last blocks are in the page
+            words[0] = None
+
+        votes, voters = self._votes(words)
+
+        candidates = []
+        for i, nvotes in votes.items():
+            matched = sum(self._verse(i+m-1) == verse for verse, m in markers)
+            sura, vers, word, _ = QIndex.from_int(self.starts[i])
+            bloc = 1
+            if partial and first:
+                if not self.skeletons[i].endswith(first):
+                    continue
+                bloc = max(1, self.nblocks[i] - len([b for b in split_blocks(first) if b]) + 1)
+            candidates.append(((matched, nvotes, -i), {'index': [sura, vers, word, bloc],
+                                                       'votes': nvotes,
+                                                       'voters': voters,
+                                                       'markers': matched}))
+
+        candidates.sort(key=lambda c: c[0], reverse=True)
+
+        return [cand for _, cand in candidates[:top]]
+
+
+def build_reference_index(source=DEFAULT_SOURCE, n=NGRAM, cache_fname=CACHE_FILE, rebuild=False):
+    """ get the index of the reference text from the cache, or build it if the cache is missing or outdated.
+
+    Args:
+        source (str): quranic source for rasm.
+        n (int): number of words of each n-gram.
+        cache_fname (str): pickle file for storing the index. If None, no cache is used.
+        rebuild (bool): force the creation of the index.
+
+    Return:
+        ReferenceIndex: index of the reference text.
+
+    """
+    key = (source, n, cache_fname)
+
+    index = None if rebuild else _LOADED.get(key)
+
+    if not index and not rebuild and cache_fname:
+        try:
+            with open(cache_fname, 'rb') as cache_fp:
+                cached_key, index = pickle.load(cache_fp)
+            if cached_key != (source, n) or index.version != LOCATE_VERSION:
+                index = None
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+            index = None
+
+    if not index:
+        index = ReferenceIndex(source, n)
+        if cache_fname:
+            try:
+                write_atomic(cache_fname, lambda cache_fp: pickle.dump(((source, n), index), cache_fp, protocol=pickle.HIGHEST_PROTOCOL), 'wb')
+            except (OSError, pickle.PicklingError):
+                # the cache is an optimisation, we can work without it
+                pass
+
+    _LOADED[key] = index
+
+    return index
+
+def page_query(trans, max_words=QUERY_WORDS):
+    """ extract the skeletons of the first words of the transcription of a page and its verse markers.
+
+    Args:
+        trans (str): transcription of the page, as matched by BLOCKS_REGEX.
+        max_words (int): maximum number of words.
+
+    Return:
+        list, list, bool: skeleton of each word (None if the word is not readable), verse markers as pairs of
+            QIndex and number of words before the marker, and whether the page starts in the middle of a word.
+
+    """
+    words = []
+    markers = []
+    partial = False
+    absent = False
+
+    lines = [LINE_REGEX.match(line) for line in filter(None, trans.replace('\r\n', '\n').split('\n'))]
+
+    for line in filter(None, lines):
+        for tok in VARIANT_REGEX.sub(r'\1', line.group('li')).split('#'):
+
+            if len(words) >= max_words:
+                return words, markers, partial
+
+            if not tok:
+                continue
+
+            if (m := VERSE_MARKER_REGEX.match(tok)):
+                try:
+                    markers.append((QIndex(*map(int, m.groups())), len(words)))
+                except ValueError:
+                    pass
+                continue
+
+            if DIVIDER_REGEX.match(tok):
+                continue
+
+            if ESTIMATE_TOKEN_REGEX.search(tok):
+                # the number of missing words is unknown, the following words cannot be placed
+                return words, markers, partial
+
+            unreadable = absent or any(c in tok for c in '⟦⟨⟧⟩')
+            for c in re.findall(r'[⟦⟨⟧⟩]', tok):
+                absent = c in '⟦⟨'
+
+            sk = skeleton(tok.replace(EMPTY_SET, ''))
+
+            if re.match(r'^[⟦{(]?=', tok):
+                if words:
+                    # continuation of the last word of the previous line
+                    words[-1] = None if unreadable or words[-1] is None else words[-1] + sk
+                    continue
+                partial = True
+
+            words.append(None if unreadable or not sk else sk)
+
+    return words, markers, partial
+
+def locate_text(text, index, catalog=None, all_pages=False, max_words=QUERY_WORDS, top=TOP):
+    """ locate the pages of an InterSaME text document.
+
+    Args:
+        text (str): InterSaME text document.
+        index (ReferenceIndex): index of the reference text.
+        catalog (isame_catalog.Catalog): start indexes of the pages. Pages already in it are skipped unless all_pages is True.
+        all_pages (bool): locate also the pages with a start index.
+        max_words (int): maximum number of words of each page used for locating it.
+        top (int): maximum number of candidates for each page.
+
+    Yield:
+        dict: title, hist_id, signature, folio, current start index (None if not found) and candidates of each page.
+
+    Raise:
+        InterSaMELocateError: if the title of a page is not valid.
+
+    """
+    for block in BLOCKS_REGEX.finditer(text):
+
+        title = block.group('title').strip()
+
+        if not (title_parsed := TITLE_REGEX.match(title)):
+            raise InterSaMELocateError(f'invalid syntax for title "{title}"')
+
+        hist_id, _, sig, folio, _ = title_parsed.groups()
+
+        try:
+            ini = catalog.start_index(hist_id, sig, folio) if catalog else None
+        except KeyError:
+            ini = None
+
+        if ini and not all_pages:
+            continue
+
+        words, markers, partial = page_query(block.group('trans').strip(), max_words)
+
+        yield {'title': title,
+               'hist_id': hist_id,
+               'signature': sig,
+               'folio': folio,
+               'ini_index': ini,
+               'candidates': index.locate(words, markers, partial, top)}
+
+def write_indexes(index_fname, located):
+    """ add the best candidate of each page without start index to the index file. Existing entries are kept.
+
+    Args:
+        index_fname (str): json file with the start indexes.
+        located (list): pages as yielded by locate_text.
+
+    Return:
+        int: number of start indexes added.
+
+    """
+    try:
+        with open(index_fname) as index_fp:
+            indexes = json.load(index_fp)
+    except FileNotFoundError:
+        indexes = {}
+
+    added = 0
+    for page in located:
+        if not page['candidates']:
+            continue
+        folios = indexes.setdefault(page['hist_id'], {}).setdefault(page['signature'], {})
+        if page['folio'] not in folios:
+            folios[page['folio']] = page['candidates'][0]['index']
+            added += 1
+
+    if added:
+        write_atomic(index_fname, lambda index_fp: json.dump(indexes, index_fp, ensure_ascii=False, indent=4))
+
+    return added
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='locate the start index of the pages of an InterSaME text document in the reference text')
+    parser.add_argument('infile', nargs='?', type=FileType('r'), default=sys.stdin, help='text file')
+    parser.add_argument('outfile', nargs='?', type=FileType('w'), default=sys.stdout, help='json file with the candidates of each page')
+    parser.add_argument('--indexes', default=INDEXES_FILE, help=f'json file with start qindexes [default {INDEXES_FILE}]')
+    parser.add_argument('--all', action='store_true', help='locate also the pages that have a start index')
+    parser.add_argument('--write', action='store_true', help='add the best candidate of each page without start index to the index file')
+    parser.add_argument('--top', type=int, default=TOP, help=f'number of candidates of each page [default {TOP}]')
+    parser.add_argument('--words', type=int, default=QUERY_WORDS, help=f'number of words of the page used for locating it [default {QUERY_WORDS}]')
+    parser.add_argument('--ngram', type=int, default=NGRAM, help=f'number of words of each n-gram of the index [default {NGRAM}]')
+    parser.add_argument('--source', default=DEFAULT_SOURCE, help=f'quranic source for rasm [default {DEFAULT_SOURCE}]')
+    parser.add_argument('--rebuild', action='store_true', help='force the creation of the index of the reference text')
+    args = parser.parse_args()
+
+    index = build_reference_index(args.source, args.ngram, rebuild=args.rebuild)
+
+    try:
+        if args.write and not os.path.exists(args.indexes):
+            # the index file is created by --write
+            catalog = build_catalog(index_fname=args.indexes)
+        else:
+            catalog = load_catalog(index_fname=args.indexes)
+    except FileNotFoundError as e:
+        print(f'Fatal error! {e}', file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        located = list(locate_text(args.infile.read(), index, catalog, args.all, args.words, args.top))
+    except InterSaMELocateError as e:
+        print(f'Fatal error! {e}', file=sys.stderr)
+        sys.exit(1)
+
+    for page in located:
+        if not page['candidates']:
+            print(f'Warning! page "{page["title"]}" not found in the reference text', file=sys.stderr)
+
+    if args.write:
+        added = write_indexes(args.indexes, located)
+        print(f'{added} start indexes added to {args.indexes}', file=sys.stderr)
+
+    json.dump(located, args.outfile, ensure_ascii=False, indent=4)
+    print(file=args.outfile)
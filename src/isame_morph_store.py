@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+#
+#    isame_morph_store.py
+#
+# compile the morphological analysis of the Quran (mushaf.json) into an indexed sqlite store
+# and read it lazily.
+#
+# The store contains one row per word, keyed by (sura, vers, word), with the analyses already
+# joined in the format used in the csv. Reading a word only loads that row from disk.
+#
+# examples:
+#   $ python isame_morph_store.py ../../../../abjad_util/data/processed/mushaf.json mushaf.morph.sqlite
+#   $ python isame_morph_store.py --get 2:255:1
+#
+###########################################################################################################################
+
+import os
+import sys
+import sqlite3
+from argparse import ArgumentParser
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+MYPATH = os.path.abspath(os.path.dirname(__file__))
+DT_QURAN_FNAME = os.path.join(MYPATH, '../../../../abjad_util/data/processed/mushaf.json')
+MORPH_STORE_FNAME = f'{os.path.splitext(DT_QURAN_FNAME)[0]}.morph.sqlite'
+
+# increase when the schema or the content of the store changes
+STORE_VERSION = 1
+
+MORPH_FIELDS = ('POS', 'type', 'afix', 'derv', 'lema', 'root', 'flec')
+
+
+def morph_fields(item):
+    """ join the analyses of a word of mushaf.json.
+
+    Args:
+        item (dict): word of mushaf.json, with a list of analyses in 'morf'.
+
+    Return:
+        dict: POS, type, afix, derv, lema, root and flec strings.
+
+    """
+    return {
+        'POS' : ';'.join((i['POS'] for i in item['morf'])),
+        'type' : ';'.join((i['type'] for i in item['morf'])),
+        'afix' : ';'.join(filter(None, (i['afix'] for i in item['morf']))),
+        'derv' : ';'.join(','.join(x) for x in filter(None, (i['derv'] for i in item['morf']))),
+        'lema' : ';'.join(filter(None, (i['lema'] for i in item['morf']))),
+        'root' : ';'.join(filter(None, (i['root'] for i in item['morf']))),
+        'flec' : ';'.join(','.join(x) for x in filter(None, (i['flec'] for i in item['morf']))),
+    }
+
+def compile_store(json_fname=DT_QURAN_FNAME, store_fname=MORPH_STORE_FNAME):
+    """ create morphological store from mushaf.json.
+
+    The store is written in a temporary file and moved into place when it is complete.
+
+    Args:
+        json_fname (str): mushaf.json file.
+        store_fname (str): sqlite file to create.
+
+    """
+    st = os.stat(json_fname)
+    with open(json_fname) as infp:
+        dt_quran = json.load(infp)
+
+    # same scheme as isame_util.write_atomic, sqlite needs the path instead of an open stream
+    tmp_fname = f'{store_fname}.{os.getpid()}.tmp'
+    if os.path.exists(tmp_fname):
+        os.remove(tmp_fname)
+
+    try:
+        with sqlite3.connect(tmp_fname) as conn:
+            conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.execute(f'CREATE TABLE morph (sura INTEGER, vers INTEGER, word INTEGER, {", ".join(f"{f} TEXT" for f in MORPH_FIELDS)}, '
+                          'PRIMARY KEY (sura, vers, word)) WITHOUT ROWID')
+            conn.executemany(f'INSERT OR REPLACE INTO morph VALUES (?, ?, ?, {", ".join("?" for _ in MORPH_FIELDS)})',
+                             ((item['sura'], item['vers'], item['word'], *morph_fields(item).values()) for item in dt_quran))
+            conn.executemany('INSERT INTO meta VALUES (?, ?)', (('version', str(STORE_VERSION)),
+                                                                ('source_mtime', str(st.st_mtime_ns)),
+                                                                ('source_size', str(st.st_size))))
+        conn.close()
+        os.replace(tmp_fname, store_fname)
+    finally:
+        if os.path.exists(tmp_fname):
+            os.remove(tmp_fname)
+
+def store_is_current(json_fname=DT_QURAN_FNAME, store_fname=MORPH_STORE_FNAME):
+    """ check if the store exists and was compiled from the current version of json_fname.
+
+    If json_fname does not exist, any existing store of the right version is valid.
+
+    Args:
+        json_fname (str): mushaf.json file.
+        store_fname (str): sqlite file.
+
+    Return:
+        bool: True if the store can be used.
+
+    """
+    if not os.path.exists(store_fname):
+        return False
+    try:
+        with sqlite3.connect(f'file:{store_fname}?mode=ro', uri=True) as conn:
+            meta = dict(conn.execute('SELECT key, value FROM meta'))
+        conn.close()
+    except sqlite3.Error:
+        return False
+
+    if meta.get('version') != str(STORE_VERSION):
+        return False
+
+    try:
+        st = os.stat(json_fname)
+    except OSError:
+        return True
+
+    return meta.get('source_mtime') == str(st.st_mtime_ns) and meta.get('source_size') == str(st.st_size)
+
+class MorphStore:
+    """ read-only mapping of (sura, vers, word) to the morphological analysis of the word, as
+    returned by morph_fields. Rows are loaded from the store the first time they are requested.
+
+    """
+    def __init__(self, store_fname=MORPH_STORE_FNAME):
+        self.fname = store_fname
+        self._conn = sqlite3.connect(f'file:{store_fname}?mode=ro', uri=True)
+        self._cache = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        row = self._conn.execute(f'SELECT {", ".join(MORPH_FIELDS)} FROM morph WHERE sura=? AND vers=? AND word=?', tuple(key)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        self._cache[key] = value = dict(zip(MORPH_FIELDS, row))
+        return value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def open_store(json_fname=DT_QURAN_FNAME, store_fname=MORPH_STORE_FNAME):
+    """ open the morphological store, compiling it first if it is missing or outdated.
+
+    Args:
+        json_fname (str): mushaf.json file.
+        store_fname (str): sqlite file.
+
+    Return:
+        MorphStore: lazy mapping of (sura, vers, word) to analysis.
+
+    Raise:
+        OSError: if the store cannot be compiled.
+
+    """
+    if not store_is_current(json_fname, store_fname):
+        compile_store(json_fname, store_fname)
+    return MorphStore(store_fname)
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='compile morphological analysis of the Quran into a sqlite store')
+    parser.add_argument('infile', nargs='?', default=DT_QURAN_FNAME, help=f'mushaf json file [default {DT_QURAN_FNAME}]')
+    parser.add_argument('store', nargs='?', default=MORPH_STORE_FNAME, help=f'sqlite store [default {MORPH_STORE_FNAME}]')
+    parser.add_argument('--force', action='store_true', help='compile the store even if it is up to date')
+    parser.add_argument('--get', metavar='SURA:VERS:WORD', help='show analysis of word')
+    args = parser.parse_args()
+
+    if args.force or not store_is_current(args.infile, args.store):
+        try:
+            compile_store(args.infile, args.store)
+        except OSError as e:
+            print(f'Fatal error! store could not be compiled: {e}', file=sys.stderr)
+            sys.exit(1)
+
+    if args.get:
+        with MorphStore(args.store) as store:
+            try:
+                print(json.dumps(store[tuple(map(int, args.get.split(':')))], ensure_ascii=False))
+            except KeyError:
+                print(f'Error! {args.get} not found in store', file=sys.stderr)
+                sys.exit(1)
@@ -17,33 +17,37 @@
 #   $ cat ../../data/arabic/trans/foo-4.txt | python isame_parser.py --debug | tee ../../data/arabic/trans/foo-5-pre.json | python isame_mapper.py |
 #     tee ../../data/arabic/trans/foo-6.json | python isame_json2tei.py > ../../data/arabic/trans/foo-7.xml
 #
+#   # with json lines, each stage processes the pages while the previous one is still running
+#   $ cat ../../data/arabic/trans/foo-4.txt | python isame_parser.py --jsonl | python isame_mapper.py --jsonl |
+#     python isame_json2tei.py > ../../data/arabic/trans/foo-7.xml
+#
+#   # time of each phase and page, see isame_profile.py
+#   $ python isame_parser.py ../../data/arabic/trans/foo-4.txt foo-5-pre.json --profile foo-parse-profile.json
+#
 #   $ cat ../../data/arabic/trans/BnF.Ar.330b-3-trans.xml | python isame_xml2txt.py --rm_note_tags | tee ../../data/arabic/trans/BnF.Ar.330b-4.txt |
 #     python isame_parser.py | tee ../../data/arabic/trans/BnF.Ar.330b-5-pre.json | python isame_json2tei.py | tee ../../data/arabic/trans/BnF.Ar.330b-7.xml
 #    cat ../../data/arabic/trans/F003_BnF.Ar.330b-3-trans.xml | python isame_xml2txt.py --rm_note_tags | tee F003_BnF.Ar.330b-4-trans.txt | python isame_parser.py | tee ../../data/arabic/trans/F003_BnF.Ar.330b-5-pre.json | python isame_json2tei.py | tee ../../data/arabic/trans/F003_BnF.Ar.330b-7.xml
 #
 ############################################################################################################################################################
 
-import os
 import re
 import sys
 import logging
-logging.basicConfig(handlers=[
-                        logging.FileHandler(f'{os.path.splitext(os.path.basename(__file__))[0]}.log', mode='w',),
-                        logging.StreamHandler()
-                    ],
-                    format='%(asctime)s :: %(levelname)s :: %(funcName)s :: %(lineno)d :: %(message)s',
-                    level=logging.DEBUG)
-try:
-    import ujson as json
-except ImportError:
-    import json
+from itertools import chain
+from functools import lru_cache
 
 from pprint import pprint #DEBUG
 from argparse import ArgumentParser, FileType
 
 from rasm import rasm
 
-from isame_util import NUM_VERSES, ARCH, ARDW, NOTES_TAGS, EMPTY_SET, calculate_line, absent_text
+from isame_util import NUM_VERSES, ARCH, ARDW, NOTES_TAGS, EMPTY_SET, calculate_line, absent_text, write_pages, \
+                       setup_logging
+from isame_catalog import INDEXES_FILE, load_catalog
+from isame_qindex import QIndex, is_verse, next_verse
+from isame_profile import phase, iter_phase, count_page, add_profile_arguments, setup_profiling_args
+
+logger = logging.getLogger(__name__)
 
 class NoteError(TypeError):
     """Raised then notes information if not correct."""
@@ -59,8 +63,6 @@ PARSING_ERROR = False
 
 ARCH = ARCH+EMPTY_SET
 
-INDEXES_FILE = 'isame_indexes.json'
-
 BLOCKS_REGEX = re.compile(r'TITLE:(?P<title>.+?)\n'
                           r'Source:(?P<source>.+?)\n'
                           r'(?P<trans>.+?)'
@@ -117,6 +119,43 @@ DOT_SYNTAX = re.compile(r'^([ᵘᵢᵃaiuʷᴬ]©?(→{1,2}|←{1,2}|↔{1,2})?[
 
 ERROR_DOT_SEQUENCES = ('ᵘ←', 'ᵃ-', 'ᵃ-!', 'ᵃ-↕!')
 
+DOUBLE_DOT_REGEX = re.compile(r'(?:ᵘᵘ|ᵃᵃ|ᵢᵢ)[A-Y]')
+
+Y_WITHOUT_TAIL_REGEX = re.compile(r'(Y)(?![⇓⇒])')
+ILLEGAL_SHAPE_REGEX = re.compile(r'Y→|Y↓|G←|G↘|ˀ˦|ˀ˥')
+OLD_DOT_REGEX = re.compile(r'[ᵟᵒ°ᵐ]')
+
+# codes of the problems found by dot_errors
+DOT_MISSING = 'dot-missing'         # dot attribute symbols without a preceding dot
+DOT_INITIAL = 'dot-initial'         # token starts with a dot or hamza
+DOT_ERRONEOUS = 'dot-erroneous'     # one of ERROR_DOT_SEQUENCES
+DOT_DOUBLE = 'dot-double'           # ᵘᵘ, ᵃᵃ or ᵢᵢ before a letter
+DOT_DUBIOUS = 'dot-dubious'         # invalid dot sequence containing a .
+DOT_INVALID = 'dot-invalid'         # invalid dot sequence
+
+# maximum number of tokens whose dot errors are kept in cache
+DOT_CACHE_SIZE = 2**16
+
+def _valid_dot_sequences():
+    """ compile DOT_SYNTAX into the set of dot sequences it accepts. As the language is finite,
+    a sequence is validated with a single lookup instead of trying the alternatives of the regex.
+
+    Return:
+        frozenset: valid dot sequences.
+
+    """
+    horizontal = ('', *(arrow*n for arrow in '→←↔' for n in (1, 2)))
+    vertical = ('', *(arrow*n for arrow in '↑↓↕' for n in (1, 2)))
+    copy_marks = (('', '', ''), ('©', '', ''), ('', '©', ''), ('', '', '©'))
+
+    candidates = chain((f'ˀ{arrow}' for arrow in '↑↕↓'),
+                       (f'{dot}{c1}{hor}{shape}{c2}{ver}{excl}{c3}' for dot in 'ᵘᵢᵃaiuʷᴬ' for c1, c2, c3 in copy_marks
+                        for hor in horizontal for shape in ('', '-', '≠') for ver in vertical for excl in ('', '!', '!!')))
+
+    return frozenset(seq for seq in candidates if DOT_SYNTAX.match(seq))
+
+VALID_DOT_SEQUENCES = _valid_dot_sequences()
+
 
 def parse_trans(title, folio, ini_index, trans, debug=False):
     """ prcess all information of a transcription of a manuscript image
@@ -183,7 +222,7 @@ def parse_trans(title, folio, ini_index, trans, debug=False):
     """
     global PARSING_ERROR
 
-    if debug: logging.debug(f'title={title}')
+    if debug: logger.debug('title=%s', title)
 
     struct = {
         'blocks' : [],
@@ -225,14 +264,14 @@ def parse_trans(title, folio, ini_index, trans, debug=False):
             notes_lines.append(num_line)
 
         if debug:
-            logging.debug(f'$num_line={num_line} $line={line}')
+            logger.debug('$num_line=%s $line=%s', num_line, line)
 
         i, n = -1, len(line)
         while (i:=i+1) < n:
             char = line[i]
 
             if debug:
-                logging.debug(f'$char={char} $cur_ibloc={cur_ibloc} $ichar_ptr={ichar_ptr}')
+                logger.debug('$char=%s $cur_ibloc=%s $ichar_ptr=%s', char, cur_ibloc, ichar_ptr)
 
             # skip sura info
             if char == '%':
@@ -255,7 +294,7 @@ def parse_trans(title, folio, ini_index, trans, debug=False):
 
             if char == '[':
                 if variant['inib']:
-                    logging.error(f'missing ] in "{title}". Stop parsing at [[{folio}.L{num_line}]]')
+                    logger.error('missing ] in "%s". Stop parsing at [[%s.L%s]]', title, folio, num_line)
                     PARSING_ERROR = True
                 variant_opened = True
 
@@ -278,18 +317,20 @@ def parse_trans(title, folio, ini_index, trans, debug=False):
                     i += m.end()-1
                     variant['endb'] = len(struct['blocks'])
                     variant['endc'] = ichar_ptr-1
-                    if debug: logging.debug(f'@DEBUG:save:variant@ {variant}')
+                    if debug: logger.debug('@DEBUG:save:variant@ %s', variant)
                     struct['variants'].append(variant)
                     variant = {'inib': None, 'inic': None, 'endb': None, 'endc': None, 'ref': None, 'stc':None, 'typ': None, 'lay': None}
                     variant_layers = None
                 else:
-                    logging.error(f'malformed variant in "{title}". The expected format is [A/B=D=C]. Stop parsing at [[{folio}.L{num_line}]]')
+                    logger.error('malformed variant in "%s". The expected format is [A/B=D=C]. Stop parsing at [[%s.L%s]]',
+                                 title, folio, num_line)
                     PARSING_ERROR = True
                 variant_opened = False
 
             elif char == ']':
                 #raise SyntaxError(f'malformed variant in "{title}". The expected format is [A/B=D=C]. Stop parsing at [[{folio}.L{num_line}]]') #FIXME
-                logging.error(f'malformed variant in "{title}". The expected format is [A/B=D=C]. Stop parsing at [[{folio}.L{num_line}]]')
+                logger.error('malformed variant in "%s". The expected format is [A/B=D=C]. Stop parsing at [[%s.L%s]]',
+                             title, folio, num_line)
                 PARSING_ERROR = True
 
             #
@@ -301,7 +342,8 @@ def parse_trans(title, folio, ini_index, trans, debug=False):
                 if current_block:
 
                     if debug:
-                        logging.debug(f'@DEBUG:save:1@ $tok={"".join(current_block)} $cur_isura={cur_isura} $cur_ivers={cur_ivers} $cur_iword={cur_iword} $cur_ibloc={cur_ibloc}')
+                        logger.debug('@DEBUG:save:1@ $tok=%s $cur_isura=%s $cur_ivers=%s $cur_iword=%s $cur_ibloc=%s',
+                                     "".join(current_block), cur_isura, cur_ivers, cur_iword, cur_ibloc)
 
                     if reading_fasila:
                         struct['fasilas'].append(len(struct['blocks']))
@@ -333,7 +375,8 @@ def parse_trans(title, folio, ini_index, trans, debug=False):
                 if i == 0 or (i == 1 and line[i-1] in ('⟦', '{', '(')) or re.match(r'^([^\]]+>)', line[:i-1]):
                     pass
                 else:
-                    logging.error(f'character = found in illegal position in "{title}". Stop parsing at [[{folio}.L{num_line}]]')
+                    logger.error('character = found in illegal position in "%s". Stop parsing at [[%s.L%s]]',
+                                 title, folio, num_line)
                     PARSING_ERROR = True
 
             #
@@ -346,13 +389,13 @@ def parse_trans(title, folio, ini_index, trans, debug=False):
             
             elif char == ')':
                 if not notes or notes[-1]['inib'] == None:
-                    logging.error(f'missing ( in "{title}". Stop parsing at [[{folio}.L{num_line}]]')
+                    logger.error('missing ( in "%s". Stop parsing at [[%s.L%s]]', title, folio, num_line)
                     PARSING_ERROR = True
                 
                 notes[-1]['endb'] = len(struct['blocks'])
                 notes[-1]['endc'] = ichar_ptr-1
 
-                if debug: logging.debug(f"@DEBUG:save:note@ {notes[-1]}")
+                if debug: logger.debug("@DEBUG:save:note@ %s", notes[-1])
                 struct['notes'].append(notes[-1])
                 notes.pop()
 
@@ -362,19 +405,19 @@ def parse_trans(title, folio, ini_index, trans, debug=False):
 
             elif char == '{':
                 if unclear['inib']:
-                    logging.error(f'missing }} in "{title}". Stop parsing at [[{folio}.L{num_line}]]')
+                    logger.error('missing } in "%s". Stop parsing at [[%s.L%s]]', title, folio, num_line)
                     PARSING_ERROR = True
                 unclear_opened = True
             
             elif char == '}':
                 if unclear['inib'] == None:
-                    logging.error(f'missing {{ in "{title}". Stop parsing at [[{folio}.L{num_line}]]')
+                    logger.error('missing { in "%s". Stop parsing at [[%s.L%s]]', title, folio, num_line)
                     PARSING_ERROR = True
                 
                 unclear['endb'] = len(struct['blocks'])
                 unclear['endc'] = ichar_ptr-1
 
-                if debug: logging.debug(f"@DEBUG:save:unclear@ {unclear}")
+                if debug: logger.debug("@DEBUG:save:unclear@ %s", unclear)
                 struct['unclear'].append(unclear)
                 unclear = {'inib' : None, 'inic' : None, 'endb' : None, 'endc' : None}
 
@@ -384,19 +427,19 @@ def parse_trans(title, folio, ini_index, trans, debug=False):
     
             elif char == '⟦':
                 if lacuna['inib']:
-                    logging.error(f'missing ⟧ in "{title}". Stop parsing at [[{folio}.L{num_line}]]')
+                    logger.error('missing ⟧ in "%s". Stop parsing at [[%s.L%s]]', title, folio, num_line)
                     PARSING_ERROR = True
                 lacuna_opened = True
 
             elif char == '⟧':
                 if lacuna['inib'] == None:
-                    logging.error(f'missing ⟦ in "{title}". Stop parsing at [[{folio}.L{num_line}]]')
+                    logger.error('missing ⟦ in "%s". Stop parsing at [[%s.L%s]]', title, folio, num_line)
                     PARSING_ERROR = True
 
                 lacuna['endb'] = len(struct['blocks'])
                 lacuna['endc'] = ichar_ptr-1
 
-                if debug: logging.debug(f"@DEBUG:save:lacuna@ {lacuna}")
+                if debug: logger.debug("@DEBUG:save:lacuna@ %s", lacuna)
                 struct['lacunas'].append(lacuna)
                 lacuna = {'inib' : None, 'inic' : None, 'endb' : None, 'endc' : None}
     
@@ -406,21 +449,21 @@ def parse_trans(title, folio, ini_index, trans, debug=False):
 
             elif char == '⟨':
                 if illegible['inib']:
-                    logging.error(f'missing ⟩ in "{title}". Stop parsing at [[{folio}.L{num_line}]]')
+                    logger.error('missing ⟩ in "%s". Stop parsing at [[%s.L%s]]', title, folio, num_line)
                     PARSING_ERROR = True
                 else:
                     illegible_opened = True
 
             elif char == '⟩':
                 if illegible['inib'] == None:
-                    logging.error(f'missing ⟨ in "{title}". Stop parsing at [[{folio}.L{num_line}]]')
+                    logger.error('missing ⟨ in "%s". Stop parsing at [[%s.L%s]]', title, folio, num_line)
                     PARSING_ERROR = True
 
                 illegible['endb'] = len(struct['blocks'])
                 illegible['endc'] = ichar_ptr-1
                 
                 illegible['endc'] = ichar_ptr-1
-                if debug: logging.debug(f"@DEBUG:save:illegible@ {illegible}")
+                if debug: logger.debug("@DEBUG:save:illegible@ %s", illegible)
                 struct['illegible'].append(illegible)
                 illegible = {'inib' : None, 'inic' : None, 'endb' : None, 'endc' : None}
 
@@ -429,9 +472,10 @@ def parse_trans(title, folio, ini_index, trans, debug=False):
             #
 
             elif char == '*' and line[i+1] not in '⟩⟧':
-                if debug: logging.debug(f"@DEBUG:processing-fasila")
+                if debug: logger.debug("@DEBUG:processing-fasila")
                 if not FASILA_REGEX.search(line[i:]):
-                    logging.error(f'invalid syntax following fasila * "{line[i:].partition("#")[0]}" in "{title}". Perhaps invalid variant or unclear instead of illegible? Stop parsing at [[{folio}.L{num_line}]]')
+                    logger.error('invalid syntax following fasila * "%s" in "%s". Perhaps invalid variant or unclear instead of illegible? Stop parsing at [[%s.L%s]]',
+                                 line[i:].partition("#")[0], title, folio, num_line)
                     PARSING_ERROR = True
                 continue
 
@@ -441,7 +485,8 @@ def parse_trans(title, folio, ini_index, trans, debug=False):
 
             elif char == 'x' and line[i+1] not in '⟩⟧':
                 if not AWASHIR_REGEX.search(line[i:]):
-                    logging.error(f'invalid syntax following awashir x "{line[i:].partition("#")[0]}" in "{title}". Stop parsing at [[{folio}.L{num_line}]]')
+                    logger.error('invalid syntax following awashir x "%s" in "%s". Stop parsing at [[%s.L%s]]',
+                                 line[i:].partition("#")[0], title, folio, num_line)
                     PARSING_ERROR = True
                 continue
 
@@ -451,7 +496,8 @@ def parse_trans(title, folio, ini_index, trans, debug=False):
 
             elif char == 'v' and line[i+1] not in '⟩⟧':
                 if not KHAWAMIS_REGEX.search(line[i:]):
-                    logging.error(f'invalid syntax following khawamis v "{line[i:].partition("#")[0]}" in "{title}". Stop parsing at [[{folio}.L{num_line}]]')
+                    logger.error('invalid syntax following khawamis v "%s" in "%s". Stop parsing at [[%s.L%s]]',
+                                 line[i:].partition("#")[0], title, folio, num_line)
                     PARSING_ERROR = True
                 continue
 
@@ -461,35 +507,40 @@ def parse_trans(title, folio, ini_index, trans, debug=False):
 
             elif char == 'c' and line[i+1] not in '⟩⟧':
                 if not HUNDRED_REGEX.search(line[i:]):
-                    logging.error(f'invalid syntax following miaa c "{line[i:].partition("#")[0]}" in "{title}". Stop parsing at [[{folio}.L{num_line}]]')
+                    logger.error('invalid syntax following miaa c "%s" in "%s". Stop parsing at [[%s.L%s]]',
+                                 line[i:].partition("#")[0], title, folio, num_line)
                     PARSING_ERROR = True
                 continue
 
             elif char in '123456789' and not reading_fasila and not reading_khawamis and not reading_awashir and not reading_miaa and not ESTIMATE_REGEX.search(line[i:]):
                 if (m := VERSE_DIV_REGEX.search(line[i:])):
-                    cur_isura = int(m.group(1))
-                    cur_ivers = int(m.group(2))+1
+                    sura, vers = int(m.group(1)), int(m.group(2))
                     cur_iword = 1
                     cur_ibloc = 1
-                    if cur_ivers == NUM_VERSES[cur_isura]+1:
-                        cur_isura += 1
+                    if not is_verse(sura, vers):
+                        cur_isura = sura+1
                         cur_ivers = 1
-                        if cur_isura > 114:
-                            logging.error(f'invalid sura number in "{title}": there are a total of 114 in the reference Quran. Stop parsing at [[{folio}.L{num_line}]]')
-                    elif cur_ivers > NUM_VERSES[cur_isura]:
-                        cur_isura = int(m.group(1))+1
-                        cur_ivers = 1
-                        logging.error(f'invalid verse number in "{title}": sura {cur_isura} has only {NUM_VERSES[cur_isura]} but {cur_ivers} found. Stop parsing at [[{folio}.L{num_line}]]')
+                        logger.error('invalid verse number in "%s": sura %s has only %s but %s found. Stop parsing at [[%s.L%s]]',
+                                     title, sura, NUM_VERSES.get(sura), vers, folio, num_line)
                         PARSING_ERROR = True
+                    elif (succ := next_verse(QIndex(sura, vers))):
+                        cur_isura, cur_ivers = succ.sura, succ.vers
+                    else:
+                        cur_isura = sura+1
+                        cur_ivers = 1
+                        logger.error('invalid sura number in "%s": there are a total of 114 in the reference Quran. Stop parsing at [[%s.L%s]]',
+                                     title, folio, num_line)
                     i += m.end()-1
                 else:
-                    logging.error(f'invalid syntax in "{title}": unexpected number found. Stop parsing at [[{folio}.L{num_line}]]')
+                    logger.error('invalid syntax in "%s": unexpected number found. Stop parsing at [[%s.L%s]]',
+                                 title, folio, num_line)
           
             else:
                 # there can be something like ...W1-2r...
                 if (char in ARCH or char in '123456789') and ARDW_found and current_block and not reading_fasila and not reading_awashir and \
                     not reading_khawamis and not reading_miaa:
-                    if debug: logging.debug(f"@DEBUG:save:2@ $tok={''.join(current_block)} $cur_isura={cur_isura} $cur_ivers={cur_ivers} $cur_iword={cur_iword} $cur_ibloc={cur_ibloc}")
+                    if debug: logger.debug("@DEBUG:save:2@ $tok=%s $cur_isura=%s $cur_ivers=%s $cur_iword=%s $cur_ibloc=%s",
+                                           ''.join(current_block), cur_isura, cur_ivers, cur_iword, cur_ibloc)
                     struct['blocks'].append(
                         {'tok' : ''.join(current_block),
                          'ind' : [(cur_isura, cur_ivers, cur_iword, cur_ibloc)],
@@ -582,7 +633,7 @@ def merge_notes(folio, parsed, footnotes, line_notes):
         parsed['notes'].append({'inib': -1, 'inic': -1, 'endb': -1, 'endc': -1, 'line': lin, 'note': None})
 
     if len(parsed['notes']) != len(footnotes):
-        logging.error(f'Mismatch in the number of note annotations and footnotes in {folio}')
+        logger.error('Mismatch in the number of note annotations and footnotes in %s', folio)
         NOTE_ERROR = True
 
     for noteann, footnote in zip(sorted(parsed['notes'], key=lambda x: (x['line'], x['inib'], x['inic'], x['endb'], x['endc'])), footnotes):
@@ -615,7 +666,7 @@ def merge_notes(folio, parsed, footnotes, line_notes):
             noteann_cut['note'] = noteann_cut['note'][:min(20, len(noteann_cut['note']))]+' ...'
             footnote_cut = dict(footnote)
             footnote_cut['textnote'] = footnote_cut['textnote'][:min(20, len(footnote_cut['textnote']))]+' ...'
-            logging.error(f'noteann "{noteann_cut}" and footnote "{footnote_cut}" refer to different lines')
+            logger.error('noteann "%s" and footnote "%s" refer to different lines', noteann_cut, footnote_cut)
             NOTE_ERROR = True
 
         del noteann['line']
@@ -623,17 +674,60 @@ def merge_notes(folio, parsed, footnotes, line_notes):
     if NOTE_ERROR:
         raise NoteError(f'error parsing notes')
 
-def check_dots(token, title, folio, lines, curbloc, level='error'):
+@lru_cache(maxsize=DOT_CACHE_SIZE)
+def dot_errors(token):
+    """ check the dot system of a token. Results are cached, as the same tokens occur again and again in a manuscript.
+
+    Args:
+        token (str): token to check.
+
+    Return:
+        tuple: (code, text) of each problem found, in order of check, where code is one of DOT_MISSING,
+            DOT_INITIAL, DOT_ERRONEOUS, DOT_DOUBLE, DOT_DUBIOUS and DOT_INVALID and text is the part
+            of the token affected.
+
     """
+    if not token:
+        return ()
+
+    errors = []
+
+    # we don't check - because it can be part of i-jr
+    # Be aware that the hamza has arrows too: ˀ↑, ˀ↕, ˀ↓
+    if (dot_miss := DOT_MISSING_REGEX.search(token)):
+        errors.append((DOT_MISSING, dot_miss.group(0)))
+
+    if token[0] in DOTS_HAMZA_SET:
+        errors.append((DOT_INITIAL, token[0]))
+
+    errors.extend((DOT_ERRONEOUS, seq) for seq in ERROR_DOT_SEQUENCES if seq in token)
+
+    if (double := DOUBLE_DOT_REGEX.search(token)):
+        errors.append((DOT_DOUBLE, double.group(0)))
+
+    # notice the defaults:
+    #    ᵘ: by default baseline, attached and left
+    #    ᵢ: by default below the baseline, attached and centre
+    #    ᵃ: by default above the baseline, attached and centre
+    if any(d in token for d in DOTS_HAMZA_SET):
+        errors.extend((DOT_DUBIOUS if '.' in dot else DOT_INVALID, dot)
+                      for dot in DOT_SEQ.findall(token) if dot not in VALID_DOT_SEQUENCES)
+
+    return tuple(errors)
+
+def check_dots(token, title, folio, lines, curbloc, level='error'):
+    """ check the dot system of a token and log the problems found.
+
     Args:
         token (str): token to parse.
         title (str): title of token to parse.
         folio (str): folio of token to parse.
         lines (list): struct containing lines info.
         curbloc (int): current block.
+        level (str): error or warning, level of invalid dot sequences.
 
     Return:
-        bool: False if token has a dot sequence with incorrect syntax, True otherwise.
+        bool: True if token has a fatal dot error, False otherwise.
 
     """
     if not token:
@@ -644,252 +738,268 @@ def check_dots(token, title, folio, lines, curbloc, level='error'):
 
     ERROR_FOUND = False
 
-    # we don't check - because it can be part of i-jr
-    # Be aware that the hamza has arrows too: ˀ↑, ˀ↕, ˀ↓
-    if (dot_miss := DOT_MISSING_REGEX.search(token)):
-        logging.error(f'Fatal error: dot attribute symbols "{dot_miss.group(0)}" found without any preceding ᵘᵢᵃ in '
-                      f'"{title}" tok="{token}" [[{folio}.L{calculate_line(lines, curbloc)}]]')
-        ERROR_FOUND = True
+    for code, text in dot_errors(token):
 
-    if token[0] in DOTS_HAMZA_SET:
-        logging.warning(f'Warning: dot/hamza at the beginning of token in '
-                      f'"{title}" tok="{token}" [[{folio}.L{calculate_line(lines, curbloc)}]]') 
+        if code == DOT_MISSING:
+            logger.error('Fatal error: dot attribute symbols "%s" found without any preceding ᵘᵢᵃ in '
+                         '"%s" tok="%s" [[%s.L%s]]',
+                         text, title, token, folio, calculate_line(lines, curbloc))
+            ERROR_FOUND = True
 
-    for dot_error in ERROR_DOT_SEQUENCES:
-        if dot_error in token:
-            logging.warning(f'Fatal error: token has erroneous dot sequence in '
-                          f'"{title}" tok="{token}" [[{folio}.L{calculate_line(lines, curbloc)}]]')
-        
-    if any(re.search(rf'{s}[A-Y]', token) for s in ('ᵘᵘ', 'ᵃᵃ', 'ᵢᵢ')):
-        logging.error(f'Fatal error: invalid sequence ᵘᵘ, ᵃᵃ or ᵢᵢ in '
-                      f'"{title}" tok="{token}" [[{folio}.L{calculate_line(lines, curbloc)}]]')
-        ERROR_FOUND = True
+        elif code == DOT_INITIAL:
+            logger.warning('Warning: dot/hamza at the beginning of token in '
+                           '"%s" tok="%s" [[%s.L%s]]', title, token, folio, calculate_line(lines, curbloc))
 
-    # notice the defaults:
-    #    ᵘ: by default baseline, attached and left
-    #    ᵢ: by default below the baseline, attached and centre
-    #    ᵃ: by default above the baseline, attached and centre
-    if any(d in  token for d in DOTS_HAMZA_SET):
+        elif code == DOT_ERRONEOUS:
+            logger.warning('Fatal error: token has erroneous dot sequence in '
+                           '"%s" tok="%s" [[%s.L%s]]',
+                           title, token, folio, calculate_line(lines, curbloc))
+
+        elif code == DOT_DOUBLE:
+            logger.error('Fatal error: invalid sequence ᵘᵘ, ᵃᵃ or ᵢᵢ in '
+                         '"%s" tok="%s" [[%s.L%s]]', title, token, folio, calculate_line(lines, curbloc))
+            ERROR_FOUND = True
+
+        elif code == DOT_DUBIOUS:
+            logger.warning('Possible invalid dot syntax "%s" in "%s" tok="%s" [[%s.L%s]]',
+                           text, title, token, folio, calculate_line(lines, curbloc))
+
+        elif level == 'error':
+            logger.error('Fatal error: invalid dot syntax "%s" in "%s" tok="%s" [[%s.L%s]]',
+                         text, title, token, folio, calculate_line(lines, curbloc))
+            ERROR_FOUND = True
+
+        else:
+            logger.warning('Warning: possible invalid dot syntax "%s" in "%s" tok="%s" [[%s.L%s]]',
+                           text, title, token, folio, calculate_line(lines, curbloc))
 
-        for dot in DOT_SEQ.findall(token):
-            #print(f'~/DEBUG/~ dot="{dot}"', file=sys.stderr) #DEBUG
-            if not DOT_SYNTAX.match(dot) or dot.count('©')>1:
-                if '.' in dot:
-                    logging.warning(f'Possible invalid dot syntax "{dot}" in "{title}" tok="{token}" [[{folio}.L{calculate_line(lines, curbloc)}]]')
-                else:
-                    if level == 'error':
-                        logging.error(f'Fatal error: invalid dot syntax "{dot}" in "{title}" tok="{token}" [[{folio}.L{calculate_line(lines, curbloc)}]]')
-                        ERROR_FOUND = True
-                    elif level == 'warning':
-                        logging.warning(f'Warning: possible invalid dot syntax "{dot}" in "{title}" tok="{token}" [[{folio}.L{calculate_line(lines, curbloc)}]]')
-    
     return ERROR_FOUND
 
-def parse(infp, outfp, index_fname=INDEXES_FILE, no_dot_check=False, debug=False):
-    """ parse infp text file and conevrt it into a json document.
+def _match_blocks(text):
+    """ find the blocks of transcription of each image in text.
 
     Args:
-        infp (io.TextIOWrapper):
-        outfq (io.TextIOWrapper):
-        index_fname (str): name of json file contaning quran indexes. #FIXME deberias quitarlo de aqui y usarlo solo en el mapper
-        no_dot_check (bool): do not check the dots.
-        debug (bool): show debugging info.
+        text (str): InterSaME text.
 
-    Raise:
-        InterSaMESyntaxError: if InterSaME txt document is malformed.
+    Return:
+        list: matches of BLOCKS_REGEX.
 
     """
     global PARSING_ERROR
 
-    with open(index_fname) as index_fp:
-        indexes = json.load(index_fp)
-
-    text = infp.read()
-
     blocks = list(BLOCKS_REGEX.finditer(text))
     
     if len(blocks) != len(re.findall(r'TITLE:', text, re.DOTALL)):
-        logging.error("Fatal error: one or more blocks not recognised in file")
+        logger.error("Fatal error: one or more blocks not recognised in file")
+        PARSING_ERROR = True
+
+    return blocks
+
+def _check_lines(title, folio, side, ini, lines):
+    """ check the syntax of the lines of the transcription of an image.
+
+    Args:
+        title (str): title of the transcription.
+        folio (str): folio of the transcription.
+        side (str): side of the folio.
+        ini (tuple): start index of the page.
+        lines (list): lines matched by LINE_REGEX.
+
+    """
+    global PARSING_ERROR
+
+    if not all(lines):
+        logger.error("Fatal error: invalid syntax for one or more lines in \"%s\"", title)
         PARSING_ERROR = True
         
+    # check empty lines
+    for i, (j, li) in enumerate(((l.group('n'), l.group('li')) for l in lines), 1):
+        if not li and len(lines)==i-1:
+            logger.error("Fatal error: invalid syntax for line in \"%s\" [[%s.L%s]]", title, folio, j)
+            PARSING_ERROR = True
+            
+        
+    # check line numbers that don't match, exclusing -
+    for i, (j, li) in enumerate([(l.group('n'), l.group('li')) for l in lines if l.group('n')!='-'], 1):
+        if i != int(j):
+            logger.error("Fatal error: invalid line number for line in \"%s\" [[%s%s.L%s]]", title, folio, side, j)
+            PARSING_ERROR = True
+            
 
-    # we need to have a list because a hist-id can have more than one fragments
-    out = []
-    for block in blocks:
+    # check a lacuna is not surrounding an index in the whole text (it may be covering several lines)
+    if re.search(r'⟦[^⟦]+?#\d+:\d+#[^⟦]+?⟧', ''.join(l.group('li') for l in lines)):
+        logger.error("Fatal error: a lacuna cannot include a Quranic index \"%s\" [[%s.L?]]", title, folio)
+        PARSING_ERROR = True
         
-        title = block.group('title').strip()
-        source = block.group('source').strip()
-        trans = block.group('trans').strip()
-        notes = block.group('notes')
 
-        if not (title_parsed := TITLE_REGEX.match(title)):
-            logging.error(f"Fatal error: invalid syntax for title \"{title}\"")
+    for j, li in ((l.group('n'), l.group('li')) for l in lines):
+        # check there are no spaces
+        if ' ' in li:
+            logger.error('Fatal error: space found in "%s" [[%s.L%s]]', title, folio, j)
+            PARSING_ERROR = True
+            
+        # check there are no multiple # together
+        if '##' in li:
+            logger.error('Fatal error: concatenated # found in "%s" [[%s.L%s]]', title, folio, j)
+            PARSING_ERROR = True
+            
+        # check there are no opening tags at the end of a line
+        if li and li[-1] in ('{', '⟦', '⟨', '['):
+            logger.error('Fatal error: opening {, ⟦, ⟨ or [ found at the end of line in "%s" [[%s.L%s]]', title, folio, j)
+            PARSING_ERROR = True
+            
+        # check there are no closing tags after a word separator, i.e. #}
+        if re.search(r'#[\}⟧⟩\]]', li):
+            logger.error('Fatal error: closing tag }, ⟧, ⟩ or ] found just after a word separator in "%s" [[%s.L%s]]', title, folio, j)
+            PARSING_ERROR = True
+            
+        # check there are no NQY in non-final positions (the checking is done only in the first hand!)
+        if re.search(fr'[NQY][^#]*[{ARCH}]', re.sub(r'\[(.+?)(?:[>^&].*?)*/.+?\]', r'\1', li)):
+            logger.warning('Warning: there might be N, Q or Y in non-final position in "%s" [[%s.L%s]]', title, folio, j)
+            #PARSING_ERROR = True
+            
+        # check ther are no letterblocks splited between two lines
+        if re.search(rf'[BGSCTEFQKLMNHY][^{ARCH}#=]*$', li):
+            logger.error('Fatal error: letterblock splitted between two lines "%s" [[%s.L%s]]', title, folio, j)
+            PARSING_ERROR = True
+            
+        # check an index is always surrounded by hashtag
+        if re.search(r'[^#\d]\d+:\d+#|#\d+:\d+[^#\d]', li):
+            logger.error('Fatal error: an index must always be surrounded by # "%s" [[%s.L%s]]', title, folio, j)
+            PARSING_ERROR = True
+            
+        # check reference is not empty
+        if '/=' in li:
+            logger.error('Fatal error: reference text empty ("/=") in "%s" [[%s.L%s]]', title, folio, j)
             PARSING_ERROR = True
-            hist_id, loc, sig, folio, side = 5*(None,)
-        else:
-            hist_id, loc, sig, folio, side = title_parsed.groups()
 
-        try:
-            ini = indexes[hist_id][sig][folio]
-        except KeyError:
-            logging.error(f"Fatal error: start index not found in index file for hist_id=\"{hist_id}\" sig={sig} folio={folio}")
+        # check fasila containing empty set is marked with the corresponding subdivision
+        # [∅>*1CD07/*=sub=fasila], [*∅>*1VO05/*=sub=fasila] are wrong
+        if re.search(r'\[∅(>\*[0-9A-Z]{5})?/\*=sub=fasila\]', li) or re.search(r'\[*∅>*[0-9A-Z]{5}/*=sub=fasila\]', li):
+            logger.error('Fatal error: subdivision variant without marking the fasila in "%s" [[%s.L%s]]', title, folio, j)
             PARSING_ERROR = True
-            ini = 4*(-1,)
 
-        meta = {'title' : title,
-                'hist_id' : hist_id,
-                'location' : loc,
-                'signature' : sig,
-                'folio' : folio,
-                'side' : side,
-                'ini_index' : ini,
-                'source' : source}
+        # note after correction e.g. [BEFLWN>B+’’EFLWN(ᵃ←!)/B’’ᵃE’ᵒF’ᵘLᵘWN’ᵃ=r=mech.haplog] is ILLEGAL
+        if (m:=re.search(r'[>&\^][^/]*[()]', li)):
+            logger.error('Fatal error: Note tags cannot appear after a > & or ^, "%s" in "%s" [[%s.L%s]]',
+                         m.group(), title, folio, j)
+            PARSING_ERROR = True
 
-        if debug:
-            logging.debug(f"$hist_id={hist_id} $location={loc} $signature={sig} $folio={folio} $side={side} "
-                          f"$START={ini} $source={source}")
+        # note within reference text
+        if (m:=re.search(r'/[^=]*[()]', li)):
+            logger.error('Fatal error: Note tags cannot appear within the reference text, "%s" in "%s" [[%s.L%s]]',
+                         m.group(), title, folio, j)
+            PARSING_ERROR = True
 
-        lines = [LINE_REGEX.match(line) for line in filter(None, trans.replace('\r\n', '\n').split('\n'))]
+        # closing unclear inside correction, e.g. [{ᵃ→↕>ᵃ©←↑}/ˀᵃ=vd=hamza] is ILLEGAL, but [ᵃ→↕>ᵃ{©←↑}/ˀᵃ=vd=hamza] is LEGAL
+        if (m:=re.search(r'>[^/{]*}', li)):
+            logger.error('Fatal error: unclear closing tag cannot be inside a correction, unless the opening tag is also within the correction,'
+                         ' "%s" in "%s" [[%s.L%s]]', m.group(), title, folio, j)
+            PARSING_ERROR = True
+        # closing illegible inside correction
+        if (m:=re.search(r'>[^/⟨]*\⟩', li)):
+            logger.error('Fatal error: illegible closing tag cannot be inside a correction, unless the opening tag is also within the correction,'
+                         ' "%s" in "%s" [[%s.L%s]]', m.group(), title, folio, j)
+            PARSING_ERROR = True
+        # closing lacuna inside correction
+        if (m:=re.search(r'>[^/⟦]*\⟧', li)):
+            logger.error('Fatal error: lacuna closing tag cannot be inside a correction, unless the opening tag is also within the correction,'
+                         ' "%s" in "%s" [[%s.L%s]]', m.group(), title, folio, j)
+            PARSING_ERROR = True
+
+        # if a divider is unclear, illegible or lacuna, the mark must cover the divider and not the other way round
+        # e.g. *{1DS03} is wrong  /  {*1DS03} is right
+        if re.search(r'[*xvc][\{⟨⟦(]', li):
+            logger.error('Fatal error: unclear/illegible/lacuna/note must be outside the divider (fasila, khawamis, awashir, miaa)'
+                         ', so e.g. {*...} is correct, *{...} is not, in "%s" [[%s.L%s]]', title, folio, j)
+            PARSING_ERROR = True
+
+        # missing variant brackets, e.g. |2|=MA#LHMᵘ←/ᵒ#
+        if re.search(r'^[^\[]+?/', li):
+            logger.error('Fatal error: variant without brackets in "%s" [[%s.L%s]]', title, folio, j)
+            PARSING_ERROR = True
 
-        if not all(lines):
-            logging.error(f"Fatal error: invalid syntax for one or more lines in \"{title}\"")
+    # check when a line does not end in # the following starts with =
+    for k, (j, li) in enumerate((l.group('n'), l.group('li')) for l in lines[:-1]):
+        final_hashtag = re.search(r'#(?:(=.+?=.+?(;.+?=.+?)*\])|⟧)?$', li)
+        next_initial_equal = re.search(r'^(?:([^\]]+>)|⟦)?=', lines[k+1].group('li'))
+        if not final_hashtag and not next_initial_equal:
+            logger.error('Fatal error: line missing final # or next line missing = in "%s" [[%s.L%s]]', title, folio, j)
             PARSING_ERROR = True
             
-        # check empty lines
-        for i, (j, li) in enumerate(((l.group('n'), l.group('li')) for l in lines), 1):
-            if not li and len(lines)==i-1:
-                logging.error(f"Fatal error: invalid syntax for line in \"{title}\" [[{folio}.L{j}]]")
-                PARSING_ERROR = True
-                
+        if final_hashtag and next_initial_equal:
+            logger.error('Fatal error: line ending in # and next line ending in = in "%s" [[%s.L%s]]', title, folio, j)
+            PARSING_ERROR = True
             
-        # check line numbers that don't match, exclusing -
-        for i, (j, li) in enumerate([(l.group('n'), l.group('li')) for l in lines if l.group('n')!='-'], 1):
-            if i != int(j):
-                logging.error(f"Fatal error: invalid line number for line in \"{title}\" [[{folio}{side}.L{j}]]")
-                PARSING_ERROR = True
-                
 
-        # check a lacuna is not surrounding an index in the whole text (it may be covering several lines)
-        if re.search(r'⟦[^⟦]+?#\d+:\d+#[^⟦]+?⟧', ''.join(l.group('li') for l in lines)):
-            logging.error(f"Fatal error: a lacuna cannot include a Quranic index \"{title}\" [[{folio}.L?]]")
+    # check if Quran ref starts in block 1 and the first line has an equal
+    if re.match(r'\(?=', lines[0].group('li')):
+        if ini[3] == 1:
+            logger.error('Fatal error: block inicated as 1 and first line starts with = in "%s" [[%s.L1]].', title, folio)
             PARSING_ERROR = True
             
+    # check if Quran ref do not start in block 1 and the first line does not have an equal
+    else:
+        if ini[3] != 1:
+            logger.error('Fatal error: block is not 1 and first line does not start with = in "%s" [[%s.L1]].', title, folio)
+            PARSING_ERROR = True
 
-        for j, li in ((l.group('n'), l.group('li')) for l in lines):
-            # check there are no spaces
-            if ' ' in li:
-                logging.error(f'Fatal error: space found in "{title}" [[{folio}.L{j}]]')
-                PARSING_ERROR = True
-                
-            # check there are no multiple # together
-            if '##' in li:
-                logging.error(f'Fatal error: concatenated # found in "{title}" [[{folio}.L{j}]]')
-                PARSING_ERROR = True
-                
-            # check there are no opening tags at the end of a line
-            if li and li[-1] in ('{', '⟦', '⟨', '['):
-                logging.error(f'Fatal error: opening {{, ⟦, ⟨ or [ found at the end of line in "{title}" [[{folio}.L{j}]]')
-                PARSING_ERROR = True
-                
-            # check there are no closing tags after a word separator, i.e. #}
-            if re.search(r'#[\}⟧⟩\]]', li):
-                logging.error(f'Fatal error: closing tag }}, ⟧, ⟩ or ] found just after a word separator in "{title}" [[{folio}.L{j}]]')
-                PARSING_ERROR = True
-                
-            # check there are no NQY in non-final positions (the checking is done only in the first hand!)
-            if re.search(fr'[NQY][^#]*[{ARCH}]', re.sub(r'\[(.+?)(?:[>^&].*?)*/.+?\]', r'\1', li)):
-                logging.warning(f'Warning: there might be N, Q or Y in non-final position in "{title}" [[{folio}.L{j}]]')
-                #PARSING_ERROR = True
-                
-            # check ther are no letterblocks splited between two lines
-            if re.search(rf'[BGSCTEFQKLMNHY][^{ARCH}#=]*$', li):
-                logging.error(f'Fatal error: letterblock splitted between two lines "{title}" [[{folio}.L{j}]]')
-                PARSING_ERROR = True
-                
-            # check an index is always surrounded by hashtag
-            if re.search(r'[^#\d]\d+:\d+#|#\d+:\d+[^#\d]', li):
-                logging.error(f'Fatal error: an index must always be surrounded by # "{title}" [[{folio}.L{j}]]')
-                PARSING_ERROR = True
-                
-            # check reference is not empty
-            if '/=' in li:
-                logging.error(f'Fatal error: reference text empty ("/=") in "{title}" [[{folio}.L{j}]]')
-                PARSING_ERROR = True
-
-            # check fasila containing empty set is marked with the corresponding subdivision
-            # [∅>*1CD07/*=sub=fasila], [*∅>*1VO05/*=sub=fasila] are wrong
-            if re.search(r'\[∅(>\*[0-9A-Z]{5})?/\*=sub=fasila\]', li) or re.search(r'\[*∅>*[0-9A-Z]{5}/*=sub=fasila\]', li):
-                logging.error(f'Fatal error: subdivision variant without marking the fasila in "{title}" [[{folio}.L{j}]]')
-                PARSING_ERROR = True
-
-            # note after correction e.g. [BEFLWN>B+’’EFLWN(ᵃ←!)/B’’ᵃE’ᵒF’ᵘLᵘWN’ᵃ=r=mech.haplog] is ILLEGAL
-            if (m:=re.search(r'[>&\^][^/]*[()]', li)):
-                logging.error(f'Fatal error: Note tags cannot appear after a > & or ^, "{m.group()}" in "{title}" [[{folio}.L{j}]]')
-                PARSING_ERROR = True
+def _parse_block(block, catalog, debug=False):
+    """ parse the transcription of an image.
 
-            # note within reference text
-            if (m:=re.search(r'/[^=]*[()]', li)):
-                logging.error(f'Fatal error: Note tags cannot appear within the reference text, "{m.group()}" in "{title}" [[{folio}.L{j}]]')
-                PARSING_ERROR = True
+    Args:
+        block (re.Match): block matched by BLOCKS_REGEX.
+        catalog (isame_catalog.Catalog): start indexes of the pages.
+        debug (bool): show debugging info.
 
-            # closing unclear inside correction, e.g. [{ᵃ→↕>ᵃ©←↑}/ˀᵃ=vd=hamza] is ILLEGAL, but [ᵃ→↕>ᵃ{©←↑}/ˀᵃ=vd=hamza] is LEGAL
-            if (m:=re.search(r'>[^/{]*}', li)):
-                logging.error(f'Fatal error: unclear closing tag cannot be inside a correction, unless the opening tag is also within the correction,'
-                              f' "{m.group()}" in "{title}" [[{folio}.L{j}]]')
-                PARSING_ERROR = True
-            # closing illegible inside correction
-            if (m:=re.search(r'>[^/⟨]*\⟩', li)):
-                logging.error(f'Fatal error: illegible closing tag cannot be inside a correction, unless the opening tag is also within the correction,'
-                              f' "{m.group()}" in "{title}" [[{folio}.L{j}]]')
-                PARSING_ERROR = True
-            # closing lacuna inside correction
-            if (m:=re.search(r'>[^/⟦]*\⟧', li)):
-                logging.error(f'Fatal error: lacuna closing tag cannot be inside a correction, unless the opening tag is also within the correction,'
-                              f' "{m.group()}" in "{title}" [[{folio}.L{j}]]')
-                PARSING_ERROR = True
+    Return:
+        dict: page object with meta and page information, or None if the transcription could not be parsed.
 
-            # if a divider is unclear, illegible or lacuna, the mark must cover the divider and not the other way round
-            # e.g. *{1DS03} is wrong  /  {*1DS03} is right
-            if re.search(r'[*xvc][\{⟨⟦(]', li):
-                logging.error(f'Fatal error: unclear/illegible/lacuna/note must be outside the divider (fasila, khawamis, awashir, miaa)'
-                              f', so e.g. {{*...}} is correct, *{{...}} is not, in "{title}" [[{folio}.L{j}]]')
-                PARSING_ERROR = True
+    """
+    global PARSING_ERROR
 
-            # missing variant brackets, e.g. |2|=MA#LHMᵘ←/ᵒ#
-            if re.search(r'^[^\[]+?/', li):
-                logging.error(f'Fatal error: variant without brackets in "{title}" [[{folio}.L{j}]]')
-                PARSING_ERROR = True
+    title = block.group('title').strip()
+    source = block.group('source').strip()
+    trans = block.group('trans').strip()
+    notes = block.group('notes')
 
-        # check when a line does not end in # the following starts with =
-        for k, (j, li) in enumerate((l.group('n'), l.group('li')) for l in lines[:-1]):
-            final_hashtag = re.search(r'#(?:(=.+?=.+?(;.+?=.+?)*\])|⟧)?$', li)
-            next_initial_equal = re.search(r'^(?:([^\]]+>)|⟦)?=', lines[k+1].group('li'))
-            if not final_hashtag and not next_initial_equal:
-                logging.error(f'Fatal error: line missing final # or next line missing = in "{title}" [[{folio}.L{j}]]')
-                PARSING_ERROR = True
-                
-            if final_hashtag and next_initial_equal:
-                logging.error(f'Fatal error: line ending in # and next line ending in = in "{title}" [[{folio}.L{j}]]')
-                PARSING_ERROR = True
-                
+    if not (title_parsed := TITLE_REGEX.match(title)):
+        logger.error("Fatal error: invalid syntax for title \"%s\"", title)
+        PARSING_ERROR = True
+        hist_id, loc, sig, folio, side = 5*(None,)
+    else:
+        hist_id, loc, sig, folio, side = title_parsed.groups()
 
-        # check if Quran ref starts in block 1 and the first line has an equal
-        if re.match(r'\(?=', lines[0].group('li')):
-            if ini[3] == 1:
-                logging.error(f'Fatal error: block inicated as 1 and first line starts with = in "{title}" [[{folio}.L1]].')
-                PARSING_ERROR = True
-                
-        # check if Quran ref do not start in block 1 and the first line does not have an equal
-        else:
-            if ini[3] != 1:
-                logging.error(f'Fatal error: block is not 1 and first line does not start with = in "{title}" [[{folio}.L1]].')
-                PARSING_ERROR = True
-                
+    try:
+        ini = catalog.start_index(hist_id, sig, folio)
+    except KeyError:
+        logger.error("Fatal error: start index not found in index file for hist_id=\"%s\" sig=%s folio=%s "
+                     "(isame_locate.py can find it)", hist_id, sig, folio)
+        PARSING_ERROR = True
+        ini = 4*(-1,)
+
+    meta = {'title' : title,
+            'hist_id' : hist_id,
+            'location' : loc,
+            'signature' : sig,
+            'folio' : folio,
+            'side' : side,
+            'ini_index' : ini,
+            'source' : source}
+
+    if debug:
+        logger.debug("$hist_id=%s $location=%s $signature=%s $folio=%s $side=%s "
+                     "$START=%s $source=%s", hist_id, loc, sig, folio, side, ini, source)
+
+    with phase('validate', title):
+        lines = [LINE_REGEX.match(line) for line in filter(None, trans.replace('\r\n', '\n').split('\n'))]
+        _check_lines(title, folio, side, ini, lines)
 
-        #======================
-        # process transcription
-        #======================
+    #======================
+    # process transcription
+    #======================
 
+    with phase('parse', title):
         sura_vers_marks = re.findall(r'\d{1,3}:\d{1,3}', ''.join(li.group('li') for li in lines))
 
         if sura_vers_marks:
@@ -900,8 +1010,9 @@ def parse(infp, outfp, index_fname=INDEXES_FILE, no_dot_check=False, debug=False
         try:
             parsed = parse_trans(title, folio, ini, [line_regex.groups() for line_regex in lines], debug)
         except (SyntaxError, IndexError) as err:
-            logging.error(f'Fatal error: {err}')
+            logger.error('Fatal error: %s', err)
             PARSING_ERROR = True
+            return None
 
         if notes:
             found_notes = [{'iniline': int(inili),
@@ -916,51 +1027,188 @@ def parse(infp, outfp, index_fname=INDEXES_FILE, no_dot_check=False, debug=False
                 merge_notes(folio, parsed, found_notes, parsed["notes_lines"])
                 del parsed['notes_lines']
             except NoteError as err:
-                logging.error(f'Fatal error: {err}')
+                logger.error('Fatal error: %s', err)
                 PARSING_ERROR = True
 
-        out.append({'meta' : meta, 'page' : parsed})
+    return {'meta' : meta, 'page' : parsed}
+
+def _check_page(item, no_dot_check=False):
+    """ check the encoding of the transcription of a parsed page.
+
+    Args:
+        item (dict): page object as returned by _parse_block.
+        no_dot_check (bool): do not check the dots.
+
+    """
+    global PARSING_ERROR
+
+    title = item['meta']['title']
+    folio = item['meta']['folio']
+    lines = item['page']['lines']
+
+    for i, block in enumerate(item['page']['blocks']):
+
+        tok = block['tok']
+
+        if (m := Y_WITHOUT_TAIL_REGEX.search(tok)):
+            if not absent_text(i, m.span()[0], item['page']['illegible'], item['page']['lacunas']):
+                logger.warning('Warning: Y found without ⇓⇒ in "%s" tok="%s" [[%s.L%s]]',
+                               title, tok, folio, calculate_line(lines, i))
+
+        if ILLEGAL_SHAPE_REGEX.search(tok):
+            logger.error('Fatal error: illegal Y or G shape symbol or ˀ in "%s" tok="%s" [[%s.L%s]]',
+                         title, tok, folio, calculate_line(lines, i))
+            PARSING_ERROR = True
+            
+        if not no_dot_check and check_dots(tok, title, folio, lines, i):
+            PARSING_ERROR = True
+
+        if not no_dot_check and OLD_DOT_REGEX.search(tok):
+            logger.error('Fatal error: any of ᵟᵒᵐᵚ found in "%s" tok="%s" [[%s.L%s]]',
+                         title, tok, folio, calculate_line(lines, i))
+            PARSING_ERROR = True
+                    
+    for var in item['page']['variants']:
+        if var['lay'] and (m := Y_WITHOUT_TAIL_REGEX.search(var['lay'])):
+                if not absent_text(i, m.span()[0], item['page']['illegible'], item['page']['lacunas']):
+                    logger.warning('Warning: Y found without ⇓⇒ in "%s" tok="%s" [[%s.L%s]]',
+                                   title, tok, folio, calculate_line(lines, i))
+        if not no_dot_check and check_dots(var['lay'], title, folio, lines, var['inib'], level='warning'):
+            PARSING_ERROR = True
+
+def parse_text(text, index_fname=INDEXES_FILE, no_dot_check=False, debug=False, progress=None):
+    """ parse text in InterSaME text format and convert it into InterSaME structure.
+
+    Args:
+        text (str): InterSaME text document.
+        index_fname (str): name of json file contaning quran indexes. #FIXME deberias quitarlo de aqui y usarlo solo en el mapper
+        no_dot_check (bool): do not check the dots.
+        debug (bool): show debugging info.
+        progress (callable): function called with the number of blocks parsed and the total after each block.
+
+    Return:
+        list: pages, each one with its meta and page information.
+
+    Raise:
+        InterSaMESyntaxError: if InterSaME txt document is malformed.
+
+    """
+    global PARSING_ERROR
+
+    PARSING_ERROR = False
+
+    with phase('load'):
+        catalog = load_catalog(index_fname=index_fname)
+
+    # we need to have a list because a hist-id can have more than one fragments
+    with phase('validate'):
+        blocks = _match_blocks(text)
+    out = []
+    for i, block in enumerate(blocks, 1):
+        if (item := _parse_block(block, catalog, debug)):
+            out.append(item)
+        if progress:
+            progress(i, len(blocks))
 
     #
     # check transcription encoding
     #
 
     for item in out:
+        with phase('dot-check', item['meta']['title']):
+            _check_page(item, no_dot_check)
+        count_page('parse', item)
 
-        title = item['meta']['title']
-        folio = item['meta']['folio']
-        lines = item['page']['lines']
+    if PARSING_ERROR:
+        raise InterSaMESyntaxError('parsing error!')
 
-        for i, block in enumerate(item['page']['blocks']):
+    return out
 
-            tok = block['tok']
+def iter_block_texts(infp):
+    """ read the text of infp one image transcription at a time. Each text starts in a line beginning with TITLE:
 
-            if (m := re.search(r'(Y)(?![⇓⇒])', block['tok'])):
-                if not absent_text(i, m.span()[0], item['page']['illegible'], item['page']['lacunas']):
-                    logging.warning(f'Warning: Y found without ⇓⇒ in "{title}" tok="{tok}" [[{folio}.L{calculate_line(lines, i)}]]')
+    Args:
+        infp (io.TextIOWrapper): InterSaME text stream.
 
-            if any(s in tok for s in ('Y→', 'Y↓', 'G←', 'G↘', 'ˀ˦', 'ˀ˥')):
-                logging.error(f'Fatal error: illegal Y or G shape symbol or ˀ in "{title}" tok="{tok}" [[{folio}.L{calculate_line(lines, i)}]]')
-                PARSING_ERROR = True
-                
-            if not no_dot_check and check_dots(tok, title, folio, lines, i):
-                PARSING_ERROR = True
+    Yield:
+        str: text of next transcription.
 
-            if not no_dot_check and any(s in tok for s in 'ᵟᵒ°ᵐ'):
-                logging.error(f'Fatal error: any of ᵟᵒᵐᵚ found in "{title}" tok="{tok}" [[{folio}.L{calculate_line(lines, i)}]]')
-                PARSING_ERROR = True
-                        
-        for var in item['page']['variants']:
-            if var['lay'] and (m := re.search(r'(Y)(?![⇓⇒])', var['lay'])):
-                    if not absent_text(i, m.span()[0], item['page']['illegible'], item['page']['lacunas']):
-                        logging.warning(f'Warning: Y found without ⇓⇒ in "{title}" tok="{tok}" [[{folio}.L{calculate_line(lines, i)}]]')
-            if not no_dot_check and check_dots(var['lay'], title, folio, lines, var['inib'], level='warning'):
-                PARSING_ERROR = True
-                
-    if PARSING_ERROR:
+    """
+    buf = []
+    for line in infp:
+        if line.startswith('TITLE:') and buf:
+            yield ''.join(buf)
+            buf = []
+        buf.append(line)
+    if buf:
+        yield ''.join(buf)
+
+def iter_parse(infp, index_fname=INDEXES_FILE, no_dot_check=False, debug=False):
+    """ parse InterSaME text stream and yield each page as soon as it is parsed and checked.
+
+    As pages are yielded before the whole document is read, the error is only raised after the last page.
+    Pages with errors are held back, so that the following stages only get valid pages.
+
+    Args:
+        infp (io.TextIOWrapper): InterSaME text stream.
+        index_fname (str): name of json file contaning quran indexes.
+        no_dot_check (bool): do not check the dots.
+        debug (bool): show debugging info.
+
+    Yield:
+        dict: page object with meta and page information.
+
+    Raise:
+        InterSaMESyntaxError: if InterSaME txt document is malformed.
+
+    """
+    global PARSING_ERROR
+
+    PARSING_ERROR = False
+
+    with phase('load'):
+        catalog = load_catalog(index_fname=index_fname)
+
+    failed = False
+    for text in iter_phase('load', iter_block_texts(infp)):
+        with phase('validate'):
+            blocks = _match_blocks(text)
+        for block in blocks:
+            failed, PARSING_ERROR = failed or PARSING_ERROR, False
+            if (item := _parse_block(block, catalog, debug)):
+                with phase('dot-check', item['meta']['title']):
+                    _check_page(item, no_dot_check)
+            if item and not PARSING_ERROR:
+                count_page('parse', item)
+                yield item
+
+    if failed or PARSING_ERROR:
         raise InterSaMESyntaxError('parsing error!')
 
-    json.dump(out, outfp, ensure_ascii=False, indent=4)
+def parse(infp, outfp, index_fname=INDEXES_FILE, no_dot_check=False, debug=False, jsonl=False):
+    """ parse infp text file and conevrt it into a json document.
+
+    Args:
+        infp (io.TextIOWrapper):
+        outfq (io.TextIOWrapper):
+        index_fname (str): name of json file contaning quran indexes.
+        no_dot_check (bool): do not check the dots.
+        debug (bool): show debugging info.
+
+        jsonl (bool): write json lines, one page per line, as soon as each page is parsed.
+
+    Raise:
+        InterSaMESyntaxError: if InterSaME txt document is malformed.
+
+    """
+    if jsonl:
+        write_pages(iter_parse(infp, index_fname, no_dot_check, debug), outfp, jsonl=True)
+    else:
+        with phase('load'):
+            text = infp.read()
+        pages = parse_text(text, index_fname, no_dot_check, debug)
+        with phase('serialize'):
+            write_pages(pages, outfp)
 
 
 if __name__ == '__main__':
@@ -970,12 +1218,17 @@ if __name__ == '__main__':
     parser.add_argument('outfile', nargs='?', type=FileType('w'), default=sys.stdout, help='json file')
     parser.add_argument('--indexes', default=INDEXES_FILE, help='json file with start qindexes')
     parser.add_argument('--no_dot_check', action='store_true', help='do not check dot system')
+    parser.add_argument('--jsonl', action='store_true', help='write json lines, one page per line, as pages are parsed')
     parser.add_argument('--debug', action='store_true', help='debug mode')
+    add_profile_arguments(parser)
     args = parser.parse_args()
 
+    setup_logging('isame_parser', args.debug)
+    setup_profiling_args('isame_parser', args)
+
     try:
-        parse(args.infile, args.outfile, args.indexes, args.no_dot_check, args.debug)
-    except (KeyError, InterSaMESyntaxError) as e:
-        logging.error(f'Parsing aborted! "{e}"')
+        parse(args.infile, args.outfile, args.indexes, args.no_dot_check, args.debug, args.jsonl)
+    except (KeyError, InterSaMESyntaxError, FileNotFoundError) as e:
+        logger.error('Parsing aborted! "%s"', e)
         sys.exit(1)
 
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+#
+#    isame_pipeline.py
+#
+# run the processing workflow of InterSaME transcriptions in a single process
+#
+#   xml2txt -> parse -> quran_map -> json2tei / json2csv
+#
+# Each stage takes and returns Python objects, so the pages are not serialised into json and read again
+# between the stages. Intermediate files are written only when they are requested.
+#
+# The stage the pipeline starts with depends on the extension of the input files: archetype xml (.xml),
+# InterSaME text (.txt), parsed json (-pre.json or .pre.json) or mapped json (.json).
+#
+# examples:
+#   $ python isame_pipeline.py ../../data/arabic/trans/F001_BnF.Ar.330f-3-trans.xml --tei ../../data/arabic/trans/F001_BnF.Ar.330f-7.xml
+#
+#   $ python isame_pipeline.py ../../data/arabic/trans/F001_BnF.Ar.330f-3-trans.xml \
+#       --txt ../../data/arabic/trans/F001_BnF.Ar.330f-4.txt --pre_json ../../data/arabic/trans/F001_BnF.Ar.330f-5-pre.json \
+#       --json ../../data/arabic/trans/F001_BnF.Ar.330f-6.json --tei ../../data/arabic/trans/F001_BnF.Ar.330f-7.xml \
+#       --csv ../../data/arabic/trans/F001_BnF.Ar.330f-7.csv
+#
+####################################################################################################################################
+
+import sys
+from io import StringIO
+from contextlib import contextmanager
+from argparse import ArgumentParser
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from isame_settings import SETTINGS_PATH, InterSaMESettingsError
+from isame_xml2txt import InterSaMEXmlError, xml2txt_files
+from isame_parser import INDEXES_FILE, InterSaMESyntaxError, parse_text
+from isame_mapper import InterSaMEMappingError, map_struct
+from isame_json2tei import DEFAULT_WORD_SEP, InterSaMETeiError, iter_render_body, struct2tei
+from isame_json2csv import SEP, InterSaMECsvError, json2csv, load_morphology
+from isame_util import setup_logging
+from isame_profile import phase
+
+STAGES = ('xml2txt', 'parse', 'map', 'export')
+
+# errors raised by the stages
+PIPELINE_ERRORS = (InterSaMESettingsError, InterSaMEXmlError, InterSaMESyntaxError, InterSaMEMappingError,
+                   InterSaMETeiError, InterSaMECsvError)
+
+class InterSaMEPipelineError(Exception):
+    """ Exception for input files that cannot be processed together.
+
+    """
+    pass
+
+class InterSaMEPipelineCancelled(InterSaMEPipelineError):
+    """ Exception raised by a progress function to stop the pipeline.
+
+    """
+    pass
+
+def input_stage(fname):
+    """ get the first stage to be applied to a file, according to its name.
+
+    Args:
+        fname (str): input file name.
+
+    Return:
+        str: one of STAGES.
+
+    Raise:
+        InterSaMEPipelineError: if the extension is not known.
+
+    """
+    if fname.endswith('.xml'):
+        return 'xml2txt'
+    if fname.endswith('.txt'):
+        return 'parse'
+    if fname.endswith(('-pre.json', '.pre.json')):
+        return 'map'
+    if fname.endswith('.json'):
+        return 'export'
+    raise InterSaMEPipelineError(f'unknown type of input file {fname}')
+
+def as_json_types(obj):
+    """ convert obj to the types it would have after being dumped to json and loaded again, i.e. tuples
+    into lists and dict keys into strings. Stages are thus given the same data as when they are run
+    separately.
+
+    Args:
+        obj (object): json serialisable object.
+
+    Return:
+        object: converted object.
+
+    """
+    if isinstance(obj, dict):
+        return {k if isinstance(k, str) else json.dumps(k) : as_json_types(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [as_json_types(v) for v in obj]
+    return obj
+
+@contextmanager
+def _output(dest):
+    """ open dest for writing if it is a file name.
+
+    """
+    if isinstance(dest, str):
+        with open(dest, 'w') as outfp:
+            yield outfp
+    else:
+        yield dest
+
+class Pipeline:
+    """ stages of the processing workflow, configured once.
+
+    Attributes:
+        settings (str): settings file for Archetype transcription editor menus.
+        rm_notes (bool): remove notes tags and footnotes in xml2txt.
+        index_fname (str): json file with start qindexes.
+        no_dot_check (bool): do not check dot system when parsing.
+        sep (str): word separator for the TEI.
+        to_ara (bool): convert transcription into Arabic script in the TEI.
+        jobs (int): number of processes for converting xml files and rendering TEI pages.
+        cache_dir (str): directory for caching rendered TEI pages.
+        source (str): quranic source for rasm in the csv.
+        no_sign (bool): do not add ms signature to csv.
+        csv_sep (str): csv separator.
+        debug (bool): show debugging info.
+        progress (callable): function called with the stage, the number of items done and the total as
+            each stage advances, one item per file, block or page. It may raise InterSaMEPipelineCancelled
+            to stop the pipeline.
+
+    """
+    def __init__(self,
+                 settings = SETTINGS_PATH,
+                 rm_notes = False,
+                 index_fname = INDEXES_FILE,
+                 no_dot_check = False,
+                 sep = DEFAULT_WORD_SEP,
+                 to_ara = False,
+                 jobs = 1,
+                 cache_dir = None,
+                 source = 'tanzil-uthmani',
+                 no_sign = False,
+                 csv_sep = SEP,
+                 debug = False,
+                 progress = None):
+        self.settings = settings
+        self.rm_notes = rm_notes
+        self.index_fname = index_fname
+        self.no_dot_check = no_dot_check
+        self.sep = sep
+        self.to_ara = to_ara
+        self.jobs = jobs
+        self.cache_dir = cache_dir
+        self.source = source
+        self.no_sign = no_sign
+        self.csv_sep = csv_sep
+        self.debug = debug
+        self.progress = progress
+
+    def _report(self, stage, done, total):
+        if self.progress:
+            self.progress(stage, done, total)
+
+    def xml2txt(self, fnames):
+        """ convert archetype xml files into InterSaME text.
+
+        Args:
+            fnames (list): xml files.
+
+        Return:
+            str: concatenated text of the files.
+
+        """
+        out = StringIO()
+        self._report('xml2txt', 0, len(fnames))
+        xml2txt_files(fnames, out, self.settings, self.rm_notes, self.jobs)
+        self._report('xml2txt', len(fnames), len(fnames))
+        return out.getvalue()
+
+    def parse(self, text):
+        """ parse InterSaME text.
+
+        Args:
+            text (str): InterSaME text.
+
+        Return:
+            list: pages of the parsed structure.
+
+        """
+        progress = (lambda done, total: self._report('parse', done, total)) if self.progress else None
+        return as_json_types(parse_text(text, self.index_fname, self.no_dot_check, self.debug, progress))
+
+    def quran_map(self, struct):
+        """ map parsed pages to the Cairo Quran. struct is modified in place.
+
+        Args:
+            struct (list): pages as returned by parse.
+
+        Return:
+            list: mapped pages.
+
+        """
+        progress = (lambda done, total: self._report('map', done, total)) if self.progress else None
+        return as_json_types(map_struct(struct, self.debug, progress))
+
+    def json2tei(self, struct, outfp):
+        """ convert mapped pages into TEI.
+
+        Args:
+            struct (list): pages as returned by quran_map.
+            outfp (io.TextIOWrapper): output xml file.
+
+        """
+        body = None
+        if self.progress:
+            body = []
+            for _, content in iter_render_body(struct, self.sep, self.to_ara, self.jobs, self.cache_dir, self.debug):
+                body.append(content)
+                self._report('export', len(body), len(struct))
+        with phase('serialize'):
+            struct2tei(struct, outfp, sep=self.sep, to_ara=self.to_ara, jobs=self.jobs, cache_dir=self.cache_dir, body=body,
+                       debug=self.debug)
+
+    def json2csv(self, struct, outfp, columnar=None):
+        """ convert mapped pages into csv.
+
+        Args:
+            struct (list): pages as returned by quran_map.
+            outfp (io.TextIOWrapper): output csv file, None for not writing csv.
+            columnar (str): file for writing the table in columnar format, None for not writing it.
+
+        """
+        json2csv(struct, outfp, load_morphology(), self.source, self.no_sign, self.csv_sep, columnar, self.debug)
+
+    def run(self, fnames, txt=None, pre_json=None, json_=None, tei=None, csv=None, columnar=None):
+        """ run all stages needed from the type of the input files to the requested outputs.
+
+        Outputs may be file names or open text streams. If an output is None it is not written.
+
+        Args:
+            fnames (list): input files, all of the same type.
+            txt: output for the InterSaME text.
+            pre_json: output for the parsed json.
+            json_: output for the mapped json.
+            tei: output for the TEI.
+            csv: output for the csv.
+            columnar (str): file for the table in columnar format.
+
+        Return:
+            list: mapped pages.
+
+        Raise:
+            InterSaMEPipelineError: if the input files are not of the same type or there are none.
+            InterSaMESettingsError, InterSaMEXmlError, InterSaMESyntaxError, InterSaMEMappingError,
+            InterSaMETeiError, InterSaMECsvError: if any stage fails.
+
+        """
+        if not fnames:
+            raise InterSaMEPipelineError('no input files')
+
+        stages = {input_stage(fname) for fname in fnames}
+        if len(stages) != 1:
+            raise InterSaMEPipelineError(f'input files must be of the same type: {", ".join(fnames)}')
+        first = STAGES.index(stages.pop())
+
+        if first <= STAGES.index('xml2txt'):
+            text = self.xml2txt(fnames)
+            if txt:
+                with phase('serialize'), _output(txt) as outfp:
+                    outfp.write(text)
+        elif first == STAGES.index('parse'):
+            text = ''
+            for fname in fnames:
+                with phase('load'), open(fname) as infp:
+                    text += infp.read()
+
+        if first <= STAGES.index('parse'):
+            struct = self.parse(text)
+            if pre_json:
+                with phase('serialize'), _output(pre_json) as outfp:
+                    json.dump(struct, outfp, ensure_ascii=False, indent=4)
+        else:
+            struct = []
+            for fname in fnames:
+                with phase('load'), open(fname) as infp:
+                    struct.extend(json.load(infp))
+
+        if first <= STAGES.index('map'):
+            struct = self.quran_map(struct)
+            if json_:
+                with phase('serialize'), _output(json_) as outfp:
+                    json.dump(struct, outfp, ensure_ascii=False, indent=4)
+
+        if tei:
+            with _output(tei) as outfp:
+                self.json2tei(struct, outfp)
+
+        if csv or columnar:
+            with _output(csv) as outfp:
+                self.json2csv(struct, outfp, columnar)
+
+        return struct
+
+def add_run_arguments(parser):
+    """ add arguments of the run command to parser.
+
+    Args:
+        parser (argparse.ArgumentParser): command line parser.
+
+    """
+    parser.add_argument('files', nargs='+', help='input files: archetype xml, InterSaME txt, parsed json (-pre.json) or mapped json')
+    parser.add_argument('--txt', help='write InterSaME text in this file')
+    parser.add_argument('--pre_json', help='write parsed json in this file')
+    parser.add_argument('--json', help='write mapped json in this file')
+    parser.add_argument('--tei', help='write TEI in this file ("-" for stdout, default if no other output is given)')
+    parser.add_argument('--csv', help='write csv in this file ("-" for stdout)')
+    parser.add_argument('--columnar', metavar='FILE', help='write also table with typed columns in Parquet (.parquet), NumPy (.npz) '
+                                                            'or Arrow IPC (any other extension)')
+    parser.add_argument('--settings', default=SETTINGS_PATH, help='local settings file for archetype')
+    parser.add_argument('--rm_notes', action='store_true', help='remove note tags within the text')
+    parser.add_argument('--indexes', default=INDEXES_FILE, help='json file with start qindexes')
+    parser.add_argument('--no_dot_check', action='store_true', help='do not check dot system')
+    parser.add_argument('--sep', default=DEFAULT_WORD_SEP, help=f'word separator in TEI (default "{DEFAULT_WORD_SEP}")')
+    parser.add_argument('--ara', action='store_true', help='convert transctiption into Arabic script in TEI')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='number of processes for converting xml files and rendering pages [default 1]')
+    parser.add_argument('--cache', metavar='DIR', help='directory for caching rendered TEI pages')
+    parser.add_argument('--source', default='tanzil-uthmani', help='quranic source for rasm in csv [default tanzil-uthmani]')
+    parser.add_argument('--no_sign', action='store_true', help='do not add ms signature to csv output')
+    parser.add_argument('--csv_sep', default=SEP, help=f'csv separator [default {SEP}]')
+    parser.add_argument('--debug', action='store_true', help='debug mode')
+
+def run(args):
+    """ run the pipeline with the command line arguments added by add_run_arguments.
+
+    Args:
+        args (argparse.Namespace): parsed arguments.
+
+    Return:
+        int: exit status.
+
+    """
+    outputs = {'txt' : args.txt, 'pre_json' : args.pre_json, 'json_' : args.json, 'tei' : args.tei, 'csv' : args.csv}
+    if not any(outputs.values()) and not args.columnar:
+        outputs['tei'] = '-'
+    outputs = {k : sys.stdout if v == '-' else v for k, v in outputs.items()}
+
+    pipeline = Pipeline(args.settings, args.rm_notes, args.indexes, args.no_dot_check, args.sep, args.ara, args.jobs,
+                        args.cache, args.source, args.no_sign, args.csv_sep, args.debug)
+    try:
+        pipeline.run(args.files, columnar=args.columnar, **outputs)
+    except (InterSaMEPipelineError, *PIPELINE_ERRORS, OSError) as e:
+        print(f'Fatal error! {e}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='run InterSaME processing workflow in a single process')
+    add_run_arguments(parser)
+    args = parser.parse_args()
+
+    setup_logging('isame_pipeline', args.debug)
+
+    if len(args.csv_sep) != 1:
+        parser.error('separator must be a single character')
+
+    sys.exit(run(args))
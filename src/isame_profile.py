@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+#
+#    isame_profile.py
+#
+# profiling of the InterSaME tools, for finding the slow phases and pages of a run
+#
+# The tools mark their phases (load, validate, parse, dot-check, map, render, serialize) with phase()
+# and iter_phase(), which do nothing unless profiling has been set up by the entry point (--profile).
+# Phases can be nested; the time of a phase includes the time of the phases nested in it.
+#
+# At the end of the run two files are written:
+#   * a json report with the wall and cpu time of each phase, the number of pages, blocks and annotations
+#     processed by each stage, the time of each phase for each page, and the slowest pages. Optionally,
+#     the functions that took most time in each page (cProfile) and the memory allocated in each page
+#     together with the lines that allocated most (tracemalloc).
+#   * a file of collapsed stacks (same name with extension .folded) with the exclusive wall time in
+#     microseconds of each stack of tool, phases and pages, e.g.
+#       isame_parser;parse;F001_Q.2:1-2:5_Paris_BnF.Ar.330f_f.1r_hair 5321
+#     which can be drawn with flamegraph.pl or loaded in speedscope.
+#
+# examples:
+#   $ python isame_parser.py F001-4.txt F001-5-pre.json --profile F001-parse.json
+#   $ python isame_mapper.py F001-5-pre.json F001-6.json --profile F001-map.json --profile_functions --profile_memory
+#   $ flamegraph.pl F001-parse.folded > F001-parse.svg
+#   $ python isame_profile.py F001-parse.json --top 10
+#
+###########################################################################################################
+
+import os
+import sys
+import time
+import atexit
+import pstats
+import cProfile
+import tracemalloc
+from datetime import datetime
+from contextlib import contextmanager, nullcontext
+from argparse import ArgumentParser, FileType
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+# increase when the content of the report changes
+PROFILE_VERSION = 1
+
+PHASES = ('load', 'validate', 'parse', 'dot-check', 'map', 'render', 'serialize')
+
+# keys of a page object counted as annotations
+ANNOTATIONS = ('variants', 'lacunas', 'unclear', 'illegible', 'notes')
+
+TOP_FUNCTIONS = 20
+TOP_ALLOCATIONS = 10
+SLOWEST_PAGES = 20
+
+FOLDED_EXT = '.folded'
+
+# profiler of this run, None if not profiling
+_PROFILER = None
+
+
+class Profiler:
+    """ time of the phases of a tool, in total and per page.
+
+    Attributes:
+        name (str): name of the tool, root of the collapsed stacks.
+        fname (str): json file for the report.
+        functions (bool): profile the functions called for each page with cProfile.
+        memory (bool): trace the memory allocated for each page with tracemalloc.
+        phases (dict): phase -> calls, wall and cpu time.
+        pages (dict): page -> wall and cpu time, and time of each phase.
+        counts (dict): stage -> number of pages, blocks and annotations.
+        stacks (dict): collapsed stack -> exclusive wall time in seconds.
+
+    """
+    def __init__(self, name, fname, functions=False, memory=False):
+
+        self.name = name
+        self.fname = fname
+        self.functions = functions
+        self.memory = memory
+
+        self.phases = {}
+        self.pages = {}
+        self.counts = {}
+        self.stacks = {}
+
+        # open phases, innermost last
+        self._open = []
+        # page being measured with cProfile and tracemalloc, and its measures
+        self._measured = None
+        self._page_profiles = {}
+        self._page_memory = {}
+
+        self._start = time.perf_counter(), time.process_time()
+
+    def push(self, name, page=None):
+        """ open a phase. It inherits the page of the enclosing phase if page is None.
+
+        Args:
+            name (str): name of the phase.
+            page (str): page processed in the phase.
+
+        Return:
+            dict: open phase, to be closed with pop.
+
+        """
+        parent = self._open[-1] if self._open else None
+
+        if page is None and parent:
+            page = parent['page']
+
+        frames = (parent['frames'] if parent else (self.name,)) + (name,)
+        new_page = page is not None and (not parent or parent['page'] != page)
+        if new_page:
+            frames += (page.replace(';', ','),)
+
+        entry = {'name' : name,
+                 'page' : page,
+                 'frames' : frames,
+                 'measured' : new_page and self._measured is None and (self.functions or self.memory),
+                 'child_wall' : 0.0,
+                 'child_cpu' : 0.0}
+
+        if entry['measured']:
+            self._start_measures(page)
+
+        self._open.append(entry)
+        entry['wall'], entry['cpu'] = time.perf_counter(), time.process_time()
+        return entry
+
+    def pop(self, entry, page=None):
+        """ close the innermost phase, which must be entry.
+
+        Args:
+            entry (dict): phase returned by push.
+            page (str): page processed in the phase, if it was not known when the phase was opened.
+
+        """
+        wall = time.perf_counter() - entry['wall']
+        cpu = time.process_time() - entry['cpu']
+
+        self._open.pop()
+
+        if entry['measured']:
+            self._stop_measures(entry['page'])
+
+        frames = entry['frames']
+        if entry['page'] is None and page is not None:
+            entry['page'] = page
+            frames += (page.replace(';', ','),)
+
+        stats = self.phases.setdefault(entry['name'], {'calls' : 0, 'wall' : 0.0, 'cpu' : 0.0})
+        stats['calls'] += 1
+        stats['wall'] += wall
+        stats['cpu'] += cpu
+
+        self_wall = wall - entry['child_wall']
+        self_cpu = cpu - entry['child_cpu']
+
+        stack = ';'.join(frames)
+        self.stacks[stack] = self.stacks.get(stack, 0.0) + self_wall
+
+        if entry['page'] is not None:
+            page_stats = self.pages.setdefault(entry['page'], {'wall' : 0.0, 'cpu' : 0.0, 'phases' : {}})
+            page_stats['wall'] += self_wall
+            page_stats['cpu'] += self_cpu
+            phase_stats = page_stats['phases'].setdefault(entry['name'], {'wall' : 0.0, 'cpu' : 0.0})
+            phase_stats['wall'] += wall
+            phase_stats['cpu'] += cpu
+
+        if self._open:
+            self._open[-1]['child_wall'] += wall
+            self._open[-1]['child_cpu'] += cpu
+
+    @contextmanager
+    def phase(self, name, page=None):
+        """ context of a phase, see push.
+
+        """
+        entry = self.push(name, page)
+        try:
+            yield
+        finally:
+            self.pop(entry)
+
+    def _start_measures(self, page):
+        """ start profiling functions and tracing memory for page.
+
+        """
+        self._measured = page
+        if self.memory:
+            tracemalloc.reset_peak()
+            self._page_memory.setdefault(page, {'allocated' : 0, 'peak' : 0, 'top' : {}})['start'] = \
+                (tracemalloc.get_traced_memory()[0], tracemalloc.take_snapshot())
+        if self.functions:
+            self._page_profiles.setdefault(page, cProfile.Profile()).enable()
+
+    def _stop_measures(self, page):
+        """ stop profiling functions and tracing memory for page.
+
+        """
+        if self.functions:
+            self._page_profiles[page].disable()
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            measures = self._page_memory[page]
+            start, snapshot = measures.pop('start')
+            measures['allocated'] += current - start
+            measures['peak'] = max(measures['peak'], peak - start)
+            for stat in tracemalloc.take_snapshot().compare_to(snapshot, 'lineno')[:TOP_ALLOCATIONS]:
+                where = f'{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}'
+                size, count = measures['top'].get(where, (0, 0))
+                measures['top'][where] = (size + stat.size_diff, count + stat.count_diff)
+        self._measured = None
+
+    def count(self, stage, pages=0, blocks=0, annotations=0):
+        """ add to the number of pages, blocks and annotations processed by stage.
+
+        Args:
+            stage (str): name of the stage.
+            pages (int): number of pages.
+            blocks (int): number of blocks.
+            annotations (int): number of annotations.
+
+        """
+        counts = self.counts.setdefault(stage, {'pages' : 0, 'blocks' : 0, 'annotations' : 0})
+        counts['pages'] += pages
+        counts['blocks'] += blocks
+        counts['annotations'] += annotations
+
+    def report(self):
+        """ summary of the measures.
+
+        Return:
+            dict: json report.
+
+        """
+        pages = {}
+        for page, stats in self.pages.items():
+            pages[page] = {'wall' : round(stats['wall'], 6),
+                           'cpu' : round(stats['cpu'], 6),
+                           'phases' : {name : {k : round(v, 6) for k, v in phase.items()} for name, phase in stats['phases'].items()}}
+
+            if page in self._page_profiles:
+                pages[page]['functions'] = _top_functions(self._page_profiles[page])
+
+            if page in self._page_memory:
+                measures = self._page_memory[page]
+                pages[page]['memory'] = {'allocated_kib' : round(measures['allocated']/1024, 1),
+                                         'peak_kib' : round(measures['peak']/1024, 1),
+                                         'top' : [{'line' : where, 'size_kib' : round(size/1024, 1), 'count' : count}
+                                                  for where, (size, count) in sorted(measures['top'].items(), key=lambda x: -x[1][0])
+                                                  [:TOP_ALLOCATIONS]]}
+
+        return {'version' : PROFILE_VERSION,
+                'tool' : self.name,
+                'date' : datetime.now().isoformat(timespec='seconds'),
+                'argv' : sys.argv,
+                'wall' : round(time.perf_counter() - self._start[0], 6),
+                'cpu' : round(time.process_time() - self._start[1], 6),
+                'functions' : self.functions,
+                'memory' : self.memory,
+                'counts' : self.counts,
+                'phases' : {name : {k : round(v, 6) for k, v in stats.items()}
+                            for name, stats in sorted(self.phases.items(), key=lambda x: _phase_order(x[0]))},
+                'slowest_pages' : [[page, round(stats['wall'], 6)]
+                                   for page, stats in sorted(self.pages.items(), key=lambda x: -x[1]['wall'])[:SLOWEST_PAGES]],
+                'pages' : pages}
+
+    def write(self):
+        """ write the json report in fname and the collapsed stacks next to it.
+
+        Return:
+            str: name of the file of collapsed stacks.
+
+        """
+        folded_fname = os.path.splitext(self.fname)[0] + FOLDED_EXT
+
+        with open(self.fname, 'w') as outfp:
+            json.dump(self.report(), outfp, indent=2, ensure_ascii=False)
+
+        with open(folded_fname, 'w') as outfp:
+            for stack, wall in sorted(self.stacks.items()):
+                if (usec := round(wall*1e6)) > 0:
+                    print(f'{stack} {usec}', file=outfp)
+
+        return folded_fname
+
+def _phase_order(name):
+    """ position of a phase in PHASES, unknown phases at the end.
+
+    """
+    return PHASES.index(name) if name in PHASES else len(PHASES)
+
+def _top_functions(profile):
+    """ functions with the highest exclusive time in profile.
+
+    Args:
+        profile (cProfile.Profile): profile of a page.
+
+    Return:
+        list: function, calls, exclusive and inclusive time of the TOP_FUNCTIONS first functions.
+
+    """
+    stats = pstats.Stats(profile).stats
+    top = sorted(stats.items(), key=lambda x: -x[1][2])[:TOP_FUNCTIONS]
+    return [{'function' : f'{os.path.basename(fname)}:{line}({func})',
+             'calls' : ncalls,
+             'tottime' : round(tottime, 6),
+             'cumtime' : round(cumtime, 6)} for (fname, line, func), (_, ncalls, tottime, cumtime, _) in top]
+
+def setup_profiling(name, fname, functions=False, memory=False):
+    """ start profiling the phases of this run. The report is written when the run ends, or with write_profile.
+
+    Args:
+        name (str): name of the tool.
+        fname (str): json file for the report. The collapsed stacks are written in the same path with extension .folded.
+        functions (bool): profile the functions called for each page with cProfile.
+        memory (bool): trace the memory allocated for each page with tracemalloc.
+
+    Return:
+        Profiler: profiler of this run.
+
+    """
+    global _PROFILER
+
+    if _PROFILER:
+        return _PROFILER
+
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    _PROFILER = Profiler(name, fname, functions, memory)
+    atexit.register(write_profile)
+
+    return _PROFILER
+
+def write_profile():
+    """ write the report of this run and stop profiling. It does nothing if not profiling.
+
+    Return:
+        str: name of the json report, None if not profiling.
+
+    """
+    global _PROFILER
+
+    if not _PROFILER:
+        return None
+
+    profiler, _PROFILER = _PROFILER, None
+    folded_fname = profiler.write()
+    print(f'Profile written to {profiler.fname} and {folded_fname}', file=sys.stderr)
+
+    return profiler.fname
+
+def phase(name, page=None):
+    """ context of a phase of the current tool.
+
+    Args:
+        name (str): name of the phase, see PHASES.
+        page (str): title of the page processed in the phase, None for phases not bound to a page
+            or for taking the page of the enclosing phase.
+
+    Return:
+        context manager
+
+    """
+    return _PROFILER.phase(name, page) if _PROFILER else nullcontext()
+
+def iter_phase(name, items, page=None):
+    """ measure the production of each item of an iterable as a phase, e.g. the pages read from a stream.
+
+    Args:
+        name (str): name of the phase.
+        items (iterable): items to measure.
+        page (callable): function returning the title of the page of an item, None if items are not pages.
+
+    Return:
+        iterable: items, unchanged if not profiling.
+
+    """
+    return _iter_phase(name, items, page) if _PROFILER else items
+
+def _iter_phase(name, items, page):
+    """ generator for iter_phase.
+
+    """
+    items = iter(items)
+    while True:
+        # the profiler might have been stopped while the items were consumed
+        if not (profiler := _PROFILER):
+            yield from items
+            return
+        entry = profiler.push(name)
+        try:
+            item = next(items)
+        except StopIteration:
+            profiler.pop(entry)
+            return
+        except BaseException:
+            profiler.pop(entry)
+            raise
+        profiler.pop(entry, page(item) if page else None)
+        yield item
+
+def count(stage, pages=0, blocks=0, annotations=0):
+    """ add to the number of pages, blocks and annotations processed by stage, if profiling.
+
+    """
+    if _PROFILER:
+        _PROFILER.count(stage, pages, blocks, annotations)
+
+def count_page(stage, item):
+    """ count a page processed by stage, with its blocks and annotations, if profiling.
+
+    Args:
+        stage (str): name of the stage.
+        item (dict): page object.
+
+    """
+    if _PROFILER:
+        page = item.get('page') or {}
+        _PROFILER.count(stage, 1, len(page.get('blocks', ())), sum(len(page.get(key) or ()) for key in ANNOTATIONS))
+
+def page_title(item):
+    """ title of a page object, for naming it in the profile.
+
+    """
+    return item['meta']['title']
+
+def add_profile_arguments(parser):
+    """ add profiling arguments to the parser of a tool.
+
+    Args:
+        parser (argparse.ArgumentParser): command line parser.
+
+    """
+    parser.add_argument('--profile', metavar='FILE', help=f'write json report of time per phase and page to FILE, '
+                                                          f'and collapsed stacks for flame graphs with extension {FOLDED_EXT}')
+    parser.add_argument('--profile_functions', action='store_true', help='with --profile, profile the functions called for each page')
+    parser.add_argument('--profile_memory', action='store_true', help='with --profile, trace the memory allocated for each page (slow)')
+
+def setup_profiling_args(name, args):
+    """ start profiling if requested in the arguments added by add_profile_arguments.
+
+    Args:
+        name (str): name of the tool.
+        args (argparse.Namespace): parsed arguments.
+
+    """
+    if args.profile:
+        setup_profiling(name, args.profile, args.profile_functions, args.profile_memory)
+
+def print_report(report, top=SLOWEST_PAGES, outfp=sys.stdout):
+    """ print the phases, counts and slowest pages of a report.
+
+    Args:
+        report (dict): json report.
+        top (int): number of pages to print.
+        outfp (io.TextIOWrapper): output stream.
+
+    """
+    print(f'{report["tool"]}  wall {report["wall"]:.3f}s  cpu {report["cpu"]:.3f}s', file=outfp)
+
+    print('\nphase'.ljust(14) + 'calls'.rjust(8) + 'wall'.rjust(12) + 'cpu'.rjust(12), file=outfp)
+    for name, stats in report['phases'].items():
+        print(name.ljust(13) + str(stats['calls']).rjust(8) + f'{stats["wall"]:12.3f}' + f'{stats["cpu"]:12.3f}', file=outfp)
+
+    if report['counts']:
+        print('\nstage'.ljust(14) + 'pages'.rjust(8) + 'blocks'.rjust(12) + 'annotations'.rjust(12), file=outfp)
+        for stage, counts in report['counts'].items():
+            print(stage.ljust(13) + str(counts['pages']).rjust(8) + str(counts['blocks']).rjust(12) + str(counts['annotations']).rjust(12),
+                  file=outfp)
+
+    if report['slowest_pages']:
+        print('\nslowest pages', file=outfp)
+        for page, wall in report['slowest_pages'][:top]:
+            print(f'{wall:10.3f}  {page}', file=outfp)
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='print summary of an InterSaME profile report')
+    parser.add_argument('infile', nargs='?', type=FileType('r'), default=sys.stdin, help='json report')
+    parser.add_argument('--top', type=int, default=SLOWEST_PAGES, help=f'number of slowest pages to show [default {SLOWEST_PAGES}]')
+    args = parser.parse_args()
+
+    try:
+        print_report(json.load(args.infile), args.top)
+    except (ValueError, KeyError) as e:
+        print(f'Fatal error! invalid profile report: {e}', file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+#
+#    isame_qindex.py
+#
+# quranic indexes packed into a single int
+#
+# A quranic index (sura, vers, word, bloc) is packed into the bits of an int, with the sura in the
+# highest ones, so that comparing two indexes is comparing two ints and the order is the order of the
+# text. Missing trailing parts, e.g. word and bloc in a verse index, are packed as 0 and sort before
+# any word of the verse.
+#
+# Verses can be converted to their position in the whole Quran (ordinal) and back in constant time using
+# tables of cumulative offsets built from NUM_VERSES.
+#
+# example:
+#   $ python isame_qindex.py 2:282 3:1
+#
+########################################################################################################
+
+import sys
+from array import array
+from itertools import accumulate
+from argparse import ArgumentParser
+
+from isame_util import NUM_VERSES
+
+# bits of each part of the index, from the lowest to the highest
+BLOC_BITS = 6
+WORD_BITS = 8
+VERS_BITS = 9
+SURA_BITS = 7
+
+WORD_SHIFT = BLOC_BITS
+VERS_SHIFT = WORD_SHIFT + WORD_BITS
+SURA_SHIFT = VERS_SHIFT + VERS_BITS
+
+BLOC_MASK = (1 << BLOC_BITS) - 1
+WORD_MASK = (1 << WORD_BITS) - 1
+VERS_MASK = (1 << VERS_BITS) - 1
+SURA_MASK = (1 << SURA_BITS) - 1
+
+LAST_SURA = max(NUM_VERSES)
+
+# VERSE_OFFSETS[sura] is the number of verses of the suras before sura
+VERSE_OFFSETS = [0, 0, *accumulate(NUM_VERSES[sura] for sura in range(1, LAST_SURA+1))]
+
+TOTAL_VERSES = VERSE_OFFSETS[LAST_SURA+1]
+
+# sura and vers of each verse ordinal
+_ORDINAL_SURA = array('B', (sura for sura in range(1, LAST_SURA+1) for _ in range(NUM_VERSES[sura])))
+_ORDINAL_VERS = array('H', (vers for sura in range(1, LAST_SURA+1) for vers in range(1, NUM_VERSES[sura]+1)))
+
+
+class QIndex(int):
+    """ quranic index packed into an int.
+
+    It can be unpacked as a tuple, e.g. sura, vers, word, bloc = qind, and is printed as sura:vers:word:bloc
+    without the missing trailing parts.
+
+    """
+    __slots__ = ()
+
+    def __new__(cls, sura, vers=None, word=None, bloc=None):
+        """ pack a quranic index. None parts are packed as 0.
+
+        Args:
+            sura (int): sura number.
+            vers (int): verse number.
+            word (int): word number.
+            bloc (int): block number.
+
+        Raise:
+            ValueError: if any part does not fit in its bits.
+
+        """
+        vers, word, bloc = vers or 0, word or 0, bloc or 0
+        if not (0 < sura <= SURA_MASK and 0 <= vers <= VERS_MASK and 0 <= word <= WORD_MASK and 0 <= bloc <= BLOC_MASK):
+            raise ValueError(f'quranic index out of range: {sura}:{vers}:{word}:{bloc}')
+        return super().__new__(cls, sura << SURA_SHIFT | vers << VERS_SHIFT | word << WORD_SHIFT | bloc)
+
+    @classmethod
+    def from_tuple(cls, ind):
+        """ pack an index given as a sequence, e.g. an 'ind' of a block of a page object.
+
+        Args:
+            ind (sequence): sura, and optionally vers, word and bloc.
+
+        Return:
+            QIndex
+
+        """
+        return cls(*ind)
+
+    @classmethod
+    def from_int(cls, packed):
+        """ wrap an index already packed, e.g. stored in an array.
+
+        Args:
+            packed (int): packed quranic index.
+
+        Return:
+            QIndex
+
+        """
+        return super().__new__(cls, packed)
+
+    @classmethod
+    def parse(cls, text):
+        """ pack an index written as sura:vers:word:bloc, with any of the trailing parts missing.
+
+        Args:
+            text (str): quranic index.
+
+        Return:
+            QIndex
+
+        Raise:
+            ValueError: if text is not a valid index.
+
+        """
+        return cls(*map(int, text.split(':')))
+
+    @property
+    def sura(self):
+        return self >> SURA_SHIFT
+
+    @property
+    def vers(self):
+        return self >> VERS_SHIFT & VERS_MASK
+
+    @property
+    def word(self):
+        return self >> WORD_SHIFT & WORD_MASK
+
+    @property
+    def bloc(self):
+        return self & BLOC_MASK
+
+    def __iter__(self):
+        return iter((self.sura, self.vers, self.word, self.bloc))
+
+    def __getnewargs__(self):
+        # pickle the parts, not the packed int, which __new__ would take as the sura
+        return tuple(self)
+
+    def verse(self):
+        """ index of the verse, without word and bloc.
+
+        """
+        return QIndex(self.sura, self.vers)
+
+    def __str__(self):
+        parts = list(self)
+        while parts[-1] == 0:
+            parts.pop()
+        return ':'.join(map(str, parts))
+
+    def __repr__(self):
+        return f'QIndex({self})'
+
+    def __format__(self, spec):
+        return format(str(self), spec)
+
+def is_verse(sura, vers):
+    """ check if sura:vers exists in the Quran.
+
+    """
+    return sura in NUM_VERSES and 1 <= vers <= NUM_VERSES[sura]
+
+def last_verse(sura):
+    """ number of the last verse of sura.
+
+    """
+    return NUM_VERSES[sura]
+
+def verse_ordinal(qind):
+    """ position of the verse of qind in the Quran, starting from 0.
+
+    Args:
+        qind (QIndex): quranic index.
+
+    Return:
+        int: verse ordinal.
+
+    """
+    return VERSE_OFFSETS[qind.sura] + qind.vers - 1
+
+def verse_at(ordinal):
+    """ verse in position ordinal of the Quran.
+
+    Args:
+        ordinal (int): verse ordinal, as returned by verse_ordinal.
+
+    Return:
+        QIndex: verse index.
+
+    Raise:
+        IndexError: if ordinal is out of the Quran.
+
+    """
+    if not 0 <= ordinal < TOTAL_VERSES:
+        raise IndexError(f'verse ordinal out of range: {ordinal}')
+    return QIndex(_ORDINAL_SURA[ordinal], _ORDINAL_VERS[ordinal])
+
+def next_verse(qind):
+    """ verse following the verse of qind, in the same sura or in the next one.
+
+    Return:
+        QIndex: verse index, None if qind is in the last verse of the Quran.
+
+    """
+    ordinal = verse_ordinal(qind) + 1
+    return verse_at(ordinal) if ordinal < TOTAL_VERSES else None
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='show the verse distance between two quranic indexes')
+    parser.add_argument('ini', type=QIndex.parse, help='first index, sura:vers[:word[:bloc]]')
+    parser.add_argument('end', type=QIndex.parse, help='last index, sura:vers[:word[:bloc]]')
+    args = parser.parse_args()
+
+    for qind in (args.ini, args.end):
+        if not is_verse(qind.sura, qind.vers):
+            print(f'Fatal error! verse {qind.verse()} not found in the Quran', file=sys.stderr)
+            sys.exit(1)
+
+    print(f'verses\t{verse_ordinal(args.end) - verse_ordinal(args.ini)}')
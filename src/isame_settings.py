@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+#
+#    isame_settings.py
+#
+# compiled model of the text editor configuration of Archetype (TEXT_EDITOR_OPTIONS in local_settings.py).
+#
+# local_settings.py is a django settings file that imports digipal, so it cannot be imported here.
+# TEXT_EDITOR_OPTIONS is extracted from its syntax tree and evaluated as a literal. The model is
+# cached per file and it is only compiled again if the file changes.
+#
+# examples:
+#   $ python isame_settings.py
+#   $ python isame_settings.py --settings local_settings.py --variants
+#
+###########################################################################################################################
+
+import os
+import re
+import ast
+import sys
+from functools import lru_cache
+from argparse import ArgumentParser, FileType
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+SETTINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'local_settings.py')
+
+SETTINGS_VAR = 'TEXT_EDITOR_OPTIONS'
+
+SPAN_ATTRS_REGEX = re.compile(r'(data-dpt(?:-type)?)="(.*?)"')
+
+
+class InterSaMESettingsError(Exception):
+    """ Error in the Archetype settings file.
+
+    """
+    pass
+
+class ArchetypeSettings:
+    """ annotation types configured in the text editor of Archetype.
+
+    Attributes:
+        path (str): settings file.
+        options (dict): content of TEXT_EDITOR_OPTIONS.
+        span_types (dict): data-dpt-type -> data-dpt of each button that inserts a span.
+        variants (dict): data-dpt-type -> (struct, type) of each variant class, e.g. 'r/hamza' -> ('r', 'hamza').
+
+    """
+    def __init__(self, path, options):
+
+        self.path = path
+        self.options = options
+        self.span_types = {}
+        self.variants = {}
+
+        for key, button in options.get('buttons', {}).items():
+
+            names = [key, *button.get('buttons', [])]
+
+            if (xml := button.get('xml')):
+                attrs = dict(SPAN_ATTRS_REGEX.findall(xml))
+                if 'data-dpt-type' in attrs:
+                    self.span_types.setdefault(attrs['data-dpt-type'], attrs.get('data-dpt'))
+                    names.append(attrs['data-dpt-type'])
+
+            for name in names:
+                if '/' in name:
+                    struct, type_ = name.split('/', 1)
+                    self.variants.setdefault(name, (struct, type_))
+
+def _parse_settings(source, path):
+    """ extract TEXT_EDITOR_OPTIONS from the source of the settings file without executing it.
+
+    Args:
+        source (str): python source of settings file.
+        path (str): name of settings file, for error messages.
+
+    Return:
+        dict: TEXT_EDITOR_OPTIONS.
+
+    Raise:
+        InterSaMESettingsError: if the variable is not found or it is not a literal.
+
+    """
+    try:
+        tree = ast.parse(source, filename=path)
+    except SyntaxError as e:
+        raise InterSaMESettingsError(f'invalid syntax in settings file {path}: {e}')
+
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == SETTINGS_VAR for t in node.targets):
+            try:
+                return ast.literal_eval(node.value)
+            except ValueError as e:
+                raise InterSaMESettingsError(f'{SETTINGS_VAR} in {path} is not a literal: {e}')
+
+    raise InterSaMESettingsError(f'{SETTINGS_VAR} not found in settings file {path}')
+
+@lru_cache(maxsize=8)
+def _compile_settings(path, mtime, size):
+    """ compile settings file. The arguments mtime and size are only used as part of the cache key.
+
+    """
+    with open(path) as fp:
+        return ArchetypeSettings(path, _parse_settings(fp.read(), path))
+
+def load_settings(path=SETTINGS_PATH):
+    """ get the compiled model of an Archetype settings file.
+
+    Args:
+        path (str): settings file.
+
+    Return:
+        ArchetypeSettings: compiled settings, shared by all calls until the file changes.
+
+    Raise:
+        InterSaMESettingsError: if TEXT_EDITOR_OPTIONS cannot be extracted.
+        OSError: if the file cannot be read.
+
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    return _compile_settings(path, st.st_mtime_ns, st.st_size)
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='show annotation types configured in archetype settings')
+    parser.add_argument('outfile', nargs='?', type=FileType('w'), default=sys.stdout, help='output json file')
+    parser.add_argument('--settings', default=SETTINGS_PATH, help='local settings file for archetype')
+    parser.add_argument('--variants', action='store_true', help='show only variant classes')
+    args = parser.parse_args()
+
+    try:
+        settings = load_settings(args.settings)
+    except InterSaMESettingsError as e:
+        print(f'Fatal error! {e}', file=sys.stderr)
+        sys.exit(1)
+
+    if args.variants:
+        out = sorted(settings.variants)
+    else:
+        out = {'span_types': settings.span_types, 'variants': sorted(settings.variants)}
+
+    json.dump(out, args.outfile, ensure_ascii=False, indent=4)
+    print(file=args.outfile)
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+#
+#    isame_synth.py
+#
+# generate synthetic InterSaME text documents of any size from the reference Quran, together with the
+# start indexes of their folios in the format of isame_indexes.json
+#
+# The words of the reference are written in Latin archigraphemes with consonantal strokes, vowel dots
+# and tail marks for ya, one page per image transcription (TITLE:, Source:, |n| lines and Notes:).
+# Verse indexes, fasilas and awashir are added at the end of the verses, and variants, lacunas, unclear
+# and illegible sections and notes are added at the given densities. The documents pass the checks of
+# isame_parser and map to the reference, so that they can be used for testing and benchmarking the
+# whole workflow. The same seed always produces the same document.
+#
+# Folios are numbered from 1r in synthetic fragments with hist-ids U900, U901, ... A new fragment is
+# started when a fragment is full (999 folios) or when the end of the Quran is reached.
+#
+# examples:
+#   $ python isame_synth.py --pages 50 --indexes synth_indexes.json > synth-4.txt
+#   $ python isame_synth.py --pages 500 --start 2:1 --seed 7 --density lacuna=0.05 note=0.02 --indexes synth_indexes.json > synth-4.txt
+#   $ python isame_parser.py synth-4.txt --indexes synth_indexes.json | python isame_mapper.py > synth-6.json
+#
+##########################################################################################################
+
+import sys
+import random
+from collections import deque
+from argparse import ArgumentParser, FileType
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from rasm import rasm
+
+from isame_util import NUM_VERSES, NOTES_TAGS
+
+# probability of each feature:
+#   strokes, vowels: for each letter that can have them
+#   fasila: for each verse end
+#   awashir: for each tenth verse, instead of the fasila
+#   variant, lacuna, unclear, illegible, note: for each word
+DENSITIES = {'strokes'   : 0.5,
+             'vowels'    : 0.2,
+             'fasila'    : 0.8,
+             'awashir'   : 0.8,
+             'variant'   : 0.02,
+             'lacuna'    : 0.01,
+             'unclear'   : 0.02,
+             'illegible' : 0.01,
+             'note'      : 0.01}
+
+LINES_PER_PAGE = 16
+WORDS_PER_LINE = 10
+FOLIOS_PER_FRAGMENT = 999
+
+FIRST_HIST_ID = 900
+LOCATION = 'Synthetic'
+
+STROKED = 'BGTFQNY'
+STROKES = ('’', '’’', '’’’', ',', ',,')
+VOWELS = 'ᵃᵢᵘ'
+YA_TAILS = '⇒⇓'
+FASILA_SHAPES = 'VHDCTSLO'
+FASILA_FILLS = 'SOD'
+AWASHIR_SHAPES = 'HARSLCPFO'
+
+# annotations that enclose whole words
+SPANS = {'lacuna' : ('⟦', '⟧'),
+         'unclear' : ('{', '}'),
+         'illegible' : ('⟨', '⟩')}
+
+MAX_SPAN = 3
+
+WORD, INDEX, DIVIDER = 'word', 'index', 'divider'
+
+
+class InterSaMESynthError(Exception):
+    """ Exception for invalid generation options.
+
+    """
+    pass
+
+def parse_qindex(qindex):
+    """ convert sura:vers into a tuple of ints.
+
+    Args:
+        qindex (str): quranic index, e.g. 2:255.
+
+    Return:
+        tuple: sura and vers.
+
+    Raise:
+        InterSaMESynthError: if the index does not exist in the Quran.
+
+    """
+    try:
+        sura, vers = map(int, qindex.split(':'))
+    except ValueError:
+        raise InterSaMESynthError(f'invalid quranic index "{qindex}", the expected format is sura:vers')
+
+    if sura not in NUM_VERSES or not 1 <= vers <= NUM_VERSES[sura]:
+        raise InterSaMESynthError(f'quranic index {qindex} does not exist')
+
+    return sura, vers
+
+def parse_densities(items):
+    """ convert feature=probability items into densities.
+
+    Args:
+        items (list): densities in the format feature=probability, e.g. lacuna=0.05.
+
+    Return:
+        dict: feature -> probability.
+
+    Raise:
+        InterSaMESynthError: if an item is malformed.
+
+    """
+    densities = {}
+    for item in items:
+        feature, _, p = item.partition('=')
+        try:
+            densities[feature] = float(p)
+        except ValueError:
+            raise InterSaMESynthError(f'invalid density "{item}", the expected format is feature=probability')
+    return densities
+
+def iter_reference(start=(1, 1)):
+    """ read the words of the reference Quran from start to the end, one sura at a time.
+
+    Blocks that the mapper skips (e.g. ۞) are discarded.
+
+    Args:
+        start (tuple): sura and vers of the first word.
+
+    Yield:
+        tuple, list: index of the word (sura, vers, word) and its blocks in Latin archigraphemes.
+
+    """
+    for sura in range(start[0], 115):
+        ini = (sura, start[1] if sura == start[0] else 1, 1, 1)
+        for _, blocks in rasm((ini, (sura, None, None, None)), source='tanzil-uthmani', blocks=True, paleo=True):
+            if (rasm_blocks := [b[1] for b in blocks if b[3] not in '۞۩']):
+                yield tuple(blocks[0][4][:3]), rasm_blocks
+
+def iter_items(words, rng, densities):
+    """ convert the words of the reference into the items of a transcription, adding the verse indexes
+    and the dividers at the end of each verse.
+
+    Args:
+        words (iterable): words as yielded by iter_reference.
+        rng (random.Random): random generator.
+        densities (dict): probability of each feature, see DENSITIES.
+
+    Yield:
+        tuple: kind of item (WORD, INDEX, DIVIDER), its text and the index of the word (None for other items).
+
+    """
+    prev = None
+    for ind, blocks in words:
+        if prev and prev[:2] != ind[:2]:
+            yield from _verse_end(prev, rng, densities)
+        yield WORD, render_word(blocks, rng, densities), ind
+        prev = ind
+
+    if prev:
+        yield from _verse_end(prev, rng, densities)
+
+def _verse_end(ind, rng, densities):
+    """ items that close a verse: fasila, awashir and verse index.
+
+    """
+    sura, vers, _ = ind
+    # the mapper has no reference beyond the last verse of the Quran for dividers or indexes
+    if vers == NUM_VERSES[sura] and sura == 114:
+        return
+    # the mark of the tenth verses replaces the fasila
+    if vers % 10 == 0 and rng.random() < densities['awashir']:
+        yield DIVIDER, f'x{rng.randint(1, 3)}{rng.choice(AWASHIR_SHAPES)}', None
+    elif rng.random() < densities['fasila']:
+        yield DIVIDER, f'*{rng.randint(1, 3)}{rng.choice(FASILA_SHAPES)}{rng.choice(FASILA_FILLS)}{rng.randint(1, 12):02d}', None
+    yield INDEX, f'{sura}:{vers}', None
+
+def render_word(blocks, rng, densities):
+    """ write a word of the reference with strokes, vowel dots and tail marks, and maybe a variant
+    in the vowel of its first letter.
+
+    Args:
+        blocks (list): blocks of the word in Latin archigraphemes.
+        rng (random.Random): random generator.
+        densities (dict): probability of each feature, see DENSITIES.
+
+    Return:
+        str: token of the word.
+
+    """
+    variant = rng.random() < densities['variant']
+
+    out = []
+    for i, char in enumerate(''.join(blocks)):
+        out.append(char)
+        if char == 'Y':
+            out.append(rng.choice(YA_TAILS))
+        if char in STROKED and rng.random() < densities['strokes']:
+            out.append(rng.choice(STROKES))
+        if i == 0 and variant:
+            base, ref = rng.sample(VOWELS, 2)
+            out.append(f'[{base}/{ref}=vd=dots]')
+        elif rng.random() < densities['vowels']:
+            out.append(rng.choice(VOWELS))
+
+    return ''.join(out)
+
+def _peek(buf, items):
+    """ next item of items without consuming it, None if there are no more items.
+
+    """
+    if not buf and (item := next(items, None)):
+        buf.append(item)
+    return buf[0] if buf else None
+
+def _take_line(buf, items, nwords):
+    """ take the items of a line with nwords words. Verse ends are kept in the line of their last word.
+
+    """
+    line = []
+    while (item := _peek(buf, items)) and (nwords or item[0] != WORD):
+        if item[0] == WORD:
+            nwords -= 1
+        line.append(buf.popleft())
+    return line
+
+def render_line(items, num, rng, densities, notes):
+    """ write the items of a line, enclosing words in lacunas, unclear and illegible sections and notes.
+
+    Args:
+        items (list): items of the line, as yielded by iter_items.
+        num (int): number of the line.
+        rng (random.Random): random generator.
+        densities (dict): probability of each feature, see DENSITIES.
+        notes (list): footnotes of the page. The footnotes of the notes added are appended.
+
+    Return:
+        str, int: line in InterSaME text format and number of annotations added.
+
+    """
+    pieces = [text for _, text, _ in items]
+    nann = 0
+
+    i, n = 0, len(items)
+    while i < n:
+        if items[i][0] != WORD or '[' in pieces[i]:
+            i += 1
+            continue
+
+        r = rng.random()
+        for span, (opening, closing) in SPANS.items():
+            if r < densities[span]:
+                # a span covers consecutive words without variants, and never an index
+                j = i
+                while j+1 < n and j-i+1 < MAX_SPAN and items[j+1][0] == WORD and '[' not in pieces[j+1] and rng.random() < 0.5:
+                    j += 1
+                pieces[i] = opening + pieces[i]
+                pieces[j] = pieces[j] + closing
+                nann += 1
+                i = j
+                break
+            r -= densities[span]
+        else:
+            if r < densities['note']:
+                pieces[i] = f'({pieces[i]})'
+                notes.append(f'|L{num}.{rng.choice(NOTES_TAGS)}|synthetic note {len(notes)+1}')
+                nann += 1
+        i += 1
+
+    return f'|{num}|' + '#'.join(pieces) + '#', nann
+
+def generate(pages,
+             start = (1, 1),
+             lines_per_page = LINES_PER_PAGE,
+             words_per_line = WORDS_PER_LINE,
+             densities = None,
+             seed = 0):
+    """ generate a synthetic InterSaME text document.
+
+    Args:
+        pages (int): number of pages.
+        start (tuple): sura and vers where the document starts.
+        lines_per_page (int): number of lines of a page, at most 99.
+        words_per_line (int): average number of words in a line.
+        densities (dict): probability of each feature, the ones not given are taken from DENSITIES.
+        seed (int): seed of the random generator.
+
+    Return:
+        str, dict, dict: InterSaME text document; start indexes of the folios (hist_id -> signature ->
+            folio -> [sura, vers, word, block]); and number of pages, lines, words and annotations.
+
+    Raise:
+        InterSaMESynthError: if the options are out of range.
+
+    """
+    if pages < 1:
+        raise InterSaMESynthError('the number of pages must be at least 1')
+    if not 1 <= lines_per_page <= 99:
+        raise InterSaMESynthError('the number of lines per page must be between 1 and 99')
+    if words_per_line < 1:
+        raise InterSaMESynthError('the number of words per line must be at least 1')
+
+    densities = {**DENSITIES, **(densities or {})}
+    if (unknown := set(densities) - set(DENSITIES)):
+        raise InterSaMESynthError(f'unknown features {", ".join(sorted(unknown))}, available features are {", ".join(DENSITIES)}')
+
+    rng = random.Random(seed)
+
+    docs = []
+    indexes = {}
+    stats = {'pages' : 0, 'lines' : 0, 'words' : 0, 'annotations' : 0}
+
+    ifrag = ipage = 0
+    items = iter_items(iter_reference(start), rng, densities)
+    buf = deque()
+    while stats['pages'] < pages:
+
+        if not _peek(buf, items):
+            # end of the Quran, start again in a new fragment
+            items = iter_items(iter_reference(), rng, densities)
+            ifrag, ipage = ifrag+1, 0
+
+        if ipage == 2*FOLIOS_PER_FRAGMENT:
+            ifrag, ipage = ifrag+1, 0
+
+        if FIRST_HIST_ID+ifrag > 999:
+            raise InterSaMESynthError(f'too many pages, at most {1000-FIRST_HIST_ID} fragments can be generated')
+
+        hist_id = f'U{FIRST_HIST_ID+ifrag}'
+        sig = f'Synth.{FIRST_HIST_ID+ifrag}'
+        folio = f'{ipage//2+1}{"rv"[ipage%2]}'
+
+        ini = _peek(buf, items)[2]
+        indexes.setdefault(hist_id, {}).setdefault(sig, {})[folio] = [*ini, 1]
+
+        lines, notes = [], []
+        end = ini
+        for num in range(1, lines_per_page+1):
+            if not _peek(buf, items):
+                break
+            line_items = _take_line(buf, items, rng.randint(max(1, words_per_line-2), words_per_line+2))
+            line, nann = render_line(line_items, num, rng, densities, notes)
+            lines.append(line)
+            stats['lines'] += 1
+            stats['words'] += sum(kind == WORD for kind, _, _ in line_items)
+            stats['annotations'] += nann + sum('[' in text for _, text, _ in line_items)
+            end = next((ind for kind, _, ind in reversed(line_items) if kind == WORD), end)
+
+        title = f'{hist_id}_Q.{ini[0]}:{ini[1]}-{end[0]}:{end[1]}_{LOCATION}_{sig}_f.{folio}_{"hair" if ipage%2 else "flesh"}'
+        doc = [f'TITLE:{title}', f'Source:synthetic transcription (seed {seed})', *lines]
+        if notes:
+            doc.append('Notes:')
+            doc.extend(notes)
+        docs.append('\n'.join(doc)+'\n')
+
+        stats['pages'] += 1
+        ipage += 1
+
+    return ''.join(docs), indexes, stats
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='generate synthetic InterSaME text documents from the reference Quran')
+    parser.add_argument('outfile', nargs='?', type=FileType('w'), default=sys.stdout, help='InterSaME text document [default stdout]')
+    parser.add_argument('--indexes', required=True, type=FileType('w'), help='json file for the start indexes of the folios')
+    parser.add_argument('--pages', type=int, default=10, help='number of pages [default 10]')
+    parser.add_argument('--start', default='1:1', help='sura:vers where the document starts [default 1:1]')
+    parser.add_argument('--lines', type=int, default=LINES_PER_PAGE, help=f'lines per page [default {LINES_PER_PAGE}]')
+    parser.add_argument('--words', type=int, default=WORDS_PER_LINE, help=f'average words per line [default {WORDS_PER_LINE}]')
+    parser.add_argument('--density', nargs='+', default=[], metavar='FEATURE=P',
+                        help=f'probability of a feature, one of {", ".join(DENSITIES)}')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator [default 0]')
+    args = parser.parse_args()
+
+    try:
+        text, indexes, stats = generate(args.pages, parse_qindex(args.start), args.lines, args.words, parse_densities(args.density), args.seed)
+
+    except InterSaMESynthError as e:
+        print(f'Fatal error! {e}', file=sys.stderr)
+        sys.exit(1)
+
+    args.outfile.write(text)
+    json.dump(indexes, args.indexes, indent=2)
+
+    print(', '.join(f'{k}: {v}' for k, v in stats.items()), file=sys.stderr)
@@ -0,0 +1,624 @@
+#!/usr/bin/env python3
+#
+#    isame_tei2json.py
+#
+# read the TEI created by isame_json2tei.py back into the InterSaME page structure, and check
+# published TEI files against the json they were created from.
+#
+# The TEI is read in a single streaming pass and each page is available as soon as the next
+# pb is found. The structure of the pages is rebuilt from pb, lb, div/ab, app/lem/rdg, gap,
+# supplied, unclear, pc and note. Blocks are split inside words following the same rules as
+# isame_parser.py. The TEI does not contain the word and block of the quranic index, so the
+# index of each block only contains sura and verse, e.g. [[2, 255, null, null]]. Only the TEI in
+# Latin transcription can be read; the conversion to Arabic script (--ara) cannot be undone.
+#
+# The round-trip check compares the pages read from each TEI with the pages of its json, only
+# on the information that the TEI contains. Neither the Archetype sources nor rasm are needed.
+#
+# examples:
+#   $ cat ../../data/arabic/trans/F001-7.xml | python isame_tei2json.py > F001-6-from-tei.json
+#
+#   $ python isame_tei2json.py --check --files ../../data/arabic/trans/F001-7.xml
+#   $ python isame_tei2json.py --check --files ../../data/arabic/trans --jobs 8
+#   $ python isame_tei2json.py --check --files '../../published/*-7.xml' --json_dir ../../data/arabic/trans
+#
+###########################################################################################################################################################
+
+import os
+import re
+import sys
+from argparse import ArgumentParser, FileType
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from lxml import etree
+
+from isame_util import ARCH, ARDW, expand_inputs
+
+DEFAULT_WORD_SEP = '#'
+
+CHUNK_SIZE = 64 * 1024
+
+# files checked when a directory is given
+TEI_FILES_PATTERN = '*-7.xml'
+
+# the json of F001-7.xml is F001-6.json
+TEI_FNAME_REGEX = re.compile(r'-7\.xml$')
+JSON_FNAME_SUFFIX = '-6.json'
+
+# unit of pc -> key of page structure
+DIVIDER_UNITS = {'fasila' : 'fasilas', 'awashir' : 'awashir', 'khawamis' : 'khawamis', 'miaa' : 'miaa'}
+
+# reason of supplied and gap -> key of page structure
+ABSENT_REASONS = {'lacuna' : 'lacunas', 'illegible' : 'illegible'}
+
+SUMMARY_REGEX = re.compile(r'Contains ff?\. (?P<ini>\S+)(?: to (?P<end>\S+))?')
+
+# maximum number of differences reported for each file
+MAX_DIFFS = 20
+
+
+class InterSaMETeiReadError(Exception):
+    """ Error reading InterSaME TEI.
+
+    """
+    pass
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def _norm_text(text):
+    return ' '.join(text.split())
+
+def new_page(folio, side, source, signature=None, location=None):
+    """ create empty page object.
+
+    Args:
+        folio (str): folio of the page, e.g. 12r.
+        side (str): side of the page.
+        source (str): web link of the image.
+        signature (str): signature of the manuscript, None if unknown.
+        location (str): location of the manuscript, None if unknown.
+
+    Return:
+        dict: page object with meta and page.
+
+    """
+    return {'meta' : {'folio' : folio,
+                      'side' : side,
+                      'source' : source,
+                      'signature' : signature,
+                      'location' : location},
+            'page' : {'blocks' : [],
+                      'lines' : [],
+                      'unclear' : [],
+                      'lacunas' : [],
+                      'illegible' : [],
+                      'variants' : [],
+                      'fasilas' : [],
+                      'awashir' : [],
+                      'khawamis' : [],
+                      'miaa' : [],
+                      'sura_div' : [],
+                      'notes' : []}}
+
+def variant_layers(extra):
+    """ recover the lay field of a variant from the readings added by post_process_variants of isame_json2tei.
+
+    Args:
+        extra (list): (attributes, text) of each rdg of the app after the first one.
+
+    Return:
+        str: other layers of the variant, None if there are none.
+
+    """
+    if not extra:
+        return None
+    if any('change' in attrs for attrs, _ in extra):
+        return '>' + extra[-1][1]
+    if len(extra) == 2:
+        return ('^' if extra[1][0].get('varSeq') == '2' else '&') + extra[1][1]
+    if len(extra) == 3:
+        return f'&{extra[1][1]}&{extra[2][1]}'
+    return None
+
+class _IsameTeiTarget:
+    """ lxml parser target that rebuilds the pages of an InterSaME TEI on the fly.
+
+    Pages are appended to pages when they are complete.
+
+    """
+    def __init__(self, sep=DEFAULT_WORD_SEP):
+        self.sep = sep
+        self.pages = []
+        self.fragments = []  # (signature, location, first folio, last folio) of each msFrag
+
+        self._stack = []     # (kind, rec) of open elements
+        self._in_body = False
+        self._page = None
+        self._ifrag = 0
+        self._sura = self._vers = None
+
+        self._frag = None    # msFrag being read in header
+        self._capture = None # text of lem, note or additional rdg being read
+
+        self._block = []     # characters of current block
+        self._block_sura = self._block_vers = None
+        self._ardw = False
+        self._divider = False
+        self._pc = 0         # open pc elements
+        self._pending = []   # annotations that start at the next character
+        self._last = None    # (block, char) of last character
+        self._app = None     # [variant, number of rdg, additional rdgs]
+
+    #
+    # pages and blocks
+    #
+
+    def _close_block(self, end):
+        if not self._block:
+            return
+        self._page['page']['blocks'].append({'tok' : ''.join(self._block),
+                                             'ind' : [[self._block_sura, self._block_vers, None, None]],
+                                             'end' : end})
+        self._block = []
+        self._ardw = False
+        self._divider = False
+
+    def _add_char(self, char):
+        # same condition of isame_parser for starting a new block within a word
+        if (char in ARCH or char in '123456789') and self._ardw and self._block and not self._divider:
+            self._close_block(False)
+
+        if not self._block:
+            self._divider = self._pc > 0
+            self._block_sura, self._block_vers = self._sura, self._vers
+
+        self._block.append(char)
+        if char in ARDW:
+            self._ardw = True
+
+        self._last = (len(self._page['page']['blocks']), len(self._block)-1)
+        for rec in self._pending:
+            rec['inib'], rec['inic'] = self._last
+        self._pending.clear()
+
+    def _add_text(self, text):
+        # whitespace is only added by the formatting of the xml
+        for i, word in enumerate(''.join(text.split()).split(self.sep)):
+            if i:
+                self._close_block(True)
+            for char in word:
+                self._add_char(char)
+
+    def _open(self, rec):
+        rec.update({'inib' : None, 'inic' : None, 'endb' : None, 'endc' : None})
+        self._pending.append(rec)
+        return rec
+
+    def _close(self, rec):
+        if self._last:
+            rec['endb'], rec['endc'] = self._last
+
+    def _finish_page(self):
+        if self._page is None:
+            return
+        self._close_block(False)
+        self.pages.append(self._page)
+        self._page = None
+        self._pending.clear()
+        self._last = None
+
+    def _start_page(self, attrib):
+        folio = attrib.get('n')
+        signature = location = None
+
+        if self._ifrag < len(self.fragments):
+            signature, location, ini, end = self.fragments[self._ifrag]
+            if folio == (end or ini):
+                self._ifrag += 1
+
+        self._page = new_page(folio, attrib.get('type'), attrib.get('facs'), signature, location)
+
+    #
+    # parser target interface
+    #
+
+    def start(self, tag, attrib):
+        tag = _local(tag)
+
+        if not self._in_body:
+            kind = None
+            if tag == 'msFrag':
+                self._frag = {}
+            elif tag in ('settlement', 'idno', 'summary') and self._frag is not None:
+                self._capture, kind = [], tag
+            elif tag == 'body':
+                self._in_body = True
+            self._stack.append((kind, None))
+            return
+
+        kind, rec = None, None
+
+        if tag == 'div':
+            self._sura = int(attrib['n'])
+        elif tag == 'ab':
+            self._vers = int(attrib['n'])
+
+        elif tag == 'pb':
+            self._finish_page()
+            if attrib.get('n', '')[-1:] not in ('-', '+'):
+                self._start_page(attrib)
+
+        elif self._page is None:
+            pass
+
+        # annotations within the text of lem, note or additional readings
+        elif self._capture is not None:
+            if tag == 'unclear':
+                self._capture.append('{')
+                kind, rec = 'wrap', '}'
+            elif tag == 'supplied' and attrib.get('reason') == 'lacuna':
+                self._capture.append('⟦')
+                kind, rec = 'wrap', '⟧'
+
+        elif tag == 'lb':
+            self._close_block(False)
+            num = attrib.get('n')
+            self._page['page']['lines'].append({'num' : float(num) if '.' in num else int(num),
+                                                'inib' : len(self._page['page']['blocks'])})
+
+        elif tag == 'note':
+            kind, rec = 'note', self._open({'type' : attrib.get('type'), 'note' : None})
+            self._capture = []
+
+        elif tag == 'app':
+            self._app = [self._open({'ref' : None, 'stc' : None, 'typ' : None, 'lay' : None}), 0, []]
+            kind = 'app'
+
+        elif tag == 'lem' and self._app:
+            kind = 'lem'
+            self._capture = []
+
+        elif tag == 'rdg' and self._app:
+            self._app[1] += 1
+            if self._app[1] == 1:
+                variant = self._app[0]
+                variant['stc'], variant['typ'] = attrib.get('type'), attrib.get('cause')
+                if '_lay' in attrib:
+                    variant['lay'] = attrib['_lay'] or None
+                kind = 'rdg'
+            else:
+                kind, rec = 'extra', dict(attrib)
+                self._capture = []
+
+        elif tag == 'unclear':
+            kind, rec = 'unclear', self._open({})
+
+        elif tag == 'supplied' and attrib.get('reason') in ABSENT_REASONS:
+            kind, rec = ABSENT_REASONS[attrib['reason']], self._open({})
+
+        elif tag == 'gap' and attrib.get('reason') in ABSENT_REASONS and attrib.get('unit') == 'rasm':
+            # estimation of missing letters, e.g. 2-3r
+            rec = self._open({})
+            if 'extent' in attrib:
+                self._add_text(f'{attrib["extent"]}r')
+            else:
+                self._add_text(f'{attrib.get("atLeast")}-{attrib.get("atMost")}r')
+            self._close(rec)
+            self._page['page'][ABSENT_REASONS[attrib['reason']]].append(rec)
+
+        elif tag == 'pc' and attrib.get('unit') in DIVIDER_UNITS:
+            if not self._pc:
+                self._close_block(False)
+            self._page['page'][DIVIDER_UNITS[attrib['unit']]].append(len(self._page['page']['blocks']))
+            kind = 'pc'
+            self._pc += 1
+
+        self._stack.append((kind, rec))
+
+    def end(self, tag):
+        kind, rec = self._stack.pop()
+
+        if not self._in_body:
+            if kind:
+                self._frag[kind] = _norm_text(''.join(self._capture))
+                self._capture = None
+            elif _local(tag) == 'msFrag' and self._frag is not None:
+                m = SUMMARY_REGEX.search(self._frag.get('summary', ''))
+                self.fragments.append((self._frag.get('idno'), self._frag.get('settlement'),
+                                       m.group('ini') if m else None, m.group('end') if m else None))
+                self._frag = None
+            return
+
+        if kind is None:
+            if _local(tag) == 'body':
+                self._finish_page()
+                self._in_body = False
+            return
+
+        if kind == 'wrap':
+            self._capture.append(rec)
+
+        elif kind == 'note':
+            rec['note'] = _norm_text(''.join(self._capture))
+            self._capture = None
+            self._page['page']['notes'].append(rec)
+
+        elif kind == 'lem':
+            self._app[0]['ref'] = _norm_text(''.join(self._capture))
+            self._capture = None
+
+        elif kind == 'extra':
+            self._app[2].append((rec, _norm_text(''.join(self._capture))))
+            self._capture = None
+
+        elif kind == 'rdg':
+            self._close(self._app[0])
+
+        elif kind == 'app':
+            variant, _, extra = self._app
+            if variant['lay'] is None:
+                variant['lay'] = variant_layers(extra)
+            self._page['page']['variants'].append(variant)
+            self._app = None
+
+        elif kind == 'pc':
+            self._pc -= 1
+
+        elif self._page is not None:
+            self._close(rec)
+            self._page['page'][kind].append(rec)
+
+    def data(self, data):
+        if self._capture is not None:
+            self._capture.append(data)
+        elif self._in_body and self._page is not None:
+            self._add_text(data)
+
+    def close(self):
+        self._finish_page()
+
+def iter_pages(infp, sep=DEFAULT_WORD_SEP):
+    """ read the pages of a TEI created by isame_json2tei.py.
+
+    Args:
+        infp (io.BufferedReader): TEI input stream.
+        sep (str): word separator used in the TEI. It cannot be a whitespace.
+
+    Yield:
+        dict: page object with meta and page, in the format of the InterSaME json.
+
+    Raise:
+        InterSaMETeiReadError: if the xml is malformed.
+
+    """
+    target = _IsameTeiTarget(sep)
+    parser = etree.XMLParser(target=target, remove_comments=True, remove_pis=True, huge_tree=True)
+
+    try:
+        while chunk := infp.read(CHUNK_SIZE):
+            parser.feed(chunk)
+            yield from target.pages
+            target.pages.clear()
+        parser.close()
+    except (etree.XMLSyntaxError, ValueError, KeyError) as e:
+        raise InterSaMETeiReadError(f'invalid InterSaME TEI {getattr(infp, "name", "")}: {e}')
+
+    yield from target.pages
+
+def tei2json(infp, outfp, sep=DEFAULT_WORD_SEP):
+    """ convert InterSaME TEI into json. The json list is written page by page.
+
+    Args:
+        infp (io.BufferedReader): TEI input stream.
+        outfp (io.TextIOWrapper): json output stream.
+        sep (str): word separator used in the TEI.
+
+    Return:
+        int: number of pages.
+
+    Raise:
+        InterSaMETeiReadError: if the xml is malformed.
+
+    """
+    npages = 0
+    outfp.write('[')
+    for page in iter_pages(infp, sep):
+        if npages:
+            outfp.write(',\n')
+        outfp.write(json.dumps(page, ensure_ascii=False))
+        npages += 1
+    outfp.write(']\n')
+    return npages
+
+#
+# round-trip check
+#
+
+def _spans(items, *keys):
+    return sorted(tuple(item.get(k) for k in ('inib', 'inic', 'endb', 'endc', *keys)) for item in items)
+
+def tei_view(page_obj):
+    """ get the information of a page that is contained in its TEI.
+
+    Args:
+        page_obj (dict): page object with meta and page.
+
+    Return:
+        dict: comparable fields of the page.
+
+    """
+    meta, page = page_obj['meta'], page_obj['page']
+    nblocks = len(page['blocks'])
+
+    return {
+        'folio' : meta.get('folio'),
+        'side' : meta.get('side'),
+        'source' : meta.get('source'),
+        'signature' : meta.get('signature'),
+        'location' : meta.get('location'),
+        'blocks' : [(b['tok'], b['end']) for b in page['blocks']],
+        'verses' : [tuple(b['ind'][0][:2]) if b['ind'] else None for b in page['blocks']],
+        'lines' : [(float(l['num']), l['inib']) for l in page['lines'] if l['inib'] < nblocks],
+        'unclear' : _spans(page['unclear']),
+        'lacunas' : _spans(page['lacunas']),
+        'illegible' : _spans(page['illegible']),
+        'variants' : sorted((v['inib'], v['inic'], v['endb'], v['endc'], v['ref'], v['stc'], v['typ'], v['lay'] or None)
+                            for v in page['variants']),
+        'fasilas' : sorted(page['fasilas']),
+        'awashir' : sorted(page['awashir']),
+        'khawamis' : sorted(page['khawamis']),
+        'miaa' : sorted(page['miaa']),
+        'notes' : sorted((n['inib'], n['inic'], n['type'], _norm_text(str(n['note']))) for n in page['notes']),
+    }
+
+def compare_pages(expected, found):
+    """ compare pages of json with pages read from its TEI.
+
+    Args:
+        expected (list): page objects of json.
+        found (list): page objects read from TEI.
+
+    Yield:
+        str: description of each difference.
+
+    """
+    if len(expected) != len(found):
+        yield f'{len(expected)} pages in json but {len(found)} in TEI'
+
+    for exp_page, found_page in zip(expected, found):
+        exp, fnd = tei_view(exp_page), tei_view(found_page)
+
+        # blocks without quranic index keep the verse of the previous one in the TEI
+        fnd['verses'] = [None if e is None else f for e, f in zip(exp['verses'], fnd['verses'])]
+
+        # the fragments might not be in the TEI header
+        for key in ('signature', 'location'):
+            if fnd[key] is None:
+                exp[key] = None
+
+        for key, value in exp.items():
+            if value != fnd[key]:
+                if isinstance(value, list):
+                    diff = next((i for i, (a, b) in enumerate(zip(value, fnd[key])) if a != b), min(len(value), len(fnd[key])))
+                    yield f'folio {exp["folio"]}: {key} differ at {diff}: json {value[diff:diff+1]} tei {fnd[key][diff:diff+1]}'
+                else:
+                    yield f'folio {exp["folio"]}: {key} differ: json {value!r} tei {fnd[key]!r}'
+
+def json_fname_for(tei_fname, json_dir=None):
+    """ get name of the json file from which a TEI file was created, e.g. F001-7.xml -> F001-6.json.
+
+    Args:
+        tei_fname (str): TEI file.
+        json_dir (str): directory of json file. If None, it is the directory of the TEI file.
+
+    Return:
+        str: json file name.
+
+    """
+    if TEI_FNAME_REGEX.search(tei_fname):
+        fname = TEI_FNAME_REGEX.sub(JSON_FNAME_SUFFIX, tei_fname)
+    else:
+        fname = f'{os.path.splitext(tei_fname)[0]}.json'
+    if json_dir:
+        fname = os.path.join(json_dir, os.path.basename(fname))
+    return fname
+
+def check_file(args):
+    """ check that a TEI file corresponds to its json.
+
+    Args:
+        args (tuple): TEI file, json file and word separator.
+
+    Return:
+        str, list: TEI file and differences found, up to MAX_DIFFS.
+
+    """
+    tei_fname, json_fname, sep = args
+    try:
+        with open(json_fname) as fp:
+            expected = json.load(fp)
+        with open(tei_fname, 'rb') as fp:
+            found = list(iter_pages(fp, sep))
+    except (OSError, ValueError, InterSaMETeiReadError) as e:
+        return tei_fname, [str(e)]
+
+    diffs = []
+    for diff in compare_pages(expected, found):
+        diffs.append(diff)
+        if len(diffs) == MAX_DIFFS:
+            break
+    return tei_fname, diffs
+
+def check_files(fnames, json_dir=None, sep=DEFAULT_WORD_SEP, jobs=1):
+    """ check several TEI files against their json.
+
+    Args:
+        fnames (list): TEI files.
+        json_dir (str): directory of json files. If None, each json is in the directory of its TEI.
+        sep (str): word separator used in the TEI.
+        jobs (int): number of processes. If 1, files are checked one after another in the current process.
+
+    Yield:
+        str, list: TEI file and differences found, in the order of fnames.
+
+    """
+    tasks = [(fname, json_fname_for(fname, json_dir), sep) for fname in fnames]
+
+    if jobs <= 1 or len(tasks) <= 1:
+        yield from map(check_file, tasks)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+        yield from executor.map(check_file, tasks)
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='convert InterSaME TEI back into json, or check TEI files against their json')
+    parser.add_argument('infile', nargs='?', type=FileType('rb'), default=sys.stdin.buffer, help='xml file')
+    parser.add_argument('outfile', nargs='?', type=FileType('w'), default=sys.stdout, help='json file')
+    parser.add_argument('--sep', default=DEFAULT_WORD_SEP, help=f'word separator of TEI, it cannot be a whitespace (default "{DEFAULT_WORD_SEP}")')
+    parser.add_argument('--check', action='store_true', help='check --files against their json, e.g. F001-7.xml against F001-6.json')
+    parser.add_argument('--files', '-f', nargs='+', help=f'xml files, directories (files {TEI_FILES_PATTERN}) or glob patterns to check')
+    parser.add_argument('--json_dir', help='directory of json files for --check [default directory of each xml file]')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='number of processes for checking files in parallel [default 1]')
+    args = parser.parse_args()
+
+    if not args.sep or args.sep.isspace():
+        parser.error('word separator cannot be empty nor a whitespace')
+
+    if args.check != bool(args.files):
+        parser.error('--check and --files must be used together')
+
+    if not args.check:
+        try:
+            tei2json(args.infile, args.outfile, args.sep)
+        except InterSaMETeiReadError as e:
+            print(f'Fatal error! {e}', file=sys.stderr)
+            sys.exit(1)
+        sys.exit(0)
+
+    try:
+        fnames = expand_inputs(args.files, TEI_FILES_PATTERN)
+    except FileNotFoundError as e:
+        print(f'Fatal error! {e}', file=sys.stderr)
+        sys.exit(1)
+
+    nfailed = 0
+    for fname, diffs in check_files(fnames, args.json_dir, args.sep, args.jobs):
+        if diffs:
+            nfailed += 1
+            print(f'FAIL {fname}', file=args.outfile)
+            for diff in diffs:
+                print(f'    {diff}', file=args.outfile)
+        else:
+            print(f'OK   {fname}', file=args.outfile)
+
+    print(f'{len(fnames)-nfailed} of {len(fnames)} files passed', file=sys.stderr)
+    if nfailed:
+        sys.exit(1)
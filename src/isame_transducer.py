@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+#
+#    isame_transducer.py
+#
+# conversion engine shared by the script conversion tools (to_arabic, to_paleo, lat2ar, ar2latrasm)
+#
+# A mapping table is compiled once into a trie and text is converted in a single left-to-right scan,
+# replacing at each position the longest key of the table that matches. Tables with single character
+# keys only are compiled into a translation table for str.translate. Conversions of tokens are kept
+# in an LRU cache, since the same words occur again and again in a corpus.
+#
+# The script also converts whole files with any of the conversion tools, one line at a time.
+#
+# examples:
+#   $ cat ../data/arabic/decotype_quran.txt | python isame_transducer.py ar2latrasm > ../data/arabic/decotype_quran_latrasm.txt
+#   $ python isame_transducer.py to_paleo --files ../../data/arabic/transcriptions --outdir ../../data/paleo --jobs 4
+#
+######################################################################################################################
+
+import os
+import re
+import sys
+import importlib
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from argparse import ArgumentParser, FileType
+
+from isame_util import expand_inputs, write_atomic
+
+DEFAULT_CACHE_SIZE = 2**16
+
+# key of the output of a trie node, never a character of the text
+_END = ''
+
+_TOKEN_REGEX = re.compile(r'(\s+)')
+
+# conversion name -> module and per-line callable
+CONVERSIONS = {
+    'to_arabic'  : ('to_arabic', 'to_arabic'),
+    'to_paleo'   : ('to_paleo', 'to_paleo'),
+    'lat2ar'     : ('lat2ar', 'TRANSDUCER'),
+    'ar2latrasm' : ('ar2latrasm', 'ar2latrasm'),
+}
+
+FILES_PATTERN = '*.txt'
+
+
+class Transducer:
+    """ longest-match conversion compiled from a mapping table.
+
+    Characters not matched by any key are kept untouched.
+
+    Attributes:
+        mapping (dict): key -> replacement.
+
+    """
+    def __init__(self, mapping, cache_size=DEFAULT_CACHE_SIZE):
+        """ compile mapping.
+
+        Args:
+            mapping (dict or iterable): key -> replacement, or (key, replacement) pairs. If a key
+                appears more than once, its first replacement is kept.
+            cache_size (int): maximum number of tokens kept in the cache.
+
+        Raise:
+            ValueError: if any key is empty.
+
+        """
+        self.mapping = {}
+        for key, value in (mapping.items() if isinstance(mapping, dict) else mapping):
+            if not key:
+                raise ValueError('empty key in mapping')
+            self.mapping.setdefault(key, value)
+
+        self._table = None
+        self._root = {}
+        if all(len(key) == 1 for key in self.mapping):
+            self._table = str.maketrans(self.mapping)
+        else:
+            for key, value in self.mapping.items():
+                node = self._root
+                for char in key:
+                    node = node.setdefault(char, {})
+                node[_END] = value
+
+        # tokens can only be converted separately if no key crosses a space
+        self._tokenize = not any(len(key) > 1 and _TOKEN_REGEX.search(key) for key in self.mapping)
+        self._cached = lru_cache(maxsize=cache_size)(self.convert)
+
+    def convert(self, text):
+        """ convert text in a single scan, without cache.
+
+        Args:
+            text (str): input text.
+
+        Return:
+            str: converted text.
+
+        """
+        if self._table is not None:
+            return text.translate(self._table)
+
+        root = self._root
+        out = []
+        i, n = 0, len(text)
+        while i < n:
+            node = root.get(text[i])
+            if node is None:
+                out.append(text[i])
+                i += 1
+                continue
+
+            match, end = None, i
+            j = i + 1
+            while True:
+                if _END in node:
+                    match, end = node[_END], j
+                if j == n or (node := node.get(text[j])) is None:
+                    break
+                j += 1
+
+            if match is None:
+                out.append(text[i])
+                i += 1
+            else:
+                out.append(match)
+                i = end
+
+        return ''.join(out)
+
+    def __call__(self, text):
+        """ convert text, token by token, taking the conversion of each token from the cache.
+
+        Args:
+            text (str): input text.
+
+        Return:
+            str: converted text.
+
+        """
+        if not self._tokenize:
+            return self._cached(text)
+        return ''.join(map(self._cached, _TOKEN_REGEX.split(text)))
+
+    def convert_file(self, infp, outfp):
+        """ convert a whole text stream.
+
+        Args:
+            infp (io.TextIOWrapper): input stream.
+            outfp (io.TextIOWrapper): output stream.
+
+        """
+        outfp.writelines(map(self, infp))
+
+    def cache_info(self):
+        return self._cached.cache_info()
+
+
+def get_conversion(name):
+    """ get the per-line function of a conversion tool.
+
+    Args:
+        name (str): conversion name, one of CONVERSIONS.
+
+    Return:
+        callable: function converting a line.
+
+    """
+    module, attr = CONVERSIONS[name]
+    return getattr(importlib.import_module(module), attr)
+
+def convert_stream(conversion, infp, outfp):
+    """ convert a text stream line by line with a conversion tool. Lines starting with TITLE are
+    kept as they are, as done by the tools.
+
+    Args:
+        conversion (str): conversion name.
+        infp (io.TextIOWrapper): input stream.
+        outfp (io.TextIOWrapper): output stream.
+
+    Return:
+        int: number of lines converted.
+
+    """
+    convert = get_conversion(conversion)
+    nlines = 0
+    for line in infp:
+        line = line.strip()
+        print(line if line.startswith('TITLE') else convert(line), file=outfp)
+        nlines += 1
+    return nlines
+
+def _convert_file(args):
+    """ convert a single file, in a worker process.
+
+    The output is written in a temporary file that is moved into place when the conversion ends.
+
+    Args:
+        args (tuple): conversion name, input file name and output file name.
+
+    Return:
+        tuple: output file name and number of lines.
+
+    """
+    conversion, fname, out_fname = args
+    with open(fname) as infp:
+        nlines = write_atomic(out_fname, lambda outfp: convert_stream(conversion, infp, outfp))
+    return out_fname, nlines
+
+def convert_files(conversion, fnames, outdir, jobs=1):
+    """ convert several files into outdir.
+
+    Args:
+        conversion (str): conversion name.
+        fnames (list): input files.
+        outdir (str): output directory. Each output file has the name of its input file.
+        jobs (int): number of processes. If 1, files are converted one after another in the current process.
+
+    Yield:
+        str, int: output file name and number of lines, in the order of fnames.
+
+    """
+    os.makedirs(outdir, exist_ok=True)
+    tasks = [(conversion, fname, os.path.join(outdir, os.path.basename(fname))) for fname in fnames]
+
+    if jobs <= 1 or len(tasks) <= 1:
+        yield from map(_convert_file, tasks)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+        yield from executor.map(_convert_file, tasks)
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='convert text files between scripts')
+    parser.add_argument('conversion', choices=CONVERSIONS, help='conversion tool')
+    parser.add_argument('infile', nargs='?', type=FileType('r'), default=sys.stdin, help='input file')
+    parser.add_argument('outfile', nargs='?', type=FileType('w'), default=sys.stdout, help='output file')
+    parser.add_argument('--files', '-f', nargs='+', help=f'text files, directories (files {FILES_PATTERN}) or glob patterns to convert into --outdir')
+    parser.add_argument('--outdir', help='output directory for --files')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='number of processes for converting --files in parallel [default 1]')
+    args = parser.parse_args()
+
+    if bool(args.files) != bool(args.outdir):
+        parser.error('--files and --outdir must be used together')
+
+    try:
+        if args.files:
+            for out_fname, nlines in convert_files(args.conversion, expand_inputs(args.files, FILES_PATTERN), args.outdir, args.jobs):
+                print(f'{out_fname}: {nlines} lines', file=sys.stderr)
+        else:
+            convert_stream(args.conversion, args.infile, args.outfile)
+    except OSError as e:
+        print(f'Fatal error! {e}', file=sys.stderr)
+        sys.exit(1)
@@ -6,9 +6,23 @@
 #
 ######################################################
 
+import os
 import re
 import sys
+import ast
+import glob
+import time
+import hashlib
+import atexit
+import logging
+import logging.handlers
+import multiprocessing
+from importlib import metadata
 from bs4 import BeautifulSoup
+try:
+    import ujson as json
+except ImportError:
+    import json
 
 CUSTOM_MAPPING = {
     'ك'   : 'ک',
@@ -43,6 +57,17 @@ REPL_ISAME = {'¹':'’',
 
 TO_ISAME_REGEX = re.compile('|'.join(REPL_ISAME))
 
+MYPATH = os.path.dirname(os.path.abspath(__file__))
+
+# key of the record that closes a json lines stream
+END_KEY = 'end'
+
+LOG_DIR = 'logs'
+LOG_FORMAT = '%(asctime)s :: %(levelname)s :: %(name)s :: %(funcName)s :: %(lineno)d :: %(message)s'
+
+# listener of the logging queue of this process, if set up
+_LOG_LISTENER = None
+
 #           sura : number of verses
 NUM_VERSES = { 1 :   7 ,
                2 : 286 ,
@@ -453,7 +478,7 @@ def diff_variant(variants, btok, ibloc, logging, debug=False):
         # btok had a variant inside; block btok==ABC in A[B/ref]C
         if var['inib'] == var['endb'] == ibloc:
             if debug:
-                logging.debug(f'~~ A. btok containing both start and end of variant ({var["stc"]}, {var["typ"]})')
+                logging.debug('~~ A. btok containing both start and end of variant (%s, %s)', var["stc"], var["typ"])
             
             aux = btok[:var['inic']] + var['ref'] + btok[var['endc']+1:], [(var['stc'], var['typ'])]
 
@@ -463,7 +488,7 @@ def diff_variant(variants, btok, ibloc, logging, debug=False):
                 prev_var = variants[j]
                 if prev_var['inib'] == prev_var['endb'] == ibloc:
                     if debug:
-                        logging.debug(f'~~ A-2. btok containing both start and end of variant ({var["stc"]}, {var["typ"]})')
+                        logging.debug('~~ A-2. btok containing both start and end of variant (%s, %s)', var["stc"], var["typ"])
 
                     aux = aux[0][:prev_var['inic']] + prev_var['ref'] + aux[0][prev_var['endc']+1:], [(prev_var['stc'], prev_var['typ'])] + aux[1]
             return aux
@@ -474,7 +499,7 @@ def diff_variant(variants, btok, ibloc, logging, debug=False):
                 if c in BLOCK_START:
                     break
             if debug:
-                logging.debug(f'~~ B. btok containing start of variant ({var["stc"]}, {var["typ"]})')
+                logging.debug('~~ B. btok containing start of variant (%s, %s)', var["stc"], var["typ"])
             return btok[:var['inic']] + var['ref'][:iref], [(var['stc'], var['typ'])]
 
         elif var['inib'] < ibloc:
@@ -490,7 +515,7 @@ def diff_variant(variants, btok, ibloc, logging, debug=False):
             # block has a variant that starts in previous block(s) and ends in the block we are currently reading; block btok==B in [AB/ref]
             if var['endb'] == ibloc:
                 if debug:
-                    logging.debug(f'~~ C. btok containing end of variant ({var["stc"]}, {var["typ"]})')
+                    logging.debug('~~ C. btok containing end of variant (%s, %s)', var["stc"], var["typ"])
                 return var['ref'][iref:] + btok[var['endc']:], [(var['stc'], var['typ'])]
 
             # btok is in the middle of a variant; block btok==B in [ABC/ref]
@@ -504,7 +529,8 @@ def diff_variant(variants, btok, ibloc, logging, debug=False):
                     if cnt == nnext_blocks:
                         break
                 if debug:
-                    logging.debug(f'~~ D. btok is inside a variant that starts and end in surrounding blocks ({var["stc"]}, {var["typ"]})')
+                    logging.debug('~~ D. btok is inside a variant that starts and end in surrounding blocks (%s, %s)',
+                                  var["stc"], var["typ"])
                 return var['ref'][iref:iref_end+1], [(var['stc'], var['typ'])]
 
     return btok, None
@@ -606,3 +632,240 @@ def absent_text(ibloc, ichar, illegible, lacunas):
                 elem['inic'] <= ichar and elem['endc'] >= ichar:
                 return True
     return False
+
+def tool_sources(module):
+    """ get the source files of a tool module and of all the modules of this directory it imports.
+
+    Args:
+        module (str): module name.
+
+    Return:
+        list: sorted paths of the source files.
+
+    """
+    sources = set()
+    pending = [module]
+    while pending:
+        fname = os.path.join(MYPATH, f'{pending.pop()}.py')
+        if fname in sources or not os.path.exists(fname):
+            continue
+        sources.add(fname)
+        with open(fname) as fp:
+            tree = ast.parse(fp.read(), fname)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                pending.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                pending.append(node.module)
+    return sorted(sources)
+
+def package_version(name):
+    """ get the installed version of a package, None if it is not installed.
+
+    """
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+def fingerprint(fname, old=None):
+    """ calculate the fingerprint of a file. The hash is only recalculated if mtime or size have changed.
+
+    Args:
+        fname (str): path of file.
+        old (dict): previous fingerprint of the same file, None if not available.
+
+    Return:
+        dict: {'mtime': int, 'size': int, 'sha1': str} or None if fname does not exist.
+
+    """
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return None
+
+    if old and old['mtime'] == st.st_mtime_ns and old['size'] == st.st_size:
+        return old
+
+    sha1 = hashlib.sha1()
+    with open(fname, 'rb') as fp:
+        while (chunk := fp.read(1 << 20)):
+            sha1.update(chunk)
+
+    return {'mtime': st.st_mtime_ns, 'size': st.st_size, 'sha1': sha1.hexdigest()}
+
+def expand_inputs(paths, pattern):
+    """ get the list of files indicated by paths.
+
+    Args:
+        paths (list): file names, directories or glob patterns.
+        pattern (str): glob pattern of the files a directory is expanded to, e.g. '*.xml'.
+
+    Return:
+        list: file names, in the order given and sorted within each directory or pattern.
+
+    Raise:
+        FileNotFoundError: if a directory or pattern does not match any file.
+
+    """
+    fnames = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = sorted(glob.glob(os.path.join(path, pattern)))
+        elif glob.has_magic(path):
+            matches = sorted(glob.glob(path))
+        else:
+            matches = [path]
+        if not matches:
+            raise FileNotFoundError(f'no {pattern} files found in {path}')
+        fnames.extend(matches)
+    return fnames
+
+def write_atomic(fname, write, mode='w'):
+    """ write a file through a temporary file that is moved into place when writing ends, so that a
+    failed conversion does not leave a partial file. The temporary file is removed on any error.
+
+    Args:
+        fname (str): output file.
+        write (callable): function writing into the open stream.
+        mode (str): 'w' for a utf-8 text stream, 'wb' for a binary one, e.g. for pickle.
+
+    Return:
+        result of write.
+
+    """
+    tmp_fname = f'{fname}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_fname, mode, encoding=None if 'b' in mode else 'utf-8') as outfp:
+            result = write(outfp)
+        os.replace(tmp_fname, fname)
+    finally:
+        if os.path.exists(tmp_fname):
+            os.remove(tmp_fname)
+    return result
+
+class InterSaMEStreamError(Exception):
+    """ Exception for json lines streams that are truncated or were closed by a failed stage.
+
+    """
+    pass
+
+def read_pages(infp):
+    """ read the pages of an InterSaME json document, either a json array or json lines with one page per line.
+    The format is detected from the first character of the stream.
+
+    Json lines are read one at a time, so that pages can be processed while the previous stage is still writing.
+    The stream must be closed by the end record written by write_pages.
+
+    Args:
+        infp (io.TextIOWrapper): input json stream.
+
+    Yield:
+        dict: page object with meta and page.
+
+    Raise:
+        InterSaMEStreamError: if the json lines stream has no end record or the stage that wrote it failed,
+            with the error of that stage.
+
+    """
+    first = infp.read(1)
+    while first and first.isspace():
+        first = infp.read(1)
+
+    if not first:
+        return
+
+    if first == '[':
+        yield from json.loads(first+infp.read())
+        return
+
+    line = first+infp.readline()
+    while line:
+        if line.strip():
+            page = json.loads(line)
+            if END_KEY in page:
+                if (error := page[END_KEY].get('error')):
+                    raise InterSaMEStreamError(error)
+                return
+            yield page
+        line = infp.readline()
+
+    raise InterSaMEStreamError('json lines stream truncated, end record not found')
+
+def write_pages(pages, outfp, jsonl=False):
+    """ write the pages of an InterSaME structure.
+
+    Json lines streams are closed by an end record, {"end": {"pages": int, "error": str}}, with the
+    error that stopped the pages or null, so that the next stage does not take a failed or truncated
+    stream for a complete one.
+
+    Args:
+        pages (iterable): page objects.
+        outfp (io.TextIOWrapper): output json stream.
+        jsonl (bool): write json lines, one page per line, flushing after each page. Otherwise, write
+            an indented json array.
+
+    Return:
+        int: number of pages written.
+
+    """
+    if not jsonl:
+        pages = list(pages)
+        json.dump(pages, outfp, ensure_ascii=False, indent=4)
+        return len(pages)
+
+    npages = 0
+    try:
+        for page in pages:
+            outfp.write(f'{json.dumps(page, ensure_ascii=False)}\n')
+            outfp.flush()
+            npages += 1
+    except Exception as e:
+        outfp.write(f'{json.dumps({END_KEY: {"pages": npages, "error": str(e) or type(e).__name__}})}\n')
+        outfp.flush()
+        raise
+    outfp.write(f'{json.dumps({END_KEY: {"pages": npages, "error": None}})}\n')
+    outfp.flush()
+    return npages
+
+def setup_logging(name, debug=False, log_dir=LOG_DIR):
+    """ send the log records of all modules to stderr and to a log file of this run, from a background thread.
+
+    Records are put in a queue and written by a listener thread, so formatting and I/O happen off the
+    processing path. The queue is shared with forked worker processes, so their records are also kept.
+    Each run writes its own file, named after the tool, the start time and the process id, which is
+    only created if something is logged. To be called once by the entry points; it does nothing if
+    logging is already set up.
+
+    Args:
+        name (str): name of the tool, used for the log file.
+        debug (bool): log also debug records.
+        log_dir (str): directory for the log files.
+
+    Return:
+        str: path of the log file of this run.
+
+    """
+    global _LOG_LISTENER
+
+    if _LOG_LISTENER:
+        return _LOG_LISTENER.handlers[0].baseFilename
+
+    os.makedirs(log_dir, exist_ok=True)
+    log_fname = os.path.join(log_dir, f'{name}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.log')
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.FileHandler(log_fname, delay=True), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = multiprocessing.Queue(-1)
+    _LOG_LISTENER = logging.handlers.QueueListener(log_queue, *handlers)
+    _LOG_LISTENER.start()
+    atexit.register(_LOG_LISTENER.stop)
+
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.DEBUG if debug else logging.INFO)
+
+    return log_fname
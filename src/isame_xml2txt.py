@@ -48,6 +48,13 @@
 #     tee ../../data/arabic/trans/F001-5-pre.json | python isame_mapper.py |
 #     tee ../../data/arabic/trans/F001-6.json | python isame_json2tei.py | tee ../../data/arabic/trans/F001-7.xml
 #
+# whole corpus in parallel, with the files of each directory in alphabetical order:
+#   $ python isame_xml2txt.py -f ../../data/arabic/trans/ --jobs 8 > corpus-4.txt
+#   $ python isame_xml2txt.py -f '../../data/arabic/trans/F001_*-3-trans.xml' --jobs 2 > ../../data/arabic/trans/F001-4.txt
+#
+# time of each phase and page:
+#   $ python isame_xml2txt.py -f ../../data/arabic/trans/ F001-4.txt --profile xml2txt-profile.json
+#
 # D001:
 #   $ python isame_xml2txt.py -f ../../data/arabic/trans/D001_UbT.Ma.VI.165-3-trans.xml | tee ../../data/arabic/trans/D001_UbT.Ma.VI.165-4.txt |
 #     python isame_parser.py | tee D001_UbT.Ma.VI.165-5-pre.json | python isame_mapper.py | tee D001_UbT.Ma.VI.165-6.json
@@ -64,25 +71,19 @@
 #
 ###############################################################################################################################################################################
 
-import os
 import re
 import sys
 import json
-from io import TextIOBase
-from bs4 import BeautifulSoup
+from io import TextIOBase, StringIO
+from lxml import etree
 from contextlib import ExitStack
-from functools import singledispatch
+from functools import singledispatch, lru_cache
 from argparse import ArgumentParser, FileType
+from concurrent.futures import ProcessPoolExecutor
 
-import logging
-logging.basicConfig(handlers=[
-                        logging.FileHandler(f'{os.path.splitext(os.path.basename(__file__))[0]}.log', mode='w',),
-                        logging.StreamHandler()
-                    ],
-                    format='%(asctime)s :: %(levelname)s :: %(funcName)s :: %(lineno)d :: %(message)s',
-                    level=logging.DEBUG)
-
-SETTINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'local_settings.py')
+from isame_settings import SETTINGS_PATH, InterSaMESettingsError, load_settings
+from isame_profile import phase, count, add_profile_arguments, setup_profiling_args
+from isame_util import expand_inputs
 
 #FIXME it might be that supplied text at the beginning of a page enters the last part of the notes of the previous page. Check!!
 BLOCKS_REGEX = re.compile(r'(?P<title>TITLE:.+?)\n'
@@ -92,136 +93,338 @@ BLOCKS_REGEX = re.compile(r'(?P<title>TITLE:.+?)\n'
 
 LINE_REGEX = re.compile(r'((?:\( *)?\| *(?:-|[0-9]{1,2}) *\|(?: *\))?.*?)(?=(?:\( *)?\||$)', re.DOTALL)
 
+CHUNK_SIZE = 64 * 1024
 
-def _xml2txt(infp, variants, rm_notes=False):
-    """ convert content of archetype xml fp file to txt InterSaME format and write it in outfp.
+# files taken from a directory given as input
+TRANS_FILES_PATTERN = '*trans.xml'
+
+# the text of these elements is not part of the transcription
+SKIP_TAGS = frozenset(('script', 'style', 'template'))
+
+# whitespace-only text is kept as it is inside these elements and collapsed elsewhere
+PRESERVE_WS_TAGS = frozenset(('pre', 'textarea'))
+ASCII_SPACES = str.maketrans('', '', ' \n\t\x0c\r')
+
+# dividers are resolved in this order, each one seeing the previous ones already converted
+DIVIDER_STAGES = {'fasila': 0, 'awashir': 1, 'khawamis': 2, 'miaa': 3}
+DIVIDER_MARKS = {'awashir': 'x', 'khawamis': 'v', 'miaa': 'c'}
+NSTAGES = len(DIVIDER_STAGES)
+
+SUPPLIED_MARKS = {'unclear': ('{', '}'), 'lacuna': ('⟦', '⟧'), 'illegible': ('⟨', '⟩')}
+
+# actions for spans
+REMOVE, UNWRAP, WRAP, DIVIDER = range(4)
+
+# key of the action for notes in the dispatch table, which cannot clash with a data-dpt-type
+NOTE_KEY = ('note_',)
+
+
+class InterSaMEXmlError(Exception):
+    """ Error in the xml exported from Archetype.
+
+    """
+    pass
+
+@lru_cache(maxsize=None)
+def compile_actions(settings, rm_notes=False):
+    """ create dispatch table of span conversions from the compiled Archetype settings.
 
     Args:
-        infp (io.TextIOWrapper): xml input file resulted from Archetype.
-        variants (list): list of variants read from settings file for Archetype transcription editor menus.
-        rm_notes (bool): flag to indicate if notes tags and footnotes should be kept in conversion or not.
+        settings (isame_settings.ArchetypeSettings): compiled settings.
+        rm_notes (bool): flag to indicate if notes tags should be removed.
 
-    Yield:
-        tuple: title, source, content, notes of each image transcription found in infp.
+    Return:
+        dict: data-dpt-type -> (data-dpt required or None for any, action). The action is a
+            tuple with the action type and its arguments. Notes are stored under NOTE_KEY, as they
+            are resolved by data-dpt.
 
     """
-    xmltxt = infp.read()
-    #xmltxt = BeautifulSoup(xmltxt, 'html5lib') #FIXME
-    xmltxt = BeautifulSoup(xmltxt, 'lxml')
-
-
-    # check there are *no* nested tags
-    for child in xmltxt.recursiveChildGenerator():
-        if child.name == 'span':
-            for grand in child.find_all('span'):
-                if grand.attrs == child.attrs:
-                    print('Fatal error! Nested elements with the same tag were found and are not supported:',
-                          child.name, child.attrs, file=sys.stderr)
-                    sys.exit(1)
-
-    # remove locus
-    for elem in xmltxt.find_all("span", {"data-dpt" : "location", "data-dpt-loctype" : "locus"}):
-        elem.replace_with('')
-
-    # remove ref tags
-    for elem in xmltxt.find_all("span", {"data-dpt" : "divider", "data-dpt-type" : "ref"}):
-        elem.replaceWithChildren()
-
-    # remove note tags and (if param on) them with plain text
-    for elem in xmltxt.find_all("span", {"data-dpt" : "note_"}):
-        if not rm_notes:
-            elem.insert(0, '(')
-            elem.append(')')
-        elem.replaceWithChildren()
-
-    # remove variant tags and mark them with plain text
-    for struct, type_ in variants:
-        for elem in xmltxt.find_all("span", {"data-dpt-type" : f'{struct}/{type_}'}):
-            elem.insert(0, '[')
-            elem.append(f'={struct}={type_}]')
-            elem.replaceWithChildren()
-
-    # remove supplied tags and them with plain text
-    for elem in xmltxt.find_all("span", {"data-dpt" : "supplied_", "data-dpt-type" : "unclear"}):
-        elem.insert(0, '{')
-        elem.append('}')
-        elem.replaceWithChildren()
-    for elem in xmltxt.find_all("span", {"data-dpt" : "supplied_", "data-dpt-type" : "lacuna"}):
-        elem.insert(0, '⟦')
-        elem.append('⟧')
-        elem.replaceWithChildren()
-    for elem in xmltxt.find_all("span", {"data-dpt" : "supplied_", "data-dpt-type" : "illegible"}):
-        elem.insert(0, '⟨')
-        elem.append('⟩')
-        elem.replaceWithChildren()
-
-    # remove division tags and them with plain text
-    for elem in xmltxt.find_all("span", {"data-dpt" : "divider", "data-dpt-type" : "fasila"}):
-        if elem.text != '*':
-            elem.insert(0, '*')
-            elem.replaceWithChildren()
-        #if elem.text in ('{*}', '⟨*⟩', '⟦*⟧'):
-        #    elem.replaceWithChildren()
-        #else:
-        #    elem.insert(0, '*')
-        #    elem.replaceWithChildren()
-        #    #elem.replace_with(f'*{elem.text}') #FIXME
-
-    for elem in xmltxt.find_all("span", {"data-dpt" : "divider", "data-dpt-type" : "awashir"}):
-        if elem.text in ('{x}', '⟨x⟩', '⟦x⟧'):
-            elem.replaceWithChildren()
-        elif elem.text[0] == '+':
-            elem.replace_with(f'+x{elem.text[1:]}')
-        else:
-            elem.replace_with(f'x{elem.text}')
+    actions = {'ref': ('divider', (UNWRAP,))}
+    actions.update((typ, ('supplied_', (WRAP, *marks))) for typ, marks in SUPPLIED_MARKS.items())
+    actions.update((typ, ('divider', (DIVIDER, stage, typ))) for typ, stage in DIVIDER_STAGES.items())
 
-    for elem in xmltxt.find_all("span", {"data-dpt" : "divider", "data-dpt-type" : "khawamis"}):
-        if elem.text in ('{v}', '⟨v⟩', '⟦v⟧'):
-            elem.replaceWithChildren()
-        elif elem.text[0] == '+':
-            elem.replace_with(f'+v{elem.text[1:]}')
-        else:
-            elem.replace_with(f'v{elem.text}')
+    for typ, (struct, type_) in settings.variants.items():
+        actions.setdefault(typ, (None, (WRAP, '[', f'={struct}={type_}]')))
+
+    actions[NOTE_KEY] = (None, (UNWRAP,) if rm_notes else (WRAP, '(', ')'))
+
+    return actions
+
+def _span_action(attrs, actions):
+    """ get the conversion to apply to a span according to its data-dpt and data-dpt-type attributes.
+
+    Args:
+        attrs (dict): attributes of span.
+        actions (dict): dispatch table as returned by compile_actions.
+
+    Return:
+        tuple: action and its arguments, None if the span is kept as it is.
+
+    """
+    dpt = attrs.get('data-dpt')
+
+    if dpt == 'location' and attrs.get('data-dpt-loctype') == 'locus':
+        return REMOVE,
+    if dpt == 'note_':
+        return actions[NOTE_KEY][1]
+    if (entry := actions.get(attrs.get('data-dpt-type'))) and entry[0] in (None, dpt):
+        return entry[1]
+    return None
 
-    for elem in xmltxt.find_all("span", {"data-dpt" : "divider", "data-dpt-type" : "miaa"}):
-        if elem.text in ('{c}', '⟨c⟩', '⟦c⟧'):
-            elem.replaceWithChildren()
-        elif elem.text[0] == '+':
-            elem.replace_with(f'+c{elem.text[1:]}')
+def _resolve_divider(typ, text):
+    """ convert divider span according to its text.
+
+    Args:
+        typ (str): type of divider.
+        text (str): text of divider with inner annotations already converted.
+
+    Return:
+        str, str: prefix to add to the content of the divider (None if it is kept as it is), and
+            text that replaces the whole divider (None if the content is kept).
+
+    """
+    if typ == 'fasila':
+        return ('*' if text != '*' else None), None
+
+    mark = DIVIDER_MARKS[typ]
+    if text in (f'{{{mark}}}', f'⟨{mark}⟩', f'⟦{mark}⟧'):
+        return None, None
+    if text[:1] == '+':
+        return None, f'+{mark}{text[1:]}'
+    return None, f'{mark}{text}'
+
+class _ArchetypeTarget:
+    """ lxml parser target that converts the annotations of Archetype into plain text on the fly.
+
+    The strings of the document are collected in pieces, which are the same strings that
+    BeautifulSoup(...).strings would return after converting the annotations on the tree.
+    The content of dividers is buffered until the divider is closed, as its conversion depends
+    on its text; the rest of pieces are available as soon as they are parsed.
+
+    """
+    def __init__(self, actions):
+        self.actions = actions
+        self.pieces = []
+        self._data = []
+        self._stack = []     # (tag, attrs, action) of open elements
+        self._spans = []     # attrs of open spans, for detecting nesting
+        self._skip = 0       # open elements whose text is discarded
+        self._preserve = 0   # open elements where whitespace is preserved
+        self._dividers = []  # (stage, typ, texts, pieces) of open dividers
+
+    def _emit(self, texts, pieces):
+        if self._dividers:
+            div_texts, div_pieces = self._dividers[-1][2:]
+            for i in range(NSTAGES):
+                div_texts[i].append(texts[i])
+            div_pieces.extend(pieces)
         else:
-            elem.replace_with(f'c{elem.text}')
+            self.pieces.extend(pieces)
+
+    def _emit_str(self, s):
+        self._emit((s,)*NSTAGES, (s,))
+
+    def _flush_data(self):
+        if not self._data:
+            return
+        text = ''.join(self._data)
+        self._data = []
+        if self._skip:
+            return
+        if not self._preserve and not text.translate(ASCII_SPACES):
+            text = '\n' if '\n' in text else ' '
+        self._emit_str(text)
+
+    def start(self, tag, attrib):
+        self._flush_data()
+
+        action = None
+        if tag == 'span':
+            attrs = {k: (' '.join(v.split()) if k == 'class' else v) for k, v in attrib.items()}
+            if attrs in self._spans:
+                raise InterSaMEXmlError(f'Nested elements with the same tag were found and are not supported: {tag} {attrs}')
+            self._spans.append(attrs)
+            action = _span_action(attrs, self.actions)
+
+        self._stack.append((tag, action))
+
+        if tag in SKIP_TAGS:
+            self._skip += 1
+        if tag in PRESERVE_WS_TAGS:
+            self._preserve += 1
+
+        if not action:
+            return
+        if action[0] == REMOVE:
+            self._skip += 1
+        elif self._skip:
+            return
+        elif action[0] == WRAP:
+            self._emit_str(action[1])
+        elif action[0] == DIVIDER:
+            self._dividers.append((action[1], action[2], [[] for _ in range(NSTAGES)], []))
+
+    def _close(self, tag, action):
+        if tag == 'span':
+            self._spans.pop()
+        if tag in PRESERVE_WS_TAGS:
+            self._preserve -= 1
+
+        if action and action[0] == REMOVE:
+            self._skip -= 1
+            if not self._skip:
+                self._emit_str('')
+        elif action and not self._skip:
+            if action[0] == WRAP:
+                self._emit_str(action[2])
+            elif action[0] == DIVIDER:
+                stage, typ, texts, pieces = self._dividers.pop()
+                texts = [''.join(t) for t in texts]
+                prefix, replacement = _resolve_divider(typ, texts[stage])
+                if replacement is not None:
+                    self._emit(texts[:stage+1] + [replacement]*(NSTAGES-stage-1), (replacement,))
+                elif prefix is not None:
+                    self._emit(texts[:stage+1] + [prefix+t for t in texts[stage+1:]], (prefix, *pieces))
+                else:
+                    self._emit(texts, pieces)
+
+        if tag in SKIP_TAGS:
+            self._skip -= 1
+
+    def end(self, tag):
+        self._flush_data()
+        if not any(t == tag for t, _ in self._stack):
+            return
+        while self._stack:
+            open_tag, action = self._stack.pop()
+            self._close(open_tag, action)
+            if open_tag == tag:
+                break
+
+    def data(self, data):
+        self._data.append(data)
+
+    def comment(self, text):
+        self._flush_data()
+
+    def pi(self, target, data=None):
+        self._flush_data()
+
+    def doctype(self, *args):
+        self._flush_data()
+
+    def close(self):
+        self._flush_data()
+        while self._stack:
+            self._close(*self._stack.pop())
+
+def _parse_blocks(text, rm_notes=False):
+    """ extract the transcription blocks from the plain text of the xml.
 
-    ANY_BLOCK = False
+    Args:
+        text (str): strings of the converted xml joined by newlines.
+        rm_notes (bool): flag to indicate if notes should be removed.
 
-    for block in BLOCKS_REGEX.finditer('\n'.join(xmltxt.strings)):
+    Yield:
+        tuple: title, source, content, notes of each image transcription found in text.
 
-        ANY_BLOCK = True
+    """
+    for block in BLOCKS_REGEX.finditer(text):
 
         title = block.group('title').strip()
         source = block.group('source').strip()
 
-        # if there is a supplied at the end, it can be known only by 2 newlines
-        content_block, _, supplied = block.group('content').partition('\n\n')
-        if '|' in supplied:
-            print('block.group(content):  ' + block.group('content'), file=sys.stderr)
-            print('content_block:  ' + content_block, file=sys.stderr)
-            print('supplied:  ' + supplied, file=sys.stderr)
-            print('Fatal error processing xml! There is a line in a separate paragraph.', file=sys.stderr)
+        with phase('parse', title):
+
+            # if there is a supplied at the end, it can be known only by 2 newlines
+            content_block, _, supplied = block.group('content').partition('\n\n')
+            if '|' in supplied:
+                print('block.group(content):  ' + block.group('content'), file=sys.stderr)
+                print('content_block:  ' + content_block, file=sys.stderr)
+                print('supplied:  ' + supplied, file=sys.stderr)
+                print('Fatal error processing xml! There is a line in a separate paragraph.', file=sys.stderr)
 
-        content = '\n'.join(li.replace(' ','').replace(chr(0xa0), '').strip() for li in LINE_REGEX.findall(content_block.replace('\n', ' ')))
+            content = '\n'.join(li.replace(' ','').replace(chr(0xa0), '').strip() for li in LINE_REGEX.findall(content_block.replace('\n', ' ')))
 
-        notes = ''
-        if not rm_notes and block.group('notes'):
-            notes = re.sub(r'\n+', '\n', block.group('notes').strip(), re.DOTALL)
+            notes = ''
+            if not rm_notes and block.group('notes'):
+                notes = re.sub(r'\n+', '\n', block.group('notes').strip(), re.DOTALL)
 
-        # fix annotation of multiple variants for the same text section
-        content = content.replace(']=', ';')
-        content = re.sub(r'\[+', '[', content)
+            # fix annotation of multiple variants for the same text section
+            content = content.replace(']=', ';')
+            content = re.sub(r'\[+', '[', content)
 
-        #print(xmltxt.prettify(), file=sys.stderr) #DEBUG
+        count('xml2txt', pages=1)
 
         yield title, source, content, notes
 
+def _xml2txt(infp, settings, rm_notes=False):
+    """ convert content of archetype xml fp file to txt InterSaME format and write it in outfp.
+
+    The xml is converted in a single streaming pass. Blocks are yielded as soon as the title
+    of the next one is found, so the memory used depends on the size of a page, not of the file.
+
+    Args:
+        infp (io.TextIOWrapper): xml input file resulted from Archetype.
+        settings (isame_settings.ArchetypeSettings): compiled settings for Archetype transcription editor menus.
+        rm_notes (bool): flag to indicate if notes tags and footnotes should be kept in conversion or not.
+
+    Yield:
+        tuple: title, source, content, notes of each image transcription found in infp.
+
+    Raise:
+        InterSaMEXmlError: if nested elements with the same attributes are found.
+
+    """
+    target = _ArchetypeTarget(compile_actions(settings, rm_notes))
+    parser = etree.HTMLParser(target=target, strip_cdata=False, recover=True)
+
+    ANY_BLOCK = False
+
+    # parts of the text pending to be split in blocks, joined with newlines when the block is complete.
+    # Each block ends before a newline followed by TITLE. TITLE never spans two pieces, so the pieces are
+    # searched one by one and each character is scanned once
+    pending = []
+
+    def split_blocks(final=False):
+        for piece in target.pieces:
+            if pending and piece.startswith('TITLE'):
+                yield '\n'.join(pending) + '\n'
+                pending.clear()
+            start = 0
+            while (i := piece.find('\nTITLE', start)) != -1:
+                pending.append(piece[start:i+1])
+                yield '\n'.join(pending)
+                pending.clear()
+                start = i+1
+            pending.append(piece[start:])
+        target.pieces.clear()
+
+        if final and pending:
+            yield '\n'.join(pending)
+            pending.clear()
+
+    first = True
+    while chunk := infp.read(CHUNK_SIZE):
+        if first and chunk[0] == '\ufeff':
+            chunk = chunk[1:]
+        first = False
+        with phase('load'):
+            parser.feed(chunk)
+        for text in split_blocks():
+            for block in _parse_blocks(text, rm_notes):
+                ANY_BLOCK = True
+                yield block
+
+    with phase('load'):
+        if first:
+            parser.feed('')
+        parser.close()
+    for text in split_blocks(final=True):
+        for block in _parse_blocks(text, rm_notes):
+            ANY_BLOCK = True
+            yield block
+
     if not ANY_BLOCK:
         print('Fatal error! No transcritions were found in this page. Check that the page template is correct.', file=sys.stderr) #TRACE
 
@@ -230,57 +433,101 @@ def xml2txt(input_):
     raise NotImplementedError('Unsupported type')
 
 @xml2txt.register(TextIOBase)
-def _(input_, outfp, settingsfp=open(SETTINGS_PATH), rm_notes=False):
+def _(input_, outfp, settings=SETTINGS_PATH, rm_notes=False):
     """ convert content of archetype xml fp file to txt InterSaME format and write it in outfp.
 
     Args:
         _input (io.TextIOWrapper): xml input file resulted from Archetype.
         outfp (io.TextIOWrapper): output stream for storing txt InterSaME conversion.
-        settingsfp (io.TextIOWrapper): settings file for Archetype transcription editor menus.
+        settings (str): settings file for Archetype transcription editor menus.
         rm_notes (bool): flag to indicate if notes tags and footnotes should be kept in conversion or not.
 
     Yield:
         tuple: title, source, content, notes of each image transcription found in infp.
 
     """
-    #logging.debug(f"SETTINGS_PATH={SETTINGS_PATH}  VARIANTS={variants}") #DEBUG
-    variants = [(str_, typ) for str_, typ in re.findall(f'\'(.+?)/(.+?)\'', settingsfp.read())]
-
-    for title, source, content, notes in _xml2txt(input_, variants, rm_notes):
-        print(f'{title}\n{source}\n{content}\n{notes}\n', file=outfp)
+    for title, source, content, notes in _xml2txt(input_, load_settings(settings), rm_notes):
+        with phase('serialize', title):
+            print(f'{title}\n{source}\n{content}\n{notes}\n', file=outfp)
 
 @xml2txt.register(list)
-def _(input_, outfp, settingsfp=open(SETTINGS_PATH), rm_notes=False):
+def _(input_, outfp, settings=SETTINGS_PATH, rm_notes=False):
     """ convert content of archetype xml fp file to txt InterSaME format and write it in outfp.
 
     Args:
         input_ (list): grpup of xml input files(io.TextIOWrapper) resulted from Archetype.
         outfp (io.TextIOWrapper): output stream for storing txt InterSaME conversion.
-        settingsfp (io.TextIOWrapper): settings file for Archetype transcription editor menus.
+        settings (str): settings file for Archetype transcription editor menus.
         rm_notes (bool): flag to indicate if notes tags and footnotes should be kept in conversion or not.
 
     Yield:
         tuple: title, source, content, notes of each image transcription found in infp.
 
     """
-    #logging.debug(f"SETTINGS_PATH={SETTINGS_PATH}  VARIANTS={variants}") #DEBUG
-    variants = [(str_, typ) for str_, typ in re.findall(f'\'(.+?)/(.+?)\'', settingsfp.read())]
+    settings = load_settings(settings)
 
     for infp in input_:
-        for title, source, content, notes in _xml2txt(infp, variants, rm_notes):
-            print(f'{title}\n{source}\n{content}\n{notes}\n', file=outfp)
-    
+        for title, source, content, notes in _xml2txt(infp, settings, rm_notes):
+            with phase('serialize', title):
+                print(f'{title}\n{source}\n{content}\n{notes}\n', file=outfp)
+
+def _convert_file(args):
+    """ convert a single xml file in a worker process.
+
+    Args:
+        args (tuple): file name, settings file and rm_notes flag.
+
+    Return:
+        str: txt InterSaME conversion of the file.
+
+    """
+    fname, settings, rm_notes = args
+    out = StringIO()
+    with open(fname) as infp:
+        for title, source, content, notes in _xml2txt(infp, load_settings(settings), rm_notes):
+            print(f'{title}\n{source}\n{content}\n{notes}\n', file=out)
+    return out.getvalue()
+
+def xml2txt_files(fnames, outfp, settings=SETTINGS_PATH, rm_notes=False, jobs=1):
+    """ convert several archetype xml files to txt InterSaME format and write them in outfp in the order given.
+
+    Args:
+        fnames (list): xml input files resulted from Archetype.
+        outfp (io.TextIOWrapper): output stream for storing txt InterSaME conversion.
+        settings (str): settings file for Archetype transcription editor menus.
+        rm_notes (bool): flag to indicate if notes tags and footnotes should be kept in conversion or not.
+        jobs (int): number of processes. If 1, files are converted one after another in the current process.
+
+    """
+    if jobs <= 1 or len(fnames) <= 1:
+        with ExitStack() as stack:
+            xml2txt([stack.enter_context(open(fname)) for fname in fnames], outfp, settings, rm_notes)
+        return
+
+    # files converted in the workers are only measured as a whole
+    with phase('parse'), ProcessPoolExecutor(max_workers=min(jobs, len(fnames))) as executor:
+        # results are yielded in input order, so each file is written as soon as all previous ones are done
+        for text in executor.map(_convert_file, ((fname, settings, rm_notes) for fname in fnames)):
+            outfp.write(text)
+            outfp.flush()
+
 
 if __name__ == '__main__':
 
     parser = ArgumentParser(description='convert xml archetype output to plain text in intersame format')
-    parser.add_argument('--file', '-f', nargs='+', required=True, help='xml file(s)')
+    parser.add_argument('--file', '-f', nargs='+', required=True, help=f'xml file(s), directories (files {TRANS_FILES_PATTERN}) or glob patterns')
     parser.add_argument('outfile', nargs='?', type=FileType('w'), default=sys.stdout, help='text file with concatenated result of input files')
-    parser.add_argument('--settings', type=FileType('r'), default=SETTINGS_PATH, help='local settings file for archetype')
+    parser.add_argument('--settings', default=SETTINGS_PATH, help='local settings file for archetype')
     parser.add_argument('--rm_notes', action='store_true', help='remove note tags within the text')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='number of processes for converting files in parallel [default 1]')
+    add_profile_arguments(parser)
     args = parser.parse_args()
 
-    with ExitStack() as stack:
-        fp_list = [stack.enter_context(open(fname)) for fname in args.file]
-        xml2txt(fp_list, args.outfile, args.settings, args.rm_notes)
+    setup_profiling_args('isame_xml2txt', args)
+
+    try:
+        xml2txt_files(expand_inputs(args.file, TRANS_FILES_PATTERN), args.outfile, args.settings, args.rm_notes, args.jobs)
+    except (InterSaMEXmlError, InterSaMESettingsError, OSError) as e:
+        print(f'Fatal error! {e}', file=sys.stderr)
+        sys.exit(1)
 
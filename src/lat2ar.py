@@ -15,6 +15,8 @@ from bs4 import BeautifulSoup
 from collections import OrderedDict
 from argparse import ArgumentParser, FileType
 
+from isame_transducer import Transducer
+
 _translation = [  
     ('='   , '='), # added so that the checking does not fail
     ('♯'   , ' '),
@@ -98,7 +100,7 @@ rules = [
     ('.', 'UNK')
 ]
 
-TRANSLIT_REGEX = re.compile('|'.join(mapping))
+TRANSDUCER = Transducer(mapping)
 
 
 
@@ -137,7 +139,7 @@ def lat2ar(lines):
     # apply conversion
     #
 
-    newlines = (TRANSLIT_REGEX.sub(lambda m: mapping[m.group(0)], line) for line in lines)
+    newlines = map(TRANSDUCER, lines)
     
     yield from newlines
 
@@ -2,27 +2,75 @@
 #
 #    tei2json.py
 #
-# convert TEI to json
+# convert TEI DOTS documents to json lines
+#
+# The TEI is read incrementally: the metadata is extracted from teiHeader and the body is split in
+# pages at each pb tag. The first line of the output contains {"meta": {...}} and each following
+# line contains {"page": {...}}, written as soon as the page has been read. Only the page being read
+# is kept in memory.
 #
 # dependencies
-#   * https://pypi.org/project/tei-reader
-#     https://github.com/UUDigitalHumanitieslab/tei_reader
+#   * https://pypi.org/project/lxml
 #
 # example:
 #   $ python tei2json.py ../data/arabic/initial/5_TEI_MS_Q.2-95-106.150-164_BnF_330d_ff.20-21.xml \
-#                        ../data/arabic/initial/5_TEI_MS_Q.2-95-106.150-164_BnF_330d_ff.20-21.json
+#                        ../data/arabic/initial/5_TEI_MS_Q.2-95-106.150-164_BnF_330d_ff.20-21.jsonl
+#
+#   $ python tei2json.py --files ../data/arabic/initial --outdir ../data/arabic/initial/json --jobs 8
 #
 # usage:
-#   $ cat <edition>.xml | python tei2json.py > <edition>.json
+#   $ cat <edition>.xml | python tei2json.py > <edition>.jsonl
 #
 #######################################################################################################
 
+import os
 import re
 import sys
-import ujson as json
-from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor
 from argparse import ArgumentParser, FileType
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from lxml import etree
+
+from isame_util import expand_inputs, write_atomic
+
+TEI_FILES_PATTERN = '*.xml'
+
+XML_NS = '{http://www.w3.org/XML/1998/namespace}'
+
+EXTENT_REGEX = re.compile(r'^(?:\d|[1-9]\d+)(-(?:\d|[1-9]\d+))?$')
+SPACES_REGEX = re.compile(r'[\n ]+')
+
+# key in output -> path of tags in teiHeader. Each tag is searched among the descendants of the previous one
+METADATA_FIELDS = {
+    'doc_title' : ('fileDesc', 'titleStmt', 'title'),
+    'editor' : ('fileDesc', 'titleStmt', 'respStmt', 'name'),
+    'ref_text' : ('fileDesc', 'editionStmt', 'edition'),
+    'project' : ('fileDesc', 'publicationStmt', 'authority'),
+    'country' : ('fileDesc', 'sourceDesc', 'msDesc', 'msIdentifier', 'country'),
+    'settlement' : ('fileDesc', 'sourceDesc', 'msDesc', 'msIdentifier', 'settlement'),
+    'repository' : ('fileDesc', 'sourceDesc', 'msDesc', 'msIdentifier', 'repository'),
+    'collection' : ('fileDesc', 'sourceDesc', 'msDesc', 'msIdentifier', 'collection'),
+    'idno' : ('fileDesc', 'sourceDesc', 'msDesc', 'msIdentifier', 'idno'),
+    'ms_name' : ('fileDesc', 'sourceDesc', 'msDesc', 'msIdentifier', 'msName'),
+    'locus' : ('fileDesc', 'sourceDesc', 'msDesc', 'msContents', 'msItem', 'locus'),
+    'frag_title' : ('fileDesc', 'sourceDesc', 'msDesc', 'msContents', 'msItem', 'title'),
+    'phys_desc' : ('fileDesc', 'sourceDesc', 'msDesc', 'physDesc', 'objectDesc'),
+    'history' : ('fileDesc', 'sourceDesc', 'msDesc', 'history'),
+}
+MS_ITEM_PATH = ('fileDesc', 'sourceDesc', 'msDesc', 'msContents', 'msItem')
+LIST_WIT_PATH = ('fileDesc', 'sourceDesc', 'listWit')
+REVISION_PATH = ('revisionDesc',)
+
+
+class TeiFormatError(Exception):
+    """ Error in the format of a TEI document.
 
+    """
+    pass
 
 def norm_spaces_meta(s):
     """ strip and normalise spaces in metadata text values.
@@ -37,22 +85,6 @@ def norm_spaces_meta(s):
     return re.sub(r'\n{2,}', '\n\n', re.sub(r' +', ' ', s.strip()).replace('\n ', '\n'))
 
 
-def _getattr(li, name):
-    """ get index of item in list li that item[0] equals value of name.
-
-    Args:
-        li (list): sequence of two element tuples.
-        name (str): name of attrib to find in li.
-
-    Return:
-        i (int): index of li where name is found.
-
-    """
-    for i, attr in enumerate(li):
-        if attr[0] == name:
-            return i
-
-
 def process_gaps(tags_lines, fname):
     """ process info of gap and supplied text.
 
@@ -65,6 +97,9 @@ def process_gaps(tags_lines, fname):
         {'tag' : str, 'attribs' : [(str, str), ...], 'text' : str} -> untouched lines.
         {'tag' : 'gap', 'attribs' : [('unit','surah|ayah|letter'), ('extent', 'i|i-j'), ('supplied', str)] -> lines corresponding to gap(+supplied).
 
+    Raise:
+        TeiFormatError: if the attributes of gap are not valid or gap is followed by text.
+
     """
     i, size = 0, len(tags_lines)
 
@@ -78,46 +113,33 @@ def process_gaps(tags_lines, fname):
 
         # modified lines (gap+supplied)
         else:
-            attribs = tags_lines[i]['attribs']
-            
-            n = len(attribs)
+            attribs = dict(tags_lines[i]['attribs'])
 
             # attrib /reason/ is required
 
-            j = _getattr(attribs, 'reason')
-            
-            if attribs[j][1] != 'fragmWit':
-                print(f'Error in TEI file {fname}: unexpected value of attrib /reason/: /{attribs[j][1]}/ for tag /gap/', file=sys.stderr) #ERROR
-                sys.exit(1)
+            if attribs.get('reason') != 'fragmWit':
+                raise TeiFormatError(f'Error in TEI file {fname}: unexpected value of attrib /reason/: /{attribs.get("reason")}/ for tag /gap/')
 
             # if there are more attribs, these are: /unit/ and /extent/, and both must appear
             if len(attribs) > 1:
 
-                j = _getattr(attribs, 'unit')
-                if attribs[j][1] not in ('ayah', 'surah', 'letters'):
-                    print(f'Error in TEI file {fname}: unexpected value of attrib /unit/: /{attribs[j][1]}/ for tag /gap/', file=sys.stderr) #ERROR
-                    sys.exit(1)
-                else:
-                    gap_attribs['unit'] = attribs[j][1]
-                
-                j = _getattr(attribs, 'extent')
-                if not re.match(r'^(?:\d|[1-9]\d+)(-(?:\d|[1-9]\d+))?$', attribs[j][1]):
-                    print(f'Error in TEI file {fname}: unexpected value of attrib /extent/: /{attribs[j][1]}/ for tag /gap/', file=sys.stderr) #ERROR
-                    sys.exit(1)
-                else:
-                    gap_attribs['extent'] = attribs[j][1]
-                
+                if attribs.get('unit') not in ('ayah', 'surah', 'letters'):
+                    raise TeiFormatError(f'Error in TEI file {fname}: unexpected value of attrib /unit/: /{attribs.get("unit")}/ for tag /gap/')
+                gap_attribs['unit'] = attribs['unit']
+
+                if not EXTENT_REGEX.match(attribs.get('extent', '')):
+                    raise TeiFormatError(f'Error in TEI file {fname}: unexpected value of attrib /extent/: /{attribs.get("extent")}/ for tag /gap/')
+                gap_attribs['extent'] = attribs['extent']
+
                 text_ = tags_lines[i]['text'].strip()
                 if text_:
-                    print(f'Fatal error: text "{text_}" found after tag gap', file=sys.stderr) #ERROR
-                    sys.exit(1)
+                    raise TeiFormatError(f'Error in TEI file {fname}: text "{text_}" found after tag gap')
 
             # check if supplied comes after
-            if i < size-1:
-                if tags_lines[i+1]['tag'] == 'supplied':
-                    gap_attribs['supplied'] = re.sub(r'[\n ]+', r' ', tags_lines[i+1]['text'])
+            if i < size-1 and tags_lines[i+1]['tag'] == 'supplied':
+                gap_attribs['supplied'] = SPACES_REGEX.sub(' ', tags_lines[i+1]['text'])
                 i += 1
-                    
+
             yield { 'tag' : 'gap', 'attribs' : list(gap_attribs.items()), 'text' : None}
 
         i += 1
@@ -135,260 +157,333 @@ def process_apps(tags_lines, fname):
         {'tag' : 'gap', 'attribs' : [('',''), ...] -> lines corresponding to apparatus. #FIXME
 
     """
-    i, size = 0, len(tags_lines)
+    for line in tags_lines:
+        yield line
 
-    while i < size:
+def _local(tag):
+    """ remove namespace from tag or attribute name. The xml namespace is kept as prefix xml:.
 
-        gap_attribs = {'unit' : None, 'extent' : None, 'supplied' : None}
+    """
+    if tag.startswith(XML_NS):
+        return f'xml:{tag[len(XML_NS):]}'
+    return tag.rsplit('}', 1)[-1]
 
-        # lines not modified
-        if tags_lines[i]['tag'] != 'app':
-            yield tags_lines[i]
+def _find(elem, path):
+    """ follow path of tag names from elem. Each tag is the first descendant with that name of the
+    previous one, regardless of its namespace.
 
-        # modified lines (gap+supplied)
-        else:
-            yield tags_lines[i]
+    Args:
+        elem (lxml.etree._Element): initial element.
+        path (tuple): sequence of tag names.
 
-        i += 1
+    Return:
+        lxml.etree._Element: element found, None if not found.
 
+    """
+    for name in path:
+        elem = next((e for e in elem.iterdescendants() if _local(e.tag) == name), None)
+        if elem is None:
+            return None
+    return elem
 
-if __name__ == '__main__':
+def _find_all(elem, path, name):
+    """ get all descendants with tag name of the element found following path from elem.
 
-    parser = ArgumentParser(description='parser for TEI DOTS document')
-    parser.add_argument('infile', nargs='?', type=FileType('r'), default=sys.stdin, help='xml file')
-    parser.add_argument('outfile', nargs='?', type=FileType('w'), default=sys.stdout, help='json file')
-    args = parser.parse_args()
-    
-    soup = BeautifulSoup(args.infile.read(), 'xml')
-    metadata = soup.teiHeader
-    content_tag = soup.find('text').body
+    Raise:
+        TeiFormatError: if path is not found.
 
-    out = {'meta' : {}, 'text' : {}}
+    """
+    parent = _find(elem, path)
+    if parent is None:
+        raise TeiFormatError('.'.join(path))
+    return [e for e in parent.iterdescendants() if _local(e.tag) == name]
 
-    #
-    # metadata
-    #
+def _text(elem):
+    return norm_spaces_meta(''.join(elem.itertext()))
 
-    try:
-        out['meta']['doc_title'] = norm_spaces_meta(metadata.fileDesc.titleStmt.title.text)
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.titleStmt.title not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+def parse_header(header, fname):
+    """ extract metadata from teiHeader.
 
-    try:
-        out['meta']['editor'] = norm_spaces_meta(metadata.fileDesc.titleStmt.respStmt.find('name').text)
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.titleStmt.respStmt.name not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+    Args:
+        header (lxml.etree._Element): teiHeader element.
+        fname (str): file name.
 
-    try:
-        out['meta']['ref_text'] = norm_spaces_meta(metadata.fileDesc.editionStmt.edition.text)
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.titleStmt.editionStmt.edition not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+    Return:
+        dict: metadata of the document.
 
-    try:
-        out['meta']['project'] = norm_spaces_meta(metadata.fileDesc.publicationStmt.authority.text)
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.titleStmt.publicationStmt.authority not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+    Raise:
+        TeiFormatError: if a required element of the header is not found.
 
-    try:
-        out['meta']['country'] = norm_spaces_meta(metadata.fileDesc.find('sourceDesc').msDesc.msIdentifier.country.text)
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.sourceDesc.msDesc.msIdentifier.country not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+    """
+    meta = {}
 
-    try:
-        out['meta']['settlement'] = norm_spaces_meta(metadata.fileDesc.find('sourceDesc').msDesc.msIdentifier.find('settlement').text)
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.sourceDesc.msDesc.msIdentifier.settlement not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+    for key, path in METADATA_FIELDS.items():
+        if (elem := _find(header, path)) is None:
+            raise TeiFormatError(f'Error in TEI file {fname}: {".".join(path)} not found')
+        meta[key] = _text(elem)
 
     try:
-        out['meta']['repository'] = norm_spaces_meta(metadata.fileDesc.find('sourceDesc').msDesc.msIdentifier.find('repository').text)
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.sourceDesc.msDesc.msIdentifier.repository not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+        meta['nitems'] = int(norm_spaces_meta(_find(header, MS_ITEM_PATH).get('n')))
+    except (AttributeError, TypeError, ValueError):
+        raise TeiFormatError(f'Error in TEI file {fname}: {".".join(MS_ITEM_PATH)}.n not found')
 
+    #FIXME add sub-parsing
     try:
-        out['meta']['repository'] = norm_spaces_meta(metadata.fileDesc.find('sourceDesc').msDesc.msIdentifier.find('repository').text)
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.sourceDesc.msDesc.msIdentifier.repository not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+        meta['bibl'] = [_text(e) for e in _find_all(header, MS_ITEM_PATH, 'bibl')]
+        meta['witness_list'] = [{'witness' : _text(e), 'id' : e.get(f'{XML_NS}id')} for e in _find_all(header, LIST_WIT_PATH, 'witness')]
+        meta['notes'] = [{'note' : _text(e), 'date' : e.get('when')} for e in _find_all(header, REVISION_PATH, 'change')]
+    except TeiFormatError as e:
+        raise TeiFormatError(f'Error in TEI file {fname}: {e} not found')
 
-    try:
-        out['meta']['collection'] = norm_spaces_meta(metadata.fileDesc.find('sourceDesc').msDesc.msIdentifier.find('collection').text)
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.sourceDesc.msDesc.msIdentifier.collection not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+    return meta
 
-    try:
-        out['meta']['idno'] = norm_spaces_meta(metadata.fileDesc.find('sourceDesc').msDesc.msIdentifier.find('idno').text)
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.sourceDesc.msDesc.msIdentifier.idno not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+def parse_pb(attribs, fname):
+    """ get page info from the attributes of a pb tag.
 
-    try:
-        out['meta']['ms_name'] = norm_spaces_meta(metadata.fileDesc.find('sourceDesc').msDesc.msIdentifier.find('msName').text)
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.sourceDesc.msDesc.msIdentifier.msName not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+    Args:
+        attribs (list): sequence of (name, value) attributes of pb.
+        fname (str): file name.
 
-    try:
-        out['meta']['nitems'] = int(norm_spaces_meta(metadata.fileDesc.find('sourceDesc').msDesc.find('msContents').msItem['n']))
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.sourceDesc.msDesc.msContents.msItems not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+    Return:
+        dict: page with keys n, gap, facs, source and inner.
 
-    try:
-        out['meta']['locus'] = norm_spaces_meta(metadata.fileDesc.find('sourceDesc').msDesc.find('msContents').msItem.locus.text)
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.sourceDesc.msDesc.msContents.msItem.locus not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+    Raise:
+        TeiFormatError: if the attributes are not valid.
 
-    try:
-        out['meta']['frag_title'] = norm_spaces_meta(metadata.fileDesc.find('sourceDesc').msDesc.find('msContents').msItem.find('title').text)
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.sourceDesc.msDesc.msContents.msItem.title not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+    """
+    page = {'n' : -1, 'gap' : None, 'facs' : None, 'source' : None, 'inner' : []}
+    pb_tag = ' '.join(f'{k}="{v}"' for k, v in attribs)
+
+    if not attribs:
+        raise TeiFormatError(f'Error in TEI file {fname}: format of tag "pb": tag is empty')
+
+    # +/- page
+    if len(attribs) == 1:
+        m = re.match(r'(\d+[rv])([\-+])$', attribs[0][1])
+        if attribs[0][0] != 'n' or not m:
+            raise TeiFormatError(f'Error in TEI file {fname}: format of tag "pb {pb_tag}"')
+        page['n'], page['gap'] = m.groups()
+        return page
+
+    # page with image ; attrib n is required, attribs facs and source are optional
+    for name, value in attribs:
+        if name == 'facs' and value.endswith('.jpg'):
+            page['facs'] = value
+        elif name == 'source':
+            page['source'] = value
+        elif name == 'n' and re.match(r'\d+[rv]$', value):
+            page['n'] = value
+        else:
+            raise TeiFormatError(f'Error in TEI file {fname}: format of tag "pb {pb_tag}", unkown attrib "{name}"')
 
-    #FIXME add sub-parsing
-    try:
-        out['meta']['bibl'] = [norm_spaces_meta(i.text) for i in metadata.fileDesc.find('sourceDesc').msDesc.find('msContents').msItem.find_all('bibl')]
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.sourceDesc.msDesc.msContents.msItem.bibl not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+    if page['n'] == -1:
+        raise TeiFormatError(f'Error in TEI file {fname}: format of tag "pb {pb_tag}", attrib n is missing')
 
-    try:
-        out['meta']['phys_desc'] = norm_spaces_meta(metadata.fileDesc.find('sourceDesc').msDesc.find('physDesc').objectDesc.text)
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.sourceDesc.physDesc.objectDesc not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+    return page
 
-    try:
-        out['meta']['history'] = norm_spaces_meta(metadata.fileDesc.find('sourceDesc').msDesc.find('history').text)
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.sourceDesc.history not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+def iter_tei(infp, fname=None):
+    """ read TEI DOTS document incrementally.
 
-    #FIXME add sub-parsing
-    try:
-        out['meta']['witness_list'] = [{'witness' :  norm_spaces_meta(i.text), 'id' : i['xml:id']}
-                                      for i in metadata.fileDesc.find('sourceDesc').find('listWit').find_all('witness')]
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: fileDesc.sourceDesc.listWit not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+    Each tag of the body after a pb is converted to {'tag':str, 'attribs':list, 'text':str}, where text is
+    the text that follows the opening tag until the next opening tag.
 
-    try:
-        out['meta']['notes'] = [{'note' : norm_spaces_meta(i.text), 'date' : i['when']} for i in metadata.find('revisionDesc').find_all('change')]
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: revisionDesc not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+    Args:
+        infp (io.BufferedReader): TEI input stream, opened in binary mode.
+        fname (str): file name for error messages. If None, the name of infp is used.
+
+    Yield:
+        dict: {'meta' : dict} first, and then {'page' : dict} for each pb, as returned by parse_pb with
+            the processed tags of the page in inner.
+
+    Raise:
+        TeiFormatError: if the document does not follow the expected format.
+
+    """
+    if fname is None:
+        fname = getattr(infp, 'name', '<stdin>')
 
-    #
-    # text
-    #
+    body, page, npages = None, None, 0
+    meta_found = False
 
-    # --- dirty hack, long live to json!! ----
+    recs = {}  # element -> record of element
+    last = {}  # closed element -> last record opened within it, which receives the tail of the element
 
-    # check there is content
+    def add_text(rec, text):
+        if text:
+            rec['text'] += text
+
+    def flush():
+        for rec in page['inner']:
+            rec['text'] = SPACES_REGEX.sub(' ', rec['text'].strip())
+        page['inner'] = list(process_apps(list(process_gaps(page['inner'], fname)), fname))
+        return {'page' : page}
 
     try:
-        content_tag.text
-    except (AttributeError, TypeError):
-        print(f'Error in TEI file {args.infile.name}: text.body not found', file=sys.stderr) #ERROR
-        sys.exit(1)
+        for event, elem in etree.iterparse(infp, events=('start', 'end'), remove_comments=True, remove_pis=True):
+
+            if body is None:
+                if event == 'end' and _local(elem.tag) == 'teiHeader':
+                    yield {'meta' : parse_header(elem, fname)}
+                    meta_found = True
+                    elem.clear()
+                elif event == 'start' and _local(elem.tag) == 'body' and _local(elem.getparent().tag) == 'text':
+                    if not meta_found:
+                        raise TeiFormatError(f'Error in TEI file {fname}: teiHeader not found')
+                    body = elem
+                continue
+
+            if elem is body:
+                if event == 'end':
+                    if page is None:
+                        raise TeiFormatError(f'Error in TEI file {fname}: body does not start with pb directly followed by another tag')
+                    if len(body):
+                        add_text(last[body[-1]], body[-1].tail)
+                    yield flush()
+                    npages += 1
+                    body = None
+                continue
+
+            parent = elem.getparent()
+
+            if event == 'start':
+
+                # text preceding the tag is already complete
+                if (prev := elem.getprevious()) is not None:
+                    add_text(last[prev], prev.tail)
+                elif parent is not body:
+                    add_text(recs[parent], parent.text)
+                elif (body.text or '').strip():
+                    raise TeiFormatError(f'Error in TEI file {fname}: body does not start with pb directly followed by another tag')
+
+                # text between the first pb and the next tag is not allowed
+                if npages == 0 and page and page['pb']['text'].strip():
+                    raise TeiFormatError(f'Error in TEI file {fname}: body does not start with pb directly followed by another tag')
+
+                rec = {'tag' : _local(elem.tag), 'attribs' : [(_local(k), v) for k, v in elem.attrib.items()], 'text' : ''}
+                recs[elem] = rec
+
+                if rec['tag'] == 'pb':
+                    if page is not None:
+                        yield flush()
+                        npages += 1
+                    page = parse_pb(rec['attribs'], fname)
+                    page['pb'] = rec
+
+                elif page is None:
+                    raise TeiFormatError(f'Error in TEI file {fname}: body does not start with pb directly followed by another tag')
+
+                else:
+                    page['inner'].append(rec)
 
-    content = str(content_tag)
+            else:
+                if len(elem):
+                    add_text(last[elem[-1]], elem[-1].tail)
+                    last[elem] = last[elem[-1]]
+                else:
+                    add_text(recs[elem], elem.text)
+                    last[elem] = recs[elem]
 
-    # remove body tag and comments
-    content_str_clean = re.sub(r'<!--.+?-->', '', content, flags=re.DOTALL).replace('<body>', '').replace('</body>', '')
+                # keep only the open elements and their last closed child
+                for child in elem:
+                    recs.pop(child, None)
+                    last.pop(child, None)
+                elem.clear(keep_tail=True)
+                while (prev := elem.getprevious()) is not None:
+                    recs.pop(prev, None)
+                    last.pop(prev, None)
+                    parent.remove(prev)
 
-    # check that the first tag is pb and it is directly followed by another tag (not text)
-    if not re.match(r'<pb[^>]+><', re.sub(r'[ \n]', r'', content_str_clean)):
-        print(f'Error in TEI file {args.infile.name}: body does not start with pb directly followed by another tag', file=sys.stderr) #ERROR
-        sys.exit(1)
+    except etree.XMLSyntaxError as e:
+        raise TeiFormatError(f'Error in TEI file {fname}: {e}')
 
-    # parse tags
+    if not npages:
+        raise TeiFormatError(f'Error in TEI file {fname}: text.body not found')
 
-    # ----------
-    # groupby pb
-    # ----------
+def tei2json(infp, outfp, fname=None):
+    """ convert TEI DOTS document to json lines.
 
-    pbs = [(p.strip(), r.strip()) for p,r in re.findall(r'<pb(.+?)/>(.+?)(?=<pb|$)', content_str_clean, flags=re.DOTALL)]
+    Args:
+        infp (io.BufferedReader): TEI input stream, opened in binary mode.
+        outfp (io.TextIOWrapper): json lines output stream.
+        fname (str): file name for error messages.
 
-    pbs_out = list({'n' : -1, 'gap' : None, 'storage' : None, 'source' : None, 'content' : None} for i in range(len(pbs)))
+    Return:
+        int: number of pages.
 
-    for i, (pb, rest) in enumerate(pbs):
-        attribs = pb.split()
+    Raise:
+        TeiFormatError: if the document does not follow the expected format.
 
-        if not attribs:
-            print(f'Error in TEI file {args.infile.name}: format of tag "{pb_tag}": tag is empty', file=sys.stderr) #ERROR
-            sys.exit(1)
-    
-        # +/- page
-        elif len(attribs) == 1:
+    """
+    npages = 0
+    for item in iter_tei(infp, fname):
+        if 'page' in item:
+            del item['page']['pb']
+            npages += 1
+        print(json.dumps(item, ensure_ascii=False), file=outfp)
+    return npages
 
-            m = re.match(r'n="(\d+[rv])([\-+])"', attribs[0])
-            if not m:
-                print(f'Error in TEI file {args.infile.name}: format of tag "{pb_tag}"', file=sys.stderr) #ERROR
-                sys.exit(1)
-            pbs_out[i]['n'] = m.group(1)
-            pbs_out[i]['gap'] = m.group(2)
+def _convert_file(args):
+    """ convert a single TEI file into a json lines file, in a worker process.
 
-        # page with image ; attrib n is required, attribs facs and source are optional
-        else:
-            
-            n_attrib_found = False
-            #FIXME actualizar cuando conda distribuya de una *** vez python 8...
-            for attrib in attribs:
-                m = re.match(r'facs="(.+.jpg)"', attrib)
-                if m:
-                    pbs_out[i]['facs'] = m.group(1)
-                    continue
-                m = re.match(r'source="(.+)"', attrib)
-                if m:
-                    pbs_out[i]['source'] = m.group(1)
-                    continue
-                m = re.match(r'n="(\d+[rv])"', attrib)
-                if m:
-                    n_attrib_found = True
-                    pbs_out[i]['n'] = m.group(1)
-                    continue
-                
-                print(f'Error in TEI file {args.infile.name}: format of tag "{pb_tag}", unkown attrib "{attrib}"', file=sys.stderr) #ERROR
+    The output is written in a temporary file that is moved into place when the conversion ends.
 
-            if not n_attrib_found:
-                print(f'Error in TEI file {args.infile.name}: format of tag "{pb_tag}", attrib n is missing', file=sys.stderr) #ERROR
+    Args:
+        args (tuple): input file name and output file name.
+
+    Return:
+        tuple: output file name and number of pages.
 
+    """
+    fname, out_fname = args
+    with open(fname, 'rb') as infp:
+        npages = write_atomic(out_fname, lambda outfp: tei2json(infp, outfp, fname))
+    return out_fname, npages
 
-        # remove closing tags from content after pb
-        rest = re.sub(r'</.+?>', r'', rest)
+def tei2json_files(fnames, outdir, jobs=1):
+    """ convert several TEI files into json lines files in outdir.
 
-        # parse rest of tags that follow pb and their attribs and text until the next pb tag
-        inner_info = [(tagi.strip().split(), texti.strip()) for tagi, texti in re.findall(r'<(.+?)>(.+?)(?=<|$)', rest, flags=re.DOTALL)]
+    Args:
+        fnames (list): TEI input files.
+        outdir (str): output directory. Each output file has the name of its input file with extension .jsonl.
+        jobs (int): number of processes. If 1, files are converted one after another in the current process.
+
+    Yield:
+        str, int: output file name and number of pages, in the order of fnames.
 
+    Raise:
+        TeiFormatError: if a document does not follow the expected format.
 
-        inner = [{'tag' : tagi, 'attribs' : ([] if r==[] else [re.match(r'(.+)="(.+)"', at).groups() for at in r]), 'text' : re.sub(r'[\n ]+', r' ', texti)} for
-                ((tagi, *r), texti) in inner_info]
+    """
+    os.makedirs(outdir, exist_ok=True)
+    tasks = [(fname, os.path.join(outdir, f'{os.path.splitext(os.path.basename(fname))[0]}.jsonl')) for fname in fnames]
 
-        inner_proc_gaps = list(process_gaps(inner, args.infile.name))
-        inner_proc_app = list(process_apps(inner_proc_gaps, args.infile.name))
-        
-        pbs_out[i]['inner'] = inner_proc_app
+    if jobs <= 1 or len(tasks) <= 1:
+        yield from map(_convert_file, tasks)
+        return
 
-    #
-    # re-organise info
-    #
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+        yield from executor.map(_convert_file, tasks)
 
-    for pinfo in pbs_out:
-        print('\n----------------------------------------------------------------------------------------------------') #DEBUG
-        print(f"n={pinfo['n']} gap={pinfo['gap']} storage={pinfo['storage']} source={pinfo['source']}") #DEBUG
 
-        for item in pinfo['inner']:
+if __name__ == '__main__':
 
-            print('item::', item)
+    parser = ArgumentParser(description='parser for TEI DOTS document')
+    parser.add_argument('infile', nargs='?', type=FileType('rb'), default=sys.stdin.buffer, help='xml file')
+    parser.add_argument('outfile', nargs='?', type=FileType('w'), default=sys.stdout, help='json lines file')
+    parser.add_argument('--files', '-f', nargs='+', help=f'xml files, directories (files {TEI_FILES_PATTERN}) or glob patterns to convert into --outdir')
+    parser.add_argument('--outdir', help='output directory for --files')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='number of processes for converting --files in parallel [default 1]')
+    args = parser.parse_args()
 
-    #json.dump(out, args.outfile, ensure_ascii=False)
+    if bool(args.files) != bool(args.outdir):
+        parser.error('--files and --outdir must be used together')
 
+    try:
+        if args.files:
+            for out_fname, npages in tei2json_files(expand_inputs(args.files, TEI_FILES_PATTERN), args.outdir, args.jobs):
+                print(f'{out_fname}: {npages} pages', file=sys.stderr)
+        else:
+            tei2json(args.infile, args.outfile)
+    except (TeiFormatError, OSError) as e:
+        print(f'Fatal error! {e}', file=sys.stderr)
+        sys.exit(1)
@@ -14,6 +14,8 @@ import re
 import sys
 from argparse import ArgumentParser, FileType
 
+from isame_transducer import Transducer
+
 STROKE_ABOVE = '’'
 STROKE_BELOW = ','
 
@@ -143,7 +145,89 @@ MAPPING_TRANS = {
 }
 
 
-REGEX_TRANS = re.compile('|'.join(MAPPING_TRANS))
+MAPPING_ENTITIES = {
+    '&rsquo;' : '’' ,
+    '&rarr;'  : '→' ,
+    '&darr;'  : '↓' ,
+    '&uarr;'  : '↑' ,
+    '&larr;'  : '←' ,
+    '&harr;'  : '↔' ,
+    '&dArr;'  : '⇓' ,
+    '&rArr;'  : '⇒' ,
+    '&copy;'  : '©' ,
+    '&empty;' : '∅' ,
+    '&ne;'    : '≠' ,
+    '&deg;'   : '°' ,
+}
+
+# the longest key matching is replaced, e.g. B,, before B, before B
+MAPPING_TOARAB = {
+    'B,,'  : '\u064a' ,
+    'B,'   : '\u0628' ,
+    'B’’’' : '\u062b' ,
+    'B’’'  : '\u062a' ,
+    'B’'   : '\u0646' ,
+    'B'    : '\u066e' ,
+
+    'N’'   : '\u0646' ,
+    'N'    : '\u06ba' ,
+
+    'F,'   : '\u06a2' ,
+    'F’’'  : '\u0642' ,
+    'F’'   : '\u0641' ,
+    'F'    : '\u06a1' ,
+
+    'Q’’'  : '\u0642' ,
+    'Q'    : '\u066f' ,
+
+    'Y’’'  : '\u064a' ,
+    'Y,,'  : '\u064a' ,
+    'Y⇓'   : '\u06cc' ,
+    'Y⇒'   : '\u06d2' ,
+    'Y'    : '\u06cc' ,
+
+    'G’'   : '\u062e' ,
+    'G,'   : '\u062c' ,
+    'G'    : '\u062d' ,
+
+    'D’'   : '\u0630' ,
+    'D'    : '\u062f' ,
+
+    'R’'   : '\u0632' ,
+    'R'    : '\u0631' ,
+
+    'S’’’' : '\u0634' ,
+    'S'    : '\u0633' ,
+
+    'C’'   : '\u0636' ,
+    'C'    : '\u0635' ,
+
+    'T’'   : '\u0638' ,
+    'T'    : '\u0637' ,
+
+    'E’'   : '\u063a' ,
+    'E'    : '\u0639' ,
+
+    'K'    : '\u06a9' , #isolated/final 06A9 in the option --KP Kaf parallel 06AA
+                        #initial/middle 0643
+    'L'    : '\u0644' ,
+    'M'    : '\u0645' ,
+    'H'    : '\u0647' ,
+    'W'    : '\u0648' ,
+
+    'A'    : '\u0627' ,
+    'ᵃᵃ'   : '\u064b' ,
+    'ᵃ'    : '\u064e' ,
+    'ᵘᵘ'   : '\u064c' ,
+    'ᵘ'    : '\u064f' ,
+    'ᵢᵢ'   : '\u064d' ,
+    'ᵢ'    : '\u0650' ,
+
+    '#'    : ' ' ,
+}
+
+ENTITIES = Transducer(MAPPING_ENTITIES)
+LETTERS = Transducer(MAPPING_TOARAB)
 
 
 def to_arabic(tok, space=' ', debug=False, html=False, varr=False):
@@ -163,20 +247,7 @@ def to_arabic(tok, space=' ', debug=False, html=False, varr=False):
 
     if html:
 
-            tok = re.sub("&rsquo;", "’", tok)    
-            tok = re.sub("&rsquo;", "’", tok)    
-            tok = re.sub("&rarr;", "→", tok)    
-            tok = re.sub("&darr;", "↓", tok)    
-            tok = re.sub("&uarr;", "↑", tok)    
-            tok = re.sub("&larr;", "←", tok)    
-            #tok = re.sub("", "↕", tok)    
-            tok = re.sub("&harr;", "↔", tok)    
-            tok = re.sub("&dArr;", "⇓", tok)    
-            tok = re.sub("&rArr;", "⇒", tok)    
-            tok = re.sub("&copy;", "©", tok)    
-            tok = re.sub("&empty;", "∅", tok)    
-            tok = re.sub("&ne;", "≠", tok)
-            tok = re.sub("&deg;", "°", tok)
+            tok = ENTITIES(tok)
 
             #tok = re.sub("", "ᵒˀᴬⁿ―ʸ", tok)    
 
@@ -260,80 +331,13 @@ def to_arabic(tok, space=' ', debug=False, html=False, varr=False):
         tok = re.sub(r'[∅ᵒˀᴬⁿʸ°]', '', tok)
 
     # replace symbol by symbol
-    tok = re.sub("B,,", "\u064a", tok)
-    tok = re.sub("B,", "\u0628", tok)
-    tok = re.sub("B’’’", "\u062b", tok)
-    tok = re.sub("B’’", "\u062a", tok)
-    tok = re.sub("B’", "\u0646", tok)
-    tok = re.sub("B", "\u066e", tok)
-
-    tok = re.sub("N’", "\u0646", tok)
-    tok = re.sub("N", "\u06ba", tok)
- 
-    tok = re.sub("F,", "\u06a2", tok)
-    tok = re.sub("F’’", "\u0642", tok)
-    tok = re.sub("F’", "\u0641", tok)
-    tok = re.sub("F", "\u06a1", tok)
-    
-    tok = re.sub("Q’’", "\u0642", tok)
-    tok = re.sub("Q", "\u066f", tok)
-    tok = re.sub("Y’’", "\u064a", tok)
-    tok = re.sub("Y,,", "\u064a", tok)
-    
-    tok = re.sub("Y⇓", "\u06cc", tok)
-    tok = re.sub("Y⇒", "\u06d2", tok)
-    tok = re.sub("Y", "\u06cc", tok)
- 
-    tok = re.sub("G’", "\u062e", tok)
-    tok = re.sub("G,", "\u062c", tok)
-    tok = re.sub("G", "\u062d", tok)
-
-    tok = re.sub("D’", "\u0630", tok)
-    tok = re.sub("D", "\u062f", tok)
-
-    tok = re.sub("R’", "\u0632", tok)
-    tok = re.sub("R", "\u0631", tok)
-
-    tok = re.sub("S’’’", "\u0634", tok)
-    tok = re.sub("S", "\u0633", tok)
-
-    tok = re.sub("C’", "\u0636", tok)
-    tok = re.sub("C", "\u0635", tok)
-
-    tok = re.sub("T’", "\u0638", tok)
-    tok = re.sub("T", "\u0637", tok)
-
-    tok = re.sub("E’", "\u063a", tok)
-    tok = re.sub("E", "\u0639", tok)
-
-    tok = re.sub("K", "\u06a9", tok)
-    #isolated/final 06A9 in the option --KP Kaf parallel 06AA
-    #initial/middle 0643
-
-    tok = re.sub("L", "\u0644", tok)
-    tok = re.sub("M", "\u0645", tok)
-    tok = re.sub("H", "\u0647", tok)
-    tok = re.sub("W", "\u0648", tok)
-
-    tok = re.sub("A", "\u0627", tok)
-    tok = re.sub("ᵃᵃ", "\u064b", tok)
-    tok = re.sub("ᵃ", "\u064e", tok)
-    tok = re.sub("ᵘᵘ", "\u064c", tok)
-    tok = re.sub("ᵘ", "\u064f", tok)
-    tok = re.sub("ᵢᵢ", "\u064d", tok)
-    tok = re.sub("ᵢ", "\u0650", tok)
-
+    tok = LETTERS(tok)
 
     #Sura ending
     #5vv> remove 1, keep letter HA
     #10w> flower like star \u066D
     #number of tens: FD3E and FD3F for ornated parenthesis include number
 
-    tok = re.sub("#", ' ', tok)
-
-    # convert simple mapping
-    # tok = REGEX_TRANS.sub(lambda m: MAPPING_TOARAB[m.group(0)], tok)
-
     return tok
 
 
@@ -16,6 +16,8 @@ import re
 import sys
 from argparse import ArgumentParser, FileType
 
+from isame_transducer import Transducer
+
 STROKE_ABOVE = '’'
 STROKE_BELOW = ','
 
@@ -117,7 +119,20 @@ MAPPING_TRANS = {
 }
 
 
-REGEX_TRANS = re.compile('|'.join(MAPPING_TRANS))
+# consonantal strokes of each letter, added after its archigrapheme
+STROKES = {
+    **{c : STROKE_BELOW for c in 'بج'},
+    **{c : STROKE_ABOVE for c in 'خذزنضظغف'},
+    **{c : STROKE_ABOVE*2 for c in 'ةتق'},
+    **{c : STROKE_ABOVE*3 for c in 'ثش'},
+}
+
+# letters and diacritics converted in a single pass; ن, ى, ي, ق and ئ are resolved later by context
+TRANSDUCER = Transducer({
+    **MAPPING_TRANS,
+    **{c : f'{MAPPING_TRANS.get(c, c)}{stroke}' for c, stroke in STROKES.items()},
+    'ئ' : 'ىˀ˥',
+})
 
 def to_paleo(tok, space='#', rm_cons_strokes=False, sep_non_join=False, debug=False):
     """ Convert all Arabic-scriped text within string tok into paleographic transcription.
@@ -136,33 +151,21 @@ def to_paleo(tok, space='#', rm_cons_strokes=False, sep_non_join=False, debug=Fa
     """
     if debug: print(f'@DEBUG[1]@ {tok}', file=sys.stderr) #TRACE
 
-    # convert strokes
-    tok = re.sub(r'([بج])', rf'\1{STROKE_BELOW}', tok)
+    # convert strokes, simple mapping and hamza on ya
+    tok = TRANSDUCER(tok)
     if debug: print(f'@DEBUG[2]@ {tok}', file=sys.stderr) #TRACE
-    tok = re.sub(r'([خذزنضظغف])', rf'\1{STROKE_ABOVE}', tok)
-    if debug: print(f'@DEBUG[3]@ {tok}', file=sys.stderr) #TRACE
-    tok = re.sub(r'([ةتق])', rf'\1{STROKE_ABOVE}{STROKE_ABOVE}', tok)
-    if debug: print(f'@DEBUG[4]@ {tok}', file=sys.stderr) #TRACE
-    tok = re.sub(r'([ثش])', rf'\1{STROKE_ABOVE}{STROKE_ABOVE}{STROKE_ABOVE}', tok)
-    if debug: print(f'@DEBUG[5]@ {tok}', file=sys.stderr) #TRACE
 
-    # convert simple mapping
-    tok = REGEX_TRANS.sub(lambda m: MAPPING_TRANS[m.group(0)], tok)
-    if debug: print(f'@DEBUG[6]@ {tok}', file=sys.stderr) #TRACE
-    
     # convert special archigraphemes - NQY
-    tok = tok.replace('ئ', 'ىˀ˥')
-    if debug: print(f'@DEBUG[7]@ {tok}', file=sys.stderr) #TRACE
     tok = re.sub(rf'ن([^{ARCHIGRAPHEMES}نىيق]*(?: |$))', r'N\1', tok)
-    if debug: print(f'@DEBUG[8]@ {tok}', file=sys.stderr) #TRACE
+    if debug: print(f'@DEBUG[3]@ {tok}', file=sys.stderr) #TRACE
     tok = re.sub(rf'[ىي]([^{ARCHIGRAPHEMES}ىيق]*(?: |$))', r'Y\1', tok)
-    if debug: print(f'@DEBUG[9]@ {tok}', file=sys.stderr) #TRACE
+    if debug: print(f'@DEBUG[4]@ {tok}', file=sys.stderr) #TRACE
 
     tok = re.sub(rf'[نىي]', r'B', tok)
-    if debug: print(f'@DEBUG[A]@ {tok}', file=sys.stderr) #TRACE
+    if debug: print(f'@DEBUG[5]@ {tok}', file=sys.stderr) #TRACE
     tok = re.sub(rf'ق([^{ARCHIGRAPHEMES}ق]*(?: |$))', r'Q\1', tok)
     tok = tok.replace('ق', 'F')
-    if debug: print(f'@DEBUG[B]@ {tok}', file=sys.stderr) #TRACE
+    if debug: print(f'@DEBUG[6]@ {tok}', file=sys.stderr) #TRACE
 
     # separate letterblocks - ARDW
     if sep_non_join: